@@ -9,6 +9,7 @@
     --no-voice      禁用语音对话（仅 GUI）
     --text          纯文本对话模式（控制台，无 GUI）
     --text-gui      文字输入模式（GUI + 终端文字对话，不使用麦克风）
+    --server        无界面多会话服务（WebSocket，其余参数见 python -m core.session_server -h）
 
 使用示例:
     python main.py              # 完整模式（GUI + 语音对话）
@@ -16,6 +17,7 @@
     python main.py --no-voice   # 仅 GUI，不启动语音
     python main.py --text       # 纯文本对话（控制台）
     python main.py --text-gui   # GUI + 终端文字输入对话
+    python main.py --server --port 8766 --max-sessions 32   # 多会话服务
 """
 import sys
 from pathlib import Path
@@ -60,13 +62,20 @@ def main():
     no_voice = "--no-voice" in sys.argv
     text_mode = "--text" in sys.argv
     text_gui_mode = "--text-gui" in sys.argv
+    server_mode = "--server" in sys.argv
     asr_device = _parse_asr_device(sys.argv)
     
     print("=" * 60)
     print("        玲 (Liying) - 智能虚拟助手")
     print("=" * 60)
     
-    if text_mode:
+    if server_mode:
+        # 多会话服务模式（无 GUI、无本地音频设备）
+        print("模式: 多会话服务（WebSocket）")
+        from core.session_server import main as server_main
+        sys.argv = [sys.argv[0]] + [a for a in sys.argv[1:] if a not in ("--server", "--debug", "-d")]
+        server_main()
+    elif text_mode:
         # 纯文本模式（控制台对话）
         print("模式: 纯文本对话（控制台）")
         run_text_mode(debug_mode)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+BM25 检索基准：逐文档循环打分 vs 向量化打分（score_top_k）
+
+对每个规模生成合成语料（常用汉字按 Zipf 分布抽取，长度接近对话记忆），比较：
+  - loop       原实现：按查询词 × 倒排逐文档 Python 循环累加，再整体排序
+  - memory     内存版 BM25（retriever.BM25）：dict 倒排编译成 CSR 后向量化打分
+  - persistent 持久化 BM25（bm25_index.PersistentBM25）：bulk_load 构建内存映射基础段
+并校验三者的 top-k 结果（doc_id 顺序与分数）逐位一致。
+
+loop / memory 需要 Python dict 倒排，百万级文档内存占用过大，默认只在不超过
+--reference-max 的规模上运行；更大的规模只测持久化索引。
+
+用法：
+  python scripts/bench_bm25.py
+  python scripts/bench_bm25.py --sizes 10000 100000 --queries 200 --top-k 10
+  python scripts/bench_bm25.py --sizes 1000000 --reference-max 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+def _ensure_paths():
+    src_path = Path(__file__).parent.parent / "src"
+    if str(src_path) not in sys.path:
+        sys.path.insert(0, str(src_path))
+
+
+# ============================================================
+#  合成语料
+# ============================================================
+
+_ENGLISH_WORDS = ["python", "music", "coffee", "github", "iphone", "switch", "live", "ok"]
+
+
+def make_corpus(size: int, seed: int = 0) -> Tuple[List[Tuple[str, str, None]], List[str]]:
+    """生成 size 篇文档与取自文档片段的查询"""
+    rng = random.Random(seed)
+    chars = [chr(0x4E00 + i) for i in rng.sample(range(0x5200), 3000)]
+    weights = [1.0 / (rank + 1) ** 1.1 for rank in range(len(chars))]
+    docs = []
+    for i in range(size):
+        text = "".join(rng.choices(chars, weights=weights, k=rng.randint(8, 60)))
+        if rng.random() < 0.2:
+            text += " " + rng.choice(_ENGLISH_WORDS)
+        docs.append((f"mem_{i}", text, None))
+    return docs, [docs[rng.randrange(size)][1][:rng.randint(4, 12)] for _ in range(1000)]
+
+
+# ============================================================
+#  原实现（逐文档循环）
+# ============================================================
+
+def legacy_search(bm25, query: str, top_k: int) -> List[Tuple[str, float]]:
+    """向量化之前的 BM25.search（逐字保留），作为正确性与耗时基准"""
+    if not bm25._documents:
+        return []
+
+    query_terms = bm25._tokenize(query)
+    scores = defaultdict(float)
+    for term in query_terms:
+        if term not in bm25._term_freqs:
+            continue
+        df = bm25._doc_freqs[term]
+        idf = math.log((bm25._total_docs - df + 0.5) / (df + 0.5) + 1)
+        for doc_id, tf in bm25._term_freqs[term].items():
+            doc_len = bm25._doc_lengths[doc_id]
+            numerator = tf * (bm25.k1 + 1)
+            denominator = tf + bm25.k1 * (1 - bm25.b + bm25.b * doc_len / bm25._avg_doc_length)
+            scores[doc_id] += idf * numerator / denominator
+
+    sorted_results = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    return sorted_results[:top_k]
+
+
+# ============================================================
+#  计时
+# ============================================================
+
+def time_queries(search, queries: List[str], top_k: int) -> Tuple[Dict[str, float], List[List[Tuple[str, float]]]]:
+    latencies, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(search(q, top_k))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    latencies.sort()
+    stats = {
+        "mean": sum(latencies) / len(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+    return stats, results
+
+
+def bench_size(size: int, args) -> Dict:
+    from backend.llm.rag.bm25_index import PersistentBM25, BM25IndexConfig
+    from backend.llm.rag.retriever import BM25
+
+    docs, queries = make_corpus(size, args.seed)
+    queries = queries[:args.queries]
+    row: Dict = {"size": size}
+    reference = None
+
+    if size <= args.reference_max:
+        bm25 = BM25()
+        t0 = time.perf_counter()
+        bm25.add_documents({doc_id: text for doc_id, text, _ in docs})
+        row["memory_build_s"] = time.perf_counter() - t0
+
+        row["loop"], reference = time_queries(lambda q, k: legacy_search(bm25, q, k), queries, args.top_k)
+        bm25.search(queries[0], args.top_k)  # 编译 CSR 不计入检索耗时
+        row["memory"], results = time_queries(bm25.search, queries, args.top_k)
+        row["memory_equal"] = results == reference
+        del bm25
+
+    index_dir = Path(tempfile.mkdtemp(prefix="bench_bm25_"))
+    try:
+        index = PersistentBM25(index_dir, BM25IndexConfig(background_compaction=False))
+        t0 = time.perf_counter()
+        index.bulk_load(docs)
+        row["persistent_build_s"] = time.perf_counter() - t0
+        row["persistent"], results = time_queries(index.search, queries, args.top_k)
+        if reference is not None:
+            row["persistent_equal"] = results == reference
+        index.close()
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+    return row
+
+
+def print_report(rows: List[Dict]):
+    print(f"\n{'文档数':>9}  {'实现':<10} {'构建(s)':>8} {'mean(ms)':>9} {'p50(ms)':>8} {'p95(ms)':>8}  结果一致")
+    for row in rows:
+        for name in ("loop", "memory", "persistent"):
+            if name not in row:
+                continue
+            stats = row[name]
+            build = row.get(f"{name}_build_s", row.get("memory_build_s") if name == "loop" else None)
+            equal = {"loop": "基准", "memory": row.get("memory_equal"), "persistent": row.get("persistent_equal", "-")}[name]
+            build_text = f"{build:8.1f}" if build is not None else f"{'-':>8}"
+            print(
+                f"{row['size']:>9}  {name:<10} {build_text} {stats['mean']:9.2f} "
+                f"{stats['p50']:8.2f} {stats['p95']:8.2f}  {equal}"
+            )
+        if "loop" in row:
+            print(f"{'':>9}  向量化加速: memory {row['loop']['mean'] / row['memory']['mean']:.1f}x, "
+                  f"persistent {row['loop']['mean'] / row['persistent']['mean']:.1f}x")
+
+
+def main():
+    _ensure_paths()
+
+    p = argparse.ArgumentParser(description="BM25 检索基准：逐文档循环 vs 向量化")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="语料规模")
+    p.add_argument("--queries", type=int, default=200, help="每个规模的查询数")
+    p.add_argument("--top-k", type=int, default=10)
+    p.add_argument("--reference-max", type=int, default=100_000,
+                   help="不超过此规模时运行循环基准与内存版并校验一致性（百万级 dict 倒排内存占用过大）")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+
+    rows = []
+    for size in args.sizes:
+        print(f"规模 {size} ...", flush=True)
+        rows.append(bench_size(size, args))
+    print_report(rows)
+
+    return 0 if all(row.get("memory_equal", True) and row.get("persistent_equal", True) for row in rows) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
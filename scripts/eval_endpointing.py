@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+端点检测离线评估：固定静音阈值 vs 自适应端点（core.endpointing）
+
+把夹具音频按块送入与 AudioInput.record_until_silence 相同的 VAD / hangover / 静音计时逻辑
+（按音频时间推进，不需要等实时），分别用固定阈值与自适应阈值判定说话结束，统计：
+  - 结束延迟：判定结束时刻 − 最后一段语音结束时刻（越小越好）
+  - 过早截断：在句中停顿处就判定结束（最后一段语音还没开始）
+
+用法：
+  python scripts/eval_endpointing.py
+  python scripts/eval_endpointing.py --fixtures endpoint_fixtures.json --json logs/endpoint_eval.json
+  python scripts/eval_endpointing.py --asr real --punc     # 真实流式 ASR + PUNC 模型（需本地模型）
+
+夹具格式（JSON，audio 为相对夹具文件的路径）：
+  {
+    "utterances": [
+      {"name": "question", "segments": [{"text": "今天天气怎么样"}]},
+      {"name": "pause", "segments": [
+        {"text": "我想问一下，", "audio": "fixtures/ask.wav"},
+        {"pause": 0.9},
+        {"text": "明天会不会下雨", "audio": "fixtures/rain.wav"}
+      ]}
+    ]
+  }
+  - segments 依次拼接：text 段是语音（audio 可省略，按字数生成类语音噪声），pause 段是静音（秒）
+  - --asr scripted（默认）时中间结果按 text 逐字给出（去掉标点，带 --asr-lag 延迟），模拟流式 ASR
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from replay_conversation import SAMPLE_RATE, _ensure_paths, load_wav, synth_speech
+
+
+DEFAULT_UTTERANCES = [
+    {"name": "question", "segments": [{"text": "今天天气怎么样"}]},
+    {"name": "question_particle", "segments": [{"text": "你吃饭了吗"}]},
+    {"name": "short_reply", "segments": [{"text": "好的"}]},
+    {"name": "suggestion", "segments": [{"text": "明天去公园玩吧"}]},
+    {"name": "command", "segments": [{"text": "帮我设一个明天早上八点的闹钟"}]},
+    {"name": "pause_after_comma", "segments": [{"text": "给我讲个笑话，"}, {"pause": 0.9}, {"text": "要好笑一点的"}]},
+    {"name": "pause_after_verb", "segments": [{"text": "我觉得"}, {"pause": 1.0}, {"text": "这个主意不错"}]},
+    {"name": "pause_after_conj", "segments": [{"text": "然后"}, {"pause": 0.9}, {"text": "我们去公园玩吧"}]},
+    {"name": "pause_after_filler", "segments": [{"text": "嗯"}, {"pause": 1.0}, {"text": "我再想想"}]},
+    {"name": "pause_after_ask", "segments": [{"text": "我想问一下"}, {"pause": 0.9}, {"text": "明天会不会下雨"}]},
+    {"name": "afterthought", "segments": [{"text": "今天天气怎么样"}, {"pause": 0.7}, {"text": "明天呢"}]},
+]
+
+_PUNCT = re.compile(r"[，,。.！!？?、；;：:…~～\s]")
+
+
+# ============================================================
+#  夹具
+# ============================================================
+
+def load_fixtures(path: Optional[str]) -> tuple:
+    if not path:
+        return DEFAULT_UTTERANCES, Path.cwd()
+    p = Path(path)
+    data = json.loads(p.read_text(encoding="utf-8"))
+    return data.get("utterances", []), p.parent
+
+
+def build_audio(utt: Dict, base_dir: Path, seed: int, lead_sec: float, tail_sec: float, noise: float):
+    """
+    拼接夹具音频
+
+    Returns:
+        (audio, spans)：spans 为 [(开始秒, 结束秒, 文本)]，只含语音段
+    """
+    import numpy as np
+
+    parts = [np.zeros(int(lead_sec * SAMPLE_RATE), dtype=np.float32)]
+    spans = []
+    pos = len(parts[0])
+    for i, seg in enumerate(utt.get("segments", [])):
+        if "pause" in seg:
+            audio = np.zeros(int(float(seg["pause"]) * SAMPLE_RATE), dtype=np.float32)
+        else:
+            if seg.get("audio"):
+                audio = load_wav(base_dir / seg["audio"])
+            else:
+                audio = synth_speech(_PUNCT.sub("", seg.get("text", "")), seed=seed * 100 + i)
+            spans.append((pos / SAMPLE_RATE, (pos + len(audio)) / SAMPLE_RATE, seg.get("text", "")))
+        parts.append(audio)
+        pos += len(audio)
+    parts.append(np.zeros(int(tail_sec * SAMPLE_RATE), dtype=np.float32))
+    audio = np.concatenate(parts)
+    rng = np.random.default_rng(seed)
+    audio = audio + (noise * rng.standard_normal(len(audio))).astype(np.float32)
+    return audio.astype(np.float32), spans
+
+
+def scripted_partials(spans, chunk_times: List[float], lag_sec: float) -> List[str]:
+    """按语音段逐字给出中间结果（去标点），每块一个"""
+    out = []
+    for t in chunk_times:
+        text = ""
+        for t0, t1, seg_text in spans:
+            chars = _PUNCT.sub("", seg_text)
+            frac = (t - lag_sec - t0) / max(1e-6, t1 - t0)
+            if frac <= 0:
+                break
+            text += chars[: int(round(min(1.0, frac) * len(chars)))]
+        out.append(text)
+    return out
+
+
+def real_partials(asr, audio, chunk_samples: int) -> List[str]:
+    """用真实流式 ASR 逐块识别，返回每块之后的合并中间结果"""
+    from core.conversation_manager import ConversationManager
+
+    asr.start_stream()
+    merged, last, out = "", "", []
+    for i in range(0, len(audio), chunk_samples):
+        part = (asr.feed_audio(audio[i:i + chunk_samples]) or "").strip()
+        if part and part != last:
+            last = part
+            merged = ConversationManager._merge_streaming_pair(merged, part)
+        out.append(merged)
+    asr.end_stream()
+    return out
+
+
+# ============================================================
+#  端点模拟（与 AudioInput.record_until_silence 同一套规则，按音频时间推进）
+# ============================================================
+
+def simulate_endpoint(
+    audio,
+    chunk_samples: int,
+    vad_config,
+    partials: List[str],
+    get_silence_duration: Callable[[], float],
+    on_partial: Callable[[str], None],
+) -> Optional[float]:
+    """返回判定说话结束的时刻（秒，按块到达时间）；音频结束仍未判定时返回 None"""
+    from core.vad import create_vad
+
+    vad = create_vad(vad_config)
+    vc = vad_config
+    is_speaking = False
+    silence_start = None
+    consecutive_speech = 0
+    hangover_remaining = 0
+
+    for idx, i in enumerate(range(0, len(audio) - chunk_samples + 1, chunk_samples)):
+        chunk = audio[i:i + chunk_samples]
+        now = (i + chunk_samples) / SAMPLE_RATE
+        has_speech = vad.detect_speech(chunk, SAMPLE_RATE)
+        if is_speaking:
+            on_partial(partials[idx])
+
+        if has_speech:
+            consecutive_speech += 1
+            hangover_remaining = vc.hangover_chunks
+            if not is_speaking and consecutive_speech >= vc.min_speech_chunks:
+                is_speaking = True
+                on_partial(partials[idx])
+            silence_start = None
+            continue
+
+        consecutive_speech = 0
+        if not is_speaking:
+            continue
+        if hangover_remaining > 0:
+            hangover_remaining -= 1
+            continue
+        limit = get_silence_duration()
+        if silence_start is None:
+            silence_start = now
+        elif now - silence_start > limit:
+            return now
+    return None
+
+
+def make_punctuator() -> Callable[[str], Optional[str]]:
+    """标点模型恢复函数；模型不可用时返回 None（端点检测退回规则判断）"""
+    from core.punc_engine import PUNCEngine
+
+    punc = PUNCEngine()
+
+    def punctuate(text: str) -> Optional[str]:
+        r = punc.restore(text)
+        return r.text if r.used_model else None
+
+    return punctuate
+
+
+def evaluate(utterances, base_dir: Path, args) -> List[Dict]:
+    _ensure_paths()
+    from core.vad import VADConfig
+    from core.endpointing import AdaptiveEndpointer, EndpointConfig
+
+    # 与 ConversationManager._init_audio 相同的 VAD 调整
+    vad_config = VADConfig.preset(args.vad_preset)
+    vad_config.silence_duration = args.silence
+    vad_config.min_speech_chunks = max(2, vad_config.min_speech_chunks)
+    vad_config.hangover_chunks = max(1, vad_config.hangover_chunks)
+
+    asr = None
+    chunk_samples = int(args.chunk_ms * SAMPLE_RATE / 1000.0)
+    if args.asr == "real":
+        from core.conversation_manager import ConversationManager, ConversationConfig
+
+        manager = ConversationManager(ConversationConfig())
+        manager._init_asr()
+        asr = manager._asr
+        if hasattr(asr, "get_chunk_stride"):
+            chunk_samples = asr.get_chunk_stride()
+
+    endpointer = AdaptiveEndpointer(
+        EndpointConfig(base_silence=args.silence, min_silence=args.min_silence, max_silence=args.max_silence),
+        punctuate=make_punctuator() if args.punc else None,
+    )
+
+    results = []
+    for n, utt in enumerate(utterances, start=1):
+        audio, spans = build_audio(utt, base_dir, n, args.lead_sec, args.tail_sec, args.noise)
+        if not spans:
+            continue
+        n_chunks = len(audio) // chunk_samples
+        if asr is not None:
+            partials = real_partials(asr, audio, chunk_samples)
+        else:
+            times = [(k + 1) * chunk_samples / SAMPLE_RATE for k in range(n_chunks)]
+            partials = scripted_partials(spans, times, args.asr_lag)
+
+        speech_end = spans[-1][1]
+        last_start = spans[-1][0]
+        row = {"name": utt.get("name", f"#{n}"), "text": "".join(s[2] for s in spans), "speech_end": speech_end}
+        for mode in ("fixed", "adaptive"):
+            endpointer.reset()
+            if mode == "fixed":
+                limit_fn, on_partial = (lambda: args.silence), (lambda text: None)
+            else:
+                limit_fn, on_partial = endpointer.silence_duration, endpointer.update
+            end = simulate_endpoint(audio, chunk_samples, vad_config, partials, limit_fn, on_partial)
+            cut = end is not None and end < last_start + 1e-6
+            row[mode] = {
+                "end": end,
+                "latency_ms": None if end is None or cut else round((end - speech_end) * 1000.0),
+                "cut_off": cut,
+            }
+            if mode == "adaptive":
+                row[mode]["reason"] = endpointer.last_decision[1]
+        results.append(row)
+    return results
+
+
+def print_report(results: List[Dict]):
+    def fmt(r):
+        if r["cut_off"]:
+            return "截断"
+        return "未结束" if r["latency_ms"] is None else f"{r['latency_ms']}ms"
+
+    print(f"\n{'utterance':<20} {'fixed':>8} {'adaptive':>9}  {'reason':<26} text")
+    print("-" * 90)
+    for r in results:
+        print(f"{r['name']:<20} {fmt(r['fixed']):>8} {fmt(r['adaptive']):>9}  "
+              f"{r['adaptive'].get('reason', ''):<26} {r['text']}")
+
+    print()
+    for mode in ("fixed", "adaptive"):
+        lat = [r[mode]["latency_ms"] for r in results if r[mode]["latency_ms"] is not None]
+        cuts = sum(1 for r in results if r[mode]["cut_off"])
+        mean = sum(lat) / len(lat) if lat else 0.0
+        print(f"{mode:<9} 平均结束延迟 {mean:7.1f}ms   过早截断 {cuts}/{len(results)}")
+    both = [r for r in results if r["fixed"]["latency_ms"] is not None and r["adaptive"]["latency_ms"] is not None]
+    if both:
+        saved = sum(r["fixed"]["latency_ms"] - r["adaptive"]["latency_ms"] for r in both) / len(both)
+        print(f"两者均未截断的 {len(both)} 句，自适应平均节省 {saved:.1f}ms")
+
+
+def main():
+    _ensure_paths()
+
+    p = argparse.ArgumentParser(description="端点检测离线评估：固定静音阈值 vs 自适应端点")
+    p.add_argument("--fixtures", "-f", default="", help="夹具 JSON（缺省使用内置示例）")
+    p.add_argument("--json", default="", help="逐句结果输出 JSON 路径（可选）")
+    p.add_argument("--asr", choices=["scripted", "real"], default="scripted", help="中间结果来源：脚本化或真实流式 ASR")
+    p.add_argument("--asr-lag", type=float, default=0.3, help="脚本化中间结果相对语音的延迟（秒）")
+    p.add_argument("--punc", action="store_true", help="自适应端点使用 PUNC 模型预测句末标点（需本地模型）")
+    p.add_argument("--chunk-ms", type=float, default=600.0, help="音频块时长（--asr real 时取 ASR 的 chunk stride）")
+    p.add_argument("--vad-preset", default="balanced", choices=["aggressive", "balanced", "conservative"])
+    p.add_argument("--silence", type=float, default=0.6, help="固定静音阈值 / 自适应基准时长（秒）")
+    p.add_argument("--min-silence", type=float, default=0.25, help="自适应：明确说完时的静音时长")
+    p.add_argument("--max-silence", type=float, default=1.2, help="自适应：明显没说完时的静音时长")
+    p.add_argument("--lead-sec", type=float, default=1.0, help="语音前的静音（供 VAD 校准底噪）")
+    p.add_argument("--tail-sec", type=float, default=3.0, help="语音后的静音")
+    p.add_argument("--noise", type=float, default=0.001, help="底噪幅度")
+    args = p.parse_args()
+
+    utterances, base_dir = load_fixtures(args.fixtures)
+    results = evaluate(utterances, base_dir, args)
+    print_report(results)
+
+    if args.json:
+        out = Path(args.json)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n已写入: {out}")
+
+    return 1 if any(r["adaptive"]["cut_off"] and not r["fixed"]["cut_off"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+本地 OpenAI 兼容模拟服务（带前缀缓存模拟）
+
+用于在没有真实 LLM 的机器上测量消息布局对前缀缓存命中率与首 token 延迟的影响：
+  - 按 DeepSeek 的方式以 64 token 为单位缓存请求前缀（这里 1 字符 ≈ 1 token）
+  - 首 token 延迟 = 基础延迟 + 未命中 token × 每 token 预填充耗时
+  - usage 中返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens
+  - 流式请求带 stream_options.include_usage 时，最后一个 chunk 返回 usage
+  - 可注入延迟抖动、偶发卡顿与失败，用于测试多端点路由/对冲请求
+
+用法：
+  python scripts/mock_openai_server.py --port 8001
+  然后在 .env 中设置 BASE_URL=http://127.0.0.1:8001/v1
+
+  两个端点测试路由（一个快、一个偶发卡顿）：
+  python scripts/mock_openai_server.py --port 8001 --base-ms 100
+  python scripts/mock_openai_server.py --port 8002 --base-ms 60 --stall-rate 0.3 --stall-ms 3000
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class PrefixCache:
+    """按块缓存请求前缀（只记录哈希）"""
+
+    def __init__(self, block_tokens: int = 64, capacity: int = 100000):
+        self.block_tokens = block_tokens
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._blocks = {}
+
+    def _prefix_hashes(self, text: str):
+        h = hashlib.sha1()
+        for end in range(self.block_tokens, len(text) + 1, self.block_tokens):
+            h.update(text[end - self.block_tokens:end].encode("utf-8"))
+            yield end, h.hexdigest()
+
+    def lookup_and_store(self, text: str) -> int:
+        """返回命中的前缀 token 数，并缓存本次请求的所有块前缀"""
+        hit = 0
+        missed = False
+        with self._lock:
+            for end, digest in self._prefix_hashes(text):
+                if not missed and digest in self._blocks:
+                    hit = end
+                else:
+                    missed = True
+                self._blocks[digest] = time.monotonic()
+            if len(self._blocks) > self.capacity:
+                # 淘汰最旧的一半
+                for k, _ in sorted(self._blocks.items(), key=lambda kv: kv[1])[: len(self._blocks) // 2]:
+                    del self._blocks[k]
+        return hit
+
+
+def _prompt_text(body: dict) -> str:
+    """把请求中影响前缀的部分（tools + messages）序列化为稳定文本"""
+    parts = []
+    if body.get("tools"):
+        parts.append(json.dumps(body["tools"], ensure_ascii=False, sort_keys=True))
+    for m in body.get("messages", []):
+        content = m.get("content") or ""
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False, sort_keys=True)
+        parts.append(f"<|{m.get('role', '')}|>{content}")
+        if m.get("tool_calls"):
+            parts.append(json.dumps(m["tool_calls"], ensure_ascii=False, sort_keys=True))
+    return "".join(parts)
+
+
+def _reply_for(body: dict) -> str:
+    last_user = ""
+    for m in reversed(body.get("messages", [])):
+        if m.get("role") == "user" and isinstance(m.get("content"), str):
+            last_user = m["content"]
+            break
+    return f"[neutral]收到，你说的是「{last_user[:20]}」。我明白了，我们继续聊吧。"
+
+
+def make_handler(cache: PrefixCache, args):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *a):
+            if args.verbose:
+                super().log_message(fmt, *a)
+
+        def _send_json(self, code: int, payload: dict):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_sse(self, payload) -> None:
+            line = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            self.wfile.write(f"data: {line}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": args.model, "object": "model"}]})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": {"message": "invalid json"}})
+                return
+
+            prompt = _prompt_text(body)
+            prompt_tokens = len(prompt)
+            hit = cache.lookup_and_store(prompt)
+            miss = prompt_tokens - hit
+            reply = _reply_for(body)
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(reply),
+                "total_tokens": prompt_tokens + len(reply),
+                "prompt_cache_hit_tokens": hit,
+                "prompt_cache_miss_tokens": miss,
+            }
+            if random.random() < args.fail_rate:
+                self._send_json(503, {"error": {"message": "injected failure", "type": "server_error"}})
+                return
+            # 预填充：只有未命中的部分需要计算
+            delay_ms = args.base_ms + miss * args.prefill_us_per_token / 1000.0
+            delay_ms += random.uniform(0.0, args.jitter_ms)
+            if random.random() < args.stall_rate:
+                delay_ms += args.stall_ms
+            time.sleep(delay_ms / 1000.0)
+
+            cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            created = int(time.time())
+            model = body.get("model") or args.model
+            if not body.get("stream"):
+                self._send_json(200, {
+                    "id": cid,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def chunk(delta, finish=None):
+                return {
+                    "id": cid,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }
+
+            try:
+                self._send_sse(chunk({"role": "assistant", "content": ""}))
+                for i in range(0, len(reply), 2):
+                    if i:
+                        time.sleep(args.token_ms / 1000.0)
+                    self._send_sse(chunk({"content": reply[i:i + 2]}))
+                self._send_sse(chunk({}, "stop"))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._send_sse({
+                        "id": cid,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [],
+                        "usage": usage,
+                    })
+                self._send_sse("[DONE]")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+            print(f"prompt={prompt_tokens} hit={hit} miss={miss} ({hit / max(1, prompt_tokens):.0%})")
+
+    return Handler
+
+
+def main():
+    p = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务（模拟前缀缓存与首 token 延迟）")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8001)
+    p.add_argument("--model", default="mock-chat")
+    p.add_argument("--base-ms", type=float, default=150.0, help="首 token 基础延迟（毫秒）")
+    p.add_argument("--prefill-us-per-token", type=float, default=200.0, help="每个未命中 token 的预填充耗时（微秒）")
+    p.add_argument("--token-ms", type=float, default=20.0, help="输出 token 间隔（毫秒）")
+    p.add_argument("--block", type=int, default=64, help="前缀缓存块大小（token）")
+    p.add_argument("--jitter-ms", type=float, default=0.0, help="首 token 随机附加延迟上限（毫秒）")
+    p.add_argument("--stall-rate", type=float, default=0.0, help="请求卡顿的概率")
+    p.add_argument("--stall-ms", type=float, default=5000.0, help="卡顿时附加的首 token 延迟（毫秒）")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="请求直接返回 503 的概率")
+    p.add_argument("--verbose", "-v", action="store_true")
+    args = p.parse_args()
+
+    cache = PrefixCache(block_tokens=args.block)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(cache, args))
+    print(f"mock OpenAI server: http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+"""
+离线对话回放（不需要麦克风 / 声卡 / LLM / TTS 模型）
+
+把 WAV 夹具按真实时间灌进 AudioInput → VAD → ASR → 分析 → Agent → 播放 全链路，
+外部依赖用本地替身代替：
+  - FakeSoundDevice：假麦克风（按实时节奏回调夹具音频）+ 假扬声器（按实时消耗播放缓冲）
+  - ScriptedAgent：按脚本逐 token 吐出固定回复（可设首 token 延迟 / 吐字间隔）
+  - ToneTTS：正弦 + 噪声合成，时长与字数成正比（可设合成实时率）
+  - ScriptedASR：按脚本返回识别结果（--asr real 时使用配置中的真实 ASR）
+
+每轮输出各阶段耗时（core.tracing），用于在纯 CPU 的 CI 机器上
+对流水线开销与调度回归做基准。
+
+用法：
+  python scripts/replay_conversation.py
+  python scripts/replay_conversation.py --script replay.json --out logs/replay
+  python scripts/replay_conversation.py --script replay.json --asr real --analysis
+
+脚本格式（JSON，audio 为相对脚本文件的路径）：
+  {
+    "turns": [
+      {"audio": "fixtures/hello.wav", "text": "你好", "reply": "[joy]你好呀！今天过得怎么样？"},
+      {"text": "讲个笑话", "reply": "好呀。从前有座山，山里有座庙。"}
+    ]
+  }
+  - audio 可省略：按 text 长度生成类语音噪声
+  - text 为 ScriptedASR 的识别结果（--asr real 时可省略）
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+import wave
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+
+SAMPLE_RATE = 16000
+
+DEFAULT_TURNS = [
+    {"text": "你好", "reply": "[joy]你好呀！今天过得怎么样？有什么想聊的吗？"},
+    {"text": "给我讲个笑话吧", "reply": "好呀。从前有座山，山里有座庙，庙里有个老和尚在讲故事。"},
+    {"text": "谢谢你", "reply": "[shy]不客气，能逗你开心就好。"},
+]
+
+
+def _ensure_paths():
+    project_root = Path(__file__).parent.parent
+    src_path = project_root / "src"
+    if str(src_path) not in sys.path:
+        sys.path.insert(0, str(src_path))
+    return project_root
+
+
+# ============================================================
+#  音频夹具
+# ============================================================
+
+def load_wav(path: Path, target_sr: int = SAMPLE_RATE):
+    """读取 16-bit PCM WAV 为 float32 单声道，必要时线性插值重采样"""
+    import numpy as np
+
+    with wave.open(str(path), "rb") as wf:
+        sr = wf.getframerate()
+        channels = wf.getnchannels()
+        width = wf.getsampwidth()
+        frames = wf.readframes(wf.getnframes())
+    if width != 2:
+        raise ValueError(f"仅支持 16-bit PCM WAV: {path}")
+    audio = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if sr != target_sr and len(audio):
+        n = int(round(len(audio) * target_sr / float(sr)))
+        audio = np.interp(
+            np.linspace(0, len(audio) - 1, n), np.arange(len(audio)), audio
+        ).astype(np.float32)
+    return audio
+
+
+def synth_speech(text: str, sr: int = SAMPLE_RATE, sec_per_char: float = 0.22, seed: int = 0):
+    """按字数生成类语音噪声（音节级幅度包络），足以触发 VAD"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    n_syll = max(2, len(text))
+    syll = int(sr * sec_per_char)
+    t = np.arange(syll) / float(sr)
+    env = np.sin(np.pi * t / (syll / float(sr))) ** 0.5
+    parts = []
+    for _ in range(n_syll):
+        f0 = rng.uniform(140, 260)
+        voiced = np.sin(2 * np.pi * f0 * t) + 0.5 * np.sin(4 * np.pi * f0 * t)
+        parts.append((0.15 * voiced + 0.05 * rng.standard_normal(syll)) * env)
+    return np.concatenate(parts).astype(np.float32)
+
+
+# ============================================================
+#  假 sounddevice
+# ============================================================
+
+class FakeMicrophone:
+    """假麦克风：push 的音频按实时节奏被 InputStream 读出，空闲时输出底噪"""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, noise_level: float = 0.001, seed: int = 0):
+        import numpy as np
+
+        self.sample_rate = sample_rate
+        self.noise_level = noise_level
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._pending: deque = deque()
+        self._offset = 0
+
+    def push(self, audio):
+        with self._lock:
+            self._pending.append(audio)
+
+    @property
+    def idle(self) -> bool:
+        with self._lock:
+            return not self._pending
+
+    def read(self, frames: int):
+        import numpy as np
+
+        out = (self.noise_level * self._rng.standard_normal(frames)).astype(np.float32)
+        pos = 0
+        with self._lock:
+            while pos < frames and self._pending:
+                cur = self._pending[0]
+                n = min(frames - pos, len(cur) - self._offset)
+                out[pos:pos + n] += cur[self._offset:self._offset + n]
+                pos += n
+                self._offset += n
+                if self._offset >= len(cur):
+                    self._pending.popleft()
+                    self._offset = 0
+        return out
+
+
+class _FakeStream:
+    """按实时节奏调用回调的假音频流（InputStream / OutputStream 共用）"""
+
+    def __init__(self, samplerate, channels=1, blocksize=0, callback=None, name="FakeStream"):
+        self.samplerate = int(samplerate)
+        self.channels = channels
+        self.blocksize = int(blocksize) or self.samplerate // 100
+        self.callback = callback
+        self.latency = 0.0
+        self._name = name
+        self._running = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self._name)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+        t = self._thread
+        if t is not None and t is not threading.current_thread():
+            t.join(timeout=1.0)
+        self._thread = None
+
+    def close(self):
+        self.stop()
+
+    def _run(self):
+        period = self.blocksize / float(self.samplerate)
+        next_t = time.perf_counter()
+        while self._running.is_set():
+            self._tick()
+            next_t += period
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _tick(self):
+        raise NotImplementedError
+
+
+class FakeInputStream(_FakeStream):
+    def __init__(self, mic: FakeMicrophone, samplerate, channels=1, dtype="float32", blocksize=0, callback=None, **_):
+        super().__init__(samplerate, channels, blocksize, callback, name="FakeInputStream")
+        self._mic = mic
+
+    def _tick(self):
+        block = self._mic.read(self.blocksize).reshape(-1, 1)
+        if self.callback:
+            self.callback(block, self.blocksize, None, None)
+
+
+class FakeOutputStream(_FakeStream):
+    def __init__(self, samplerate, channels=1, dtype="float32", blocksize=0, latency=None, callback=None, **_):
+        super().__init__(samplerate, channels, blocksize, callback, name="FakeOutputStream")
+        import numpy as np
+        self._block = np.zeros((self.blocksize, self.channels), dtype=np.float32)
+        self.frames_played = 0
+
+    def _tick(self):
+        if self.callback:
+            self.callback(self._block, self.blocksize, None, None)
+            self.frames_played += self.blocksize
+
+
+class FakeSoundDevice:
+    """兼容 AudioInput / AudioOutput 所用 sounddevice 接口的假设备"""
+
+    def __init__(self, mic: FakeMicrophone):
+        self.mic = mic
+        self._play_done = threading.Event()
+        self._play_done.set()
+
+    def InputStream(self, **kwargs):
+        return FakeInputStream(self.mic, **kwargs)
+
+    def OutputStream(self, **kwargs):
+        return FakeOutputStream(**kwargs)
+
+    def play(self, audio, samplerate):
+        self._play_done.clear()
+        timer = threading.Timer(len(audio) / float(samplerate), self._play_done.set)
+        timer.daemon = True
+        timer.start()
+
+    def wait(self):
+        self._play_done.wait()
+
+    def stop(self):
+        self._play_done.set()
+
+
+# ============================================================
+#  脚本化 ASR / LLM / TTS
+# ============================================================
+
+class ScriptedASR:
+    """
+    按脚本返回识别结果的 ASR（与 ASRProvider 接口一致）
+
+    流式中间结果按已送入的音频比例给出前缀，模拟 Paraformer 的增量输出。
+    """
+
+    supports_streaming = True
+
+    def __init__(self, chunk_latency_ms: float = 5.0, finalize_latency_ms: float = 30.0):
+        self.chunk_latency = chunk_latency_ms / 1000.0
+        self.finalize_latency = finalize_latency_ms / 1000.0
+        self._text = ""
+        self._speech_samples = 1
+        self._fed = 0
+
+    def expect(self, text: str, speech_samples: int):
+        self._text = text or ""
+        self._speech_samples = max(1, int(speech_samples))
+
+    def get_chunk_stride(self) -> int:
+        return 5760
+
+    def start_stream(self) -> None:
+        self._fed = 0
+
+    def feed_audio(self, chunk) -> str:
+        if self.chunk_latency:
+            time.sleep(self.chunk_latency)
+        self._fed += len(chunk)
+        n = int(len(self._text) * min(1.0, self._fed / float(self._speech_samples)))
+        return self._text[:n]
+
+    def end_stream(self) -> str:
+        if self.finalize_latency:
+            time.sleep(self.finalize_latency)
+        return self._text
+
+    def recognize_audio(self, audio, sample_rate: int = SAMPLE_RATE) -> str:
+        return self._text
+
+
+class ScriptedAgent:
+    """按脚本逐 token 输出固定回复的 Agent（确定性，与 Agent.chat 接口一致）"""
+
+    def __init__(self, replies: List[str], ttft_ms: float = 300.0, token_ms: float = 30.0, token_chars: int = 2):
+        self._replies = deque(replies)
+        self.ttft = ttft_ms / 1000.0
+        self.token_interval = token_ms / 1000.0
+        self.token_chars = max(1, token_chars)
+        self.user_id = "replay_user"
+        # 不使用回复缓存
+        self.response_cache = None
+        self.last_cache_entry = None
+
+    def _next_reply(self) -> str:
+        return self._replies.popleft() if self._replies else "[neutral]嗯。"
+
+    def _stream(self, reply: str, cancel: Optional[threading.Event] = None) -> Iterator[str]:
+        time.sleep(self.ttft)
+        for i in range(0, len(reply), self.token_chars):
+            if i:
+                time.sleep(self.token_interval)
+            if cancel is not None and cancel.is_set():
+                return
+            yield reply[i:i + self.token_chars]
+
+    def chat(
+        self,
+        message: str,
+        stream: bool = False,
+        speculation=None,
+        cancel: Optional[threading.Event] = None,
+        **kwargs,
+    ):
+        """同 Agent.chat：不发起投机回合（speculation 恒为 None），cancel 置位后停止产出"""
+        reply = self._next_reply()
+        if stream:
+            return self._stream(reply, cancel)
+        time.sleep(self.ttft + self.token_interval * (len(reply) // self.token_chars))
+        return reply
+
+    def start_chat(self):
+        pass
+
+    def end_chat(self):
+        pass
+
+    def save_context(self, user_id: str):
+        pass
+
+    def load_context(self, user_id: str):
+        pass
+
+
+class ToneTTS:
+    """正弦 + 噪声 TTS：时长与字数成正比，合成耗时 = 时长 × rtf"""
+
+    SPLIT_RE = re.compile(r"(?<=[。！？!?；;])")
+
+    def __init__(self, sample_rate: int = 22050, chars_per_sec: float = 6.0, rtf: float = 0.1, seed: int = 0):
+        import numpy as np
+
+        self.sample_rate = sample_rate
+        self.chars_per_sec = chars_per_sec
+        self.rtf = rtf
+        self._rng = np.random.default_rng(seed)
+
+    def _synth(self, text: str):
+        import numpy as np
+
+        dur = max(0.2, len(text) / self.chars_per_sec)
+        n = int(dur * self.sample_rate)
+        t = np.arange(n) / float(self.sample_rate)
+        tone = 0.2 * np.sin(2 * np.pi * 220.0 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4.0 * t))
+        audio = (tone + 0.01 * self._rng.standard_normal(n)).astype(np.float32)
+        time.sleep(dur * self.rtf)
+        return audio
+
+    def generate_audio_streaming(self, text: str, use_clone: bool = True, max_workers: int = 2):
+        segments = [s for s in self.SPLIT_RE.split(text) if s.strip()] or [text]
+        total = len(segments)
+        for i, seg in enumerate(segments, start=1):
+            yield self._synth(seg), i, total
+
+
+# ============================================================
+#  回放
+# ============================================================
+
+def load_script(path: Optional[str]) -> List[Dict]:
+    if not path:
+        return [dict(t) for t in DEFAULT_TURNS]
+    p = Path(path)
+    data = json.loads(p.read_text(encoding="utf-8"))
+    turns = data.get("turns", data) if isinstance(data, dict) else data
+    for t in turns:
+        if t.get("audio"):
+            audio = Path(t["audio"])
+            t["audio"] = str(audio if audio.is_absolute() else (p.parent / audio))
+    return turns
+
+
+def run_replay(turns: List[Dict], args) -> List[Dict]:
+    import numpy as np
+
+    from core.conversation_manager import ConversationConfig, ConversationManager, ConversationState
+    from core.tracing import tracer
+
+    mic = FakeMicrophone(SAMPLE_RATE, noise_level=args.noise)
+    device = FakeSoundDevice(mic)
+
+    config = ConversationConfig(
+        sample_rate=SAMPLE_RATE,
+        enable_ser=args.analysis,
+        enable_punc=args.analysis,
+        enable_sv=False,
+        enable_diarization=False,
+        enable_reminder=False,
+        interrupt_on_speak=False,
+        stream_tts=not args.no_stream_tts,
+        gapless_playback=True,
+        trace_export_dir=args.out or None,
+    )
+    manager = ConversationManager(config, audio_backend=device)
+
+    asr = None
+    if args.asr == "scripted":
+        asr = ScriptedASR(args.asr_chunk_ms, args.asr_final_ms)
+        manager._asr = asr
+    manager._tts = ToneTTS(chars_per_sec=args.tts_cps, rtf=args.tts_rtf)
+    manager._agent = ScriptedAgent(
+        [t.get("reply", "") for t in turns], ttft_ms=args.llm_ttft_ms, token_ms=args.llm_token_ms
+    )
+
+    listening = threading.Event()
+    results: List[Dict] = []
+    current: Dict = {}
+
+    def on_state(state):
+        if state == ConversationState.LISTENING:
+            listening.set()
+
+    manager.set_callbacks(
+        on_state_change=on_state,
+        on_user_text=lambda text: current.__setitem__("recognized", text),
+        on_ai_text=lambda text: current.__setitem__("reply", text),
+    )
+
+    tracer.clear()
+    manager.start(blocking=False)
+
+    try:
+        for i, turn in enumerate(turns, start=1):
+            if not listening.wait(timeout=args.turn_timeout):
+                print(f"⚠️ 第 {i} 轮：等待监听状态超时")
+                break
+            listening.clear()
+            # 留出录音开始时 flush 与噪声底噪校准的时间
+            time.sleep(args.lead_sec)
+
+            if turn.get("audio"):
+                speech = load_wav(Path(turn["audio"]))
+            else:
+                speech = synth_speech(turn.get("text", ""), seed=i)
+            if asr is not None:
+                asr.expect(turn.get("text", ""), len(speech))
+
+            current.clear()
+            n_before = len(tracer.turns())
+            t0 = time.perf_counter()
+            mic.push(speech.astype(np.float32))
+
+            # 本轮结束：回到监听状态（上一轮追踪已落盘）
+            if not listening.wait(timeout=args.turn_timeout + len(speech) / SAMPLE_RATE):
+                print(f"⚠️ 第 {i} 轮：回放超时")
+            traced = tracer.turns()[n_before:]
+            results.append({
+                "turn": i,
+                "expected": turn.get("text", ""),
+                "recognized": current.get("recognized", ""),
+                "reply": current.get("reply", ""),
+                "wall_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+                "trace": traced[-1].to_dict() if traced else None,
+            })
+    finally:
+        manager.stop()
+        thread = manager._conversation_thread
+        if thread is not None:
+            thread.join(timeout=5.0)
+
+    return results
+
+
+REPORT_METRICS = ["response_latency", "asr_finalize", "llm_ttft", "tts_first_packet", "playback"]
+
+
+def turn_failures(result: Dict) -> List[str]:
+    """一轮回放的问题列表（空表示完整跑通 ASR → LLM → TTS → 播放）"""
+    problems = []
+    if not result["recognized"]:
+        problems.append("未识别")
+    if not result["reply"]:
+        problems.append("回复为空")
+    metrics = (result["trace"] or {}).get("metrics", {})
+    for name in ("llm_ttft", "playback"):
+        if name not in metrics:
+            problems.append(f"缺少 {name}")
+    return problems
+
+
+def print_report(results: List[Dict]):
+    from core.tracing import tracer
+
+    header = f"{'turn':>4}  " + "  ".join(f"{m:>16}" for m in REPORT_METRICS) + "  text"
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        metrics = (r["trace"] or {}).get("metrics", {})
+        cols = "  ".join(
+            f"{metrics[m]:>16.1f}" if m in metrics else f"{'-':>16}" for m in REPORT_METRICS
+        )
+        print(f"{r['turn']:>4}  {cols}  {r['recognized'] or '(未识别)'}")
+    print("\n" + tracer.format_summary())
+
+
+def main():
+    _ensure_paths()
+
+    p = argparse.ArgumentParser(description="离线对话回放（假声卡 + 脚本化 ASR/LLM/TTS），输出每轮各阶段耗时")
+    p.add_argument("--script", "-s", default="", help="回放脚本 JSON（缺省使用内置示例）")
+    p.add_argument("--out", "-o", default="", help="追踪导出目录（JSON + CSV，可选）")
+    p.add_argument("--json", default="", help="逐轮结果输出 JSON 路径（可选）")
+    p.add_argument("--asr", choices=["scripted", "real"], default="scripted", help="ASR：脚本化或配置中的真实 ASR")
+    p.add_argument("--analysis", action="store_true", help="启用 SER / PUNC 分析（需本地模型）")
+    p.add_argument("--no-stream-tts", action="store_true", help="使用非流水线路径（先生成完整回复再合成）")
+    p.add_argument("--asr-chunk-ms", type=float, default=5.0, help="ScriptedASR 每块处理耗时")
+    p.add_argument("--asr-final-ms", type=float, default=30.0, help="ScriptedASR 收尾耗时")
+    p.add_argument("--llm-ttft-ms", type=float, default=300.0, help="ScriptedAgent 首 token 延迟")
+    p.add_argument("--llm-token-ms", type=float, default=30.0, help="ScriptedAgent token 间隔")
+    p.add_argument("--tts-cps", type=float, default=6.0, help="ToneTTS 语速（字/秒）")
+    p.add_argument("--tts-rtf", type=float, default=0.1, help="ToneTTS 合成实时率")
+    p.add_argument("--noise", type=float, default=0.001, help="假麦克风底噪幅度")
+    p.add_argument("--lead-sec", type=float, default=0.5, help="进入监听后多久开始灌入语音")
+    p.add_argument("--turn-timeout", type=float, default=30.0, help="单轮超时（秒）")
+    args = p.parse_args()
+
+    turns = load_script(args.script)
+    results = run_replay(turns, args)
+    print_report(results)
+
+    if args.json:
+        out = Path(args.json)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\n已写入: {out}")
+
+    # 任一轮未跑通（未识别 / 无回复 / 缺 LLM 或播放耗时）即返回非零，供 CI 发现流水线故障
+    failed = 0
+    for r in results:
+        problems = turn_failures(r)
+        if problems:
+            failed += 1
+            print(f"❌ 第 {r['turn']} 轮: {', '.join(problems)}")
+    return 1 if failed or len(results) < len(turns) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
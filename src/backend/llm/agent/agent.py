@@ -2,21 +2,29 @@
 Agent 核心
 支持工具调用的智能代理
 """
-from typing import Optional, List, Dict, Generator, Any
+from typing import Optional, List, Dict, Generator, AsyncGenerator, Any
+from contextlib import aclosing
+import asyncio
 import logging
 import json
+import queue
+import threading
 import time
 
 from ..api_infer.openai_infer import APIInfer
+from ..api_infer.router import create_llm_client
 from ..api_infer.config import DEEPSEEK_API_KEY, BASE_URL, MODEL
 from ..memory.context_manager import ContextManager
 from ..memory.long_term_memory import LongTermMemoryManager
 from ..memory.knowledge_graph import get_knowledge_graph
 from ..memory.entity_extractor import get_entity_extractor
+from ..memory.bookkeeping_queue import get_bookkeeping_queue
 from ..rag import get_rag_pipeline, RAGConfig
 from ..database.knowledge_dao import get_knowledge_dao
 from .tool_manager import ToolManager
-from ..tools import DateTimeTool, MemoryTool, SummaryTool, BrowserSearchTool, VisionTool, ScreenshotAnalyzeTool, ReminderTool, Live2DMotionTool, ExitAppTool, CameraCaptureTool, TerminalExecuteTool, SkillGeneratorTool
+from .response_cache import SemanticResponseCache, CachedReply, get_response_cache
+from .speculation import SpeculativeTurn, transcripts_match
+from ..tools.summary_tool import SummaryTool
 from ..utils.logging_config import setup_logging, get_logger, log_llm_request, log_llm_response, log_error
 
 try:
@@ -27,11 +35,67 @@ except ImportError:
         def debug(msg): pass
     _log = _Fallback()
 
+try:
+    from core.tracing import tracer as _tracer
+except ImportError:
+    import contextlib
+
+    class _NoTracer:
+        @staticmethod
+        def mark(name): pass
+        @staticmethod
+        def add_span(name, ms): pass
+        @staticmethod
+        def set_meta(key, value): pass
+        @staticmethod
+        def span(name): return contextlib.nullcontext()
+    _tracer = _NoTracer()
+
 # 初始化日志
 setup_logging(level=logging.DEBUG, log_file=True, console=False)
 logger = get_logger("agent")
 
 
+def _cancellable_events(
+    events: Generator[Dict, None, None], cancel: threading.Event, poll_sec: float = 0.05
+) -> Generator[Dict, None, None]:
+    """
+    在后台线程拉取 LLM 事件流并转发；cancel 置位后立即结束，不必等下一个事件到达
+
+    生成器只能在执行它的线程里关闭，由拉取线程自行关闭 events；
+    同一个 cancel 也传给了 infer_stream，它会从外部关闭 HTTP 响应，拉取线程随即从阻塞的读取中返回。
+    """
+    items: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+
+    def pump():
+        try:
+            for event in events:
+                if cancel.is_set() or stop.is_set():
+                    break
+                items.put(event)
+        except Exception as e:
+            items.put(e)
+        finally:
+            events.close()
+            items.put(None)
+
+    threading.Thread(target=pump, name="LLM-Stream", daemon=True).start()
+    try:
+        while not cancel.is_set():
+            try:
+                item = items.get(timeout=poll_sec)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
 class Agent:
     """
     智能代理
@@ -43,6 +107,8 @@ class Agent:
     """
     
     MAX_TOOL_CALLS = 5  # 单次对话最大工具调用次数
+    PROMPT_CACHE_TTL = 300.0  # 系统提示词组件缓存的最长有效期（秒），兜底其它进程的写入
+    SPECULATION_MATCH_RATIO = 0.9  # 投机文本与最终文本（去标点后）相似度不低于此值即沿用投机请求
     
     def __init__(
         self,
@@ -50,13 +116,21 @@ class Agent:
         api_key: str = None,
         base_url: str = None,
         model: str = None,
-        enable_tools: bool = True
+        enable_tools: bool = True,
+        llm: Optional[APIInfer] = None,
+        enable_response_cache: bool = False
     ):
+        """
+        Args:
+            llm: 共用的 LLM 客户端（多会话共享连接池）；None 时按 api_key/base_url/model 新建
+            enable_response_cache: 启用语义回复缓存（重复的短问句直接返回之前的回复）
+        """
         self.user_id = user_id
         self.enable_tools = enable_tools
         
         # LLM 客户端
-        self._llm = APIInfer(
+        # LLM_ROUTE_PROFILES 配置了多个端点时为 LLMRouter（按首 token 延迟选路）
+        self._llm = llm or create_llm_client(
             url=base_url or BASE_URL,
             api_key=api_key or DEEPSEEK_API_KEY,
             model_name=model or MODEL
@@ -64,6 +138,7 @@ class Agent:
         
         # 记忆管理
         self._context_manager = ContextManager(user_id=user_id)
+        self._context_manager.set_summarizer(self._summarize_history)
         self._memory_manager = LongTermMemoryManager(user_id=user_id)
         self._knowledge_dao = get_knowledge_dao()
         
@@ -77,61 +152,85 @@ class Agent:
         # 工具管理
         self._tool_manager = ToolManager()
         self._setup_tools()
+
+        # 系统提示词组件缓存：组件名 → (版本键, 构建时间, 文本)
+        self._prompt_cache: Dict[str, tuple] = {}
+        # 本轮 token 用量（多轮工具调用累加，写入延迟追踪）
+        self._turn_usage: Dict[str, int] = {}
+        # 异步接口的回合锁：同一会话的并发 achat 按顺序执行，历史不会交错
+        self._turn_lock: Optional[asyncio.Lock] = None
+
+        # 语义回复缓存（可选）
+        self._response_cache: Optional[SemanticResponseCache] = get_response_cache() if enable_response_cache else None
+        self._turn_cacheable = False
+        # 本轮回复对应的缓存条目（命中的或新写入的），调用方可据此复用/保存合成好的音频
+        self.last_cache_entry: Optional[CachedReply] = None
+
+        # 投机回合统计（ASR 中间结果提前发起的请求）
+        self._speculation_stats = {"started": 0, "committed": 0, "cancelled": 0, "wasted_tokens": 0}
+
+        # 后台记账队列：知识图谱抽取、会话记忆提取不占用用户回合
+        self._bookkeeping = get_bookkeeping_queue()
+        self._bookkeeping.register_handler("kg_extract", user_id, self._process_kg_batch)
+        self._bookkeeping.register_handler("memory_extract", user_id, self._process_memory_batch)
     
     def _setup_tools(self):
         """初始化工具"""
         if not self.enable_tools:
             return
         
+        # 工具按需加载：启动时只读取元数据/schema，第一次调用时才导入模块并构造实例
+        register = self._tool_manager.register_lazy
+
         # 注册日期时间工具
-        self._tool_manager.register(DateTimeTool())
+        register(".datetime_tool:DateTimeTool")
         
         # 注册记忆工具
-        memory_tool = MemoryTool()
-        memory_tool.set_memory_manager(self._memory_manager)
-        self._tool_manager.register(memory_tool)
+        register(
+            ".memory_tool:MemoryTool",
+            setup=lambda tool: tool.set_memory_manager(self._memory_manager)
+        )
         
         # 注册浏览器搜索工具（自动化浏览器）
         # headless=False 表示显示浏览器窗口，方便观察
         # manual_captcha=True 表示遇到人机验证时等待手动处理（推荐）
         # keep_alive=True 表示操作完成后保持浏览器打开5秒，方便查看结果
         # filter_ads=True 表示自动过滤广告结果
-        self._tool_manager.register(BrowserSearchTool(
+        register(
+            ".browser_search_tool:BrowserSearchTool",
             headless=False, 
             manual_captcha=True, 
             keep_alive=True,
             filter_ads=True
-        ))
+        )
         
         # 注册截图工具
-        from ..tools import ScreenshotTool
-        self._tool_manager.register(ScreenshotTool())
-        self._tool_manager.register(CameraCaptureTool())
+        register(".screenshot_tool:ScreenshotTool")
+        register(".camera_tool:CameraCaptureTool")
         
         # 注册文件操作工具
-        from ..tools import FileWriteTool, FileReadTool
-        self._tool_manager.register(FileWriteTool())
-        self._tool_manager.register(FileReadTool())
+        register(".file_tool:FileWriteTool")
+        register(".file_tool:FileReadTool")
         
         # 注册视觉分析工具
         # 延迟加载，只有调用时才会加载模型
-        self._tool_manager.register(VisionTool())
-        self._tool_manager.register(ScreenshotAnalyzeTool())
+        register(".vision_tool:VisionTool")
+        register(".vision_tool:ScreenshotAnalyzeTool")
         
         # 注册提醒/行程管理工具
-        self._tool_manager.register(ReminderTool())
+        register(".reminder_tool:ReminderTool")
 
         # 注册 Live2D 动作工具（用户说「做个挥手」等时由 Agent 控制角色做动作）
-        self._tool_manager.register(Live2DMotionTool())
+        register(".live2d_motion_tool:Live2DMotionTool")
 
         # 注册退出应用工具（用户告别/要求退出时调用）
-        self._tool_manager.register(ExitAppTool())
+        register(".exit_app_tool:ExitAppTool")
 
         # 注册终端执行工具（允许 Agent 在 cmd 中执行命令）
-        self._tool_manager.register(TerminalExecuteTool())
+        register(".terminal_tool:TerminalExecuteTool")
 
         # 注册技能生成器工具（允许 Agent 创建新工具）
-        self._tool_manager.register(SkillGeneratorTool())
+        register(".skill_generator_tool:SkillGeneratorTool")
 
         # 注册总结工具（内部使用）
         summary_tool = SummaryTool()
@@ -149,98 +248,222 @@ class Agent:
         结束聊天会话
         
         Args:
-            auto_summarize: 是否自动总结并提取记忆
+            auto_summarize: 是否自动总结并提取记忆（后台异步进行，不阻塞退出）
         """
         if auto_summarize:
-            self._auto_extract_memories()
+            self._enqueue_memory_extract()
         
         success = self._context_manager.end_session()
         if success:
             logger.info("Agent 会话结束")
         return success
     
-    def _extract_and_update_kg(self, message: str):
-        """从消息中提取实体关系并更新知识图谱"""
+    def _enqueue_bookkeeping(self, kind: str, payload: Dict, handler):
+        """后台任务入队；队列不可用时退化为临时线程处理，仍不阻塞当前回合"""
+        if self._bookkeeping.enqueue(kind, self.user_id, payload):
+            return
+        threading.Thread(
+            target=self._run_bookkeeping_fallback,
+            args=(handler, payload),
+            name=f"Bookkeeping-{kind}",
+            daemon=True
+        ).start()
+
+    @staticmethod
+    def _run_bookkeeping_fallback(handler, payload: Dict):
         try:
-            # 使用规则提取（快速，不调用 LLM）
-            result = self._entity_extractor.extract(message, use_llm=False)
-            
-            for triple_data in result.get("triples", []):
-                self._knowledge_graph.add_triple(
-                    subject=triple_data["subject"],
-                    relation=triple_data["relation"],
-                    obj=triple_data["object"],
-                    confidence=triple_data.get("confidence", 0.9),
-                    source=self._context_manager.session_id
-                )
+            handler([payload])
         except Exception as e:
-            logger.warning(f"知识图谱提取失败: {e}")
-    
-    def _auto_extract_memories(self):
-        """自动提取记忆"""
-        history = self._context_manager.get_history()
-        if not history or len(history) < 2:
+            logger.warning(f"后台记账处理失败: {e}")
+
+    def _enqueue_kg_extract(self, message: str):
+        """把用户消息交给后台队列做实体关系抽取"""
+        self._enqueue_bookkeeping(
+            "kg_extract",
+            {"message": message, "session_id": self._context_manager.session_id},
+            self._process_kg_batch
+        )
+
+    def _process_kg_batch(self, payloads: List[Dict]):
+        """
+        批量抽取实体关系并更新知识图谱（后台线程）
+
+        按会话合并消息做一次抽取，整批三元组去重后一次写库。
+        """
+        by_session: Dict[Any, List[Dict]] = {}
+        for p in payloads:
+            if p.get("message"):
+                by_session.setdefault(p.get("session_id"), []).append(
+                    {"role": "user", "content": p["message"]}
+                )
+
+        triples = []
+        for session_id, messages in by_session.items():
+            # 使用规则提取（快速，不调用 LLM）
+            result = self._entity_extractor.extract_from_conversation(messages, use_llm=False)
+            for t in result.get("triples", []):
+                triples.append(dict(t, source=session_id))
+
+        if triples:
+            self._knowledge_graph.add_triples(triples)
+
+    def _enqueue_memory_extract(self):
+        """把本次会话的对话快照交给后台队列提取长期记忆"""
+        history = [
+            {"role": m["role"], "content": m.get("content") or ""}
+            for m in self._context_manager.get_history()
+            if m.get("role") in ("user", "assistant")
+        ]
+        if len(history) < 2:
             return
-        
-        try:
-            result = self._summary_tool.execute(
-                messages=history,
+        self._enqueue_bookkeeping(
+            "memory_extract",
+            {"messages": history, "session_id": self._context_manager.session_id},
+            self._process_memory_batch
+        )
+
+    def _process_memory_batch(self, payloads: List[Dict]):
+        """
+        提取会话记忆并写入长期记忆（后台线程）
+
+        每个会话一次总结调用；任一会话失败时抛出，整批交给队列重试。
+        """
+        summary_tool = getattr(self, "_summary_tool", None)
+        if summary_tool is None:
+            return
+
+        for p in payloads:
+            result = summary_tool.execute(
+                messages=p.get("messages") or [],
                 extract_memories=True
             )
-            
-            if result.success and result.data:
-                memories = result.data.get("memories", [])
-                for mem in memories:
-                    if mem.get("content") and mem.get("importance", 0) >= 0.5:
-                        self._memory_manager.add_memory(
-                            content=mem["content"],
-                            memory_type=mem.get("type", "fact"),
-                            importance=mem.get("importance", 0.5),
-                            source_session_id=self._context_manager.session_id
-                        )
-                        logger.info(f"自动保存记忆: {mem['content'][:30]}...")
-        except Exception as e:
-            logger.error(f"自动提取记忆失败: {e}")
+            if not result.success:
+                raise RuntimeError(result.error or "总结失败")
+
+            memories = (result.data or {}).get("memories", [])
+            for mem in memories:
+                if mem.get("content") and mem.get("importance", 0) >= 0.5:
+                    self._memory_manager.add_memory(
+                        content=mem["content"],
+                        memory_type=mem.get("type", "fact"),
+                        importance=mem.get("importance", 0.5),
+                        source_session_id=p.get("session_id")
+                    )
+                    logger.info(f"自动保存记忆: {mem['content'][:30]}...")
     
+    def _cached_prompt_part(self, name: str, version: Any, build) -> Optional[str]:
+        """
+        取缓存的提示词组件；版本键变化或超过 TTL 时重建
+
+        版本键须在 build 之前读取：构建期间发生的写入会让下一轮重建，而不是被旧结果掩盖。
+        """
+        now = time.monotonic()
+        entry = self._prompt_cache.get(name)
+        if entry is not None and entry[0] == version and now - entry[1] < self.PROMPT_CACHE_TTL:
+            return entry[2]
+        text = build()
+        self._prompt_cache[name] = (version, now, text)
+        return text
+
+    def invalidate_prompt_cache(self):
+        """清空系统提示词缓存（外部直接改库后调用）"""
+        self._prompt_cache.clear()
+
     def _build_system_prompt(self) -> str:
-        """构建系统提示词"""
+        """
+        构建系统提示词（稳定前缀）
+
+        服务端前缀缓存按字节匹配请求开头，因此这里只放很少变化的部分：
+        角色设定 → 工具/输出说明 → 用户信息。
+        各组件按版本号缓存（DAO 写入时递增），不再每轮查库；
+        重要记忆、知识图谱（后台抽取每轮都可能写入）以及当前时间、RAG 检索结果
+        见 _build_volatile_context，放在对话历史之后，变化时不会让整段历史的前缀缓存失效。
+        """
         parts = []
         
         # 1. 角色设定
-        character = self._knowledge_dao.get_active_character()
-        if character:
-            parts.append(character.get("system_prompt", ""))
+        character_prompt = self._cached_prompt_part(
+            "character", self._knowledge_dao.character_version, self._build_character_prompt
+        )
+        if character_prompt is not None:
+            parts.append(character_prompt)
+
+        # 2. 工具使用说明 + 输出格式（只随工具列表变化）
+        tool_names = tuple(self._tool_manager.list_tools()) if self.enable_tools else ()
+        parts.append(self._cached_prompt_part(
+            "instructions", tool_names, lambda: self._build_instructions_prompt(bool(tool_names))
+        ))
         
-        # 2. 当前时间（即使有工具，也提供基本时间）
+        # 3. 用户信息
+        user_prompt = self._cached_prompt_part(
+            "user_profile", (self._knowledge_dao.profile_version, self.user_id), self._build_user_prompt
+        )
+        if user_prompt:
+            parts.append(user_prompt)
+
+        return "\n".join(parts)
+
+    def _build_volatile_context(self, rag_context: str = "") -> str:
+        """
+        可能每轮变化的上下文（放在对话历史之后）：
+        当前时间（即使有工具，也提供基本时间）→ 重要记忆 → 知识图谱 → RAG 检索结果
+
+        记忆与知识图谱仍按版本号缓存，免去每轮查库。
+        """
         from datetime import datetime
         now = datetime.now()
         weekdays = ['一', '二', '三', '四', '五', '六', '日']
-        parts.append(f"\n当前时间: {now.strftime('%Y年%m月%d日 %H:%M')} 星期{weekdays[now.weekday()]}")
-        
-        # 3. 用户信息
+        content = f"当前时间: {now.strftime('%Y年%m月%d日 %H:%M')} 星期{weekdays[now.weekday()]}"
+
+        # 重要记忆
+        memory_prompt = self._cached_prompt_part(
+            "memories", self._memory_manager.version, self._build_memory_prompt
+        )
+        if memory_prompt:
+            content += f"\n{memory_prompt}"
+
+        # 知识图谱信息
+        kg = self._knowledge_graph
+        kg_prompt = self._cached_prompt_part(
+            "knowledge_graph", (id(kg), kg.version), lambda: kg.to_context_string(max_triples=8)
+        )
+        if kg_prompt:
+            content += f"\n\n{kg_prompt}"
+
+        if rag_context:
+            content += f"\n\n{rag_context}"
+        return content
+
+    def _build_character_prompt(self) -> Optional[str]:
+        character = self._knowledge_dao.get_active_character()
+        if character:
+            return character.get("system_prompt", "")
+        return None
+
+    def _build_user_prompt(self) -> str:
         user_profile = self._knowledge_dao.get_user_profile(self.user_id)
         if user_profile:
             nickname = user_profile.get("nickname", "")
             if nickname and nickname != "用户":
-                parts.append(f"\n用户称呼: 你要称呼用户为「{nickname}」")
+                return f"\n用户称呼: 你要称呼用户为「{nickname}」"
             # 如果是默认的"用户"就不额外追加，避免 AI 把"用户"当名字用
-        
-        # 4. 重要记忆
+        return ""
+
+    def _build_memory_prompt(self) -> str:
         important_memories = self._memory_manager.get_important_memories(
             min_importance=0.7,
             limit=5
         )
         if important_memories:
             memory_texts = [m["content"] for m in important_memories]
-            parts.append(f"\n关于用户的重要信息:\n" + "\n".join(f"- {t}" for t in memory_texts))
-        
-        # 5. 知识图谱信息
-        kg_context = self._knowledge_graph.to_context_string(max_triples=8)
-        if kg_context:
-            parts.append(f"\n{kg_context}")
-        
-        # 6. 工具使用说明（如果启用）
-        if self.enable_tools and self._tool_manager.list_tools():
+            return f"\n关于用户的重要信息:\n" + "\n".join(f"- {t}" for t in memory_texts)
+        return ""
+
+    @staticmethod
+    def _build_instructions_prompt(with_tools: bool) -> str:
+        parts = []
+        # 工具使用说明（如果启用）
+        if with_tools:
             parts.append(f"""
 工具使用说明：
 你可以调用工具来获取信息或执行操作。当用户询问实时信息（如日期时间）时，优先使用工具获取准确数据。
@@ -251,7 +474,7 @@ class Agent:
 当用户要求添加新功能、创建自动化工具、扩展技能时，使用 skill_generator 工具生成新工具。
 不要滥用工具，简单的闲聊不需要工具。""")
 
-        # 7. TTS 友好输出（回复会用于语音合成，避免 Markdown/颜文字）
+        # TTS 友好输出（回复会用于语音合成，避免 Markdown/颜文字）
         parts.append("""
 【输出格式】你的回复会直接用于语音合成(TTS)。请勿使用 Markdown（如**粗体**、- 列表）、颜文字、emoji；用自然口语、连贯句子，少换行。列表内容用「第一、第二」或「还有」等口语连接。""")
 
@@ -260,42 +483,292 @@ class Agent:
     def chat(
         self,
         message: str,
-        stream: bool = True
+        stream: bool = True,
+        speculation: Optional[SpeculativeTurn] = None,
+        cancel: Optional[threading.Event] = None
     ) -> Generator[str, None, None]:
         """
         发送消息并获取回复（流式）
         
         支持工具调用的完整流程
+
+        Args:
+            speculation: speculate() 提前发起的投机回合；与 message 匹配时直接接上它的 LLM 流，否则取消
+            cancel: 取消标志（可由其他线程置位，如用户打断）；置位后 LLM 流与工具等待立即中止，
+                生成器随即结束，已生成的部分照常写入历史
+        """
+        self.last_cache_entry = None
+        cached = self._lookup_cached_reply(message)
+        if cached is not None:
+            if speculation is not None:
+                self.cancel_speculation(speculation)
+            self._record_cached_turn(message, cached)
+            yield cached.reply
+            return
+
+        first_events = None
+        if speculation is not None and self._commit_speculation(speculation, message, stream):
+            messages, tools = speculation.messages, speculation.tools
+            first_events = speculation.events()
+        else:
+            messages, tools = self._begin_turn(message)
+        
+        # 调用 LLM
+        full_response = []
+        
+        # 当前轮已产出但尚未计入 full_response 的正文（调用方中途关闭时用于保存）
+        partial: List[str] = []
+        try:
+            yield from self._chat_rounds(messages, tools, stream, full_response, partial, first_events, cancel)
+        except GeneratorExit:
+            # 调用方中途关闭（用户打断）
+            self._save_interrupted(full_response, partial, speculation if first_events is not None else None)
+            raise
+        if cancel is not None and cancel.is_set():
+            self._save_interrupted(full_response, partial, speculation if first_events is not None else None)
+            return
+        
+        # 保存助手回复
+        final_response = "".join(full_response)
+        self._context_manager.add_assistant_message(final_response)
+        self._store_cached_reply(message, messages, final_response)
+
+    def _save_interrupted(
+        self, full_response: List[str], partial: List[str], speculation: Optional[SpeculativeTurn] = None
+    ):
+        """回复被打断：保存已生成的部分，避免历史里只有用户消息"""
+        if speculation is not None:
+            # 投机请求在后台线程里拉流，需要显式断开
+            speculation.cancel()
+        interrupted = "".join(full_response) + "".join(partial)
+        if interrupted:
+            self._context_manager.add_assistant_message(interrupted)
+        logger.info("回复被打断")
+
+    async def achat(
+        self,
+        message: str,
+        stream: bool = True
+    ) -> AsyncGenerator[str, None]:
+        """
+        发送消息并获取回复（异步流式，与 chat 行为一致）
+
+        - LLM 请求走异步客户端，不占用线程；RAG/数据库/工具等阻塞操作放到线程池
+        - 所在任务被取消或调用方 aclose() 时，立即断开进行中的 LLM 请求，已生成部分写入历史
+        - 同一 Agent 上并发的 achat 按顺序执行（每个 Agent 即一个会话）
+        - 不接投机回合（投机请求跑在线程里，见 chat 的 speculation 参数）
         """
+        if self._turn_lock is None:
+            self._turn_lock = asyncio.Lock()
+        async with self._turn_lock:
+            self.last_cache_entry = None
+            cached = await asyncio.to_thread(self._lookup_cached_reply, message)
+            if cached is not None:
+                await asyncio.to_thread(self._record_cached_turn, message, cached)
+                yield cached.reply
+                return
+
+            messages, tools = await asyncio.to_thread(self._begin_turn, message)
+
+            full_response: List[str] = []
+            partial: List[str] = []
+            try:
+                async with aclosing(self._achat_rounds(messages, tools, stream, full_response, partial)) as rounds:
+                    async for text in rounds:
+                        yield text
+            except (GeneratorExit, asyncio.CancelledError):
+                # 用户打断：保存已生成的部分，避免历史里只有用户消息
+                # 写库放到线程里，不阻塞事件循环上的其他会话；shield 保证再次取消时写入照样完成
+                interrupted = "".join(full_response) + "".join(partial)
+                if interrupted:
+                    await asyncio.shield(asyncio.to_thread(self._context_manager.add_assistant_message, interrupted))
+                logger.info("回复被打断")
+                raise
+
+            final_response = "".join(full_response)
+            await asyncio.to_thread(self._context_manager.add_assistant_message, final_response)
+            await asyncio.to_thread(self._store_cached_reply, message, messages, final_response)
+
+    def _begin_turn(self, message: str):
+        """回合准备：写入用户消息、入队知识图谱抽取、构建消息；返回 (messages, tools)"""
         # 确保有活跃会话
         if not self._context_manager.session_id:
             self.start_chat()
         
         # 添加用户消息
         self._context_manager.add_user_message(message)
+        self._turn_usage = {}
         
-        # 从用户消息中提取实体关系并更新知识图谱
-        t0 = time.perf_counter()
-        self._extract_and_update_kg(message)
-        _log.debug(f"[耗时] Agent/KG: {time.perf_counter() - t0:.2f}s")
+        # 从用户消息中提取实体关系并更新知识图谱（入队，后台处理）
+        with _tracer.span("kg_enqueue"):
+            self._enqueue_kg_extract(message)
         
         # 构建消息（含 RAG 检索、系统提示、历史）
         t0 = time.perf_counter()
-        messages = self._build_messages(message)
+        with _tracer.span("build_messages"):
+            messages = self._build_messages(message)
         _log.debug(f"[耗时] Agent/RAG+构建: {time.perf_counter() - t0:.2f}s")
         
         # 获取工具 schema
         tools = self._tool_manager.get_tools_schema() if self.enable_tools else None
         
-        # 调用 LLM
-        full_response = []
-        tool_call_count = 0
-        
         logger.info(f"👤 用户消息: {message[:50]}{'...' if len(message) > 50 else ''}")
-        
+        return messages, tools
+
+    # ---- 投机回合 ----
+
+    def speculate(self, message: str) -> SpeculativeTurn:
+        """
+        用尚未定稿的用户输入（ASR 稳定的中间结果）在后台提前完成 RAG、提示词构建并发出 LLM 请求
+
+        不写历史、不入队知识图谱；最终输入确定后把返回值交给 chat(speculation=...)，
+        或调用 cancel_speculation() 放弃。
+        """
+        self._speculation_stats["started"] += 1
+        return SpeculativeTurn(self, message)
+
+    def cancel_speculation(self, speculation: SpeculativeTurn):
+        """放弃投机回合，计入浪费的 token"""
+        speculation.cancel()
+        self._speculation_stats["cancelled"] += 1
+        self._speculation_stats["wasted_tokens"] += speculation.wasted_tokens()
+
+    def _commit_speculation(self, speculation: SpeculativeTurn, message: str, stream: bool) -> bool:
+        """
+        最终输入与投机输入匹配时接管投机回合（写入用户消息、入队知识图谱），返回 True；
+        不匹配、构建失败或非流式调用时取消投机，返回 False
+        """
+        if not stream or not transcripts_match(speculation.message, message, self.SPECULATION_MATCH_RATIO) \
+                or not speculation.wait_ready():
+            self.cancel_speculation(speculation)
+            _tracer.set_meta("speculation", "miss")
+            return False
+
+        if not self._context_manager.session_id:
+            self.start_chat()
+        # 历史里记最终识别文本；已发出的请求用的是投机文本（二者几乎一致）
+        self._context_manager.add_user_message(message)
+        self._turn_usage = {}
+        with _tracer.span("kg_enqueue"):
+            self._enqueue_kg_extract(message)
+
+        self._speculation_stats["committed"] += 1
+        _tracer.set_meta("speculation", "hit")
+        logger.info(f"👤 用户消息（投机命中）: {message[:50]}{'...' if len(message) > 50 else ''}")
+        return True
+
+    def get_speculation_stats(self) -> Dict[str, float]:
+        """投机回合统计：发起/命中/取消次数、命中率、浪费的 token（无 usage 时为估算值）"""
+        stats = dict(self._speculation_stats)
+        decided = stats["committed"] + stats["cancelled"]
+        stats["hit_rate"] = stats["committed"] / decided if decided else 0.0
+        return stats
+
+    # ---- 语义回复缓存 ----
+
+    @property
+    def response_cache(self) -> Optional[SemanticResponseCache]:
+        return self._response_cache
+
+    def _cache_scope(self) -> str:
+        """缓存作用域：用户 + 角色设定 + 用户称呼 + 工具开关，任一变化都不会命中旧回复"""
+        character = self._cached_prompt_part(
+            "character", self._knowledge_dao.character_version, self._build_character_prompt
+        )
+        user_prompt = self._cached_prompt_part(
+            "user_profile", (self._knowledge_dao.profile_version, self.user_id), self._build_user_prompt
+        )
+        return SemanticResponseCache.make_scope(self.user_id, character, user_prompt, self.enable_tools)
+
+    def _lookup_cached_reply(self, message: str) -> Optional[CachedReply]:
+        """查语义回复缓存；不适合缓存的输入（时间相关、依赖上文等）直接跳过"""
+        self._turn_cacheable = False
+        cache = self._response_cache
+        if cache is None:
+            return None
+        reason = cache.skip_reason(message)
+        if reason:
+            cache.record_skip(reason)
+            return None
+        self._turn_cacheable = True
+        try:
+            with _tracer.span("response_cache"):
+                cached = cache.lookup(message, self._cache_scope())
+        except Exception as e:
+            logger.warning(f"回复缓存查询失败: {e}")
+            return None
+        _tracer.set_meta("response_cache", "hit" if cached else "miss")
+        return cached
+
+    def _record_cached_turn(self, message: str, cached: CachedReply):
+        """命中缓存的回合照常写入历史与知识图谱队列，只是不调用 LLM"""
+        if not self._context_manager.session_id:
+            self.start_chat()
+        self._context_manager.add_user_message(message)
+        self._enqueue_kg_extract(message)
+        self._context_manager.add_assistant_message(cached.reply)
+        self.last_cache_entry = cached
+        logger.info(f"👤 用户消息（缓存回复）: {message[:50]}{'...' if len(message) > 50 else ''}")
+
+    def _store_cached_reply(self, message: str, messages: List[Dict], reply: str):
+        """写入回复缓存；用到工具的回合（结果随时可能变化）不缓存"""
+        if not self._turn_cacheable or not reply:
+            return
+        if any(m.get("role") == "tool" for m in messages):
+            self._response_cache.record_skip("tool_call")
+            return
+        entry_id = self._response_cache.store(message, self._cache_scope(), reply)
+        if entry_id is not None:
+            self.last_cache_entry = CachedReply(entry_id=entry_id, query=message, reply=reply, similarity=1.0)
+
+    def _chat_rounds(
+        self,
+        messages: List[Dict],
+        tools: Optional[List[Dict]],
+        stream: bool,
+        full_response: List[str],
+        partial: List[str],
+        first_events: Optional[Generator[Dict, None, None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> Generator[str, None, None]:
+        """
+        LLM 调用 + 工具调用循环，逐段产出正文；first_events 为第一轮已发起的流（投机回合）
+
+        cancel 置位后直接返回：未完成一轮的正文留在 partial 里，由调用方保存。
+        """
+        tool_call_count = 0
         while tool_call_count < self.MAX_TOOL_CALLS:
+            if cancel is not None and cancel.is_set():
+                return
             log_llm_request(len(messages), tools is not None)
             
+            if stream:
+                # 真流式：正文 token 到达即产出，工具调用分片拼装完整后再执行
+                partial.clear()
+                content, tool_calls = yield from self._stream_round(messages, tools, partial, first_events, cancel)
+                first_events = None
+                if cancel is not None and cancel.is_set():
+                    return
+                partial.clear()
+                if tool_calls:
+                    tool_call_count += 1
+                    log_llm_response(True)
+                    if content:
+                        # 工具调用前的正文已经产出给调用方，计入最终回复
+                        full_response.append(content)
+                    messages.append({
+                        "role": "assistant",
+                        "content": content or "",
+                        "tool_calls": tool_calls,
+                    })
+                    t0 = time.perf_counter()
+                    tool_results = self._tool_manager.execute_tool_calls(tool_calls, cancel=cancel)
+                    _log.debug(f"[耗时] Agent/工具: {time.perf_counter() - t0:.2f}s")
+                    messages.extend(tool_results)
+                    continue
+                full_response.append(content)
+                break
+            
             t0 = time.perf_counter()
             response = self._llm.infer(
                 messages=messages,
@@ -303,6 +776,8 @@ class Agent:
                 tools=tools if self.enable_tools else None
             )
             _log.debug(f"[耗时] Agent/LLM: {time.perf_counter() - t0:.2f}s")
+            _tracer.add_span("llm", (time.perf_counter() - t0) * 1000.0)
+            self._trace_usage(self._llm.parse_usage(getattr(response, "usage", None)))
             
             choice = response.choices[0]
             assistant_message = choice.message
@@ -341,7 +816,7 @@ class Agent:
                     for tc in assistant_message.tool_calls
                 ]
                 t0 = time.perf_counter()
-                tool_results = self._tool_manager.execute_tool_calls(tool_calls_data)
+                tool_results = self._tool_manager.execute_tool_calls(tool_calls_data, cancel=cancel)
                 _log.debug(f"[耗时] Agent/工具: {time.perf_counter() - t0:.2f}s")
                 
                 # 添加工具结果
@@ -354,46 +829,220 @@ class Agent:
             content = assistant_message.content or ""
             full_response.append(content)
             
+            yield content
+            break
+    
+    def _stream_round(
+        self,
+        messages: List[Dict],
+        tools: Optional[List[Dict]],
+        parts: List[str],
+        events: Optional[Generator[Dict, None, None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ):
+        """
+        单轮流式 LLM 调用
+
+        正文增量直接 yield 给调用方并追加到 parts；返回 (完整正文, 工具调用列表)。
+        events 不为空时消费已发起的事件流，不再新发请求。
+        流式请求建立失败时回退到非流式请求。
+        cancel 置位时立即返回已收到的部分（卡住的流不会拖住本轮）。
+        """
+        t0 = time.perf_counter()
+        tool_calls: List[Dict] = []
+        first_token = True
+        try:
+            if events is None:
+                events = self._llm.infer_stream(messages=messages, tools=tools, cancel=cancel)
+            if cancel is not None:
+                events = _cancellable_events(events, cancel)
+            for event in events:
+                etype = event.get("type")
+                if etype == "content":
+                    if first_token:
+                        _tracer.mark("llm_first_token")
+                        _log.debug(f"[耗时] Agent/LLM 首 token: {time.perf_counter() - t0:.2f}s")
+                        first_token = False
+                    parts.append(event["content"])
+                    yield event["content"]
+                elif etype == "tool_calls":
+                    tool_calls = event["tool_calls"]
+                elif etype == "usage":
+                    self._trace_usage(event["usage"])
+        except Exception as e:
+            if parts or tool_calls or (cancel is not None and cancel.is_set()):
+                # 已经产出部分内容（或已取消），无法安全重试
+                logger.warning(f"LLM 流式中断: {e}")
+            else:
+                logger.warning(f"LLM 流式请求失败，回退非流式: {e}")
+                response = self._llm.infer(messages=messages, stream=False, tools=tools)
+                self._trace_usage(self._llm.parse_usage(getattr(response, "usage", None)))
+                message = response.choices[0].message
+                tool_calls = self._tool_calls_from_message(message)
+                if message.content:
+                    parts.append(message.content)
+                    yield message.content
+        _log.debug(f"[耗时] Agent/LLM: {time.perf_counter() - t0:.2f}s")
+        _tracer.add_span("llm", (time.perf_counter() - t0) * 1000.0)
+        return "".join(parts), tool_calls
+
+    async def _achat_rounds(
+        self,
+        messages: List[Dict],
+        tools: Optional[List[Dict]],
+        stream: bool,
+        full_response: List[str],
+        partial: List[str],
+    ) -> AsyncGenerator[str, None]:
+        """异步版 _chat_rounds"""
+        tool_call_count = 0
+        while tool_call_count < self.MAX_TOOL_CALLS:
+            log_llm_request(len(messages), tools is not None)
+
+            partial.clear()
+            result: Dict[str, Any] = {}
             if stream:
-                # 模拟流式输出
-                for char in content:
-                    yield char
+                async with aclosing(self._astream_round(messages, tools, partial, result)) as round_:
+                    async for text in round_:
+                        yield text
             else:
+                t0 = time.perf_counter()
+                response = await self._llm.ainfer(messages=messages, tools=tools)
+                _log.debug(f"[耗时] Agent/LLM: {time.perf_counter() - t0:.2f}s")
+                _tracer.add_span("llm", (time.perf_counter() - t0) * 1000.0)
+                self._trace_usage(self._llm.parse_usage(getattr(response, "usage", None)))
+                message = response.choices[0].message
+                result = {
+                    "content": message.content or "",
+                    "tool_calls": self._tool_calls_from_message(message),
+                }
+            partial.clear()
+
+            content = result.get("content", "")
+            tool_calls = result.get("tool_calls") or []
+            if tool_calls:
+                tool_call_count += 1
+                log_llm_response(True)
+                if stream and content:
+                    # 工具调用前的正文已经产出给调用方，计入最终回复
+                    full_response.append(content)
+                messages.append({
+                    "role": "assistant",
+                    "content": content or "",
+                    "tool_calls": tool_calls,
+                })
+                t0 = time.perf_counter()
+                tool_results = await asyncio.to_thread(self._tool_manager.execute_tool_calls, tool_calls)
+                _log.debug(f"[耗时] Agent/工具: {time.perf_counter() - t0:.2f}s")
+                messages.extend(tool_results)
+                continue
+
+            full_response.append(content)
+            if not stream:
                 yield content
-            
             break
-        
-        # 保存助手回复
-        final_response = "".join(full_response)
-        self._context_manager.add_assistant_message(final_response)
-    
+
+    async def _astream_round(
+        self,
+        messages: List[Dict],
+        tools: Optional[List[Dict]],
+        parts: List[str],
+        result: Dict[str, Any],
+    ) -> AsyncGenerator[str, None]:
+        """
+        异步版 _stream_round
+
+        异步生成器不能 return，(完整正文, 工具调用列表) 写入 result["content"] / result["tool_calls"]。
+        """
+        t0 = time.perf_counter()
+        tool_calls: List[Dict] = []
+        first_token = True
+        try:
+            async with aclosing(self._llm.ainfer_stream(messages=messages, tools=tools)) as events:
+                async for event in events:
+                    etype = event.get("type")
+                    if etype == "content":
+                        if first_token:
+                            _tracer.mark("llm_first_token")
+                            _log.debug(f"[耗时] Agent/LLM 首 token: {time.perf_counter() - t0:.2f}s")
+                            first_token = False
+                        parts.append(event["content"])
+                        yield event["content"]
+                    elif etype == "tool_calls":
+                        tool_calls = event["tool_calls"]
+                    elif etype == "usage":
+                        self._trace_usage(event["usage"])
+        except Exception as e:
+            if parts or tool_calls:
+                # 已经产出部分内容，无法安全重试
+                logger.warning(f"LLM 流式中断: {e}")
+            else:
+                logger.warning(f"LLM 流式请求失败，回退非流式: {e}")
+                response = await self._llm.ainfer(messages=messages, tools=tools)
+                self._trace_usage(self._llm.parse_usage(getattr(response, "usage", None)))
+                message = response.choices[0].message
+                tool_calls = self._tool_calls_from_message(message)
+                if message.content:
+                    parts.append(message.content)
+                    yield message.content
+        _log.debug(f"[耗时] Agent/LLM: {time.perf_counter() - t0:.2f}s")
+        _tracer.add_span("llm", (time.perf_counter() - t0) * 1000.0)
+        result["content"] = "".join(parts)
+        result["tool_calls"] = tool_calls
+
+    @staticmethod
+    def _tool_calls_from_message(message) -> List[Dict]:
+        """非流式响应里的 tool_calls 转为 OpenAI 消息格式"""
+        return [
+            {
+                "id": tc.id,
+                "type": "function",
+                "function": {
+                    "name": tc.function.name,
+                    "arguments": tc.function.arguments
+                }
+            }
+            for tc in (getattr(message, "tool_calls", None) or [])
+        ]
+
     def _build_messages(self, user_input: str) -> List[Dict]:
-        """构建发送给 LLM 的消息"""
-        messages = []
-        
-        # System prompt
-        system_content = self._build_system_prompt()
+        """
+        构建发送给 LLM 的消息
+
+        布局：[稳定 system] + [对话历史] + [本轮易变 system] + [当前用户输入]
+        前两段在相邻两轮之间按字节保持一致（历史只追加），可命中服务端前缀缓存；
+        时间、记忆、知识图谱与 RAG 结果放在最后，不会打断前缀。
+        """
+        messages = [{
+            "role": "system",
+            "content": self._build_system_prompt()
+        }]
         
         # RAG 检索上下文
+        rag_context = ""
         try:
-            rag_response = self._rag_pipeline.retrieve_context(user_input)
+            with _tracer.span("rag"):
+                rag_response = self._rag_pipeline.retrieve_context(user_input)
             if rag_response.context:
-                system_content += f"\n\n{rag_response.context}"
+                rag_context = rag_response.context
                 logger.debug(f"RAG 检索: 意图={rag_response.query.intent.value}, "
                            f"结果数={len(rag_response.results)}, "
                            f"耗时={rag_response.total_time_ms:.1f}ms")
         except Exception as e:
             logger.warning(f"RAG 检索失败: {e}")
         
+        # 对话历史（chat() 已先写入本轮用户消息，去掉以免与末尾重复）
+        history = self._context_manager.get_history()
+        if history and history[-1].get("role") == "user" and history[-1].get("content") == user_input:
+            history = history[:-1]
+        messages.extend(history)
+
+        # 本轮易变上下文
         messages.append({
             "role": "system",
-            "content": system_content
+            "content": self._build_volatile_context(rag_context)
         })
         
-        # 对话历史
-        history = self._context_manager.get_history()
-        messages.extend(history)
-        
         # 当前用户输入
         messages.append({
             "role": "user",
@@ -401,6 +1050,22 @@ class Agent:
         })
         
         return messages
+
+    def _trace_usage(self, usage: Optional[Dict[str, int]]):
+        """累加本轮 token 用量（含前缀缓存命中数）并写入延迟追踪"""
+        if not usage:
+            return
+        for k, v in usage.items():
+            self._turn_usage[k] = self._turn_usage.get(k, 0) + v
+            _tracer.set_meta(k, self._turn_usage[k])
+
+    def get_usage_stats(self) -> Dict[str, float]:
+        """LLM 累计 token 用量与前缀缓存命中率"""
+        return self._llm.get_usage_stats()
+
+    def get_response_cache_stats(self) -> Dict:
+        """语义回复缓存的命中/未命中/跳过统计；未启用时为空"""
+        return self._response_cache.get_stats() if self._response_cache else {}
     
     def chat_sync(self, message: str) -> str:
         """同步聊天（非流式）"""
@@ -0,0 +1,356 @@
+"""
+语义回复缓存
+对重复出现的、与上下文无关的短问句（打招呼、"你能做什么"等）直接返回之前的回复，省掉一次 LLM 往返（可选连同合成好的音频）
+
+设计思路：
+1. 作用域：同一角色 + 同一上下文指纹（用户、角色设定、用户称呼、工具开关）内才能命中，
+   角色或设定变化后旧回复自然失效
+2. 两级匹配：先按归一化文本精确匹配；未命中时用 LocalONNXMiniLM 向量做余弦相似度，超过阈值才算命中
+3. 跳过规则：过长的输入、与时间相关的问题（现在几点、今天天气）、依赖上文的问题（"那个呢"、"继续"）
+   不查也不存；用到工具或被打断的回合不存
+4. 持久化到 data/response_cache.db，带 TTL 与条数上限；音频按音色单独存储
+"""
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Tuple
+from pathlib import Path
+import hashlib
+import io
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 默认缓存文件：项目根目录/data/response_cache.db
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parents[4] / "data" / "response_cache.db"
+
+
+@dataclass
+class ResponseCacheConfig:
+    """回复缓存配置"""
+    similarity_threshold: float = 0.92   # 语义命中的最低余弦相似度
+    ttl_sec: float = 7 * 24 * 3600.0     # 条目有效期
+    max_entries: int = 2000              # 条目上限，超出时淘汰最久未命中的
+    max_query_chars: int = 40            # 只缓存短问句
+    path: Optional[str] = None           # 缓存文件，默认 data/response_cache.db
+
+
+@dataclass
+class CachedReply:
+    """命中的缓存条目"""
+    entry_id: int
+    query: str
+    reply: str
+    similarity: float
+
+
+class SemanticResponseCache:
+    """按 (角色, 上下文指纹) 分区的语义回复缓存"""
+
+    # 答案随时间变化的问题
+    TIME_SENSITIVE_PATTERN = re.compile(
+        r"(今天|明天|昨天|后天|前天|今晚|今早|现在|此刻|刚刚|刚才|几点|时间|日期|几号|星期|周几|礼拜|"
+        r"天气|气温|温度|下雨|新闻|最新|最近|今年|去年|明年|提醒|闹钟|"
+        r"\btoday\b|\btomorrow\b|\byesterday\b|\bnow\b|\btime\b|\bdate\b|\bweather\b|\bnews\b|\blatest\b)",
+        re.IGNORECASE
+    )
+    # 依赖上文或用户个人信息的问题
+    CONTEXT_DEPENDENT_PATTERN = re.compile(
+        r"(这个|那个|这些|那些|上面|前面|上一个|继续|接着|然后呢|还有呢|再说一|再来一|重复|它|他|她|"
+        r"记得|记住|我叫|我是谁|我的|"
+        r"\bthis\b|\bthat\b|\bit\b|\bagain\b|\bcontinue\b)",
+        re.IGNORECASE
+    )
+    _NORMALIZE_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+    def __init__(self, config: Optional[ResponseCacheConfig] = None):
+        self.config = config or ResponseCacheConfig()
+        self._path = str(self.config.path or DEFAULT_CACHE_PATH)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 作用域 → (条目 id 列表, 归一化向量矩阵)，写入该作用域时失效
+        self._index: Dict[str, Tuple[List[int], Optional[np.ndarray]]] = {}
+        self._embedder = None
+        self._embedder_failed = False
+        # 最近一次的 (文本, 向量)：未命中后写入同一问句时不必重复计算
+        self._last_embedding: Tuple[Optional[str], Optional[np.ndarray]] = (None, None)
+        self._stats: Dict[str, int] = {
+            "lookups": 0,
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "stores": 0,
+        }
+        self._skipped: Dict[str, int] = {}
+
+    # ==================== 存储 ====================
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """获取 SQLite 连接（跨线程共享，读写都在 self._lock 内）"""
+        if self._conn is None:
+            Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    scope TEXT NOT NULL,
+                    norm_text TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    reply TEXT NOT NULL,
+                    embedding BLOB,
+                    created_at REAL NOT NULL,
+                    last_hit REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_entries_scope_text ON entries (scope, norm_text)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS audio (
+                    entry_id INTEGER NOT NULL,
+                    voice TEXT NOT NULL,
+                    sample_rate INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (entry_id, voice)
+                )
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    # ==================== 规则 ====================
+
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        """去掉空白与标点、转小写，作为精确匹配键"""
+        return cls._NORMALIZE_PATTERN.sub("", text or "").lower()
+
+    @staticmethod
+    def make_scope(*parts) -> str:
+        """由角色与上下文指纹各部分生成作用域键"""
+        h = hashlib.sha1()
+        for part in parts:
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\x00")
+        return h.hexdigest()
+
+    def skip_reason(self, text: str) -> Optional[str]:
+        """不适合缓存的输入返回原因，否则返回 None"""
+        norm = self.normalize(text)
+        if not norm:
+            return "empty"
+        if len(text.strip()) > self.config.max_query_chars:
+            return "too_long"
+        if self.TIME_SENSITIVE_PATTERN.search(text):
+            return "time_sensitive"
+        if self.CONTEXT_DEPENDENT_PATTERN.search(text):
+            return "context_dependent"
+        return None
+
+    def record_skip(self, reason: str):
+        with self._lock:
+            self._skipped[reason] = self._skipped.get(reason, 0) + 1
+
+    # ==================== 向量 ====================
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        """文本向量（单位长度）；embedding 模型不可用时返回 None，只做精确匹配"""
+        if self._embedder_failed:
+            return None
+        if self._last_embedding[0] == text:
+            return self._last_embedding[1]
+        try:
+            if self._embedder is None:
+                from ..database.chroma_client import LocalONNXMiniLM
+                self._embedder = LocalONNXMiniLM(preferred_providers=["CPUExecutionProvider"])
+            vec = np.asarray(self._embedder([text])[0], dtype=np.float32)
+        except Exception as e:
+            self._embedder_failed = True
+            logger.warning(f"回复缓存 embedding 不可用，仅精确匹配: {e}")
+            return None
+        norm = float(np.linalg.norm(vec))
+        vec = vec / norm if norm > 0 else None
+        self._last_embedding = (text, vec)
+        return vec
+
+    def _scope_index(self, scope: str) -> Tuple[List[int], Optional[np.ndarray]]:
+        """作用域内未过期条目的向量矩阵（调用方持有 self._lock）"""
+        index = self._index.get(scope)
+        if index is not None:
+            return index
+        rows = self._get_conn().execute(
+            "SELECT id, embedding FROM entries WHERE scope = ? AND created_at >= ? AND embedding IS NOT NULL",
+            (scope, time.time() - self.config.ttl_sec)
+        ).fetchall()
+        ids = [row[0] for row in rows]
+        matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+        self._index[scope] = (ids, matrix)
+        return ids, matrix
+
+    # ==================== 查询 / 写入 ====================
+
+    def lookup(self, text: str, scope: str) -> Optional[CachedReply]:
+        """查找缓存回复；调用方应先用 skip_reason 过滤"""
+        norm = self.normalize(text)
+        expire_before = time.time() - self.config.ttl_sec
+        with self._lock:
+            self._stats["lookups"] += 1
+            row = self._get_conn().execute(
+                "SELECT id, query, reply FROM entries WHERE scope = ? AND norm_text = ? AND created_at >= ?",
+                (scope, norm, expire_before)
+            ).fetchone()
+        similarity = 1.0
+        exact = row is not None
+        if row is None:
+            vec = self._embed(text)
+            if vec is not None:
+                with self._lock:
+                    ids, matrix = self._scope_index(scope)
+                    if matrix is not None and matrix.shape[1] == vec.shape[0]:
+                        scores = matrix @ vec
+                        best = int(np.argmax(scores))
+                        if scores[best] >= self.config.similarity_threshold:
+                            similarity = float(scores[best])
+                            row = self._get_conn().execute(
+                                "SELECT id, query, reply FROM entries WHERE id = ?", (ids[best],)
+                            ).fetchone()
+
+        with self._lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["exact_hits" if exact else "semantic_hits"] += 1
+            self._get_conn().execute(
+                "UPDATE entries SET hits = hits + 1, last_hit = ? WHERE id = ?", (time.time(), row[0])
+            )
+        logger.info(f"回复缓存命中 ({similarity:.3f}): {text[:20]} → {row[1][:20]}")
+        return CachedReply(entry_id=row[0], query=row[1], reply=row[2], similarity=similarity)
+
+    def store(self, text: str, scope: str, reply: str) -> Optional[int]:
+        """写入回复，返回条目 id；同一作用域内同一问句覆盖旧回复"""
+        if not reply or not reply.strip():
+            return None
+        norm = self.normalize(text)
+        vec = self._embed(text)
+        blob = vec.astype(np.float32).tobytes() if vec is not None else None
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._get_conn()
+                old = conn.execute(
+                    "SELECT id FROM entries WHERE scope = ? AND norm_text = ?", (scope, norm)
+                ).fetchone()
+                if old is not None:
+                    # 回复变了，旧音频作废
+                    conn.execute("DELETE FROM audio WHERE entry_id = ?", (old[0],))
+                    conn.execute("DELETE FROM entries WHERE id = ?", (old[0],))
+                cur = conn.execute(
+                    "INSERT INTO entries (scope, norm_text, query, reply, embedding, created_at, last_hit) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (scope, norm, text, reply, blob, now, now)
+                )
+                entry_id = cur.lastrowid
+                self._evict(conn)
+                self._index.pop(scope, None)
+                self._stats["stores"] += 1
+            return entry_id
+        except Exception as e:
+            logger.warning(f"回复缓存写入失败: {e}")
+            return None
+
+    def _evict(self, conn: sqlite3.Connection):
+        """删除过期条目，并在超出上限时淘汰最久未命中的条目（调用方持有 self._lock）"""
+        expired = [row[0] for row in conn.execute(
+            "SELECT id FROM entries WHERE created_at < ?", (time.time() - self.config.ttl_sec,)
+        ).fetchall()]
+        count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - len(expired)
+        if count > self.config.max_entries:
+            expired += [row[0] for row in conn.execute(
+                "SELECT id FROM entries WHERE created_at >= ? ORDER BY last_hit LIMIT ?",
+                (time.time() - self.config.ttl_sec, count - self.config.max_entries)
+            ).fetchall()]
+        if expired:
+            conn.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in expired])
+            conn.executemany("DELETE FROM audio WHERE entry_id = ?", [(i,) for i in expired])
+            self._index.clear()
+
+    # ==================== 音频 ====================
+
+    def attach_audio(self, entry_id: int, voice: str, sentences: Dict[str, np.ndarray], sample_rate: int):
+        """保存条目按句合成的音频（句子文本 → float32 PCM）"""
+        if not sentences:
+            return
+        buf = io.BytesIO()
+        keys = list(sentences.keys())
+        np.savez(buf, keys=np.array(keys), **{
+            f"a{i}": np.asarray(sentences[k], dtype=np.float32) for i, k in enumerate(keys)
+        })
+        try:
+            with self._lock:
+                self._get_conn().execute(
+                    "INSERT OR REPLACE INTO audio (entry_id, voice, sample_rate, data) VALUES (?, ?, ?, ?)",
+                    (entry_id, voice, int(sample_rate), buf.getvalue())
+                )
+        except Exception as e:
+            logger.warning(f"回复缓存音频写入失败: {e}")
+
+    def get_audio(self, entry_id: int, voice: str) -> Optional[Tuple[Dict[str, np.ndarray], int]]:
+        """取条目的音频，返回 (句子文本 → PCM, 采样率)；没有时返回 None"""
+        try:
+            with self._lock:
+                row = self._get_conn().execute(
+                    "SELECT sample_rate, data FROM audio WHERE entry_id = ? AND voice = ?", (entry_id, voice)
+                ).fetchone()
+            if row is None:
+                return None
+            with np.load(io.BytesIO(row[1])) as data:
+                keys = [str(k) for k in data["keys"]]
+                return {k: data[f"a{i}"] for i, k in enumerate(keys)}, int(row[0])
+        except Exception as e:
+            logger.warning(f"回复缓存音频读取失败: {e}")
+            return None
+
+    # ==================== 统计 ====================
+
+    def get_stats(self) -> Dict:
+        """命中/未命中/跳过次数与命中率"""
+        with self._lock:
+            stats: Dict = dict(self._stats)
+            stats["skipped"] = dict(self._skipped)
+            try:
+                stats["entries"] = self._get_conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            except Exception:
+                stats["entries"] = 0
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats["hit_rate"] = round(hits / stats["lookups"], 4) if stats["lookups"] else 0.0
+        return stats
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM audio")
+            self._index.clear()
+
+
+# 全局实例
+_cache: Optional[SemanticResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(config: Optional[ResponseCacheConfig] = None) -> SemanticResponseCache:
+    """获取回复缓存单例（config 只在首次创建时生效）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticResponseCache(config)
+    return _cache
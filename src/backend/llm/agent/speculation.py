@@ -0,0 +1,105 @@
+"""
+投机回合
+用户还没说完（ASR 中间结果已稳定）时，提前在后台完成 RAG 检索、提示词构建并发出 LLM 请求；
+最终识别结果与投机文本一致（或几乎一致）时直接接上这条流，否则取消
+
+投机期间不写入对话历史、不入队知识图谱抽取，取消后没有任何副作用（除了浪费的 token）。
+"""
+from typing import Optional, List, Dict, Generator
+import difflib
+import json
+import queue
+import re
+import threading
+
+
+class SpeculativeTurn:
+    """一次投机执行：后台构建消息并拉取 LLM 事件流，事件先缓冲，提交后按序交给 chat"""
+
+    def __init__(self, agent, message: str):
+        self.message = message
+        self.messages: Optional[List[Dict]] = None
+        self.tools: Optional[List[Dict]] = None
+        self.error: Optional[BaseException] = None
+        self.generated_chars = 0            # 已收到的正文字符数
+        self.usage: Optional[Dict[str, int]] = None
+        self._agent = agent
+        self._events: "queue.Queue" = queue.Queue()
+        self._cancel = threading.Event()
+        self._ready = threading.Event()     # 消息构建完成（或失败）
+        self._requested = False             # 已发出 LLM 请求
+        self._thread = threading.Thread(target=self._run, name="SpeculativeTurn", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        agent = self._agent
+        try:
+            # 投机时本轮用户消息尚未写入历史，_build_messages 构建出的消息与正式回合一致
+            self.messages = agent._build_messages(self.message)
+            self.tools = agent._tool_manager.get_tools_schema() if agent.enable_tools else None
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
+        if self.error is not None or self._cancel.is_set():
+            self._events.put(None)
+            return
+
+        self._requested = True
+        # cancel() 时直接关闭 HTTP 响应，不等下一个事件到达
+        stream = agent._llm.infer_stream(messages=self.messages, tools=self.tools, cancel=self._cancel)
+        try:
+            for event in stream:
+                if self._cancel.is_set():
+                    break
+                if event.get("type") == "content":
+                    self.generated_chars += len(event["content"])
+                elif event.get("type") == "usage":
+                    self.usage = event["usage"]
+                self._events.put(event)
+        except Exception as e:
+            self._events.put(e)
+        finally:
+            # 在本线程内关闭生成器，释放 HTTP 连接、终止服务端生成
+            stream.close()
+            self._events.put(None)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待消息构建完成；构建失败或超时返回 False"""
+        return self._ready.wait(timeout) and self.error is None
+
+    def events(self) -> Generator[Dict, None, None]:
+        """缓冲的 + 后续到达的 LLM 事件（格式同 infer_stream）；请求失败时抛出原异常"""
+        while True:
+            item = self._events.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def cancel(self):
+        self._cancel.set()
+
+    def wasted_tokens(self) -> int:
+        """取消时已消耗的 token：有 usage 时取实际值，否则按字符数估算（中文约 1 字 1 token）"""
+        if not self._requested:
+            return 0
+        if self.usage:
+            return int(self.usage.get("prompt_tokens", 0)) + int(self.usage.get("completion_tokens", 0))
+        prompt_chars = len(json.dumps(self.messages or [], ensure_ascii=False))
+        return prompt_chars + self.generated_chars
+
+
+_NORMALIZE_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def transcripts_match(speculated: str, final: str, min_ratio: float) -> bool:
+    """忽略标点/空白/大小写后比较；完全一致或相似度不低于 min_ratio 视为匹配"""
+    a = _NORMALIZE_PATTERN.sub("", speculated or "").lower()
+    b = _NORMALIZE_PATTERN.sub("", final or "").lower()
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    return difflib.SequenceMatcher(None, a, b).ratio() >= min_ratio
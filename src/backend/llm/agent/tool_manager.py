@@ -2,15 +2,213 @@
 工具管理器
 管理和注册工具
 """
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+from dataclasses import asdict
+from pathlib import Path
+import importlib
+import importlib.util
 import json
 import logging
+import os
+import threading
+import time
 import traceback
 
-from ..tools.base_tool import BaseTool, ToolResult
+from ..tools.base_tool import BaseTool, ToolParameter, ToolResult
 
 logger = logging.getLogger("tools")
 
+try:
+    from core.tracing import tracer as _tracer
+except ImportError:
+    import contextlib
+
+    class _NoTracer:
+        @staticmethod
+        def span(name): return contextlib.nullcontext()
+    _tracer = _NoTracer()
+
+
+# 相对路径的工具模块（如 ".browser_search_tool:BrowserSearchTool"）以 backend.llm.tools 为基准
+TOOLS_PACKAGE = __name__.rsplit(".", 2)[0] + ".tools"
+# 工具元数据缓存：项目根目录/data/tool_schema_cache.json
+TOOL_SCHEMA_CACHE_PATH = Path(__file__).resolve().parents[4] / "data" / "tool_schema_cache.json"
+
+
+class _ToolMetadataCache:
+    """
+    工具元数据（名称/描述/参数/并发声明/schema）的磁盘缓存
+
+    以模块文件的 mtime + 大小为版本键，文件没改过就不必导入模块即可拿到 schema。
+    """
+
+    def __init__(self, path: Path = TOOL_SCHEMA_CACHE_PATH):
+        self._path = path
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._entries is None:
+            try:
+                with open(self._path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self._path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self._path)
+        except OSError as e:
+            logger.debug(f"写入工具元数据缓存失败: {e}")
+
+    @staticmethod
+    def _stamp(module_name: str) -> Optional[List[int]]:
+        try:
+            spec = importlib.util.find_spec(module_name, TOOLS_PACKAGE)
+            st = os.stat(spec.origin)
+            return [st.st_mtime_ns, st.st_size]
+        except Exception:
+            return None
+
+    @staticmethod
+    def _probe(module_name: str, class_name: str) -> Optional[Dict]:
+        """导入模块读取类上的元数据（不调用构造函数）；元数据依赖实例状态时返回 None"""
+        cls = getattr(importlib.import_module(module_name, TOOLS_PACKAGE), class_name)
+        try:
+            probe = cls.__new__(cls)
+            return {
+                "name": probe.name,
+                "description": probe.description,
+                "parameters": [asdict(p) for p in probe.parameters],
+                "timeout_sec": cls.timeout_sec,
+                "reentrant": cls.reentrant,
+                "side_effects": cls.side_effects,
+                "schema": probe.to_function_schema(),
+            }
+        except Exception as e:
+            logger.debug(f"无法静态读取工具元数据 {class_name}: {e}")
+            return None
+
+    def get(self, target: str) -> Optional[Dict]:
+        module_name, class_name = target.split(":", 1)
+        stamp = self._stamp(module_name)
+        with self._lock:
+            entry = self._load().get(target)
+            if entry is not None and stamp is not None and entry.get("stamp") == stamp:
+                return entry["metadata"]
+            metadata = self._probe(module_name, class_name)
+            if metadata is not None and stamp is not None:
+                self._entries[target] = {"stamp": stamp, "metadata": metadata}
+                self._save()
+            return metadata
+
+
+_metadata_cache = _ToolMetadataCache()
+
+
+class LazyTool(BaseTool):
+    """
+    延迟加载的工具
+
+    注册时只持有元数据与 schema，第一次被调用时才导入模块并构造真正的工具实例。
+    """
+
+    def __init__(
+        self,
+        target: str,
+        metadata: Dict,
+        kwargs: Optional[Dict] = None,
+        setup: Optional[Callable[[BaseTool], None]] = None
+    ):
+        self._target = target
+        self._metadata = metadata
+        self._kwargs = kwargs or {}
+        self._setup = setup
+        self._instance: Optional[BaseTool] = None
+        self._load_lock = threading.Lock()
+        self.timeout_sec = metadata.get("timeout_sec", BaseTool.timeout_sec)
+        self.reentrant = metadata.get("reentrant", BaseTool.reentrant)
+        self.side_effects = metadata.get("side_effects", BaseTool.side_effects)
+
+    @property
+    def name(self) -> str:
+        return self._metadata["name"]
+
+    @property
+    def description(self) -> str:
+        return self._metadata["description"]
+
+    @property
+    def parameters(self) -> List[ToolParameter]:
+        return [ToolParameter(**p) for p in self._metadata["parameters"]]
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def load(self) -> BaseTool:
+        """导入并构造真正的工具实例（只做一次）"""
+        if self._instance is None:
+            with self._load_lock:
+                if self._instance is None:
+                    module_name, class_name = self._target.split(":", 1)
+                    t0 = time.perf_counter()
+                    cls = getattr(importlib.import_module(module_name, TOOLS_PACKAGE), class_name)
+                    tool = cls(**self._kwargs)
+                    if self._setup is not None:
+                        self._setup(tool)
+                    self._instance = tool
+                    logger.info(f"加载工具: {self.name}（{(time.perf_counter() - t0) * 1000:.0f}ms）")
+        return self._instance
+
+    def execute(self, **kwargs) -> ToolResult:
+        return self.load().execute(**kwargs)
+
+    def to_function_schema(self) -> Dict:
+        return self._metadata["schema"]
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "lazy"
+        return f"<Tool: {self.name} ({state})>"
+
+
+class _PendingCall:
+    """一次待执行的工具调用（并行调度用）"""
+
+    def __init__(self, call_id: str, name: str, arguments: Dict, timeout: Optional[float]):
+        self.call_id = call_id
+        self.name = name
+        self.arguments = arguments
+        self.timeout = timeout
+        self.future: Future = Future()
+        self.started = threading.Event()
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._abandoned = False
+
+    def begin(self) -> bool:
+        """工作线程开始执行前调用；已被放弃（排队超时）则返回 False"""
+        with self._lock:
+            if self._abandoned:
+                return False
+            self.started_at = time.monotonic()
+            self.started.set()
+            return True
+
+    def abandon(self) -> bool:
+        """放弃尚未开始的调用；已开始则返回 False"""
+        with self._lock:
+            if self.started.is_set():
+                return False
+            self._abandoned = True
+            return True
+
 
 class ToolManager:
     """
@@ -19,23 +217,72 @@ class ToolManager:
     职责:
     1. 注册和管理工具
     2. 生成工具描述供 LLM 使用
-    3. 执行工具调用
+    3. 执行工具调用（同一批调用并行执行，结果按原顺序返回）
+
+    调度规则（见 BaseTool 的并发声明）:
+    - 普通工具：共享有界线程池并行执行
+    - reentrant=False：每个工具一条单线程通道，调用按顺序串行
+    - side_effects=True：所有副作用工具共用一条单线程通道，按调用顺序串行
+    - 每个调用受 timeout_sec 约束（从开始执行计时，排队同样最多等待 timeout_sec），
+      超时返回错误结果，不阻塞整批
     """
+
+    SIDE_EFFECT_LANE = "__side_effects__"
     
-    def __init__(self):
+    def __init__(self, max_workers: int = 4):
         self._tools: Dict[str, BaseTool] = {}
+        # schema / 描述只在注册变化时重建
+        self._schema_cache: Optional[List[Dict]] = None
+        self._description_cache: Optional[str] = None
+        self.max_workers = max(1, int(max_workers))
+        # 线程池延迟创建
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lanes: Dict[str, ThreadPoolExecutor] = {}
+        self._pool_lock = threading.Lock()
     
     def register(self, tool: BaseTool) -> None:
         """注册工具"""
         self._tools[tool.name] = tool
+        self._invalidate_schema()
         logger.info(f"注册工具: {tool.name}")
+
+    def register_lazy(
+        self,
+        target: str,
+        setup: Optional[Callable[[BaseTool], None]] = None,
+        **kwargs
+    ) -> BaseTool:
+        """
+        延迟注册工具：只读取元数据，第一次调用时才导入模块并构造实例
+        
+        Args:
+            target: "模块:类名"，模块可用相对 backend.llm.tools 的写法，如 ".browser_search_tool:BrowserSearchTool"
+            setup: 实例构造后的配置回调（如注入依赖）
+            **kwargs: 传给工具构造函数的参数
+            
+        Returns:
+            注册的工具（LazyTool；元数据无法静态读取时为立即构造的实例）
+        """
+        metadata = _metadata_cache.get(target)
+        if metadata is None:
+            # 元数据依赖实例状态，只能立即构造
+            tool = LazyTool(target, {}, kwargs, setup).load()
+        else:
+            tool = LazyTool(target, metadata, kwargs, setup)
+        self.register(tool)
+        return tool
     
     def unregister(self, tool_name: str) -> bool:
         """注销工具"""
         if tool_name in self._tools:
             del self._tools[tool_name]
+            self._invalidate_schema()
             return True
         return False
+
+    def _invalidate_schema(self):
+        self._schema_cache = None
+        self._description_cache = None
     
     def get_tool(self, name: str) -> Optional[BaseTool]:
         """获取工具"""
@@ -50,9 +297,11 @@ class ToolManager:
         获取所有工具的 OpenAI Function Calling 格式 schema
         
         Returns:
-            tools schema 列表
+            tools schema 列表（缓存对象，调用方不要修改）
         """
-        return [tool.to_function_schema() for tool in self._tools.values()]
+        if self._schema_cache is None:
+            self._schema_cache = [tool.to_function_schema() for tool in self._tools.values()]
+        return self._schema_cache
     
     def get_tools_description(self) -> str:
         """
@@ -63,6 +312,8 @@ class ToolManager:
         """
         if not self._tools:
             return ""
+        if self._description_cache is not None:
+            return self._description_cache
         
         lines = ["可用工具："]
         for name, tool in self._tools.items():
@@ -74,7 +325,8 @@ class ToolManager:
                     req = "必填" if param.required else "可选"
                     lines.append(f"  - {param.name} ({param.type}, {req}): {param.description}")
         
-        return "\n".join(lines)
+        self._description_cache = "\n".join(lines)
+        return self._description_cache
     
     def execute(self, tool_name: str, **kwargs) -> ToolResult:
         """
@@ -98,7 +350,8 @@ class ToolManager:
         try:
             logger.info(f"🔧 调用工具: {tool_name}")
             logger.info(f"   参数: {json.dumps(kwargs, ensure_ascii=False, default=str)}")
-            result = tool.execute(**kwargs)
+            with _tracer.span(f"tool.{tool_name}"):
+                result = tool.execute(**kwargs)
             if result.success:
                 logger.info(f"   ✅ 成功: {str(result.data)[:100]}")
             else:
@@ -109,36 +362,122 @@ class ToolManager:
             logger.error(f"   堆栈: {traceback.format_exc()}")
             return ToolResult(success=False, error=str(e))
     
-    def execute_tool_calls(self, tool_calls: List[Dict]) -> List[Dict]:
+    def execute_tool_calls(self, tool_calls: List[Dict], cancel: Optional[threading.Event] = None) -> List[Dict]:
         """
         批量执行工具调用（处理 LLM 返回的 tool_calls）
+
+        相互独立的调用并行执行，耗时取最慢的一个而不是总和
         
         Args:
             tool_calls: LLM 返回的工具调用列表
+            cancel: 取消标志（如用户打断）；置位后不再等待，未完成的调用返回取消结果
             
         Returns:
-            工具执行结果列表（用于发回给 LLM）
+            工具执行结果列表（与 tool_calls 顺序一致，用于发回给 LLM）
         """
-        results = []
-        
+        pending = []
         for call in tool_calls:
-            tool_call_id = call.get("id", "")
             function = call.get("function", {})
             name = function.get("name", "")
             
             # 解析参数
             try:
-                arguments = json.loads(function.get("arguments", "{}"))
+                arguments = json.loads(function.get("arguments") or "{}")
             except json.JSONDecodeError:
                 arguments = {}
-            
-            # 执行工具
-            result = self.execute(name, **arguments)
-            
+            if not isinstance(arguments, dict):
+                arguments = {}
+
+            tool = self._tools.get(name)
+            timeout = getattr(tool, "timeout_sec", None) if tool else None
+            pending.append(_PendingCall(call.get("id", ""), name, arguments, timeout))
+
+        for p in pending:
+            self._submit(p)
+
+        results = []
+        for p in pending:
+            result = self._await(p, cancel)
             results.append({
-                "tool_call_id": tool_call_id,
+                "tool_call_id": p.call_id,
                 "role": "tool",
                 "content": result.to_string()
             })
         
         return results
+
+    # ---- 并行调度 ----
+
+    def _lane_for(self, tool: Optional[BaseTool]) -> Optional[str]:
+        """串行通道名；None 表示走共享线程池"""
+        if tool is None:
+            return None
+        if getattr(tool, "side_effects", False):
+            return self.SIDE_EFFECT_LANE
+        if not getattr(tool, "reentrant", True):
+            return tool.name
+        return None
+
+    def _executor_for(self, lane: Optional[str]) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if lane is None:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="Tool"
+                    )
+                return self._pool
+            executor = self._lanes.get(lane)
+            if executor is None:
+                # 单线程：保证顺序，也让绑定线程的资源（浏览器/设备句柄）始终在同一线程使用
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"Tool-{lane}")
+                self._lanes[lane] = executor
+            return executor
+
+    def _submit(self, pending: _PendingCall):
+        executor = self._executor_for(self._lane_for(self._tools.get(pending.name)))
+        executor.submit(self._run_pending, pending)
+
+    def _run_pending(self, pending: _PendingCall):
+        if not pending.begin():
+            return
+        try:
+            pending.future.set_result(self.execute(pending.name, **pending.arguments))
+        except Exception as e:
+            pending.future.set_result(ToolResult(success=False, error=str(e)))
+
+    def _await(self, pending: _PendingCall, cancel: Optional[threading.Event] = None) -> ToolResult:
+        """等待单个调用结果（排队与执行各自受 timeout 约束，cancel 置位即放弃）"""
+        timeout = pending.timeout
+        if not self._wait(pending.started.wait, timeout, cancel) and pending.abandon():
+            if cancel is not None and cancel.is_set():
+                return ToolResult(success=False, error="工具调用已取消")
+            logger.warning(f"   ⏱️ 排队超时: {pending.name}")
+            return ToolResult(success=False, error=f"工具排队超时（{timeout:g}秒）")
+
+        remaining = None
+        if timeout is not None:
+            remaining = max(0.0, timeout - (time.monotonic() - pending.started_at))
+        if not self._wait(lambda t: bool(wait_futures([pending.future], timeout=t).done), remaining, cancel):
+            # 线程无法强制终止：结果丢弃，工具在后台自行结束
+            if cancel is not None and cancel.is_set():
+                logger.info(f"   ⏹️ 已取消: {pending.name}")
+                return ToolResult(success=False, error="工具调用已取消")
+            logger.warning(f"   ⏱️ 执行超时: {pending.name}（>{timeout:g}秒）")
+            return ToolResult(success=False, error=f"工具执行超时（>{timeout:g}秒）")
+        return pending.future.result()
+
+    @staticmethod
+    def _wait(wait: Callable[[Optional[float]], bool], timeout: Optional[float],
+              cancel: Optional[threading.Event]) -> bool:
+        """wait(t) 最多阻塞 t 秒并返回是否就绪；有 cancel 时分片等待，置位后返回 False"""
+        if cancel is None:
+            return wait(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not cancel.is_set():
+            step = 0.1 if deadline is None else min(0.1, max(0.0, deadline - time.monotonic()))
+            if wait(step):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+        return False
+
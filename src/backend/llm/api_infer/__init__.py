@@ -1,5 +1,6 @@
 # API Infer Module
 from .openai_infer import APIInfer
+from .router import LLMRouter, create_llm_client
 from .config import DEEPSEEK_API_KEY, BASE_URL, MODEL
 
-__all__ = ['APIInfer', 'DEEPSEEK_API_KEY', 'BASE_URL', 'MODEL']
+__all__ = ['APIInfer', 'LLMRouter', 'create_llm_client', 'DEEPSEEK_API_KEY', 'BASE_URL', 'MODEL']
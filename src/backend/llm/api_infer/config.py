@@ -9,4 +9,8 @@ DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
 #获取基础URL
 BASE_URL = os.getenv('BASE_URL')
 #获取模型名称
-MODEL = os.getenv('MODEL')
\ No newline at end of file
+MODEL = os.getenv('MODEL')
+#参与延迟路由的配置方案（config/llm_profiles.json 中的方案名，逗号分隔，* 为全部；不设置则只用上面的端点）
+LLM_ROUTE_PROFILES = os.getenv('LLM_ROUTE_PROFILES')
+#对冲请求延迟（毫秒）：首选端点超过该时间仍无输出时向次选端点发出同样的请求；不设置则不对冲
+LLM_HEDGE_DELAY_MS = os.getenv('LLM_HEDGE_DELAY_MS')
@@ -1,22 +1,199 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from .config import DEEPSEEK_API_KEY, BASE_URL, MODEL
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Generator, AsyncGenerator, Callable
+import asyncio
+import logging
 import os
+import socket
+import threading
+
+logger = logging.getLogger("api_infer")
+
+
+def watch_cancel(
+    cancel: threading.Event, done: threading.Event, on_cancel: Callable[[], None], poll_sec: float = 0.1
+):
+    """
+    后台线程等待 cancel：在 done 之前置位则调用一次 on_cancel
+
+    阻塞在 HTTP 读取上的流式生成器无法被其他线程 close()，用它从外部关闭底层响应。
+    """
+    def watch():
+        while not done.is_set():
+            if cancel.wait(poll_sec):
+                if not done.is_set():
+                    try:
+                        on_cancel()
+                    except Exception as e:
+                        logger.debug(f"取消回调失败: {e}")
+                return
+
+    threading.Thread(target=watch, name="LLM-CancelWatch", daemon=True).start()
+
+
+class _StreamAssembler:
+    """把 chunk 流转换为 infer_stream 的事件流（同步/异步流共用）"""
+
+    def __init__(self):
+        # index -> {"id", "type", "function": {"name", "arguments"}}
+        self.pending_calls: Dict[int, Dict] = {}
+        self.finish_reason = None
+        self.usage = None
+
+    def feed(self, chunk) -> List[Dict]:
+        events = []
+        # include_usage 时最后一个 chunk 的 choices 为空，只带 usage
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return events
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if delta is not None:
+            if delta.content:
+                events.append({"type": "content", "content": delta.content})
+
+            for tc in (getattr(delta, "tool_calls", None) or []):
+                idx = tc.index if tc.index is not None else len(self.pending_calls)
+                call = self.pending_calls.setdefault(idx, {
+                    "id": "",
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
+                })
+                if tc.id:
+                    call["id"] = tc.id
+                fn = tc.function
+                if fn is not None:
+                    # name 一般一次给全，arguments 分片到达，均按拼接处理
+                    if fn.name:
+                        call["function"]["name"] += fn.name
+                    if fn.arguments:
+                        call["function"]["arguments"] += fn.arguments
+
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        return events
+
+    def finish(self) -> List[Dict]:
+        events = []
+        if self.pending_calls:
+            events.append({
+                "type": "tool_calls",
+                "tool_calls": [self.pending_calls[i] for i in sorted(self.pending_calls)],
+            })
+        if self.usage is not None:
+            events.append({"type": "usage", "usage": self.usage})
+        events.append({"type": "finish", "finish_reason": self.finish_reason})
+        return events
+
 
 class APIInfer:
     # 单次请求超时（秒），避免 API 无响应时长时间卡住（默认 600s）
     DEFAULT_TIMEOUT = 120.0
+    # 异步客户端连接池：多会话共用长连接，省去每次请求的 TCP/TLS 握手
+    ASYNC_MAX_CONNECTIONS = 100
+    ASYNC_MAX_KEEPALIVE = 20
+    ASYNC_KEEPALIVE_EXPIRY = 60.0
 
-    def __init__(self, url, api_key, model_name, timeout: float = None):
+    def __init__(
+        self, url, api_key, model_name, timeout: float = None, stream_usage: bool = True, max_retries: int = None
+    ):
+        """
+        Args:
+            stream_usage: 流式请求携带 stream_options.include_usage，
+                          以便拿到 token 用量与前缀缓存命中数（服务端不支持时置 False）
+            max_retries: SDK 内部重试次数，None 为 SDK 默认（2 次）；多端点路由时置 0，失败直接切换端点
+        """
         self.url = url
         self.api_key = api_key
         self.model_name = model_name
         self._timeout = timeout if timeout is not None else self.DEFAULT_TIMEOUT
+        self.stream_usage = stream_usage
+        self._client_options = {"timeout": self._timeout}
+        if max_retries is not None:
+            self._client_options["max_retries"] = max_retries
         self.client = OpenAI(
             api_key=self.api_key,
             base_url=self.url,
-            timeout=self._timeout,
+            **self._client_options,
+        )
+        # 异步客户端（首次异步调用时创建，绑定到当时的事件循环）
+        self._async_client: Optional[AsyncOpenAI] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        # token 用量统计（含服务端前缀缓存命中/未命中）
+        self._usage_lock = threading.Lock()
+        self.last_usage: Optional[Dict[str, int]] = None
+        self._usage_totals: Dict[str, int] = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "prompt_cache_hit_tokens": 0,
+            "prompt_cache_miss_tokens": 0,
+        }
+
+    # ---- 用量统计 ----
+
+    @staticmethod
+    def parse_usage(usage) -> Optional[Dict[str, int]]:
+        """
+        统一解析 usage：
+        - DeepSeek：prompt_cache_hit_tokens / prompt_cache_miss_tokens
+        - OpenAI：prompt_tokens_details.cached_tokens
+        """
+        if usage is None:
+            return None
+
+        def _get(obj, key):
+            if obj is None:
+                return None
+            if isinstance(obj, dict):
+                return obj.get(key)
+            return getattr(obj, key, None)
+
+        prompt = int(_get(usage, "prompt_tokens") or 0)
+        completion = int(_get(usage, "completion_tokens") or 0)
+        hit = _get(usage, "prompt_cache_hit_tokens")
+        if hit is None:
+            hit = _get(_get(usage, "prompt_tokens_details"), "cached_tokens")
+        hit = int(hit or 0)
+        miss = _get(usage, "prompt_cache_miss_tokens")
+        miss = int(miss) if miss is not None else max(0, prompt - hit)
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": miss,
+        }
+
+    def _record_usage(self, usage) -> Optional[Dict[str, int]]:
+        parsed = self.parse_usage(usage)
+        if parsed is None:
+            return None
+        with self._usage_lock:
+            self.last_usage = parsed
+            self._usage_totals["requests"] += 1
+            for k, v in parsed.items():
+                self._usage_totals[k] += v
+        logger.debug(
+            f"token 用量: prompt={parsed['prompt_tokens']} "
+            f"(缓存命中 {parsed['prompt_cache_hit_tokens']} / 未命中 {parsed['prompt_cache_miss_tokens']}), "
+            f"completion={parsed['completion_tokens']}"
         )
+        return parsed
+
+    def get_usage_stats(self) -> Dict[str, float]:
+        """累计 token 用量与前缀缓存命中率"""
+        with self._usage_lock:
+            stats: Dict[str, float] = dict(self._usage_totals)
+        cached = stats["prompt_cache_hit_tokens"] + stats["prompt_cache_miss_tokens"]
+        stats["prompt_cache_hit_rate"] = round(stats["prompt_cache_hit_tokens"] / cached, 4) if cached else 0.0
+        return stats
+
+    def reset_usage_stats(self):
+        with self._usage_lock:
+            self.last_usage = None
+            for k in self._usage_totals:
+                self._usage_totals[k] = 0
 
     def infer(
         self,
@@ -54,8 +231,210 @@ class APIInfer:
             kwargs["stream"] = False
         
         response = self.client.chat.completions.create(**kwargs)
+        if not kwargs["stream"]:
+            self._record_usage(getattr(response, "usage", None))
         return response
-    
+
+    def infer_stream(
+        self,
+        messages: List[Dict],
+        temperature: float = 1.0,
+        top_p: float = 1,
+        tools: Optional[List[Dict]] = None,
+        tool_choice: str = "auto",
+        cancel: Optional[threading.Event] = None
+    ) -> Generator[Dict, None, None]:
+        """
+        流式推理（支持工具调用）
+
+        与 infer(stream=True) 不同，带 tools 时也保持流式：
+        正文 token 到达即产出，tool_calls 分片按 index 拼装，流结束后一次性产出。
+        cancel 置位时（可由其他线程）立即关闭 HTTP 响应，终止服务端生成，
+        不必等下一个 chunk 到达；生成器随即结束。
+
+        Yields:
+            {"type": "content", "content": str}        正文增量
+            {"type": "tool_calls", "tool_calls": list} 完整的工具调用（OpenAI 消息格式）
+            {"type": "usage", "usage": dict}           token 用量（含前缀缓存命中数，服务端返回时）
+            {"type": "finish", "finish_reason": str}   流结束
+        """
+        kwargs = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": True,
+            "temperature": temperature,
+            "top_p": top_p,
+        }
+        if tools:
+            kwargs["tools"] = tools
+            kwargs["tool_choice"] = tool_choice
+        if self.stream_usage:
+            kwargs["stream_options"] = {"include_usage": True}
+
+        response = self.client.chat.completions.create(**kwargs)
+        done = threading.Event()
+        if cancel is not None:
+            watch_cancel(cancel, done, lambda: self._abort_response(response))
+        try:
+            for event in self._assemble_stream(response):
+                if cancel is not None and cancel.is_set():
+                    return
+                if event["type"] == "usage":
+                    parsed = self._record_usage(event["usage"])
+                    if parsed is None:
+                        continue
+                    event = {"type": "usage", "usage": parsed}
+                yield event
+        except Exception:
+            if cancel is not None and cancel.is_set():
+                # 响应已被取消关闭，读取中断属预期
+                return
+            raise
+        finally:
+            done.set()
+            # 调用方提前关闭生成器（如用户打断）时释放 HTTP 连接，终止服务端生成
+            self._close_response(response)
+
+    @staticmethod
+    def _close_response(response):
+        close = getattr(response, "close", None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+
+    @classmethod
+    def _abort_response(cls, response):
+        """
+        从其他线程中止流式响应
+
+        close() 不会打断另一个线程里阻塞的 socket 读取，先 shutdown 底层连接，
+        读取线程随即返回（连接不再放回连接池），服务端也会因连接断开停止生成。
+        """
+        http_response = getattr(response, "response", None)
+        extensions = getattr(http_response, "extensions", None) or {}
+        network_stream = extensions.get("network_stream")
+        sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        cls._close_response(response)
+
+    @staticmethod
+    def _assemble_stream(response) -> Generator[Dict, None, None]:
+        """把 chunk 流转换为 infer_stream 的事件流"""
+        assembler = _StreamAssembler()
+        for chunk in response:
+            yield from assembler.feed(chunk)
+        yield from assembler.finish()
+
+    # ---- 异步接口 ----
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """
+        异步客户端（共享 keep-alive 连接池）
+
+        httpx 连接池绑定事件循环：同一循环内所有会话共用一个客户端，换循环时重建。
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            import httpx
+            from openai import DefaultAsyncHttpxClient
+
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.url,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.ASYNC_MAX_CONNECTIONS,
+                        max_keepalive_connections=self.ASYNC_MAX_KEEPALIVE,
+                        keepalive_expiry=self.ASYNC_KEEPALIVE_EXPIRY,
+                    ),
+                ),
+                **self._client_options,
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    async def aclose(self):
+        """关闭异步客户端，释放连接池"""
+        client, self._async_client, self._async_loop = self._async_client, None, None
+        if client is not None:
+            await client.close()
+
+    async def ainfer(
+        self,
+        messages: List[Dict],
+        temperature: float = 1.0,
+        top_p: float = 1,
+        tools: Optional[List[Dict]] = None,
+        tool_choice: str = "auto"
+    ):
+        """异步非流式推理；任务被取消时 httpx 立即断开请求"""
+        kwargs = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": False,
+            "temperature": temperature,
+            "top_p": top_p,
+        }
+        if tools:
+            kwargs["tools"] = tools
+            kwargs["tool_choice"] = tool_choice
+
+        response = await self.async_client.chat.completions.create(**kwargs)
+        self._record_usage(getattr(response, "usage", None))
+        return response
+
+    async def ainfer_stream(
+        self,
+        messages: List[Dict],
+        temperature: float = 1.0,
+        top_p: float = 1,
+        tools: Optional[List[Dict]] = None,
+        tool_choice: str = "auto"
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        异步流式推理，事件格式同 infer_stream
+
+        调用方 aclose() 生成器或所在任务被取消时，立即关闭 HTTP 响应：
+        连接归还/断开，服务端停止生成。
+        """
+        kwargs = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": True,
+            "temperature": temperature,
+            "top_p": top_p,
+        }
+        if tools:
+            kwargs["tools"] = tools
+            kwargs["tool_choice"] = tool_choice
+        if self.stream_usage:
+            kwargs["stream_options"] = {"include_usage": True}
+
+        response = await self.async_client.chat.completions.create(**kwargs)
+        assembler = _StreamAssembler()
+        try:
+            async for chunk in response:
+                for event in assembler.feed(chunk):
+                    yield event
+            for event in assembler.finish():
+                if event["type"] == "usage":
+                    parsed = self._record_usage(event["usage"])
+                    if parsed is None:
+                        continue
+                    event = {"type": "usage", "usage": parsed}
+                yield event
+        finally:
+            try:
+                await response.close()
+            except Exception:
+                pass
 
 
 if __name__ == "__main__":
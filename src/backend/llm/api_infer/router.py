@@ -0,0 +1,508 @@
+"""
+多提供商 LLM 路由
+在 API 页配置的多个 OpenAI 兼容端点之间按首 token 延迟选路，可选对冲请求
+
+设计思路：
+1. 每个端点记录最近 WINDOW 次请求的首 token 延迟（TTFT），取中位数作为得分；
+   尚无样本的端点得分为 0，会被优先尝试一次以获得测量值
+2. 请求失败（首 token 之前）时立即切换到下一个端点，失败的端点进入冷却期（连续失败时冷却时间翻倍）
+3. 对冲：首选端点在 hedge_delay 内没有产出第一个事件时，向次选端点发出同样的请求，
+   先产出事件的一路胜出，另一路立即取消（异步接口关闭 HTTP 连接；同步接口在下一个 chunk 到达时关闭）
+4. 落败一路的已等待时间也计入其 TTFT 样本（真实值只会更大），卡住的端点因此会被降级
+
+接口与 APIInfer 一致（infer / infer_stream / ainfer / ainfer_stream / get_usage_stats），可直接替换。
+
+用法：
+    .env 中设置
+        LLM_ROUTE_PROFILES=*              # 参与路由的方案名（config/llm_profiles.json，逗号分隔，* 为全部）
+        LLM_HEDGE_DELAY_MS=800            # 可选，对冲延迟；不设置则不发对冲请求
+    llm = create_llm_client(BASE_URL, DEEPSEEK_API_KEY, MODEL)
+"""
+from typing import List, Dict, Optional, Generator, AsyncGenerator, Tuple, Union
+from contextlib import aclosing
+from pathlib import Path
+import asyncio
+import json
+import logging
+import queue
+import statistics
+import threading
+import time
+
+from .openai_infer import APIInfer, watch_cancel
+from .config import LLM_ROUTE_PROFILES, LLM_HEDGE_DELAY_MS
+
+logger = logging.getLogger("api_infer")
+
+# API 页保存的配置方案：项目根目录/config/llm_profiles.json
+DEFAULT_PROFILES_PATH = Path(__file__).resolve().parents[4] / "config" / "llm_profiles.json"
+
+
+class _Provider:
+    """单个端点及其延迟/健康统计"""
+
+    def __init__(self, name: str, llm: APIInfer, window: int):
+        self.name = name
+        self.llm = llm
+        self.ttft: List[float] = []
+        self.window = window
+        self.failures = 0              # 连续失败次数
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.hedges = 0                # 作为对冲请求被发出的次数
+        self.hedge_wins = 0            # 作为对冲请求胜出的次数
+
+    def score(self) -> float:
+        """TTFT 中位数（秒）；无样本时为 0，优先探测"""
+        return statistics.median(self.ttft) if self.ttft else 0.0
+
+    def healthy(self, now: float) -> bool:
+        return self.cooldown_until <= now
+
+    def add_ttft(self, seconds: float):
+        self.ttft.append(seconds)
+        if len(self.ttft) > self.window:
+            del self.ttft[0]
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "model": self.llm.model_name,
+            "ttft_p50_ms": round(self.score() * 1000, 1) if self.ttft else None,
+            "samples": len(self.ttft),
+            "requests": self.requests,
+            "failures": self.failures,
+            "healthy": self.healthy(time.monotonic()),
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+class LLMRouter:
+    """按 TTFT 选路的多端点 LLM 客户端（可选对冲请求）"""
+
+    WINDOW = 20                  # TTFT 滑动窗口（请求数）
+    FAILURE_COOLDOWN_SEC = 30.0  # 首次失败后的冷却时间，连续失败翻倍
+    MAX_COOLDOWN_SEC = 300.0
+    ENDPOINT_MAX_RETRIES = 0     # 端点内不重试，失败直接切换到下一个端点
+
+    parse_usage = staticmethod(APIInfer.parse_usage)
+
+    def __init__(
+        self,
+        providers: List[Union[APIInfer, Tuple[str, APIInfer]]],
+        hedge_delay: Optional[float] = None
+    ):
+        """
+        Args:
+            providers: 端点列表（APIInfer 或 (名称, APIInfer)），顺序即无统计数据时的优先级
+            hedge_delay: 对冲延迟（秒）；None 表示不发对冲请求
+        """
+        if not providers:
+            raise ValueError("LLMRouter 至少需要一个端点")
+        self._providers: List[_Provider] = []
+        for item in providers:
+            name, llm = item if isinstance(item, tuple) else (f"{item.model_name}@{item.url}", item)
+            self._providers.append(_Provider(name, llm, self.WINDOW))
+        self.hedge_delay = hedge_delay
+        self._lock = threading.Lock()
+        self._last: Optional[_Provider] = None
+
+    # ---- 与 APIInfer 兼容的属性 ----
+
+    @property
+    def model_name(self) -> str:
+        return self._ranked()[0].llm.model_name
+
+    @property
+    def last_usage(self) -> Optional[Dict[str, int]]:
+        return self._last.llm.last_usage if self._last else None
+
+    def get_usage_stats(self) -> Dict:
+        """各端点累计用量之和，外加每个端点的延迟/健康统计"""
+        totals: Dict[str, float] = {}
+        for p in self._providers:
+            for k, v in p.llm.get_usage_stats().items():
+                if k != "prompt_cache_hit_rate":
+                    totals[k] = totals.get(k, 0) + v
+        cached = totals.get("prompt_cache_hit_tokens", 0) + totals.get("prompt_cache_miss_tokens", 0)
+        totals["prompt_cache_hit_rate"] = round(totals["prompt_cache_hit_tokens"] / cached, 4) if cached else 0.0
+        with self._lock:
+            totals["providers"] = [p.stats() for p in self._providers]
+        return totals
+
+    def reset_usage_stats(self):
+        for p in self._providers:
+            p.llm.reset_usage_stats()
+
+    # ---- 选路与统计 ----
+
+    def _ranked(self) -> List[_Provider]:
+        """健康端点按 TTFT 升序（稳定排序，同分保持配置顺序），冷却中的端点排在最后作兜底"""
+        now = time.monotonic()
+        with self._lock:
+            healthy = sorted((p for p in self._providers if p.healthy(now)), key=lambda p: p.score())
+            cooling = sorted((p for p in self._providers if not p.healthy(now)), key=lambda p: p.cooldown_until)
+        return healthy + cooling
+
+    def _record_first_event(self, p: _Provider, elapsed: float, hedged: bool):
+        with self._lock:
+            p.add_ttft(elapsed)
+            p.failures = 0
+            p.cooldown_until = 0.0
+            if hedged:
+                p.hedge_wins += 1
+        self._last = p
+
+    def _record_loser(self, p: _Provider, elapsed: float):
+        # 落败一路的真实 TTFT 不小于已等待时间，按下界计入
+        with self._lock:
+            p.add_ttft(elapsed)
+
+    def _record_failure(self, p: _Provider, exc: BaseException):
+        with self._lock:
+            p.failures += 1
+            cooldown = min(self.MAX_COOLDOWN_SEC, self.FAILURE_COOLDOWN_SEC * 2 ** (p.failures - 1))
+            p.cooldown_until = time.monotonic() + cooldown
+        logger.warning(f"LLM 端点 {p.name} 请求失败（冷却 {cooldown:.0f}s）: {exc}")
+
+    def _record_success(self, p: _Provider):
+        with self._lock:
+            p.failures = 0
+            p.cooldown_until = 0.0
+        self._last = p
+
+    def _hedge_timeout(self, started: Dict[_Provider, float], candidates: List[_Provider], live: set) -> Optional[float]:
+        """距下一次对冲的等待时间；不需要对冲时返回 None（一直等待）"""
+        if self.hedge_delay is None or len(started) >= len(candidates) or len(live) != 1:
+            return None
+        # 从最近一次发出请求起计时，故障切换后的新请求同样享有完整的等待时间
+        return max(0.0, max(started.values()) + self.hedge_delay - time.monotonic())
+
+    # ---- 非流式：按顺序故障切换 ----
+
+    def infer(
+        self,
+        messages: List[Dict],
+        stream: bool = True,
+        temperature: float = 1.0,
+        top_p: float = 1,
+        tools: Optional[List[Dict]] = None,
+        tool_choice: str = "auto"
+    ):
+        """同 APIInfer.infer；失败时依次尝试下一个端点"""
+        last_error: Optional[BaseException] = None
+        for p in self._ranked():
+            p.requests += 1
+            try:
+                response = p.llm.infer(
+                    messages=messages, stream=stream, temperature=temperature,
+                    top_p=top_p, tools=tools, tool_choice=tool_choice
+                )
+            except Exception as e:
+                self._record_failure(p, e)
+                last_error = e
+                continue
+            self._record_success(p)
+            return response
+        raise last_error
+
+    async def ainfer(
+        self,
+        messages: List[Dict],
+        temperature: float = 1.0,
+        top_p: float = 1,
+        tools: Optional[List[Dict]] = None,
+        tool_choice: str = "auto"
+    ):
+        """同 APIInfer.ainfer；失败时依次尝试下一个端点"""
+        last_error: Optional[BaseException] = None
+        for p in self._ranked():
+            p.requests += 1
+            try:
+                response = await p.llm.ainfer(
+                    messages=messages, temperature=temperature,
+                    top_p=top_p, tools=tools, tool_choice=tool_choice
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._record_failure(p, e)
+                last_error = e
+                continue
+            self._record_success(p)
+            return response
+        raise last_error
+
+    # ---- 流式：选路 + 对冲 + 故障切换 ----
+
+    def infer_stream(
+        self,
+        messages: List[Dict],
+        temperature: float = 1.0,
+        top_p: float = 1,
+        tools: Optional[List[Dict]] = None,
+        tool_choice: str = "auto",
+        cancel: Optional[threading.Event] = None
+    ) -> Generator[Dict, None, None]:
+        """
+        同 APIInfer.infer_stream（事件格式相同）
+
+        每一路请求在独立线程中拉取事件；首个事件到达前可对冲/故障切换，之后只转发胜出一路。
+        每一路带自己的取消标志：落败或整体被 cancel 取消时，该路 HTTP 响应立即关闭。
+        """
+        kwargs = dict(messages=messages, temperature=temperature, top_p=top_p, tools=tools, tool_choice=tool_choice)
+        candidates = self._ranked()
+        events: "queue.Queue[Tuple[Optional[_Provider], str, object]]" = queue.Queue()
+        started: Dict[_Provider, float] = {}
+        cancels: Dict[_Provider, threading.Event] = {}
+        done = threading.Event()
+        if cancel is not None:
+            # 唤醒阻塞在 events.get() 上的本生成器
+            watch_cancel(cancel, done, lambda: events.put((None, "cancel", None)))
+
+        def pump(p: _Provider, cancel: threading.Event):
+            stream = p.llm.infer_stream(**kwargs, cancel=cancel)
+            try:
+                for event in stream:
+                    if cancel.is_set():
+                        return
+                    events.put((p, "event", event))
+                events.put((p, "done", None))
+            except Exception as e:
+                events.put((p, "error", e))
+            finally:
+                # 在本线程内关闭生成器，释放 HTTP 连接
+                stream.close()
+
+        def launch(hedge: bool = False) -> _Provider:
+            p = candidates[len(started)]
+            p.requests += 1
+            if hedge:
+                p.hedges += 1
+                hedged.add(p)
+            started[p] = time.monotonic()
+            cancels[p] = threading.Event()
+            threading.Thread(target=pump, args=(p, cancels[p]), name=f"LLMRoute-{p.name}", daemon=True).start()
+            return p
+
+        winner: Optional[_Provider] = None
+        live = set()
+        hedged = set()
+        try:
+            live.add(launch())
+            while winner is None:
+                try:
+                    p, kind, payload = events.get(timeout=self._hedge_timeout(started, candidates, live))
+                except queue.Empty:
+                    live.add(launch(hedge=True))
+                    continue
+                if kind == "cancel":
+                    return
+                if p not in live:
+                    continue
+                if kind == "error":
+                    live.discard(p)
+                    self._record_failure(p, payload)
+                    if not live:
+                        if len(started) >= len(candidates):
+                            raise payload
+                        live.add(launch())
+                    continue
+                # 首个事件（或空回复直接结束）：该路胜出，取消其余各路
+                winner = p
+                now = time.monotonic()
+                self._record_first_event(p, now - started[p], hedged=p in hedged)
+                for other in live - {p}:
+                    cancels[other].set()
+                    self._record_loser(other, now - started[other])
+                if kind == "done":
+                    return
+                yield payload
+
+            while True:
+                p, kind, payload = events.get()
+                if kind == "cancel":
+                    return
+                if p is not winner:
+                    continue
+                if kind == "event":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    # 已经输出了部分内容，不能再切换端点
+                    self._record_failure(p, payload)
+                    raise payload
+        finally:
+            done.set()
+            for provider_cancel in cancels.values():
+                provider_cancel.set()
+
+    async def ainfer_stream(
+        self,
+        messages: List[Dict],
+        temperature: float = 1.0,
+        top_p: float = 1,
+        tools: Optional[List[Dict]] = None,
+        tool_choice: str = "auto"
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        同 APIInfer.ainfer_stream（事件格式相同）
+
+        每一路请求是一个任务；落败一路的任务被取消，其 HTTP 响应立即关闭。
+        """
+        kwargs = dict(messages=messages, temperature=temperature, top_p=top_p, tools=tools, tool_choice=tool_choice)
+        candidates = self._ranked()
+        events: "asyncio.Queue[Tuple[_Provider, str, object]]" = asyncio.Queue()
+        started: Dict[_Provider, float] = {}
+        tasks: Dict[_Provider, asyncio.Task] = {}
+
+        async def pump(p: _Provider):
+            try:
+                async with aclosing(p.llm.ainfer_stream(**kwargs)) as stream:
+                    async for event in stream:
+                        await events.put((p, "event", event))
+                await events.put((p, "done", None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await events.put((p, "error", e))
+
+        def launch(hedge: bool = False) -> _Provider:
+            p = candidates[len(started)]
+            p.requests += 1
+            if hedge:
+                p.hedges += 1
+                hedged.add(p)
+            started[p] = time.monotonic()
+            tasks[p] = asyncio.create_task(pump(p))
+            return p
+
+        winner: Optional[_Provider] = None
+        live = set()
+        hedged = set()
+        try:
+            live.add(launch())
+            while winner is None:
+                try:
+                    p, kind, payload = await asyncio.wait_for(
+                        events.get(), self._hedge_timeout(started, candidates, live)
+                    )
+                except asyncio.TimeoutError:
+                    live.add(launch(hedge=True))
+                    continue
+                if p not in live:
+                    continue
+                if kind == "error":
+                    live.discard(p)
+                    self._record_failure(p, payload)
+                    if not live:
+                        if len(started) >= len(candidates):
+                            raise payload
+                        live.add(launch())
+                    continue
+                winner = p
+                now = time.monotonic()
+                self._record_first_event(p, now - started[p], hedged=p in hedged)
+                for other in live - {p}:
+                    tasks[other].cancel()
+                    self._record_loser(other, now - started[other])
+                if kind == "done":
+                    return
+                yield payload
+
+            while True:
+                p, kind, payload = await events.get()
+                if p is not winner:
+                    continue
+                if kind == "event":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    self._record_failure(p, payload)
+                    raise payload
+        finally:
+            pending = [t for t in tasks.values() if not t.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def aclose(self):
+        for p in self._providers:
+            await p.llm.aclose()
+
+
+def load_profile_endpoints(
+    names: str, path: Optional[Path] = None, max_retries: Optional[int] = None
+) -> List[Tuple[str, APIInfer]]:
+    """
+    从 API 页的配置方案构建端点
+
+    Args:
+        names: 逗号分隔的方案名，"*" 表示全部
+        path: 配置文件路径，默认 config/llm_profiles.json
+        max_retries: 各端点的 SDK 重试次数（路由时为 0）
+    """
+    path = Path(path or DEFAULT_PROFILES_PATH)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profiles = json.load(f).get("profiles", {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取 LLM 配置方案失败 ({path}): {e}")
+        return []
+
+    wanted = [n.strip() for n in names.split(",") if n.strip()]
+    selected = list(profiles) if "*" in wanted else [n for n in wanted if n in profiles]
+    endpoints = []
+    for name in selected:
+        profile = profiles[name]
+        if not (profile.get("api_base") and profile.get("model")):
+            continue
+        try:
+            timeout = float(profile["timeout"]) if profile.get("timeout") else None
+        except ValueError:
+            timeout = None
+        endpoints.append((name, APIInfer(
+            url=profile["api_base"],
+            api_key=profile.get("api_key", ""),
+            model_name=profile["model"],
+            timeout=timeout,
+            max_retries=max_retries,
+        )))
+    return endpoints
+
+
+def create_llm_client(url, api_key, model_name) -> Union[APIInfer, LLMRouter]:
+    """
+    创建 LLM 客户端
+
+    未配置 LLM_ROUTE_PROFILES 时返回普通 APIInfer；否则以 .env 中的端点为首选，
+    加上所选配置方案中的其它端点，返回 LLMRouter。
+    """
+    if not LLM_ROUTE_PROFILES:
+        return APIInfer(url=url, api_key=api_key, model_name=model_name)
+
+    providers: List[Tuple[str, APIInfer]] = []
+    seen = {(url, model_name)}
+    for name, llm in load_profile_endpoints(LLM_ROUTE_PROFILES, max_retries=LLMRouter.ENDPOINT_MAX_RETRIES):
+        if (llm.url, llm.model_name) in seen:
+            continue
+        seen.add((llm.url, llm.model_name))
+        providers.append((name, llm))
+    if not providers:
+        return APIInfer(url=url, api_key=api_key, model_name=model_name)
+    providers.insert(0, ("default", APIInfer(
+        url=url, api_key=api_key, model_name=model_name, max_retries=LLMRouter.ENDPOINT_MAX_RETRIES
+    )))
+
+    hedge_delay = None
+    if LLM_HEDGE_DELAY_MS:
+        try:
+            hedge_delay = float(LLM_HEDGE_DELAY_MS) / 1000.0
+        except ValueError:
+            logger.warning(f"LLM_HEDGE_DELAY_MS 无效: {LLM_HEDGE_DELAY_MS}")
+    logger.info(f"LLM 路由: {[name for name, _ in providers]}，对冲延迟 {hedge_delay}")
+    return LLMRouter(providers, hedge_delay=hedge_delay)
@@ -5,7 +5,7 @@
 from typing import Optional, List, Dict, Generator, Any
 import logging
 
-from .api_infer.openai_infer import APIInfer
+from .api_infer.router import create_llm_client
 from .api_infer.config import DEEPSEEK_API_KEY, BASE_URL, MODEL
 from .memory.context_manager import ContextManager
 from .memory.long_term_memory import LongTermMemoryManager
@@ -37,7 +37,7 @@ class ChatService:
         self.user_id = user_id
         
         # LLM 客户端
-        self._llm = APIInfer(
+        self._llm = create_llm_client(
             url=base_url or BASE_URL,
             api_key=api_key or DEEPSEEK_API_KEY,
             model_name=model or MODEL
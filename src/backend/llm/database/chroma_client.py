@@ -3,6 +3,11 @@ Chroma 向量数据库客户端
 用于 RAG 检索
 """
 import os
+import re
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 
 # 项目根目录（从 src/backend/llm/database/chroma_client.py 向上4级）
@@ -20,11 +25,19 @@ except Exception:  # 依赖可能因网络/代理无法安装
     chromadb = None
     Settings = None
     ONNXMiniLM_L6_V2 = object
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 元数据中记录文档内容哈希的键（同步时据此判断是否需要重新向量化）
+CONTENT_HASH_KEY = "content_hash"
+
+
+def content_hash(text: str) -> str:
+    """文档内容哈希"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
 
 class LocalONNXMiniLM(ONNXMiniLM_L6_V2):
     """使用本地模型路径的 ONNX Embedding 函数"""
@@ -128,6 +141,162 @@ def get_chroma_client(persist_directory: str = None) -> ChromaClient:
     return _chroma_client
 
 
+class _PendingEmbedding:
+    """一条排队中的查询向量请求"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.vector: Optional[List[float]] = None
+        self.error: Optional[BaseException] = None
+
+
+class QueryEmbeddingService:
+    """
+    查询向量服务
+    
+    1. 按规范化文本（去首尾空白、合并空白、小写；MiniLM 本身不区分大小写）缓存最近的查询向量（LRU）
+    2. 并发请求微批：没有批次在算时，请求线程直接成为 leader 计算；
+       计算期间到达的请求排队，由 leader 在下一批一次算完。相同文本只算一次
+    3. 结果以 query_embeddings 传给 Chroma，避免每个集合各自再算一遍
+    """
+    
+    _WHITESPACE = re.compile(r"\s+")
+    
+    def __init__(
+        self,
+        embedding_function=None,
+        cache_size: int = 256,
+        max_batch: int = 32,
+        batch_window_ms: float = 0.0
+    ):
+        """
+        Args:
+            embedding_function: 向量函数，缺省使用 Chroma 客户端的本地 ONNX MiniLM
+            cache_size: LRU 缓存条数
+            max_batch: 单次计算的最大条数
+            batch_window_ms: leader 开算前额外等待合并的时间（默认不等，只合并计算期间到达的请求）
+        """
+        self._embedding_function = embedding_function
+        self.cache_size = cache_size
+        self.max_batch = max_batch
+        self.batch_window_ms = batch_window_ms
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._inflight: Dict[str, _PendingEmbedding] = {}
+        self._queue: List[str] = []
+        self._leader_active = False
+        self._stats = {"hits": 0, "misses": 0, "batches": 0, "embedded": 0}
+    
+    @property
+    def embedding_function(self):
+        if self._embedding_function is None:
+            self._embedding_function = get_chroma_client().embedding_function
+        return self._embedding_function
+    
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        return cls._WHITESPACE.sub(" ", text or "").strip().lower()
+    
+    def embed(self, text: str) -> List[float]:
+        """获取单条查询向量"""
+        return self.embed_many([text])[0]
+    
+    def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """获取多条查询向量（顺序与输入一致）"""
+        keys = [self.normalize(t) for t in texts]
+        vectors: Dict[str, List[float]] = {}
+        waits: Dict[str, _PendingEmbedding] = {}
+        lead = False
+        
+        with self._lock:
+            for key in keys:
+                if key in vectors or key in waits:
+                    continue
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    vectors[key] = cached
+                    self._stats["hits"] += 1
+                    continue
+                self._stats["misses"] += 1
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = _PendingEmbedding()
+                    self._inflight[key] = pending
+                    self._queue.append(key)
+                waits[key] = pending
+            if self._queue and not self._leader_active:
+                self._leader_active = True
+                lead = True
+        
+        if lead:
+            self._run_batches()
+        for key, pending in waits.items():
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            vectors[key] = pending.vector
+        return [vectors[key] for key in keys]
+    
+    def _run_batches(self):
+        """leader：循环取出排队的请求分批计算，直到队列为空"""
+        if self.batch_window_ms > 0:
+            time.sleep(self.batch_window_ms / 1000)
+        while True:
+            with self._lock:
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+                if not batch:
+                    self._leader_active = False
+                    return
+            
+            error = None
+            vectors = None
+            try:
+                vectors = [
+                    v.tolist() if hasattr(v, "tolist") else list(v)
+                    for v in self.embedding_function(batch)
+                ]
+            except Exception as e:
+                error = e
+            
+            with self._lock:
+                self._stats["batches"] += 1
+                for i, key in enumerate(batch):
+                    pending = self._inflight.pop(key)
+                    if error is not None:
+                        pending.error = error
+                    else:
+                        pending.vector = vectors[i]
+                        self._cache[key] = vectors[i]
+                        self._stats["embedded"] += 1
+                    pending.event.set()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+    
+    def get_statistics(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "cached": len(self._cache)}
+    
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_query_embedding_service: Optional[QueryEmbeddingService] = None
+_query_embedding_lock = threading.Lock()
+
+
+def get_query_embedding_service() -> QueryEmbeddingService:
+    """获取全局查询向量服务"""
+    global _query_embedding_service
+    if _query_embedding_service is None:
+        with _query_embedding_lock:
+            if _query_embedding_service is None:
+                _query_embedding_service = QueryEmbeddingService()
+    return _query_embedding_service
+
+
 class VectorStore:
     """向量存储操作封装"""
     
@@ -161,7 +330,7 @@ class VectorStore:
         add_kwargs = {
             "ids": [doc_id],
             "documents": [text],
-            "metadatas": [metadata or {}]
+            "metadatas": [self._prepare_metadata(text, metadata)]
         }
         
         if embedding:
@@ -174,26 +343,135 @@ class VectorStore:
         doc_ids: List[str],
         texts: List[str],
         metadatas: Optional[List[Dict]] = None,
-        embeddings: Optional[List[List[float]]] = None
+        embeddings: Optional[List[List[float]]] = None,
+        upsert: bool = False
     ):
-        """批量添加文档"""
+        """
+        批量添加文档
+        
+        Args:
+            upsert: 已存在的 ID 覆盖写入（默认 add 会忽略已存在的 ID）
+        """
         add_kwargs = {
             "ids": doc_ids,
             "documents": texts,
-            "metadatas": metadatas or [{} for _ in doc_ids]
+            "metadatas": [
+                self._prepare_metadata(text, meta)
+                for text, meta in zip(texts, metadatas or [None] * len(doc_ids))
+            ]
         }
         
         if embeddings:
             add_kwargs["embeddings"] = embeddings
         
-        self.collection.add(**add_kwargs)
+        if upsert:
+            self.collection.upsert(**add_kwargs)
+        else:
+            self.collection.add(**add_kwargs)
+    
+    @staticmethod
+    def _prepare_metadata(text: str, metadata: Optional[Dict]) -> Dict:
+        """补上内容哈希；Chroma 元数据只支持标量，列表拼成逗号分隔字符串，None 置空"""
+        prepared = {}
+        for key, value in (metadata or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                value = ",".join(str(v) for v in value)
+            elif value is None:
+                value = ""
+            prepared[key] = value
+        prepared[CONTENT_HASH_KEY] = content_hash(text)
+        return prepared
+    
+    def get_content_hashes(self, where: Optional[Dict] = None, page_size: int = 1000) -> Dict[str, str]:
+        """
+        获取集合中（where 范围内）所有文档的内容哈希，只读元数据不读向量
+        
+        旧文档元数据里没有哈希时读取原文计算
+        """
+        hashes: Dict[str, str] = {}
+        missing: List[str] = []
+        offset = 0
+        while True:
+            get_kwargs = {"include": ["metadatas"], "limit": page_size, "offset": offset}
+            if where:
+                get_kwargs["where"] = where
+            page = self.collection.get(**get_kwargs)
+            ids = page.get("ids") or []
+            for doc_id, meta in zip(ids, page.get("metadatas") or [None] * len(ids)):
+                digest = (meta or {}).get(CONTENT_HASH_KEY)
+                if digest:
+                    hashes[doc_id] = digest
+                else:
+                    missing.append(doc_id)
+            if len(ids) < page_size:
+                break
+            offset += page_size
+        
+        for i in range(0, len(missing), page_size):
+            page = self.collection.get(ids=missing[i:i + page_size], include=["documents"])
+            for doc_id, text in zip(page.get("ids") or [], page.get("documents") or []):
+                hashes[doc_id] = content_hash(text or "")
+        return hashes
+    
+    def sync(
+        self,
+        documents: Iterable[Tuple[str, str, Optional[Dict]]],
+        where: Optional[Dict] = None,
+        batch_size: int = 64,
+        delete_missing: bool = True
+    ) -> Dict[str, int]:
+        """
+        按内容哈希把集合同步为给定的 (doc_id, text, metadata)
+        
+        只对新增或内容变化的文档计算向量（add_batch 分批 upsert），内容未变的不动；
+        delete_missing 时删除集合中（where 范围内）已不在 documents 里的文档
+        
+        Returns:
+            {"added", "updated", "unchanged", "deleted"} 计数
+        """
+        existing = self.get_content_hashes(where)
+        stats = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+        seen = set()
+        pending: List[Tuple[str, str, Optional[Dict]]] = []
+        
+        def flush():
+            if pending:
+                self.add_batch(
+                    [doc[0] for doc in pending],
+                    [doc[1] for doc in pending],
+                    [doc[2] for doc in pending],
+                    upsert=True
+                )
+                pending.clear()
+        
+        for doc_id, text, metadata in documents:
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            old = existing.get(doc_id)
+            if old == content_hash(text):
+                stats["unchanged"] += 1
+                continue
+            stats["added" if old is None else "updated"] += 1
+            pending.append((doc_id, text, metadata))
+            if len(pending) >= batch_size:
+                flush()
+        flush()
+        
+        if delete_missing:
+            stale = [doc_id for doc_id in existing if doc_id not in seen]
+            for i in range(0, len(stale), 1000):
+                self.delete(stale[i:i + 1000])
+            stats["deleted"] = len(stale)
+        return stats
     
     def query(
         self,
         query_text: str,
         n_results: int = 5,
         where: Optional[Dict] = None,
-        where_document: Optional[Dict] = None
+        where_document: Optional[Dict] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict:
         """
         查询相似文档
@@ -203,12 +481,15 @@ class VectorStore:
             n_results: 返回数量
             where: 元数据过滤条件
             where_document: 文档内容过滤条件
+            query_embedding: 预计算的查询向量（不提供则经查询向量服务计算，命中缓存时不再计算）
             
         Returns:
             查询结果 {ids, documents, metadatas, distances}
         """
+        if query_embedding is None:
+            query_embedding = get_query_embedding_service().embed(query_text)
         query_kwargs = {
-            "query_texts": [query_text],
+            "query_embeddings": [query_embedding],
             "n_results": n_results
         }
         
@@ -248,7 +529,9 @@ class VectorStore:
         
         if text:
             update_kwargs["documents"] = [text]
-        if metadata:
+            # 内容变了，同步更新哈希（Chroma 的 update 按键合并元数据）
+            update_kwargs["metadatas"] = [self._prepare_metadata(text, metadata)]
+        elif metadata:
             update_kwargs["metadatas"] = [metadata]
         if embedding:
             update_kwargs["embeddings"] = [embedding]
@@ -68,7 +68,8 @@ class ConversationDAO:
         role: str,
         content: str,
         emotion: Optional[str] = None,
-        extra: Optional[Dict] = None
+        extra: Optional[Dict] = None,
+        tokens: Optional[int] = None
     ) -> bool:
         """
         添加消息到会话
@@ -79,6 +80,7 @@ class ConversationDAO:
             content: 消息内容
             emotion: 情感标签 (可选)
             extra: 额外信息 (可选)
+            tokens: 预估 token 数 (可选，写入后历史窗口无需重复计算)
             
         Returns:
             是否成功
@@ -89,6 +91,8 @@ class ConversationDAO:
             "timestamp": datetime.utcnow(),
         }
         
+        if tokens is not None:
+            message["tokens"] = tokens
         if emotion:
             message["emotion"] = emotion
         if extra:
@@ -134,6 +138,49 @@ class ConversationDAO:
         
         return messages
     
+    def set_rolling_summary(
+        self,
+        session_id: str,
+        summary: str,
+        upto: int,
+        expected_upto: Optional[int] = None
+    ) -> bool:
+        """
+        更新会话的滚动摘要
+        
+        Args:
+            session_id: 会话ID
+            summary: 摘要文本（覆盖 messages[:upto]）
+            upto: 已并入摘要的消息数
+            expected_upto: 期望的当前 upto（不一致则放弃更新，避免并发折叠互相覆盖）
+            
+        Returns:
+            是否成功
+        """
+        query: Dict[str, Any] = {"session_id": session_id}
+        if expected_upto is not None:
+            if expected_upto == 0:
+                # 首次折叠：字段尚不存在
+                query["rolling_summary.upto"] = {"$in": [0, None]}
+            else:
+                query["rolling_summary.upto"] = expected_upto
+        
+        result = self.collection.update_one(
+            query,
+            {
+                "$set": {
+                    "rolling_summary": {
+                        "text": summary,
+                        "upto": upto,
+                        "updated_at": datetime.utcnow()
+                    },
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        )
+        
+        return result.modified_count > 0
+    
     def get_active_session(self, user_id: str = "default_user") -> Optional[Dict]:
         """获取用户当前活跃的会话"""
         return self.collection.find_one({
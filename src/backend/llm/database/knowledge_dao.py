@@ -22,12 +22,22 @@ class KnowledgeDAO:
     TYPE_WORLD = "world"              # 世界观
     TYPE_REFERENCE = "reference"      # 参考资料
     TYPE_FAQ = "faq"                  # 常见问答
+
+    # 版本号（进程内所有实例共享）：写库成功后递增，供系统提示词缓存判断是否失效
+    character_version = 0
+    profile_version = 0
     
     def __init__(self):
         self._collection: Optional[Collection] = None
         self._character_collection: Optional[Collection] = None
         self._user_collection: Optional[Collection] = None
     
+    @classmethod
+    def _touch(cls, component: str):
+        """递增组件版本号（component: "character" | "profile"）"""
+        attr = f"{component}_version"
+        setattr(KnowledgeDAO, attr, getattr(KnowledgeDAO, attr) + 1)
+    
     @property
     def collection(self) -> Collection:
         if self._collection is None:
@@ -100,6 +110,7 @@ class KnowledgeDAO:
             {"$set": doc},
             upsert=True
         )
+        self._touch("character")
         
         return doc["character_id"]
     
@@ -118,6 +129,7 @@ class KnowledgeDAO:
             {"name": name},
             {"$set": updates}
         )
+        self._touch("character")
         return result.modified_count > 0
     
     def set_active_character(self, name: str) -> bool:
@@ -132,6 +144,7 @@ class KnowledgeDAO:
             {"name": name},
             {"$set": {"is_active": True}}
         )
+        self._touch("character")
         return result.modified_count > 0
     
     # ==================== 用户档案 ====================
@@ -177,6 +190,7 @@ class KnowledgeDAO:
             {"$set": doc},
             upsert=True
         )
+        self._touch("profile")
         
         return user_id
     
@@ -191,6 +205,7 @@ class KnowledgeDAO:
             {"user_id": user_id},
             {"$set": updates}
         )
+        self._touch("profile")
         return result.modified_count > 0
     
     def increment_user_stats(
@@ -199,7 +214,7 @@ class KnowledgeDAO:
         conversations: int = 0,
         messages: int = 0
     ) -> bool:
-        """增加用户统计"""
+        """增加用户统计（统计不进入提示词，不递增版本号）"""
         result = self.user_collection.update_one(
             {"user_id": user_id},
             {
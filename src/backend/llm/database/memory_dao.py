@@ -21,10 +21,17 @@ class MemoryDAO:
     TYPE_PREFERENCE = "preference"  # 偏好: "用户喜欢被叫主人"
     TYPE_EMOTION = "emotion"     # 情感: "用户今天很开心"
     TYPE_SUMMARY = "summary"     # 摘要: 对话摘要
+
+    # 版本号（进程内所有实例共享）：写库成功后递增，供系统提示词缓存判断是否失效
+    version = 0
     
     def __init__(self):
         self._collection: Optional[Collection] = None
     
+    @classmethod
+    def _touch(cls):
+        MemoryDAO.version += 1
+    
     @property
     def collection(self) -> Collection:
         if self._collection is None:
@@ -86,6 +93,7 @@ class MemoryDAO:
         }
         
         self.collection.insert_one(doc)
+        self._touch()
         return memory_id
     
     def get_memory(self, memory_id: str) -> Optional[Dict]:
@@ -125,6 +133,25 @@ class MemoryDAO:
             .limit(limit)
         )
     
+    def iter_memories_since(
+        self,
+        user_id: str = "default_user",
+        since: Optional[datetime] = None,
+        batch_size: int = 500
+    ):
+        """
+        按 created_at 升序遍历某时间之后（含）的记忆，供索引增量同步
+        
+        Args:
+            user_id: 用户ID
+            since: 起始时间，None 表示全部
+            batch_size: 游标每批拉取数量
+        """
+        query = {"user_id": user_id}
+        if since is not None:
+            query["created_at"] = {"$gte": since}
+        return self.collection.find(query).sort("created_at", 1).batch_size(batch_size)
+    
     def get_important_memories(
         self,
         user_id: str = "default_user",
@@ -188,11 +215,13 @@ class MemoryDAO:
                 }
             }
         )
+        self._touch()
         return result.modified_count > 0
     
     def delete_memory(self, memory_id: str) -> bool:
         """删除记忆"""
         result = self.collection.delete_one({"memory_id": memory_id})
+        self._touch()
         return result.deleted_count > 0
     
     def delete_old_memories(
@@ -212,16 +241,31 @@ class MemoryDAO:
         Returns:
             删除数量
         """
+        result = self.collection.delete_many(self._old_memories_query(user_id, days, max_importance))
+        if result.deleted_count:
+            self._touch()
+        
+        return result.deleted_count
+    
+    def get_old_memory_ids(
+        self,
+        user_id: str = "default_user",
+        days: int = 30,
+        max_importance: float = 0.3
+    ) -> List[str]:
+        """获取 delete_old_memories 将删除的记忆 ID"""
+        query = self._old_memories_query(user_id, days, max_importance)
+        return [doc["memory_id"] for doc in self.collection.find(query, {"memory_id": 1})]
+    
+    @staticmethod
+    def _old_memories_query(user_id: str, days: int, max_importance: float) -> Dict:
         from datetime import timedelta
         cutoff_date = datetime.utcnow() - timedelta(days=days)
-        
-        result = self.collection.delete_many({
+        return {
             "user_id": user_id,
             "created_at": {"$lt": cutoff_date},
             "importance": {"$lte": max_importance}
-        })
-        
-        return result.deleted_count
+        }
 
 
 # 全局实例
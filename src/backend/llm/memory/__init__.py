@@ -4,6 +4,7 @@ from .long_term_memory import LongTermMemoryManager
 from .memory_extractor import MemoryExtractor
 from .knowledge_graph import KnowledgeGraph, Entity, Relation, Triple, get_knowledge_graph
 from .entity_extractor import EntityRelationExtractor, get_entity_extractor
+from .bookkeeping_queue import BookkeepingQueue, get_bookkeeping_queue
 
 __all__ = [
     'ContextManager',
@@ -16,4 +17,6 @@ __all__ = [
     'get_knowledge_graph',
     'EntityRelationExtractor',
     'get_entity_extractor',
+    'BookkeepingQueue',
+    'get_bookkeeping_queue',
 ]
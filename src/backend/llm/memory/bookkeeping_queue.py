@@ -0,0 +1,228 @@
+"""
+后台记账队列
+把知识图谱抽取、会话记忆提取等"记账"工作移出用户回合
+
+设计思路：
+1. 持久化：任务先写入本地 SQLite（data/bookkeeping_queue.db），处理成功后才删除，
+   进程退出/崩溃后重启会继续处理遗留任务
+2. 批处理：工作线程取到任务后等待一个短窗口，把同类任务合并成一批交给处理函数
+   （多条消息一次抽取、多次写库合并为一次 bulk_write）
+3. 处理函数按 (任务类型, user_id) 注册；未注册的任务留在队列中，等对应 Agent 启动后再处理
+4. 失败重试：处理函数抛异常时整批任务 attempts+1，超过上限后丢弃并记录日志
+
+用法：
+    queue = get_bookkeeping_queue()
+    queue.register_handler("kg_extract", user_id, handle_batch)   # handle_batch(payloads: List[Dict])
+    queue.enqueue("kg_extract", user_id, {"message": "...", "session_id": "..."})
+"""
+from typing import Optional, List, Dict, Callable, Tuple
+from pathlib import Path
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 默认队列文件：项目根目录/data/bookkeeping_queue.db
+DEFAULT_QUEUE_PATH = Path(__file__).resolve().parents[4] / "data" / "bookkeeping_queue.db"
+
+
+class BookkeepingQueue:
+    """持久化的后台任务队列（单工作线程）"""
+
+    BATCH_WINDOW_SEC = 2.0   # 取到第一个任务后等待合批的时间
+    MAX_BATCH = 32           # 单批最多任务数
+    MAX_ATTEMPTS = 3         # 单个任务最多尝试次数
+    RETRY_DELAY_SEC = 10.0   # 失败后重新处理前的等待时间
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = str(path or DEFAULT_QUEUE_PATH)
+        self._handlers: Dict[Tuple[str, str], Callable[[List[Dict]], None]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread: Optional[threading.Thread] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # ==================== 存储 ====================
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """获取 SQLite 连接（跨线程共享，读写都在 self._lock 内）"""
+        if self._conn is None:
+            Path(self._path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_kind_user ON jobs (kind, user_id, id)")
+            self._conn = conn
+        return self._conn
+
+    def enqueue(self, kind: str, user_id: str, payload: Dict) -> bool:
+        """
+        入队（只做一次本地写入，不阻塞在数据库/LLM 上）
+
+        Returns:
+            是否入队成功；失败时调用方可自行决定是否同步处理
+        """
+        try:
+            data = json.dumps(payload, ensure_ascii=False, default=str)
+            with self._lock:
+                self._get_conn().execute(
+                    "INSERT INTO jobs (kind, user_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (kind, user_id, data, time.time())
+                )
+                self._idle.clear()
+            self._wakeup.set()
+            return True
+        except Exception as e:
+            logger.warning(f"后台任务入队失败: {e}")
+            return False
+
+    def pending_count(self) -> int:
+        """队列中剩余任务数"""
+        try:
+            with self._lock:
+                row = self._get_conn().execute("SELECT COUNT(*) FROM jobs").fetchone()
+            return int(row[0])
+        except Exception:
+            return 0
+
+    def _next_batch(self) -> Tuple[Optional[Tuple[str, str]], List[Tuple[int, int, float, Dict]]]:
+        """取最早一个可处理任务所在 (kind, user_id) 的一批任务"""
+        keys = list(self._handlers.keys())
+        if not keys:
+            return None, []
+        placeholders = " OR ".join(["(kind = ? AND user_id = ?)"] * len(keys))
+        params = [v for key in keys for v in key]
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            head = conn.execute(
+                f"SELECT kind, user_id FROM jobs WHERE not_before <= ? AND ({placeholders}) ORDER BY id LIMIT 1",
+                [now] + params
+            ).fetchone()
+            if head is None:
+                return None, []
+            rows = conn.execute(
+                "SELECT id, attempts, created_at, payload FROM jobs WHERE kind = ? AND user_id = ? AND not_before <= ? "
+                "ORDER BY id LIMIT ?",
+                (head[0], head[1], now, self.MAX_BATCH)
+            ).fetchall()
+        batch = []
+        for job_id, attempts, created_at, payload in rows:
+            try:
+                batch.append((job_id, attempts, created_at, json.loads(payload)))
+            except (TypeError, ValueError):
+                logger.warning(f"丢弃无法解析的后台任务 #{job_id}")
+                self._delete([job_id])
+        return (head[0], head[1]), batch
+
+    def _delete(self, job_ids: List[int]):
+        if not job_ids:
+            return
+        with self._lock:
+            self._get_conn().executemany("DELETE FROM jobs WHERE id = ?", [(i,) for i in job_ids])
+
+    def _mark_failed(self, batch: List[Tuple[int, int, float, Dict]]):
+        """整批 attempts+1；超过上限的任务丢弃"""
+        dropped = [job_id for job_id, attempts, _, _ in batch if attempts + 1 >= self.MAX_ATTEMPTS]
+        retry = [job_id for job_id, attempts, _, _ in batch if attempts + 1 < self.MAX_ATTEMPTS]
+        if dropped:
+            logger.error(f"后台任务多次失败，已丢弃: {dropped}")
+            self._delete(dropped)
+        if retry:
+            not_before = time.time() + self.RETRY_DELAY_SEC
+            with self._lock:
+                self._get_conn().executemany(
+                    "UPDATE jobs SET attempts = attempts + 1, not_before = ? WHERE id = ?",
+                    [(not_before, i) for i in retry]
+                )
+
+    # ==================== 处理 ====================
+
+    def register_handler(self, kind: str, user_id: str, handler: Callable[[List[Dict]], None]):
+        """
+        注册批处理函数并启动工作线程
+
+        handler 接收同类任务的 payload 列表（按入队顺序），正常返回即视为整批完成。
+        注册后会处理该类型此前遗留在队列中的任务。
+        """
+        self._handlers[(kind, user_id)] = handler
+        self._idle.clear()
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="BookkeepingWorker", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            # 先清标记再取任务：取任务期间的入队会让下一次 wait 立即返回
+            self._wakeup.clear()
+            try:
+                key, batch = self._next_batch()
+            except Exception as e:
+                logger.warning(f"读取后台任务失败: {e}")
+                key, batch = None, []
+
+            if not batch:
+                # 没有可处理的任务（可能还有未注册用户或等待重试的任务）
+                self._idle.set()
+                # 有失败待重试的任务时定期醒来
+                self._wakeup.wait(timeout=self.RETRY_DELAY_SEC)
+                continue
+
+            # 首个任务刚入队时稍等片刻，把同一轮对话后续的消息也合进这一批
+            age = time.time() - batch[0][2]
+            if len(batch) < self.MAX_BATCH and age < self.BATCH_WINDOW_SEC:
+                time.sleep(self.BATCH_WINDOW_SEC - age)
+                key, batch = self._next_batch()
+                if not batch:
+                    continue
+
+            handler = self._handlers.get(key)
+            if handler is None:
+                continue
+            try:
+                handler([payload for _, _, _, payload in batch])
+                self._delete([job_id for job_id, _, _, _ in batch])
+            except Exception as e:
+                logger.warning(f"后台任务处理失败 {key[0]} x{len(batch)}: {e}")
+                self._mark_failed(batch)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """等待当前可处理的任务处理完（用于测试/脚本；正常退出无需调用，遗留任务下次启动继续处理）"""
+        return self._idle.wait(timeout=timeout)
+
+
+# 全局实例
+_queue: Optional[BookkeepingQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_bookkeeping_queue() -> BookkeepingQueue:
+    """获取后台记账队列单例"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = BookkeepingQueue()
+    return _queue
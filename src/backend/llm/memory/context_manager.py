@@ -2,13 +2,15 @@
 上下文管理器
 管理短期记忆（当前会话）和构建 LLM Prompt
 """
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 from datetime import datetime
 import logging
+import threading
 
 from ..database.conversation_dao import get_conversation_dao, ConversationDAO
 from ..database.knowledge_dao import get_knowledge_dao, KnowledgeDAO
 from ..database.memory_dao import get_memory_dao, MemoryDAO
+from ..utils.token_counter import count_tokens, count_message_tokens, MESSAGE_OVERHEAD_TOKENS
 
 logger = logging.getLogger(__name__)
 
@@ -20,18 +22,30 @@ class ContextManager:
     职责:
     1. 管理当前会话 (短期记忆)
     2. 构建发送给 LLM 的 messages
-    3. 控制上下文长度
+    3. 控制上下文长度（token 预算 + 滚动摘要）
+
+    历史窗口:
+    - 已并入滚动摘要的旧消息以一条 system 摘要代替（摘要随会话存储）
+    - 窗口起点只在折叠时移动，相邻两轮的历史前缀保持一致（利于服务端前缀缓存）
+    - 窗口超出 token 预算或条数上限时，最旧的一批消息交给后台线程并入摘要，
+      窗口缩回预算的 summary_keep_ratio；摘要完成前本轮先按预算直接截断
     """
+
+    SUMMARY_MAX_CHARS = 600  # 规则摘要（无 LLM 时）的最大长度
     
     def __init__(
         self,
         user_id: str = "default_user",
         max_history_messages: int = 20,  # 最大历史消息数
         max_context_tokens: int = 4000,  # 最大上下文 token 数 (预估)
+        history_token_budget: int = 2000,  # 历史窗口 token 预算 (预估，不含摘要)
+        summary_keep_ratio: float = 0.5,  # 折叠后窗口保留的预算比例
     ):
         self.user_id = user_id
         self.max_history_messages = max_history_messages
         self.max_context_tokens = max_context_tokens
+        self.history_token_budget = history_token_budget
+        self.summary_keep_ratio = summary_keep_ratio
         
         self._conversation_dao: ConversationDAO = get_conversation_dao()
         self._knowledge_dao: KnowledgeDAO = get_knowledge_dao()
@@ -39,6 +53,15 @@ class ContextManager:
         
         self._current_session_id: Optional[str] = None
         self._system_prompt: Optional[str] = None
+
+        # 滚动摘要：summarizer(旧摘要, 待并入的消息) -> 新摘要；未设置时使用规则摘要
+        self._summarizer: Optional[Callable[[str, List[Dict]], str]] = None
+        self._fold_lock = threading.Lock()
+        self._folding = False
+
+    def set_summarizer(self, summarizer: Optional[Callable[[str, List[Dict]], str]]):
+        """设置滚动摘要生成函数（通常由 Agent 提供，调用 LLM）"""
+        self._summarizer = summarizer
     
     @property
     def session_id(self) -> Optional[str]:
@@ -98,7 +121,8 @@ class ContextManager:
         return self._conversation_dao.add_message(
             self._current_session_id,
             role="user",
-            content=content
+            content=content,
+            tokens=count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
         )
     
     def add_assistant_message(
@@ -114,7 +138,8 @@ class ContextManager:
             self._current_session_id,
             role="assistant",
             content=content,
-            emotion=emotion
+            emotion=emotion,
+            tokens=count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
         )
     
     def get_history(self, limit: Optional[int] = None) -> List[Dict]:
@@ -122,24 +147,117 @@ class ContextManager:
         获取对话历史
         
         Args:
-            limit: 限制数量
+            limit: 限制数量（指定时按条数取最近的原始消息，不使用摘要与 token 预算）
             
         Returns:
             消息列表 [{"role": "user", "content": "..."}, ...]
+            有滚动摘要时第一条为 {"role": "system", "content": "此前对话摘要..."}
         """
         if not self._current_session_id:
             return []
+
+        if limit:
+            messages = self._conversation_dao.get_messages(self._current_session_id, limit=limit)
+            return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
         
-        messages = self._conversation_dao.get_messages(
-            self._current_session_id,
-            limit=limit or self.max_history_messages
-        )
+        session = self._conversation_dao.get_session(self._current_session_id)
+        if not session:
+            return []
+        
+        messages = session.get("messages", [])
+        rolling = session.get("rolling_summary") or {}
+        summary = rolling.get("text") or ""
+        start = min(int(rolling.get("upto") or 0), len(messages))
+        
+        window = messages[start:]
+        tokens = [count_message_tokens(m) for m in window]
+        budget = self.history_token_budget
+        max_msgs = self.max_history_messages
+        
+        drop = 0
+        if sum(tokens) > budget or len(window) > max_msgs:
+            # 折叠：把最旧的一批并入摘要，窗口缩回预算的 keep_ratio
+            fold = self._fold_point(window, tokens, int(budget * self.summary_keep_ratio),
+                                    max(2, int(max_msgs * self.summary_keep_ratio)))
+            if fold > 0:
+                self._schedule_fold(self._current_session_id, summary, start, start + fold, window[:fold])
+            # 摘要完成前，本轮按预算直接截断
+            drop = self._fold_point(window, tokens, budget, max_msgs)
+        
+        history = []
+        if summary:
+            history.append({"role": "system", "content": f"此前对话摘要：\n{summary}"})
         
         # 转换为 OpenAI 格式
-        return [
+        history.extend(
             {"role": msg["role"], "content": msg["content"]}
-            for msg in messages
-        ]
+            for msg in window[drop:]
+        )
+        return history
+
+    @staticmethod
+    def _fold_point(window: List[Dict], tokens: List[int], budget: int, max_msgs: int) -> int:
+        """
+        计算折叠点：window[cut:] 满足 token 预算与条数上限，且以用户消息开头
+
+        Returns:
+            cut（需要移出窗口的消息数）
+        """
+        n = len(window)
+        total = 0
+        cut = n
+        for i in range(n - 1, -1, -1):
+            if total + tokens[i] > budget or n - i > max_msgs:
+                break
+            total += tokens[i]
+            cut = i
+        # 窗口不以助手回复开头，避免孤立的回答
+        while cut < n and window[cut].get("role") != "user":
+            cut += 1
+        if cut >= n:
+            # 最后一条本身超预算：至少保留最后一条
+            cut = n - 1
+        return max(0, cut)
+
+    def _schedule_fold(self, session_id: str, summary: str, upto_old: int, upto_new: int, messages: List[Dict]):
+        """后台把消息并入滚动摘要（同一时刻只有一个折叠任务）"""
+        with self._fold_lock:
+            if self._folding:
+                return
+            self._folding = True
+        
+        def run():
+            try:
+                new_summary = ""
+                if self._summarizer is not None:
+                    try:
+                        new_summary = (self._summarizer(summary, messages) or "").strip()
+                    except Exception as e:
+                        logger.warning(f"滚动摘要生成失败，使用规则摘要: {e}")
+                if not new_summary:
+                    new_summary = self._rule_summary(summary, messages)
+                if self._conversation_dao.set_rolling_summary(
+                    session_id, new_summary, upto_new, expected_upto=upto_old
+                ):
+                    logger.info(f"历史已折叠: 消息 {upto_old}→{upto_new} 并入摘要（{len(new_summary)} 字）")
+            except Exception as e:
+                logger.warning(f"历史折叠失败: {e}")
+            finally:
+                with self._fold_lock:
+                    self._folding = False
+        
+        threading.Thread(target=run, daemon=True, name="HistoryFold").start()
+
+    @classmethod
+    def _rule_summary(cls, summary: str, messages: List[Dict]) -> str:
+        """规则摘要（降级方案）：逐条截断后追加，只保留末尾 SUMMARY_MAX_CHARS 字"""
+        lines = [summary] if summary else []
+        for m in messages:
+            role = "用户" if m.get("role") == "user" else "助手"
+            content = (m.get("content") or "").replace("\n", " ")
+            lines.append(f"{role}: {content[:60]}")
+        text = "\n".join(lines)
+        return text[-cls.SUMMARY_MAX_CHARS:]
     
     def get_system_prompt(self) -> str:
         """
@@ -199,6 +199,8 @@ class KnowledgeGraph:
         self._triples: List[Triple] = []
         self._entities: Dict[str, Entity] = {}  # name -> Entity
         self._mongo_collection = None
+        # 版本号：三元组增删改后递增，供系统提示词缓存判断是否失效
+        self.version = 0
         
         # 初始化用户实体
         self._ensure_user_entity()
@@ -276,7 +278,35 @@ class KnowledgeGraph:
         except Exception as e:
             logger.warning(f"保存三元组失败: {e}")
     
-    def add_triple(
+    def _save_triples_to_db(self, triples: List[Triple]):
+        """批量保存三元组（一次 bulk_write 往返）"""
+        if not triples:
+            return
+        collection = self._get_collection()
+        if collection is None:
+            return
+        
+        try:
+            from pymongo import UpdateOne
+            now = datetime.now()
+            ops = [
+                UpdateOne(
+                    {
+                        "user_id": self.user_id,
+                        "triple.subject.name": t.subject.name,
+                        "triple.relation.type": t.relation.relation_type,
+                        "triple.object.name": t.obj.name
+                    },
+                    {"$set": {"user_id": self.user_id, "triple": t.to_dict(), "created_at": now}},
+                    upsert=True
+                )
+                for t in triples
+            ]
+            collection.bulk_write(ops, ordered=False)
+        except Exception as e:
+            logger.warning(f"批量保存三元组失败: {e}")
+    
+    def _merge_triple(
         self,
         subject: str,
         relation: str,
@@ -285,22 +315,8 @@ class KnowledgeGraph:
         obj_type: str = "unknown",
         confidence: float = 1.0,
         source: str = None
-    ) -> Triple:
-        """
-        添加三元组
-        
-        Args:
-            subject: 主体名称
-            relation: 关系类型
-            obj: 客体名称
-            subject_type: 主体类型
-            obj_type: 客体类型
-            confidence: 置信度
-            source: 来源
-            
-        Returns:
-            创建的 Triple
-        """
+    ) -> Tuple[Triple, bool]:
+        """把三元组合并进内存图，返回 (三元组, 是否新建)；不写数据库"""
         # 获取或创建实体
         if subject in self._entities:
             subject_entity = self._entities[subject]
@@ -314,33 +330,99 @@ class KnowledgeGraph:
             obj_entity = Entity(name=obj, entity_type=obj_type)
             self._entities[obj] = obj_entity
         
-        # 创建关系
-        relation_obj = Relation(relation_type=relation)
+        # 检查是否已存在（如果存在，更新置信度）
+        existing = self._find_triple(subject, relation, obj)
+        if existing:
+            existing.confidence = max(existing.confidence, confidence)
+            existing.source = source
+            return existing, False
         
         # 创建三元组
         triple = Triple(
             subject=subject_entity,
-            relation=relation_obj,
+            relation=Relation(relation_type=relation),
             obj=obj_entity,
             confidence=confidence,
             source=source
         )
-        
-        # 检查是否已存在（如果存在，更新置信度）
-        existing = self._find_triple(subject, relation, obj)
-        if existing:
-            existing.confidence = max(existing.confidence, confidence)
-            existing.source = source
-            self._save_triple_to_db(existing)
-            logger.info(f"更新三元组: {existing}")
-            return existing
-        
-        # 添加新三元组
         self._triples.append(triple)
+        return triple, True
+    
+    def add_triple(
+        self,
+        subject: str,
+        relation: str,
+        obj: str,
+        subject_type: str = "unknown",
+        obj_type: str = "unknown",
+        confidence: float = 1.0,
+        source: str = None
+    ) -> Triple:
+        """
+        添加三元组
+        
+        Args:
+            subject: 主体名称
+            relation: 关系类型
+            obj: 客体名称
+            subject_type: 主体类型
+            obj_type: 客体类型
+            confidence: 置信度
+            source: 来源
+            
+        Returns:
+            创建的 Triple
+        """
+        triple, created = self._merge_triple(
+            subject, relation, obj,
+            subject_type=subject_type,
+            obj_type=obj_type,
+            confidence=confidence,
+            source=source
+        )
         self._save_triple_to_db(triple)
-        logger.info(f"添加三元组: {triple}")
+        self.version += 1
+        logger.info(f"{'添加' if created else '更新'}三元组: {triple}")
         return triple
     
+    def add_triples(self, triples: List[Dict], source: str = None) -> List[Triple]:
+        """
+        批量添加三元组
+        
+        同一批内重复的 (主体, 关系, 客体) 先合并（取最高置信度），
+        再用一次 bulk_write 写库，版本号只递增一次。
+        
+        Args:
+            triples: [{"subject", "relation", "object", "confidence"?, "subject_type"?, "object_type"?, "source"?}, ...]
+            source: 默认来源（条目未指定 source 时使用）
+            
+        Returns:
+            写入的 Triple 列表
+        """
+        merged: Dict[Tuple[str, str, str], Dict] = {}
+        for data in triples:
+            key = (data["subject"], data["relation"], data["object"])
+            prev = merged.get(key)
+            if prev is None or data.get("confidence", 1.0) >= prev.get("confidence", 1.0):
+                merged[key] = data
+        
+        written: List[Triple] = []
+        for (subject, relation, obj), data in merged.items():
+            triple, _ = self._merge_triple(
+                subject, relation, obj,
+                subject_type=data.get("subject_type", "unknown"),
+                obj_type=data.get("object_type", "unknown"),
+                confidence=data.get("confidence", 1.0),
+                source=data.get("source") or source
+            )
+            written.append(triple)
+        
+        if written:
+            self._save_triples_to_db(written)
+            self.version += 1
+            logger.info(f"批量写入 {len(written)} 个三元组（输入 {len(triples)} 条）")
+        return written
+    
     def _find_triple(self, subject: str, relation: str, obj: str) -> Optional[Triple]:
         """查找三元组"""
         for triple in self._triples:
@@ -518,6 +600,7 @@ class KnowledgeGraph:
         triple = self._find_triple(subject, relation, obj)
         if triple:
             self._triples.remove(triple)
+            self.version += 1
             
             # 从数据库删除
             collection = self._get_collection()
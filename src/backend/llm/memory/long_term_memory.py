@@ -189,6 +189,11 @@ class LongTermMemoryManager:
             limit=limit
         )
     
+    @property
+    def version(self) -> int:
+        """记忆库版本号（任一写入后变化）"""
+        return self._memory_dao.version
+    
     def get_important_memories(
         self, 
         min_importance: float = 0.7,
@@ -222,6 +227,7 @@ class LongTermMemoryManager:
         if success:
             # 从 Chroma 删除
             self._vector_store.delete([memory_id])
+            self._unindex_memories([memory_id])
         
         return success
     
@@ -237,9 +243,28 @@ class LongTermMemoryManager:
             删除数量
         """
         # 这里只删除 MongoDB 中的数据
-        # Chroma 的数据可能会残留，但不影响使用
-        return self._memory_dao.delete_old_memories(
+        # Chroma 的数据可能会残留，但不影响使用；BM25 持久化索引需要同步移除
+        memory_ids = self._memory_dao.get_old_memory_ids(
+            user_id=self.user_id,
+            days=days,
+            max_importance=max_importance
+        )
+        deleted = self._memory_dao.delete_old_memories(
             user_id=self.user_id,
             days=days,
             max_importance=max_importance
         )
+        if deleted:
+            self._unindex_memories(memory_ids)
+        return deleted
+    
+    def _unindex_memories(self, memory_ids: List[str]):
+        """从持久化 BM25 记忆索引中移除（失败不影响删除本身）"""
+        try:
+            from ..rag.bm25_index import get_bm25_index
+            from ..rag.retriever import RetrievalSource
+            index = get_bm25_index(self.user_id, RetrievalSource.MEMORY.value)
+            for memory_id in memory_ids:
+                index.delete_document(memory_id)
+        except Exception as e:
+            logger.warning(f"从 BM25 索引移除记忆失败: {e}")
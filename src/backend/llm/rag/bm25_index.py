@@ -0,0 +1,753 @@
+"""
+持久化 BM25 索引
+倒排表与文档长度按紧凑数组落盘、启动时内存映射，不再每次启动从 MongoDB 全量重建
+
+存储布局（data/bm25/<user_id>/<source>/）：
+1. 基础段 seg<代>_*.npy：CSR 倒排（词典按 UTF-8 字节排序，二分查找；词 → 文档号/词频区间）
+   + 按文档号索引的文档长度与 doc_id。启动时 np.load(mmap_mode="r")，只读
+2. index.db（SQLite）：文档原文/元数据、增量段倒排（上次合并之后新增的文档）、删除标记、计数器
+3. 增删都是 O(文档词数)：新增写 SQLite + 内存增量段；删除只打标记，检索时跳过
+4. 增量段文档数或删除比例超过阈值时在后台合并出新一代基础段，提交后原子切换
+5. 检索按查询词取倒排区间做向量化累加（score_top_k），argpartition 选 top-k，
+   排序结果（含同分文档的先后）与逐文档循环的实现完全一致
+
+合并前 IDF 的文档频率包含已删除文档（倒排索引的常见近似），合并后恢复精确。
+"""
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Tuple, Iterable, Set
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from array import array
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 默认索引目录：项目根目录/data/bm25
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parents[4] / "data" / "bm25"
+
+_CHINESE_PATTERN = re.compile(r'[\u4e00-\u9fff]')
+_ENGLISH_PATTERN = re.compile(r'[a-zA-Z]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """简单分词：中文按字 + 相邻字 bigram，英文按单词（小写）"""
+    chinese = _CHINESE_PATTERN.findall(text)
+    chinese_bigrams = [chinese[i] + chinese[i + 1] for i in range(len(chinese) - 1)]
+    english = _ENGLISH_PATTERN.findall(text.lower())
+    return chinese + chinese_bigrams + english
+
+
+# 一个查询词的倒排：(idf, 文档号, 词频, 文档长度)
+Postings = Tuple[float, np.ndarray, np.ndarray, np.ndarray]
+
+
+def score_top_k(
+    postings: List[Postings],
+    num_slots: int,
+    top_k: int,
+    avg_doc_length: float,
+    k1: float = 1.5,
+    b: float = 0.75,
+) -> List[Tuple[int, float]]:
+    """
+    向量化 BM25 打分 + top-k
+
+    按查询词顺序逐词累加（与逐文档循环的浮点运算顺序相同，分数逐位一致）；
+    同分文档按首次被命中的先后排序，等价于原实现对 dict 的稳定排序。
+
+    Args:
+        postings: 按查询词顺序排列的倒排（重复的查询词重复出现）；同一词内文档号不重复
+        num_slots: 文档号上界（分数数组长度）
+
+    Returns:
+        [(文档号, 分数), ...]
+    """
+    if not postings or top_k <= 0:
+        return []
+    scores = np.zeros(num_slots, dtype=np.float64)
+    # 文档首次被命中的序号（查询词顺序 × 倒排内顺序），用于同分时的稳定排序
+    not_seen = np.iinfo(np.int64).max
+    first_seen = np.full(num_slots, not_seen, dtype=np.int64)
+    seen = 0
+    for idf, docs, tfs, lengths in postings:
+        if not len(docs):
+            continue
+        tfs = tfs.astype(np.float64)
+        denominator = tfs + k1 * (1 - b + b * lengths / avg_doc_length)
+        scores[docs] += idf * (tfs * (k1 + 1)) / denominator
+        order = np.arange(seen, seen + len(docs), dtype=np.int64)
+        first_seen[docs] = np.minimum(first_seen[docs], order)
+        seen += len(docs)
+
+    touched = np.flatnonzero(first_seen != not_seen)
+    if not len(touched):
+        return []
+    touched_scores = scores[touched]
+    if len(touched) > top_k:
+        # argpartition 取出前 k 名的最低分，再把与之同分的文档一并纳入候选，保证同分排序稳定
+        kth = touched_scores[np.argpartition(-touched_scores, top_k - 1)[:top_k]].min()
+        keep = touched_scores >= kth
+        touched, touched_scores = touched[keep], touched_scores[keep]
+    ranked = np.lexsort((first_seen[touched], -touched_scores))[:top_k]
+    return [(int(touched[i]), float(touched_scores[i])) for i in ranked]
+
+
+@dataclass
+class BM25IndexConfig:
+    """持久化 BM25 配置"""
+    k1: float = 1.5                      # 词频饱和参数
+    b: float = 0.75                      # 文档长度归一化参数
+    compact_min_docs: int = 2000         # 增量段文档数达到此值时合并
+    compact_deleted_ratio: float = 0.2   # 基础段删除标记占比超过此值时合并
+    background_compaction: bool = True   # 合并放到后台线程（False 时在写入线程同步执行）
+
+
+class _Segment:
+    """只读基础段：内存映射的 CSR 数组"""
+
+    ARRAYS = (
+        "terms",           # uint8，所有词的 UTF-8 字节按序拼接
+        "term_offsets",    # int64[V+1]，词 i 的字节区间
+        "post_offsets",    # int64[V+1]，词 i 的倒排区间
+        "post_docs",       # int32[P]，文档号（每个词内升序）
+        "post_tfs",        # int32[P]，词频
+        "doc_lengths",     # int32[M+1]，按文档号索引的文档长度
+        "doc_ids",         # uint8，所有 doc_id 的 UTF-8 字节按文档号拼接
+        "doc_id_offsets",  # int64[M+2]
+    )
+    _DTYPES = {
+        "terms": np.uint8, "term_offsets": np.int64, "post_offsets": np.int64, "post_docs": np.int32,
+        "post_tfs": np.int32, "doc_lengths": np.int32, "doc_ids": np.uint8, "doc_id_offsets": np.int64,
+    }
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.terms = arrays["terms"]
+        self.term_offsets = arrays["term_offsets"]
+        self.post_offsets = arrays["post_offsets"]
+        self.post_docs = arrays["post_docs"]
+        self.post_tfs = arrays["post_tfs"]
+        self.doc_lengths = arrays["doc_lengths"]
+        self.doc_ids = arrays["doc_ids"]
+        self.doc_id_offsets = arrays["doc_id_offsets"]
+        self.num_terms = len(self.term_offsets) - 1
+        # 基础段覆盖的最大文档号
+        self.max_num = len(self.doc_lengths) - 1
+
+    @classmethod
+    def empty(cls) -> "_Segment":
+        arrays = {name: np.zeros(0, dtype=dtype) for name, dtype in cls._DTYPES.items()}
+        for name in ("term_offsets", "post_offsets"):
+            arrays[name] = np.zeros(1, dtype=np.int64)
+        arrays["doc_lengths"] = np.zeros(1, dtype=np.int32)
+        arrays["doc_id_offsets"] = np.zeros(2, dtype=np.int64)
+        return cls(arrays)
+
+    @staticmethod
+    def path(directory: Path, gen: int, name: str) -> Path:
+        return directory / f"seg{gen}_{name}.npy"
+
+    @classmethod
+    def load(cls, directory: Path, gen: int) -> "_Segment":
+        arrays = {}
+        for name in cls.ARRAYS:
+            p = cls.path(directory, gen, name)
+            try:
+                arrays[name] = np.load(p, mmap_mode="r")
+            except ValueError:
+                # 空数组无法映射
+                arrays[name] = np.load(p)
+        return cls(arrays)
+
+    @classmethod
+    def write(cls, directory: Path, gen: int, arrays: Dict[str, np.ndarray]):
+        for name in cls.ARRAYS:
+            final = cls.path(directory, gen, name)
+            tmp = final.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(arrays[name], dtype=cls._DTYPES[name]))
+            tmp.replace(final)
+
+    def term_at(self, i: int) -> bytes:
+        return self.terms[self.term_offsets[i]:self.term_offsets[i + 1]].tobytes()
+
+    def find(self, term: str) -> Optional[Tuple[int, int]]:
+        """二分查找词，返回倒排区间 [start, end)"""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self.term_at(lo) == key:
+            return int(self.post_offsets[lo]), int(self.post_offsets[lo + 1])
+        return None
+
+    def doc_id(self, num: int) -> str:
+        return self.doc_ids[self.doc_id_offsets[num]:self.doc_id_offsets[num + 1]].tobytes().decode("utf-8")
+
+
+class PersistentBM25:
+    """
+    持久化 BM25 关键词索引
+
+    接口与内存版 BM25 一致（add_document / search / clear），另外提供删除、原文读取与同步元数据。
+    线程安全：读写都在 self._lock 内，合并的耗时部分在锁外进行。
+    """
+
+    def __init__(self, directory, config: Optional[BM25IndexConfig] = None):
+        self.config = config or BM25IndexConfig()
+        self._dir = Path(directory)
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+        self._gen = 0
+        self._base = _Segment.empty()
+        # 增量段：term → {文档号: 词频}，以及文档号 → 长度 / doc_id
+        self._delta: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._delta_lengths: Dict[int, int] = {}
+        self._delta_ids: Dict[int, str] = {}
+        # 基础段中已删除的文档号
+        self._tombstones: Set[int] = set()
+        self._deleted_mask = np.zeros(1, dtype=bool)
+        self._live_docs = 0
+        self._total_length = 0
+
+        # 合并状态：进行中时记录快照水位，期间删除的增量段文档按基础段处理
+        self._compacting = False
+        self._compact_watermark = 0
+        self._compact_deleted: Set[int] = set()
+
+        self._open()
+
+    # ==================== 存储 ====================
+
+    def _open(self):
+        self._dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self._dir / "index.db"), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                num INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT UNIQUE,
+                content TEXT,
+                metadata TEXT,
+                length INTEGER NOT NULL,
+                in_base INTEGER NOT NULL DEFAULT 0,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS delta (term TEXT NOT NULL, num INTEGER NOT NULL, tf INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_delta_num ON delta (num)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn = conn
+
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        self._gen = int(meta.get("generation", 0))
+        self._live_docs = int(meta.get("live_docs", 0))
+        self._total_length = int(meta.get("total_length", 0))
+        if self._gen:
+            self._base = _Segment.load(self._dir, self._gen)
+        self._remove_stale_segments()
+
+        # 增量段与删除标记的规模受合并阈值限制，启动时载入内存
+        for num, doc_id, length in conn.execute(
+            "SELECT num, doc_id, length FROM docs WHERE in_base = 0 AND deleted = 0"
+        ):
+            self._delta_ids[num] = doc_id
+            self._delta_lengths[num] = length
+        for term, num, tf in conn.execute("SELECT term, num, tf FROM delta"):
+            if num in self._delta_lengths:
+                self._delta[term][num] = tf
+        self._tombstones = {row[0] for row in conn.execute("SELECT num FROM docs WHERE in_base = 1 AND deleted = 1")}
+        self._reset_deleted_mask()
+
+    def _reset_deleted_mask(self):
+        """按基础段大小重建删除标记的布尔掩码（检索时向量化过滤）"""
+        mask = np.zeros(self._base.max_num + 1, dtype=bool)
+        tombstones = [num for num in self._tombstones if num <= self._base.max_num]
+        if tombstones:
+            mask[tombstones] = True
+        self._deleted_mask = mask
+
+    def _remove_stale_segments(self):
+        """删除非当前代的段文件（合并中途退出或旧段在切换时仍被映射）"""
+        for p in self._dir.glob("seg*_*.np*"):
+            if not p.name.startswith(f"seg{self._gen}_") or p.suffix == ".tmp":
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _save_counters(self, conn: sqlite3.Connection):
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("live_docs", str(self._live_docs)), ("total_length", str(self._total_length))],
+        )
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """读取调用方的同步元数据（如增量同步水位）"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # ==================== 增删 ====================
+
+    @property
+    def doc_count(self) -> int:
+        return self._live_docs
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self._total_length / self._live_docs if self._live_docs else 0.0
+
+    def add_document(self, doc_id: str, content: str, metadata: Optional[Dict] = None) -> bool:
+        """添加文档；doc_id 已存在且内容相同时只更新元数据，内容变化时替换。返回是否写入了新内容"""
+        return bool(self.add_documents([(doc_id, content, metadata)]))
+
+    def add_documents(self, documents: Iterable[Tuple[str, str, Optional[Dict]]]) -> List[str]:
+        """批量添加 (doc_id, content, metadata)，一个事务提交；返回写入了新内容的 doc_id"""
+        added = []
+        with self._lock:
+            with self._transaction() as conn:
+                for doc_id, content, metadata in documents:
+                    meta_json = json.dumps(metadata or {}, ensure_ascii=False)
+                    row = conn.execute("SELECT num, content FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+                    if row is not None:
+                        if row[1] == content:
+                            if metadata is not None:
+                                conn.execute("UPDATE docs SET metadata = ? WHERE num = ?", (meta_json, row[0]))
+                            continue
+                        self._delete_locked(conn, row[0])
+
+                    terms = tokenize(content)
+                    counts = Counter(terms)
+                    num = conn.execute(
+                        "INSERT INTO docs (doc_id, content, metadata, length) VALUES (?, ?, ?, ?)",
+                        (doc_id, content, meta_json, len(terms)),
+                    ).lastrowid
+                    conn.executemany(
+                        "INSERT INTO delta (term, num, tf) VALUES (?, ?, ?)",
+                        [(term, num, tf) for term, tf in counts.items()],
+                    )
+                    self._delta_ids[num] = doc_id
+                    self._delta_lengths[num] = len(terms)
+                    for term, tf in counts.items():
+                        self._delta[term][num] = tf
+                    self._live_docs += 1
+                    self._total_length += len(terms)
+                    added.append(doc_id)
+                self._save_counters(conn)
+        if added:
+            self._maybe_compact()
+        return added
+
+    def delete_document(self, doc_id: str) -> bool:
+        """删除文档（基础段中的只打删除标记，合并时清除）"""
+        with self._lock:
+            row = self._conn.execute("SELECT num FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return False
+            with self._transaction() as conn:
+                self._delete_locked(conn, row[0])
+                self._save_counters(conn)
+        self._maybe_compact()
+        return True
+
+    def _delete_locked(self, conn: sqlite3.Connection, num: int):
+        """删除一个文档（调用方持有 self._lock 并已开启事务）"""
+        content, length, in_base = conn.execute(
+            "SELECT content, length, in_base FROM docs WHERE num = ?", (num,)
+        ).fetchone()
+        in_snapshot = self._compacting and num <= self._compact_watermark
+        if in_base or in_snapshot:
+            # 基础段（或正在并入基础段）的文档：保留删除标记
+            conn.execute(
+                "UPDATE docs SET deleted = 1, doc_id = NULL, content = NULL, metadata = NULL WHERE num = ?", (num,)
+            )
+        else:
+            conn.execute("DELETE FROM docs WHERE num = ?", (num,))
+            conn.execute("DELETE FROM delta WHERE num = ?", (num,))
+
+        if in_base:
+            self._tombstones.add(num)
+            self._deleted_mask[num] = True
+        else:
+            for term in set(tokenize(content or "")):
+                postings = self._delta.get(term)
+                if postings is not None:
+                    postings.pop(num, None)
+                    if not postings:
+                        del self._delta[term]
+            self._delta_ids.pop(num, None)
+            self._delta_lengths.pop(num, None)
+            if in_snapshot:
+                self._compact_deleted.add(num)
+        self._live_docs -= 1
+        self._total_length -= length
+
+    def get_document(self, doc_id: str) -> Optional[Tuple[str, Dict]]:
+        """读取文档原文与元数据"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, metadata FROM docs WHERE doc_id = ? AND deleted = 0", (doc_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1] or "{}")
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM docs")
+                conn.execute("DELETE FROM delta")
+                conn.execute("DELETE FROM meta")
+                conn.execute("DELETE FROM sqlite_sequence WHERE name = 'docs'")
+            self._gen = 0
+            self._base = _Segment.empty()
+            self._delta.clear()
+            self._delta_lengths.clear()
+            self._delta_ids.clear()
+            self._tombstones.clear()
+            self._reset_deleted_mask()
+            self._live_docs = 0
+            self._total_length = 0
+            self._remove_stale_segments()
+
+    def bulk_load(self, documents: Iterable[Tuple[str, str, Optional[Dict]]]) -> int:
+        """
+        空索引的批量构建：直接生成基础段，不经过增量段（首次全量同步 / 重建用）
+        索引非空时退化为 add_documents。返回写入的文档数
+        """
+        with self._lock:
+            if self._live_docs or self._compacting:
+                return len(self.add_documents(documents))
+            self.clear()
+
+            vocab: Dict[str, int] = {}
+            term_ids = array("i")            # 所有文档的词号按文档顺序拼接
+            doc_lengths = array("i", [0])    # 文档号从 1 开始
+            id_bytes: List[bytes] = [b""]
+            seen: Set[str] = set()
+            rows = []
+            with self._transaction() as conn:
+                for doc_id, content, metadata in documents:
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    terms = tokenize(content)
+                    term_ids.extend([vocab.setdefault(term, len(vocab)) for term in terms])
+                    doc_lengths.append(len(terms))
+                    id_bytes.append(doc_id.encode("utf-8"))
+                    rows.append((
+                        len(doc_lengths) - 1, doc_id, content,
+                        json.dumps(metadata or {}, ensure_ascii=False), len(terms),
+                    ))
+                    if len(rows) >= 10000:
+                        conn.executemany(
+                            "INSERT INTO docs (num, doc_id, content, metadata, length, in_base) VALUES (?, ?, ?, ?, ?, 1)",
+                            rows,
+                        )
+                        rows = []
+                if rows:
+                    conn.executemany(
+                        "INSERT INTO docs (num, doc_id, content, metadata, length, in_base) VALUES (?, ?, ?, ?, ?, 1)",
+                        rows,
+                    )
+                num_docs = len(doc_lengths) - 1
+                if not num_docs:
+                    return 0
+
+                # 词号换成按 UTF-8 字节排序后的名次，(名次, 文档号) 去重计数即得词频
+                terms_sorted = sorted(vocab, key=lambda t: t.encode("utf-8"))
+                rank = np.empty(len(vocab), dtype=np.int64)
+                rank[[vocab[t] for t in terms_sorted]] = np.arange(len(vocab))
+                lengths = np.frombuffer(doc_lengths, dtype=np.int32)
+                docs = np.repeat(np.arange(num_docs + 1, dtype=np.int64), lengths)
+                tids = rank[np.frombuffer(term_ids, dtype=np.int32)]
+                keys, tfs = np.unique(tids * (num_docs + 1) + docs, return_counts=True)
+                post_tids, post_docs = np.divmod(keys, num_docs + 1)
+
+                arrays = self._segment_arrays(
+                    [t.encode("utf-8") for t in terms_sorted],
+                    np.bincount(post_tids, minlength=len(vocab)),
+                    post_docs, tfs, lengths, id_bytes,
+                )
+                gen = self._gen + 1
+                _Segment.write(self._dir, gen, arrays)
+                self._live_docs = num_docs
+                self._total_length = int(lengths.sum())
+                self._save_counters(conn)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(gen),))
+
+            self._gen = gen
+            self._base = _Segment.load(self._dir, gen)
+            self._reset_deleted_mask()
+            self._remove_stale_segments()
+        logger.info(f"BM25 索引批量构建完成: 文档 {num_docs}, 词 {len(vocab)}")
+        return num_docs
+
+    # ==================== 检索 ====================
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """
+        搜索
+
+        Returns:
+            [(doc_id, score), ...]
+        """
+        query_terms = tokenize(query)
+        k1, b = self.config.k1, self.config.b
+
+        with self._lock:
+            if not self._live_docs:
+                return []
+            total_docs = self._live_docs
+            avg_doc_length = self._total_length / total_docs
+            base = self._base
+            postings: List[Postings] = []
+            # 同一查询里的重复词只查一次倒排
+            looked_up: Dict[str, List[Postings]] = {}
+
+            for term in query_terms:
+                if term in looked_up:
+                    postings.extend(looked_up[term])
+                    continue
+                span = base.find(term)
+                delta = self._delta.get(term)
+                df = (span[1] - span[0] if span else 0) + (len(delta) if delta else 0)
+                term_postings: List[Postings] = []
+                if df:
+                    # IDF
+                    idf = math.log((total_docs - df + 0.5) / (df + 0.5) + 1)
+                    if span:
+                        docs = np.asarray(base.post_docs[span[0]:span[1]], dtype=np.int64)
+                        tfs = np.asarray(base.post_tfs[span[0]:span[1]])
+                        if self._tombstones:
+                            alive = ~self._deleted_mask[docs]
+                            docs, tfs = docs[alive], tfs[alive]
+                        term_postings.append((idf, docs, tfs, base.doc_lengths[docs]))
+                    if delta:
+                        docs = np.fromiter(delta.keys(), dtype=np.int64, count=len(delta))
+                        tfs = np.fromiter(delta.values(), dtype=np.int64, count=len(delta))
+                        lengths = np.fromiter((self._delta_lengths[n] for n in delta), dtype=np.int64, count=len(delta))
+                        term_postings.append((idf, docs, tfs, lengths))
+                looked_up[term] = term_postings
+                postings.extend(term_postings)
+
+            num_slots = max([base.max_num] + list(self._delta_lengths)) + 1
+            ranked = score_top_k(postings, num_slots, top_k, avg_doc_length, k1, b)
+            return [(self._doc_id(num), score) for num, score in ranked]
+
+    def _doc_id(self, num: int) -> str:
+        doc_id = self._delta_ids.get(num)
+        return doc_id if doc_id is not None else self._base.doc_id(num)
+
+    # ==================== 合并 ====================
+
+    def _maybe_compact(self):
+        with self._lock:
+            if self._compacting:
+                return
+            base_docs = self._live_docs - len(self._delta_lengths) + len(self._tombstones)
+            due = len(self._delta_lengths) >= self.config.compact_min_docs or (
+                base_docs > 0 and len(self._tombstones) >= base_docs * self.config.compact_deleted_ratio
+            )
+        if not due:
+            return
+        if self.config.background_compaction:
+            threading.Thread(target=self.compact, name="BM25Compaction", daemon=True).start()
+        else:
+            self.compact()
+
+    def compact(self) -> bool:
+        """把增量段并入基础段并清除删除标记，生成新一代基础段；返回是否执行"""
+        with self._lock:
+            if self._compacting:
+                return False
+            self._compacting = True
+            self._compact_deleted = set()
+            base, gen = self._base, self._gen
+            delta = {term: dict(postings) for term, postings in self._delta.items()}
+            delta_lengths = dict(self._delta_lengths)
+            delta_ids = dict(self._delta_ids)
+            tombstones = set(self._tombstones)
+            watermark = max([base.max_num] + list(delta_lengths))
+            self._compact_watermark = watermark
+
+        try:
+            arrays = self._merge(base, delta, delta_lengths, delta_ids, tombstones, watermark)
+            _Segment.write(self._dir, gen + 1, arrays)
+            new_base = _Segment.load(self._dir, gen + 1)
+
+            with self._lock:
+                with self._transaction() as conn:
+                    conn.execute("UPDATE docs SET in_base = 1 WHERE in_base = 0 AND num <= ?", (watermark,))
+                    conn.execute("DELETE FROM delta WHERE num <= ?", (watermark,))
+                    conn.executemany("DELETE FROM docs WHERE num = ? AND deleted = 1", [(n,) for n in tombstones])
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(gen + 1),))
+
+                self._gen = gen + 1
+                self._base = new_base
+                for term, postings in delta.items():
+                    current = self._delta.get(term)
+                    if current is None:
+                        continue
+                    for num in postings:
+                        current.pop(num, None)
+                    if not current:
+                        del self._delta[term]
+                for num in delta_lengths:
+                    self._delta_lengths.pop(num, None)
+                    self._delta_ids.pop(num, None)
+                self._tombstones -= tombstones
+                self._tombstones |= self._compact_deleted
+                self._reset_deleted_mask()
+                self._remove_stale_segments()
+            logger.info(f"BM25 索引合并完成: 第 {gen + 1} 代, 文档 {self._live_docs}, 词 {new_base.num_terms}")
+            return True
+        except Exception as e:
+            logger.warning(f"BM25 索引合并失败: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._compacting = False
+                self._compact_deleted = set()
+
+    @staticmethod
+    def _merge(
+        base: _Segment,
+        delta: Dict[str, Dict[int, int]],
+        delta_lengths: Dict[int, int],
+        delta_ids: Dict[int, str],
+        tombstones: Set[int],
+        watermark: int,
+    ) -> Dict[str, np.ndarray]:
+        """基础段（去掉删除标记）+ 增量段快照 → 新基础段数组"""
+        base_terms = [base.term_at(i) for i in range(base.num_terms)]
+        all_terms = sorted(set(base_terms) | {term.encode("utf-8") for term in delta})
+        term_index = {term: i for i, term in enumerate(all_terms)}
+
+        # 基础段倒排展开为 (词号, 文档号, 词频)，去掉已删除文档
+        base_tids = np.repeat(
+            np.array([term_index[t] for t in base_terms], dtype=np.int64),
+            np.diff(np.asarray(base.post_offsets)),
+        )
+        base_docs = np.asarray(base.post_docs, dtype=np.int64)
+        base_tfs = np.asarray(base.post_tfs, dtype=np.int64)
+        if tombstones:
+            keep = ~np.isin(base_docs, np.fromiter(tombstones, dtype=np.int64))
+            base_tids, base_docs, base_tfs = base_tids[keep], base_docs[keep], base_tfs[keep]
+
+        delta_tids, delta_docs, delta_tfs = [], [], []
+        for term, postings in delta.items():
+            tid = term_index[term.encode("utf-8")]
+            delta_tids.extend([tid] * len(postings))
+            delta_docs.extend(postings.keys())
+            delta_tfs.extend(postings.values())
+
+        tids = np.concatenate([base_tids, np.array(delta_tids, dtype=np.int64)])
+        docs = np.concatenate([base_docs, np.array(delta_docs, dtype=np.int64)])
+        tfs = np.concatenate([base_tfs, np.array(delta_tfs, dtype=np.int64)])
+
+        # 去掉已无倒排的词，按 (词号, 文档号) 排序得到 CSR
+        counts = np.bincount(tids, minlength=len(all_terms))
+        live_terms = counts > 0
+        remap = np.cumsum(live_terms) - 1
+        tids = remap[tids]
+        order = np.lexsort((docs, tids))
+        terms = [t for t, alive in zip(all_terms, live_terms) if alive]
+
+        # 按文档号索引的长度与 doc_id（基础段中已删除的置空）
+        doc_lengths = np.zeros(watermark + 1, dtype=np.int32)
+        doc_lengths[:len(base.doc_lengths)] = base.doc_lengths
+        id_bytes: List[bytes] = [b""] * (watermark + 1)
+        for num in range(1, len(base.doc_lengths)):
+            if num not in tombstones:
+                id_bytes[num] = base.doc_ids[base.doc_id_offsets[num]:base.doc_id_offsets[num + 1]].tobytes()
+        for num in tombstones:
+            if num < len(doc_lengths):
+                doc_lengths[num] = 0
+        for num, length in delta_lengths.items():
+            doc_lengths[num] = length
+            id_bytes[num] = delta_ids[num].encode("utf-8")
+
+        return PersistentBM25._segment_arrays(terms, counts[live_terms], docs[order], tfs[order], doc_lengths, id_bytes)
+
+    @staticmethod
+    def _segment_arrays(
+        terms: List[bytes],
+        term_counts: np.ndarray,
+        post_docs: np.ndarray,
+        post_tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        id_bytes: List[bytes],
+    ) -> Dict[str, np.ndarray]:
+        """排好序的词典 / 倒排 / 文档信息 → 基础段数组"""
+        term_lengths = np.array([len(t) for t in terms], dtype=np.int64)
+        id_lengths = np.array([len(x) for x in id_bytes], dtype=np.int64)
+        return {
+            "terms": np.frombuffer(b"".join(terms), dtype=np.uint8),
+            "term_offsets": np.concatenate([[0], np.cumsum(term_lengths)]),
+            "post_offsets": np.concatenate([[0], np.cumsum(term_counts)]),
+            "post_docs": post_docs,
+            "post_tfs": post_tfs,
+            "doc_lengths": doc_lengths,
+            "doc_ids": np.frombuffer(b"".join(id_bytes), dtype=np.uint8),
+            "doc_id_offsets": np.concatenate([[0], np.cumsum(id_lengths)]),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 全局实例：(user_id, source) → 索引
+_indexes: Dict[Tuple[str, str], PersistentBM25] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index(
+    user_id: str,
+    source: str,
+    config: Optional[BM25IndexConfig] = None,
+    base_dir: Optional[Path] = None,
+) -> PersistentBM25:
+    """获取 (用户, 检索源) 的持久化 BM25 索引（同一进程共享；config 只在首次创建时生效）"""
+    key = (user_id, source)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            safe_user = re.sub(r"[^\w\-]", "_", user_id) or "default_user"
+            index = PersistentBM25(Path(base_dir or DEFAULT_INDEX_DIR) / safe_user / source, config)
+            _indexes[key] = index
+    return index
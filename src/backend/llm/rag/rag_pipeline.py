@@ -7,7 +7,8 @@ RAG Pipeline
     context = pipeline.retrieve_context("用户喜欢什么？")
 """
 from typing import Optional, List, Dict, Any
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from concurrent.futures import wait as wait_futures
 import logging
 import time
 
@@ -41,6 +42,8 @@ class RAGConfig:
     # 性能配置
     enable_cache: bool = True
     cache_ttl: int = 300  # 缓存 5 分钟
+    # 检索截止时间（毫秒，含各源检索与知识图谱查询，并发执行）；超时的源放弃，用已完成的部分；0 表示不限
+    retrieval_deadline_ms: float = 1500.0
 
 
 @dataclass
@@ -52,6 +55,8 @@ class RAGResponse:
     kg_context: Optional[str] = None       # 知识图谱上下文
     retrieval_time_ms: float = 0           # 检索耗时
     total_time_ms: float = 0               # 总耗时
+    timings: Dict[str, Optional[float]] = field(default_factory=dict)  # 分源耗时（毫秒，超时为 None）
+    partial: bool = False                  # 是否有源超时被放弃
     
     def to_dict(self) -> Dict:
         return {
@@ -60,6 +65,8 @@ class RAGResponse:
             "result_count": len(self.results),
             "retrieval_time_ms": self.retrieval_time_ms,
             "total_time_ms": self.total_time_ms,
+            "timings": self.timings,
+            "partial": self.partial,
         }
 
 
@@ -69,10 +76,9 @@ class RAGPipeline:
     
     完整的检索增强生成流程：
     1. 查询预处理（意图识别、关键词提取）
-    2. 混合检索（向量 + BM25）
-    3. 知识图谱查询
-    4. 结果重排序
-    5. 上下文构建
+    2. 混合检索（向量 + BM25）与知识图谱查询并发执行，受截止时间约束
+    3. 结果重排序
+    4. 上下文构建
     """
     
     def __init__(
@@ -156,6 +162,9 @@ class RAGPipeline:
         # 确保已初始化
         if not self._indexed:
             self.initialize()
+        else:
+            # 有新写入的记忆时增量并入索引
+            self._retriever.sync_memories()
         
         # 1. 查询预处理
         processed_query = self._query_processor.process(query)
@@ -172,10 +181,17 @@ class RAGPipeline:
         # 3. 获取检索配置
         retrieval_config = self._query_processor.get_retrieval_config(processed_query)
         
-        # 4. 混合检索
+        # 4. 混合检索，知识图谱查询同时在检索线程池里进行
         retrieval_start = time.time()
+        deadline_sec = cfg.retrieval_deadline_ms / 1000 if cfg.retrieval_deadline_ms > 0 else None
         
-        results = self._retriever.retrieve(
+        kg_future = None
+        if cfg.enable_knowledge_graph and self._knowledge_graph:
+            kg_future = self._retriever.submit(
+                "knowledge_graph", self._query_knowledge_graph, processed_query, cfg.kg_max_triples
+            )
+        
+        results, timings = self._retriever.retrieve_with_timings(
             query=query,
             sources=[RetrievalSource.MEMORY, RetrievalSource.KNOWLEDGE_BASE],
             top_k=retrieval_config.get("top_k", cfg.top_k),
@@ -184,17 +200,29 @@ class RAGPipeline:
             vector_weight=cfg.vector_weight,
             keyword_weight=cfg.keyword_weight,
             min_score=cfg.min_score,
+            deadline_sec=deadline_sec,
         )
         
         # 5. 重排序
         results = self._retriever.rerank(query, results, cfg.top_k)
         
-        retrieval_time = (time.time() - retrieval_start) * 1000
-        
-        # 6. 知识图谱查询
+        # 6. 知识图谱结果（截止时间内未返回则放弃）
         kg_context = None
-        if cfg.enable_knowledge_graph and self._knowledge_graph:
-            kg_context = self._query_knowledge_graph(processed_query, cfg.kg_max_triples)
+        if kg_future is not None:
+            remaining = None
+            if deadline_sec is not None:
+                remaining = max(0.0, deadline_sec - (time.time() - retrieval_start))
+            done, _ = wait_futures([kg_future], timeout=remaining)
+            if kg_future in done:
+                kg_context = kg_future.result()
+                timings["knowledge_graph"] = getattr(kg_future, "elapsed_ms", None)
+            else:
+                timings["knowledge_graph"] = None
+                self._retriever.record_timeout("knowledge_graph")
+                logger.warning("知识图谱查询超时，本轮不使用")
+        
+        retrieval_time = (time.time() - retrieval_start) * 1000
+        partial = any(ms is None for ms in timings.values())
         
         # 7. 构建上下文
         context_config = ContextConfig(
@@ -220,14 +248,17 @@ class RAGPipeline:
             kg_context=kg_context,
             retrieval_time_ms=retrieval_time,
             total_time_ms=total_time,
+            timings=timings,
+            partial=partial,
         )
         
-        # 缓存
-        if cfg.enable_cache:
+        # 缓存（不完整的结果不缓存，下次重新检索）
+        if cfg.enable_cache and not partial:
             self._set_cache(query, response)
         
         logger.info(f"RAG 检索完成: 意图={processed_query.intent.value}, "
-                   f"结果数={len(results)}, 耗时={total_time:.1f}ms")
+                   f"结果数={len(results)}, 耗时={total_time:.1f}ms"
+                   + (f", 超时放弃={[k for k, v in timings.items() if v is None]}" if partial else ""))
         
         return response
     
@@ -8,13 +8,22 @@
 3. 结果融合（RRF: Reciprocal Rank Fusion）
 4. 多源检索（记忆、知识库、知识图谱）
 5. 重排序和过滤
+6. 各源的向量 / BM25 检索并发执行，可设截止时间（超时的源不等待，返回已完成部分），记录分源耗时
 """
 from typing import Optional, List, Dict, Any, Set, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
 import math
+import time
 import logging
+import threading
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+from datetime import datetime
+
+import numpy as np
+
+from .bm25_index import PersistentBM25, get_bm25_index, score_top_k, tokenize
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +64,8 @@ class BM25:
     """
     BM25 关键词检索算法
     
-    用于快速的关键词匹配检索
+    用于快速的关键词匹配检索。检索时把倒排编译成 CSR 数组（有新文档时重新编译），
+    用 score_top_k 向量化打分
     """
     
     def __init__(self, k1: float = 1.5, b: float = 0.75):
@@ -69,9 +79,12 @@ class BM25:
         self._documents: Dict[str, str] = {}  # doc_id -> content
         self._doc_lengths: Dict[str, int] = {}
         self._avg_doc_length: float = 0
+        self._total_length: int = 0
         self._term_freqs: Dict[str, Dict[str, int]] = defaultdict(dict)  # term -> {doc_id: freq}
         self._doc_freqs: Dict[str, int] = defaultdict(int)  # term -> doc_count
         self._total_docs: int = 0
+        # 编译后的 CSR 倒排：(term -> (start, end), 文档号, 词频, 文档号 -> 长度, 文档号 -> doc_id)
+        self._compiled: Optional[Tuple[Dict[str, Tuple[int, int]], np.ndarray, np.ndarray, np.ndarray, List[str]]] = None
     
     def add_document(self, doc_id: str, content: str):
         """添加文档"""
@@ -96,7 +109,9 @@ class BM25:
                 self._doc_freqs[term] += 1
         
         self._total_docs += 1
-        self._avg_doc_length = sum(self._doc_lengths.values()) / max(self._total_docs, 1)
+        self._total_length += len(terms)
+        self._avg_doc_length = self._total_length / self._total_docs
+        self._compiled = None
     
     def add_documents(self, documents: Dict[str, str]):
         """批量添加文档"""
@@ -114,44 +129,57 @@ class BM25:
             return []
         
         query_terms = self._tokenize(query)
+        spans, post_docs, post_tfs, doc_lengths, doc_ids = self._compile()
         
-        scores = defaultdict(float)
-        
+        postings = []
         for term in query_terms:
-            if term not in self._term_freqs:
+            if term not in spans:
                 continue
             
             # IDF
             df = self._doc_freqs[term]
             idf = math.log((self._total_docs - df + 0.5) / (df + 0.5) + 1)
             
-            for doc_id, tf in self._term_freqs[term].items():
-                doc_len = self._doc_lengths[doc_id]
-                # BM25 公式
-                numerator = tf * (self.k1 + 1)
-                denominator = tf + self.k1 * (1 - self.b + self.b * doc_len / self._avg_doc_length)
-                scores[doc_id] += idf * numerator / denominator
+            start, end = spans[term]
+            docs = post_docs[start:end]
+            postings.append((idf, docs, post_tfs[start:end], doc_lengths[docs]))
         
-        # 排序
-        sorted_results = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_results[:top_k]
+        # BM25 公式 + 排序
+        ranked = score_top_k(postings, len(doc_ids), top_k, self._avg_doc_length, self.k1, self.b)
+        return [(doc_ids[num], score) for num, score in ranked]
+    
+    def _compile(self):
+        """把 dict 倒排编译成 CSR 数组（文档号按加入顺序，与原 dict 迭代顺序一致）"""
+        if self._compiled is None:
+            doc_ids = list(self._documents)
+            doc_index = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+            spans: Dict[str, Tuple[int, int]] = {}
+            docs: List[int] = []
+            tfs: List[int] = []
+            for term, postings in self._term_freqs.items():
+                spans[term] = (len(docs), len(docs) + len(postings))
+                docs.extend(doc_index[doc_id] for doc_id in postings)
+                tfs.extend(postings.values())
+            self._compiled = (
+                spans,
+                np.array(docs, dtype=np.int64),
+                np.array(tfs, dtype=np.int64),
+                np.array([self._doc_lengths[doc_id] for doc_id in doc_ids], dtype=np.int64),
+                doc_ids,
+            )
+        return self._compiled
     
     def _tokenize(self, text: str) -> List[str]:
-        """简单分词"""
-        import re
-        
-        # 中文：按字符
-        chinese = re.findall(r'[\u4e00-\u9fff]', text)
-        
-        # 中文 bigram
-        chinese_bigrams = []
-        for i in range(len(chinese) - 1):
-            chinese_bigrams.append(chinese[i] + chinese[i+1])
-        
-        # 英文：按单词
-        english = re.findall(r'[a-zA-Z]+', text.lower())
-        
-        return chinese + chinese_bigrams + english
+        """简单分词（与持久化索引共用）"""
+        return tokenize(text)
+    
+    @property
+    def doc_count(self) -> int:
+        return self._total_docs
+    
+    @property
+    def avg_doc_length(self) -> float:
+        return self._avg_doc_length
     
     def clear(self):
         """清空索引"""
@@ -160,7 +188,9 @@ class BM25:
         self._term_freqs.clear()
         self._doc_freqs.clear()
         self._total_docs = 0
+        self._total_length = 0
         self._avg_doc_length = 0
+        self._compiled = None
 
 
 class HybridRetriever:
@@ -170,23 +200,64 @@ class HybridRetriever:
     结合向量检索和 BM25 检索，支持多源数据
     """
     
-    def __init__(self, user_id: str = "default_user"):
+    # 使用持久化 BM25 的检索源（知识图谱三元组每次从图谱加载，保持内存索引）
+    PERSISTENT_SOURCES = (RetrievalSource.MEMORY, RetrievalSource.KNOWLEDGE_BASE)
+    
+    # 增量同步每批写入的记忆条数
+    SYNC_BATCH_SIZE = 500
+    
+    # 检索线程池通道：查询向量 + 向量检索走一个池，BM25 + 知识图谱走另一个池，
+    # 慢的向量检索（或超时被放弃仍在跑的任务）不会占满线程、拖住关键词检索
+    VECTOR_LANE = "vector"
+    KEYWORD_LANE = "keyword"
+    
+    def __init__(self, user_id: str = "default_user", persistent_bm25: bool = True, max_workers: int = 4):
+        """
+        Args:
+            user_id: 用户 ID
+            persistent_bm25: 记忆 / 知识库的 BM25 索引是否落盘（打开失败时回退到内存索引）
+            max_workers: 每个检索通道的线程数（一次检索每个通道最多 3 路，多出的留给超时未结束的任务）
+        """
         self.user_id = user_id
         
+        # 并发检索线程池（按通道延迟创建）
+        self.max_workers = max(1, int(max_workers))
+        self._lanes: Dict[str, ThreadPoolExecutor] = {}
+        self._pool_lock = threading.Lock()
+        
+        # 分源耗时统计：任务名（如 "memory:vector"）→ {calls, total_ms, max_ms, timeouts}
+        self._timing_stats: Dict[str, Dict[str, float]] = {}
+        self._stats_lock = threading.Lock()
+        
         # BM25 索引（每个源一个）
-        self._bm25_indexes: Dict[RetrievalSource, BM25] = {
+        self._bm25_indexes: Dict[RetrievalSource, Any] = {
             RetrievalSource.MEMORY: BM25(),
             RetrievalSource.KNOWLEDGE_BASE: BM25(),
             RetrievalSource.KNOWLEDGE_GRAPH: BM25(),
         }
+        if persistent_bm25:
+            self._open_persistent_indexes()
         
-        # 文档缓存
+        # 文档缓存（持久化索引的文档原文存在索引里，不进缓存）
         self._doc_cache: Dict[str, Dict] = {}
         
+        # 上次同步记忆时 MemoryDAO 的写入版本
+        self._synced_memory_version: Optional[int] = None
+        # 本进程是否已按内容哈希对齐过记忆向量
+        self._memory_vectors_synced = False
+        
         # 初始化向量存储
         self._vector_stores = {}
         self._init_vector_stores()
     
+    def _open_persistent_indexes(self):
+        """打开持久化 BM25 索引"""
+        for source in self.PERSISTENT_SOURCES:
+            try:
+                self._bm25_indexes[source] = get_bm25_index(self.user_id, source.value)
+            except Exception as e:
+                logger.warning(f"打开持久化 BM25 索引失败，使用内存索引: {e}")
+    
     def _init_vector_stores(self):
         """初始化向量存储"""
         try:
@@ -201,25 +272,61 @@ class HybridRetriever:
         doc_id: str,
         content: str,
         source: RetrievalSource,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        vectorize: bool = True
     ):
         """
         索引文档
         
-        同时添加到 BM25 索引和向量存储
+        同时添加到 BM25 索引和向量存储（vectorize=False 时只建关键词索引，向量由调用方同步）
         """
-        # 添加到 BM25
-        if source in self._bm25_indexes:
-            self._bm25_indexes[source].add_document(doc_id, content)
-        
-        # 缓存文档
-        self._doc_cache[doc_id] = {
-            "content": content,
-            "source": source,
-            "metadata": metadata or {}
-        }
+        index = self._bm25_indexes.get(source)
+        if isinstance(index, PersistentBM25):
+            # 持久化索引已有相同内容时跳过（向量存储也已写过）
+            if not index.add_document(doc_id, content, metadata):
+                return
+        else:
+            # 添加到 BM25
+            if index is not None:
+                index.add_document(doc_id, content)
+            
+            # 缓存文档
+            self._doc_cache[doc_id] = {
+                "content": content,
+                "source": source,
+                "metadata": metadata or {}
+            }
         
-        # 添加到向量存储
+        if vectorize:
+            self._add_to_vector_store(doc_id, content, source, metadata)
+    
+    def remove_document(self, doc_id: str, source: RetrievalSource):
+        """从 BM25 索引和文档缓存中移除（向量存储由调用方负责）"""
+        index = self._bm25_indexes.get(source)
+        if isinstance(index, PersistentBM25):
+            index.delete_document(doc_id)
+        self._doc_cache.pop(doc_id, None)
+    
+    def _get_document(self, doc_id: str, source: RetrievalSource) -> Optional[Dict]:
+        """取文档：先查缓存，再查持久化索引"""
+        doc = self._doc_cache.get(doc_id)
+        if doc is not None:
+            return doc
+        index = self._bm25_indexes.get(source)
+        if isinstance(index, PersistentBM25):
+            found = index.get_document(doc_id)
+            if found is not None:
+                return {"content": found[0], "source": source, "metadata": found[1]}
+        return None
+    
+    def _add_to_vector_store(
+        self,
+        doc_id: str,
+        content: str,
+        source: RetrievalSource,
+        metadata: Optional[Dict] = None
+    ):
+        """添加到向量存储"""
         if source in self._vector_stores:
             try:
                 self._vector_stores[source].add(
@@ -240,10 +347,41 @@ class HybridRetriever:
         vector_weight: float = 0.7,
         keyword_weight: float = 0.3,
         min_score: float = 0.0,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        deadline_sec: Optional[float] = None
     ) -> List[RetrievalResult]:
         """
-        混合检索
+        混合检索（参数见 retrieve_with_timings）
+        
+        Returns:
+            检索结果列表
+        """
+        results, _ = self.retrieve_with_timings(
+            query, sources, top_k, use_vector, use_keyword,
+            vector_weight, keyword_weight, min_score, where, deadline_sec,
+        )
+        return results
+    
+    def retrieve_with_timings(
+        self,
+        query: str,
+        sources: Optional[List[RetrievalSource]] = None,
+        top_k: int = 5,
+        use_vector: bool = True,
+        use_keyword: bool = True,
+        vector_weight: float = 0.7,
+        keyword_weight: float = 0.3,
+        min_score: float = 0.0,
+        where: Optional[Dict] = None,
+        deadline_sec: Optional[float] = None
+    ) -> Tuple[List[RetrievalResult], Dict[str, Optional[float]]]:
+        """
+        混合检索，同时返回本次各路耗时
+        
+        各源的向量检索与 BM25 检索并发执行，总耗时取决于最慢的一路而不是各路之和。
+        向量检索在查询向量算好后才提交，不占着线程等待。
+        设置 deadline_sec 时超时未完成的检索直接放弃（未开始的取消，已开始的后台跑完后丢弃），
+        用已完成的部分融合。
         
         Args:
             query: 查询文本
@@ -255,25 +393,66 @@ class HybridRetriever:
             keyword_weight: 关键词检索权重
             min_score: 最小分数阈值
             where: 元数据过滤条件
+            deadline_sec: 截止时间（秒，从调用开始计），None 表示等待全部完成
             
         Returns:
-            检索结果列表
+            (检索结果列表, 各路耗时 {任务名: 毫秒}，超时的一路为 None)
         """
         if sources is None:
             sources = [RetrievalSource.MEMORY, RetrievalSource.KNOWLEDGE_BASE]
         
+        start = time.perf_counter()
         all_results: Dict[str, RetrievalResult] = {}
         
+        # 每次检索只计算一次查询向量，各向量检索任务共用
+        embedding_future: Optional[Future] = None
+        if use_vector and any(source in self._vector_stores for source in sources):
+            embedding_future = self.submit(
+                "query_embedding", self._embed_query, query, lane=self.VECTOR_LANE
+            )
+        
+        def vector_task(source: RetrievalSource) -> Dict[str, float]:
+            # 只在 embedding_future 完成后执行，result() 不会阻塞
+            query_embedding = embedding_future.result() if embedding_future else None
+            return self._vector_retrieve(query, source, top_k * 2, where, query_embedding)
+        
+        tasks: Dict[Tuple[RetrievalSource, str], Future] = {}
         for source in sources:
-            # 向量检索
-            vector_results = {}
             if use_vector and source in self._vector_stores:
-                vector_results = self._vector_retrieve(query, source, top_k * 2, where)
-            
-            # BM25 检索
-            keyword_results = {}
+                tasks[(source, "vector")] = self.submit(
+                    f"{source.value}:vector", vector_task, source,
+                    lane=self.VECTOR_LANE, after=embedding_future,
+                )
             if use_keyword and source in self._bm25_indexes:
-                keyword_results = self._keyword_retrieve(query, source, top_k * 2)
+                tasks[(source, "keyword")] = self.submit(
+                    f"{source.value}:keyword", self._keyword_retrieve, query, source, top_k * 2
+                )
+        
+        remaining = None if deadline_sec is None else max(0.0, deadline_sec - (time.perf_counter() - start))
+        done, pending = wait_futures(list(tasks.values()), timeout=remaining)
+        
+        timings: Dict[str, Optional[float]] = {}
+        if embedding_future is not None:
+            timings["query_embedding"] = getattr(embedding_future, "elapsed_ms", None)
+        for (source, kind), future in tasks.items():
+            name = f"{source.value}:{kind}"
+            timings[name] = getattr(future, "elapsed_ms", None) if future in done else None
+            if future in pending:
+                # 还没开始执行的直接取消，不再占用线程
+                future.cancel()
+                self.record_timeout(name)
+        if pending:
+            logger.warning(
+                f"检索超时（{deadline_sec * 1000:.0f}ms），放弃: "
+                + ", ".join(name for name, ms in timings.items() if ms is None)
+            )
+        
+        for source in sources:
+            # 已完成的向量 / BM25 结果（超时的一路按空结果处理）
+            vector_future = tasks.get((source, "vector"))
+            keyword_future = tasks.get((source, "keyword"))
+            vector_results = vector_future.result() if vector_future in done else {}
+            keyword_results = keyword_future.result() if keyword_future in done else {}
             
             # 融合结果（RRF）
             fused = self._fuse_results(
@@ -285,8 +464,8 @@ class HybridRetriever:
             
             # 创建 RetrievalResult 对象
             for doc_id, score_info in fused.items():
-                if doc_id in self._doc_cache:
-                    doc = self._doc_cache[doc_id]
+                doc = self._get_document(doc_id, source)
+                if doc is not None:
                     result = RetrievalResult(
                         doc_id=doc_id,
                         content=doc["content"],
@@ -305,14 +484,95 @@ class HybridRetriever:
         results = sorted(all_results.values(), key=lambda x: x.score, reverse=True)
         results = [r for r in results if r.score >= min_score]
         
-        return results[:top_k]
+        return results[:top_k], timings
+    
+    def _executor_for(self, lane: str) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            executor = self._lanes.get(lane)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"RAGRetrieve-{lane}"
+                )
+                self._lanes[lane] = executor
+            return executor
+    
+    def submit(self, name: str, fn, *args, lane: str = KEYWORD_LANE, after: Optional[Future] = None) -> Future:
+        """
+        在检索线程池中执行 fn(*args)，完成后把耗时记入 name 的统计，并挂在 future.elapsed_ms 上
+        （RAGPipeline 也用它并发执行知识图谱查询）
+        
+        Args:
+            lane: 线程池通道（VECTOR_LANE / KEYWORD_LANE）
+            after: 依赖的任务，完成后才提交 fn（等待期间不占线程）
+        
+        返回的 future 在开始执行前可以 cancel()。
+        """
+        pool = self._executor_for(lane)
+        future: Future = Future()
+        
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            task_start = time.perf_counter()
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.elapsed_ms = (time.perf_counter() - task_start) * 1000
+                self._record_timing(name, future.elapsed_ms)
+                future.set_exception(e)
+                return
+            future.elapsed_ms = (time.perf_counter() - task_start) * 1000
+            self._record_timing(name, future.elapsed_ms)
+            future.set_result(result)
+        
+        if after is None:
+            pool.submit(run)
+        else:
+            after.add_done_callback(lambda _: pool.submit(run))
+        return future
+    
+    def _record_timing(self, name: str, elapsed_ms: float):
+        with self._stats_lock:
+            stats = self._timing_stats.setdefault(name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "timeouts": 0})
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+    
+    def record_timeout(self, name: str):
+        """记录一次超时（调用方已放弃等待的任务）"""
+        with self._stats_lock:
+            stats = self._timing_stats.setdefault(name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "timeouts": 0})
+            stats["timeouts"] += 1
+    
+    def get_timing_stats(self) -> Dict[str, Dict[str, float]]:
+        """分源耗时统计（平均 / 最大耗时、超时次数）"""
+        with self._stats_lock:
+            return {
+                name: {
+                    "calls": stats["calls"],
+                    "avg_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                    "max_ms": round(stats["max_ms"], 2),
+                    "timeouts": stats["timeouts"],
+                }
+                for name, stats in self._timing_stats.items()
+            }
+    
+    def _embed_query(self, query: str) -> Optional[List[float]]:
+        """计算查询向量（共享 LRU + 微批）；失败时返回 None，由各存储自行计算"""
+        try:
+            from ..database.chroma_client import get_query_embedding_service
+            return get_query_embedding_service().embed(query)
+        except Exception as e:
+            logger.warning(f"计算查询向量失败: {e}")
+            return None
     
     def _vector_retrieve(
         self,
         query: str,
         source: RetrievalSource,
         top_k: int,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, float]:
         """向量检索"""
         results = {}
@@ -331,7 +591,8 @@ class HybridRetriever:
             response = store.query(
                 query_text=query,
                 n_results=top_k,
-                where=filter_where
+                where=filter_where,
+                query_embedding=query_embedding
             )
             
             if response and response.get("ids") and response["ids"][0]:
@@ -478,8 +739,36 @@ class HybridRetriever:
         
         return results
     
+    @staticmethod
+    def _memory_document(mem: Dict) -> Tuple[str, str, Dict]:
+        return (
+            mem["memory_id"],
+            mem["content"],
+            {
+                "type": mem.get("type"),
+                "importance": mem.get("importance", 0.5),
+                "tags": mem.get("tags", []),
+            },
+        )
+    
     def load_from_memory_dao(self):
-        """从 MemoryDAO 加载数据到索引"""
+        """
+        从 MemoryDAO 加载数据到索引
+        
+        关键词索引：持久化索引只同步上次之后新增的记忆
+        向量存储：按内容哈希与 MongoDB 对齐（_sync_memory_vectors），不再每次启动重新向量化
+        """
+        index = self._bm25_indexes.get(RetrievalSource.MEMORY)
+        if isinstance(index, PersistentBM25):
+            self._sync_memories(index)
+        else:
+            self._load_recent_memories()
+        
+        if not self._memory_vectors_synced:
+            self._sync_memory_vectors()
+    
+    def _load_recent_memories(self):
+        """内存索引：加载最近的记忆"""
         try:
             from ..database.memory_dao import get_memory_dao
             dao = get_memory_dao()
@@ -496,7 +785,8 @@ class HybridRetriever:
                         "type": mem.get("type"),
                         "importance": mem.get("importance", 0.5),
                         "tags": mem.get("tags", []),
-                    }
+                    },
+                    vectorize=False
                 )
             
             logger.info(f"从 MemoryDAO 加载了 {len(memories)} 条记忆")
@@ -504,6 +794,88 @@ class HybridRetriever:
         except Exception as e:
             logger.warning(f"加载记忆数据失败: {e}")
     
+    def _sync_memories(self, index: PersistentBM25):
+        """按 created_at 水位增量同步记忆，没有条数上限；已删除的记忆由 LongTermMemoryManager 同步移除"""
+        try:
+            from ..database.memory_dao import get_memory_dao, MemoryDAO
+            dao = get_memory_dao()
+            version = MemoryDAO.version
+            
+            watermark = index.get_meta("synced_until")
+            since = datetime.fromisoformat(watermark) if watermark else None
+            
+            batch: List[Tuple[str, str, Dict]] = []
+            count = 0
+            latest = since
+            memories = dao.iter_memories_since(self.user_id, since)
+            if since is None and index.doc_count == 0:
+                # 首次同步（或索引被删除后重建）：直接构建基础段
+                for mem in memories:
+                    batch.append(self._memory_document(mem))
+                    latest = mem.get("created_at") or latest
+                count = index.bulk_load(batch)
+                batch, memories = [], []
+            for mem in memories:
+                batch.append(self._memory_document(mem))
+                latest = mem.get("created_at") or latest
+                if len(batch) >= self.SYNC_BATCH_SIZE:
+                    index.add_documents(batch)
+                    count += len(batch)
+                    batch = []
+                    # 每批提交后推进水位，中途失败下次从这里继续
+                    index.set_meta("synced_until", latest.isoformat())
+            if batch:
+                index.add_documents(batch)
+                count += len(batch)
+            if latest is not None:
+                index.set_meta("synced_until", latest.isoformat())
+            
+            self._synced_memory_version = version
+            logger.info(f"记忆索引增量同步 {count} 条，索引共 {index.doc_count} 条")
+        
+        except Exception as e:
+            logger.warning(f"同步记忆数据失败: {e}")
+    
+    def _sync_memory_vectors(self):
+        """
+        按内容哈希对齐 MongoDB 记忆与 Chroma 记忆集合（当前用户范围）
+        
+        只读两边的 ID / 内容哈希做差异，仅对新增或内容变化的记忆分批向量化写入，
+        删除 MongoDB 中已不存在的记忆；运行期新增记忆由 LongTermMemoryManager 直接写入 Chroma
+        """
+        store = self._vector_stores.get(RetrievalSource.MEMORY)
+        if store is None:
+            return
+        try:
+            from ..database.memory_dao import get_memory_dao
+            dao = get_memory_dao()
+            
+            documents = []
+            for mem in dao.iter_memories_since(self.user_id, None):
+                doc_id, content, metadata = self._memory_document(mem)
+                documents.append((doc_id, content, {"user_id": self.user_id, **metadata}))
+            stats = store.sync(documents, where={"user_id": self.user_id})
+            self._memory_vectors_synced = True
+            logger.info(
+                f"记忆向量同步: 新增 {stats['added']}, 更新 {stats['updated']}, "
+                f"删除 {stats['deleted']}, 未变 {stats['unchanged']}"
+            )
+        
+        except Exception as e:
+            logger.warning(f"同步记忆向量失败: {e}")
+    
+    def sync_memories(self):
+        """MemoryDAO 有新写入时把新增记忆并入持久化索引（版本号未变时几乎零开销）"""
+        index = self._bm25_indexes.get(RetrievalSource.MEMORY)
+        if not isinstance(index, PersistentBM25):
+            return
+        try:
+            from ..database.memory_dao import MemoryDAO
+        except Exception:
+            return
+        if MemoryDAO.version != self._synced_memory_version:
+            self._sync_memories(index)
+    
     def load_from_knowledge_graph(self):
         """从知识图谱加载数据"""
         try:
@@ -537,8 +909,10 @@ class HybridRetriever:
         stats = {}
         for source, bm25 in self._bm25_indexes.items():
             stats[source.value] = {
-                "doc_count": bm25._total_docs,
-                "avg_doc_length": bm25._avg_doc_length,
+                "doc_count": bm25.doc_count,
+                "avg_doc_length": bm25.avg_doc_length,
+                "persistent": isinstance(bm25, PersistentBM25),
             }
         stats["total_cached"] = len(self._doc_cache)
+        stats["timing"] = self.get_timing_stats()
         return stats
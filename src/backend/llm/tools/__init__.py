@@ -1,21 +1,47 @@
 """
 工具系统
 提供各种工具供 Agent 调用
+
+工具模块按需导入：访问 backend.llm.tools.XxxTool 时才加载对应模块，
+避免只用到少数工具时把浏览器/视觉等模块全部导入。
 """
+import importlib
+
 from .base_tool import BaseTool, ToolResult
-from .datetime_tool import DateTimeTool
-from .memory_tool import MemoryTool
-from .summary_tool import SummaryTool
-from .screenshot_tool import ScreenshotTool
-from .camera_tool import CameraCaptureTool
-from .file_tool import FileWriteTool, FileReadTool
-from .browser_search_tool import BrowserSearchTool
-from .vision_tool import VisionTool, ScreenshotAnalyzeTool
-from .reminder_tool import ReminderTool, ReminderManager
-from .live2d_motion_tool import Live2DMotionTool
-from .exit_app_tool import ExitAppTool
-from .terminal_tool import TerminalExecuteTool
-from .skill_generator_tool import SkillGeneratorTool
+
+# 导出名 → 所在子模块
+_LAZY_EXPORTS = {
+    "DateTimeTool": ".datetime_tool",
+    "MemoryTool": ".memory_tool",
+    "SummaryTool": ".summary_tool",
+    "ScreenshotTool": ".screenshot_tool",
+    "CameraCaptureTool": ".camera_tool",
+    "FileWriteTool": ".file_tool",
+    "FileReadTool": ".file_tool",
+    "BrowserSearchTool": ".browser_search_tool",
+    "VisionTool": ".vision_tool",
+    "ScreenshotAnalyzeTool": ".vision_tool",
+    "ReminderTool": ".reminder_tool",
+    "ReminderManager": ".reminder_tool",
+    "Live2DMotionTool": ".live2d_motion_tool",
+    "ExitAppTool": ".exit_app_tool",
+    "TerminalExecuteTool": ".terminal_tool",
+    "SkillGeneratorTool": ".skill_generator_tool",
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_LAZY_EXPORTS.keys()))
+
 
 __all__ = [
     "BaseTool",
@@ -44,7 +44,16 @@ class BaseTool(ABC):
     2. description: 工具描述
     3. parameters: 参数定义
     4. execute(): 执行方法
+
+    可选的并发声明（ToolManager 并行执行同一批工具调用时使用）:
+    - timeout_sec: 单次执行超时（秒），None 表示不限
+    - reentrant: False 表示同一工具的多次调用必须串行（且固定在同一线程，如浏览器/摄像头）
+    - side_effects: True 表示有外部副作用（写文件/执行命令/退出等），与其它副作用工具按调用顺序串行
     """
+
+    timeout_sec: Optional[float] = 30.0
+    reentrant: bool = True
+    side_effects: bool = False
     
     @property
     @abstractmethod
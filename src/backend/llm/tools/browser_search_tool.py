@@ -30,6 +30,10 @@ class BrowserSearchTool(BaseTool):
     使用 Playwright 自动打开 Edge 浏览器，在 Bing 上搜索，并读取网页内容
     支持实时检测和处理人机验证（滑块、点击验证等）
     """
+
+    # 共用一个 Playwright 浏览器实例（同步 API 绑定线程），人机验证最长等待 60s
+    timeout_sec = 120.0
+    reentrant = False
     
     def __init__(self, headless: bool = False, timeout: int = 30000, manual_captcha: bool = True, keep_alive: bool = True, keep_alive_duration: int = 5000, filter_ads: bool = True):
         """
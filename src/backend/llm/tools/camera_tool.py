@@ -15,6 +15,8 @@ from .base_tool import BaseTool, ToolParameter, ToolResult
 class CameraCaptureTool(BaseTool):
     """摄像头拍照工具"""
 
+    reentrant = False  # 摄像头设备独占
+
     def __init__(self, default_save_dir: str = "data/camera"):
         self._default_save_dir = default_save_dir
         os.makedirs(default_save_dir, exist_ok=True)
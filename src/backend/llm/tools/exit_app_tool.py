@@ -14,6 +14,8 @@ from .base_tool import BaseTool, ToolParameter, ToolResult
 class ExitAppTool(BaseTool):
     """请求应用在当前回复播报后退出。"""
 
+    side_effects = True
+
     @property
     def name(self) -> str:
         return "exit_app"
@@ -12,6 +12,8 @@ from .base_tool import BaseTool, ToolParameter, ToolResult
 
 class FileWriteTool(BaseTool):
     """文件写入工具"""
+
+    side_effects = True
     
     def __init__(self, default_save_dir: str = "data/txt"):
         """
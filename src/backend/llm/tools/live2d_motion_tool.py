@@ -48,6 +48,8 @@ def resolve_motion(user_input: str) -> str | None:
 class Live2DMotionTool(BaseTool):
     """Live2D 动作控制工具"""
 
+    side_effects = True
+
     @property
     def name(self) -> str:
         return "live2d_motion"
@@ -8,6 +8,8 @@ from .base_tool import BaseTool, ToolParameter, ToolResult
 
 class MemoryTool(BaseTool):
     """记忆管理工具"""
+
+    reentrant = False  # save/search 需按调用顺序执行
     
     def __init__(self, memory_manager=None):
         """
@@ -259,6 +259,8 @@ class ReminderTool(BaseTool):
     - 查看行程
     - 取消行程
     """
+
+    side_effects = True
     
     def __init__(self):
         self._manager = ReminderManager.get_instance()
@@ -304,6 +304,8 @@ class SkillGeneratorTool(BaseTool):
     - Progressive Disclosure: 分层加载资源
     """
 
+    side_effects = True
+
     TOOLS_DIR = Path(__file__).resolve().parents[0]
 
     @property
@@ -9,19 +9,15 @@ import os
 import re
 import json
 
-try:
-    import tkinter as tk
-    from tkinter import simpledialog
-except Exception:
-    tk = None
-    simpledialog = None
-
 from .base_tool import BaseTool, ToolParameter, ToolResult
 
 
 class TerminalExecuteTool(BaseTool):
     """在终端执行命令并返回输出"""
 
+    timeout_sec = 130.0  # 命令自身超时上限 120s
+    side_effects = True
+
     @property
     def name(self) -> str:
         return "terminal_execute"
@@ -154,7 +150,11 @@ class TerminalExecuteTool(BaseTool):
                 ),
             )
 
-        if tk is None or simpledialog is None:
+        # 授权弹窗只在删除命令时才需要，延迟导入 tkinter
+        try:
+            import tkinter as tk
+            from tkinter import simpledialog
+        except Exception:
             return ToolResult(success=False, error="检测到删除命令，但当前环境无法弹出授权窗口")
 
         root = None
@@ -21,6 +21,8 @@ class VisionTool(BaseTool):
     - 读取图中文字
     - 获取图像描述
     """
+
+    timeout_sec = 90.0
     
     @property
     def name(self) -> str:
@@ -180,6 +182,8 @@ class ScreenshotAnalyzeTool(BaseTool):
     
     专门用于分析屏幕截图，优化 OCR 识别
     """
+
+    timeout_sec = 90.0
     
     @property
     def name(self) -> str:
@@ -0,0 +1,45 @@
+"""
+Token 估算
+不依赖具体分词器的快速估算，用于历史窗口的 token 预算
+
+按 DeepSeek 官方给出的换算：1 个中文字符 ≈ 0.6 token，1 个英文字符 ≈ 0.3 token；
+另加每条消息的格式开销。估算结果按文本缓存，同一条消息只算一次。
+"""
+from functools import lru_cache
+from typing import Dict, Iterable
+
+# 每条消息的角色/分隔符开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF      # CJK 统一汉字
+        or 0x3400 <= code <= 0x4DBF   # 扩展 A
+        or 0x3000 <= code <= 0x303F   # CJK 标点
+        or 0xFF00 <= code <= 0xFFEF   # 全角字符
+    )
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """估算文本 token 数（结果缓存）"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    other = len(text) - cjk
+    return max(1, int(round(cjk * 0.6 + other * 0.3)))
+
+
+def count_message_tokens(message: Dict) -> int:
+    """估算单条消息 token 数；消息自带 tokens 字段（写入时已算好）时直接使用"""
+    tokens = message.get("tokens")
+    if isinstance(tokens, int) and tokens >= 0:
+        return tokens
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def count_messages_tokens(messages: Iterable[Dict]) -> int:
+    """估算消息列表 token 总数"""
+    return sum(count_message_tokens(m) for m in messages)
@@ -10,7 +10,7 @@ import wave
 import threading
 import queue
 from pathlib import Path
-from typing import Callable, Optional, Union
+from typing import Callable, List, Optional, Union
 from dataclasses import dataclass
 from collections import deque
 
@@ -75,10 +75,13 @@ class AudioInput:
     - 连续监听模式
     - 语音活动检测 (VAD)：RMS 或 Silero 后端
     - 回调函数处理音频
+
+    backend 默认为 sounddevice，可注入兼容 InputStream 接口的假后端做离线回放。
     """
     
-    def __init__(self, config: AudioConfig = None):
+    def __init__(self, config: AudioConfig = None, backend=None):
         self.config = config or AudioConfig()
+        self._backend = backend
         self._stream = None
         self._is_listening = False
         self._audio_buffer = queue.Queue()
@@ -88,6 +91,8 @@ class AudioInput:
         self._is_speaking = False
         self._silence_start = None
         self._speech_buffer = []
+        # 插话检测时已读出的音频块，下一次录音时优先处理（不 flush）
+        self._preroll: List[np.ndarray] = []
         
         # 构建 VADConfig 与后端
         self._vad_config = self._build_vad_config()
@@ -114,7 +119,8 @@ class AudioInput:
     
     def start_listening(self):
         """开始监听麦克风"""
-        if not HAS_SOUNDDEVICE:
+        backend = self._backend if self._backend is not None else (sd if HAS_SOUNDDEVICE else None)
+        if backend is None:
             raise RuntimeError("sounddevice 未安装")
         
         if self._is_listening:
@@ -145,7 +151,7 @@ class AudioInput:
                 except Exception as e:
                     log.error(f"[AudioIO] 回调错误: {e}")
         
-        self._stream = sd.InputStream(
+        self._stream = backend.InputStream(
             samplerate=self.config.sample_rate,
             channels=self.config.channels,
             dtype=self.config.dtype,
@@ -184,6 +190,13 @@ class AudioInput:
             except queue.Empty:
                 break
         return n
+
+    def set_preroll(self, chunks: List[np.ndarray]):
+        """
+        设置预置音频块：下一次 record_until_silence 先处理这些块，且不清空队列。
+        用于播放中插话：监听线程已消费的用户语音开头需交还给 ASR。
+        """
+        self._preroll = [c for c in (chunks or []) if c is not None and len(c) > 0]
     
     def detect_speech(self, audio_chunk: np.ndarray) -> bool:
         """检测是否有语音（由 VAD 后端实现）"""
@@ -194,6 +207,7 @@ class AudioInput:
         on_speech_start: Callable = None,
         on_speech_end: Callable[[np.ndarray], None] = None,
         on_chunk: Callable[[np.ndarray], None] = None,
+        get_silence_duration: Callable[[], float] = None,
     ):
         """
         录音直到检测到静音
@@ -208,14 +222,22 @@ class AudioInput:
             on_speech_start: 检测到语音开始时的回调
             on_speech_end: 检测到语音结束时的回调，参数为完整音频
             on_chunk: 每个音频块的回调（用于流式 ASR）
+            get_silence_duration: 动态静音阈值（秒），静音期间每块调用一次；
+                None 时使用 VADConfig.silence_duration（见 core.endpointing）
         """
         if not self._is_listening:
             self.start_listening()
 
-        # 关键：清掉上一轮/空闲期间积压的旧音频，否则会“回放式”地先处理旧 chunk，导致延迟与误判
-        flushed = self.flush_buffer()
-        if flushed:
-            log.debug(f"[AudioIO] flush_buffer: {flushed} chunks")
+        pending = self._preroll
+        self._preroll = []
+        if pending:
+            # 插话场景：队列里是用户刚开口的语音，不能丢
+            log.debug(f"[AudioIO] preroll: {len(pending)} chunks")
+        else:
+            # 关键：清掉上一轮/空闲期间积压的旧音频，否则会“回放式”地先处理旧 chunk，导致延迟与误判
+            flushed = self.flush_buffer()
+            if flushed:
+                log.debug(f"[AudioIO] flush_buffer: {flushed} chunks")
         # 每次录音前重置 VAD，避免噪声底噪/状态在多轮之间漂移
         try:
             self._vad.reset()
@@ -233,7 +255,7 @@ class AudioInput:
         pre_buffer = deque(maxlen=vc.pre_buffer_chunks)
         
         while self._is_listening:
-            chunk = self.get_audio_chunk(timeout=0.5)
+            chunk = pending.pop(0) if pending else self.get_audio_chunk(timeout=0.5)
             if chunk is None:
                 continue
             
@@ -268,6 +290,8 @@ class AudioInput:
                         on_speech_start()
                 
                 if is_speaking:
+                    # 句中停顿后又开口：重新计时，否则下一段静音会立即判定结束
+                    silence_start = None
                     speech_buffer.append(chunk)
                     if on_chunk:
                         on_chunk(chunk)
@@ -289,9 +313,10 @@ class AudioInput:
                         hangover_remaining -= 1
                         continue
                     
+                    silence_limit = get_silence_duration() if get_silence_duration else vc.silence_duration
                     if silence_start is None:
                         silence_start = current_time
-                    elif current_time - silence_start > vc.silence_duration:
+                    elif current_time - silence_start > silence_limit:
                         # 静音超过阈值，语音结束
                         log.debug(f"[VAD] 语音结束 (时长 {current_time - start_time:.1f}s)")
                         if on_speech_end and speech_buffer:
@@ -305,6 +330,221 @@ class AudioInput:
         return np.concatenate(speech_buffer) if speech_buffer else None
 
 
+class RingBuffer:
+    """
+    预分配的单声道 float32 环形缓冲区
+
+    非线程安全，由 PlaybackEngine 加锁使用（音频回调里只做内存拷贝，不分配内存）。
+    """
+
+    def __init__(self, capacity: int):
+        self._buf = np.zeros(max(1, int(capacity)), dtype=np.float32)
+        self._read = 0
+        self._size = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buf)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def free(self) -> int:
+        return len(self._buf) - self._size
+
+    def write(self, data: np.ndarray) -> int:
+        """写入尽可能多的数据，返回写入样本数"""
+        n = min(len(data), self.free)
+        if n <= 0:
+            return 0
+        cap = len(self._buf)
+        start = (self._read + self._size) % cap
+        first = min(n, cap - start)
+        self._buf[start:start + first] = data[:first]
+        if n > first:
+            self._buf[:n - first] = data[first:n]
+        self._size += n
+        return n
+
+    def read_into(self, out: np.ndarray) -> int:
+        """读出至多 len(out) 个样本到 out，返回读出样本数"""
+        n = min(len(out), self._size)
+        if n <= 0:
+            return 0
+        cap = len(self._buf)
+        first = min(n, cap - self._read)
+        out[:first] = self._buf[self._read:self._read + first]
+        if n > first:
+            out[first:n] = self._buf[:n - first]
+        self._read = (self._read + n) % cap
+        self._size -= n
+        return n
+
+    def clear(self):
+        self._read = 0
+        self._size = 0
+
+
+class PlaybackEngine:
+    """
+    无缝连续播放引擎
+
+    一个常驻 OutputStream + 环形缓冲区：
+    - enqueue 任意长度的 PCM 块，段与段之间没有 open/close 带来的间隙
+    - position 为已送入声卡的样本数（绝对位置，单调递增），可精确对齐字幕/嘴型
+    - flush 立即丢弃未播放的数据（打断）
+
+    backend 默认为 sounddevice，可注入兼容 OutputStream 接口的假后端做回环测试。
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        buffer_seconds: float = 30.0,
+        blocksize: int = 0,
+        latency: Union[str, float] = "low",
+        backend=None,
+    ):
+        self.sample_rate = int(sample_rate)
+        self.blocksize = blocksize
+        self.latency = latency
+        self._sd = backend if backend is not None else (sd if HAS_SOUNDDEVICE else None)
+        if self._sd is None:
+            raise RuntimeError("sounddevice 未安装")
+        self._ring = RingBuffer(int(self.sample_rate * buffer_seconds))
+        self._cond = threading.Condition()
+        self._written = 0      # 已入队样本总数（绝对位置）
+        self._played = 0       # 已送入声卡的样本总数（绝对位置）
+        self._flush_gen = 0    # flush 代数，等待方据此感知打断
+        self._stream = None
+        self._closed = False
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        if self._stream is not None:
+            return
+        self._stream = self._sd.OutputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype="float32",
+            blocksize=self.blocksize,
+            latency=self.latency,
+            callback=self._callback,
+        )
+        self._stream.start()
+        self._closed = False
+        log.debug(f"[AudioIO] 播放引擎已启动 (sr={self.sample_rate}, buffer={self._ring.capacity})")
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.stop()
+                stream.close()
+            except Exception as e:
+                log.debug(f"[AudioIO] 关闭播放流失败: {e}")
+
+    @property
+    def output_latency(self) -> float:
+        """声卡输出延迟（秒），position 对应的声音约在此延迟后真正发出"""
+        try:
+            return float(self._stream.latency) if self._stream is not None else 0.0
+        except Exception:
+            return 0.0
+
+    # ---- 音频回调（PortAudio 线程）----
+
+    def _callback(self, outdata, frames, time_info, status):
+        out = outdata[:, 0] if outdata.ndim > 1 else outdata
+        with self._cond:
+            n = self._ring.read_into(out)
+            if n:
+                self._played += n
+                self._cond.notify_all()
+        if n < frames:
+            # 欠载：补静音，position 不前进
+            out[n:] = 0
+
+    # ---- 生产者接口 ----
+
+    def enqueue(self, audio: np.ndarray, timeout: Optional[float] = None) -> int:
+        """
+        写入一段 PCM（float32 单声道），缓冲区满时阻塞等待
+
+        Returns:
+            该段起始样本的绝对位置；被 flush 打断时仍返回起始位置（剩余数据被丢弃）
+        """
+        data = np.asarray(audio, dtype=np.float32).reshape(-1)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            start = self._written
+            gen = self._flush_gen
+            offset = 0
+            while offset < len(data):
+                if self._closed or gen != self._flush_gen:
+                    break
+                n = self._ring.write(data[offset:])
+                offset += n
+                self._written += n
+                if offset < len(data):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        log.warn(f"[AudioIO] 播放缓冲区写入超时，丢弃 {len(data) - offset} 样本")
+                        break
+                    self._cond.wait(timeout=0.1 if remaining is None else min(0.1, remaining))
+            return start
+
+    def flush(self):
+        """丢弃所有未播放数据（立即静音）"""
+        with self._cond:
+            self._ring.clear()
+            self._written = self._played
+            self._flush_gen += 1
+            self._cond.notify_all()
+
+    # ---- 位置查询 ----
+
+    @property
+    def position(self) -> int:
+        """已送入声卡的样本数（绝对位置）"""
+        return self._played
+
+    @property
+    def queued(self) -> int:
+        """尚未播放的样本数"""
+        return self._written - self._played
+
+    def wait_for_position(self, position: int, timeout: Optional[float] = None) -> bool:
+        """
+        等待播放到指定绝对位置
+
+        Returns:
+            True 表示已到达；被 flush/关闭打断或超时返回 False
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            gen = self._flush_gen
+            while self._played < position:
+                if self._closed or gen != self._flush_gen or self._written < position:
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=0.1 if remaining is None else min(0.1, remaining))
+            return True
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """等待已入队数据全部播放完"""
+        return self.wait_for_position(self._written, timeout=timeout)
+
+
 class AudioOutput:
     """
     扬声器输出管理
@@ -315,12 +555,36 @@ class AudioOutput:
     - 流式播放
     """
     
-    def __init__(self, sample_rate: int = 22050):
+    def __init__(self, sample_rate: int = 22050, backend=None):
         self.sample_rate = sample_rate
         self._is_playing = False
         self._play_thread = None
         self._stop_flag = threading.Event()
         self._play_queue = queue.Queue()
+        # 无缝播放引擎（首次 enqueue 时创建；backend 可注入假后端）
+        self._backend = backend
+        self._engine: Optional[PlaybackEngine] = None
+        self._engine_lock = threading.Lock()
+        # 引擎重建次数：重建后播放位置从 0 开始，按位置对齐的调用方据此重新对齐时钟
+        self._engine_generation = 0
+        # 播放参考信号回调 (audio, sample_rate[, start_time])，供回声感知 VAD 使用
+        self._reference_callback: Optional[Callable[..., None]] = None
+
+    def set_reference_callback(self, callback: Optional[Callable[..., None]]):
+        """设置播放参考信号回调（传 None 取消）"""
+        self._reference_callback = callback
+
+    def _notify_reference(self, audio: np.ndarray, sample_rate: int, start_time: Optional[float] = None):
+        cb = self._reference_callback
+        if cb is None:
+            return
+        try:
+            if start_time is None:
+                cb(audio, sample_rate)
+            else:
+                cb(audio, sample_rate, start_time)
+        except Exception as e:
+            log.debug(f"[AudioIO] 参考信号回调错误: {e}")
     
     def play_file(self, file_path: str, blocking: bool = True):
         """播放音频文件"""
@@ -350,6 +614,8 @@ class AudioOutput:
         
         sr = sample_rate or self.sample_rate
         self._is_playing = True
+        self._stop_flag.clear()
+        self._notify_reference(audio, sr)
         
         if blocking:
             sd.play(audio, sr)
@@ -366,56 +632,113 @@ class AudioOutput:
     
     def play_stream(self, audio_generator, sample_rate: int = None):
         """
-        流式播放音频
+        流式播放音频（基于无缝播放引擎，块与块之间无间隙）
         
         Args:
             audio_generator: 生成音频块的迭代器
             sample_rate: 采样率
         """
-        if not HAS_SOUNDDEVICE:
-            raise RuntimeError("sounddevice 未安装")
-        
         sr = sample_rate or self.sample_rate
         self._is_playing = True
         self._stop_flag.clear()
-        
-        def stream_callback(outdata, frames, time_info, status):
-            if status:
-                print(f"[AudioIO] 播放状态: {status}")
-            
-            try:
-                chunk = self._play_queue.get_nowait()
-                if len(chunk) < frames:
-                    outdata[:len(chunk), 0] = chunk
-                    outdata[len(chunk):] = 0
-                else:
-                    outdata[:, 0] = chunk[:frames]
-            except queue.Empty:
-                outdata.fill(0)
-        
-        # 填充队列
-        def fill_queue():
+        try:
             for chunk in audio_generator:
                 if self._stop_flag.is_set():
                     break
-                self._play_queue.put(chunk)
+                self.enqueue(chunk, sr)
+            if not self._stop_flag.is_set():
+                self.drain()
+        finally:
             self._is_playing = False
-        
-        fill_thread = threading.Thread(target=fill_queue, daemon=True)
-        fill_thread.start()
-        
-        with sd.OutputStream(
-            samplerate=sr,
-            channels=1,
-            callback=stream_callback
-        ):
-            while self._is_playing and not self._stop_flag.is_set():
-                time.sleep(0.1)
+
+    # ---- 无缝播放引擎 ----
+
+    def _get_engine(self, sample_rate: int) -> PlaybackEngine:
+        """获取（必要时创建/按采样率重建）常驻播放引擎"""
+        with self._engine_lock:
+            engine = self._engine
+            if engine is not None and engine.sample_rate != int(sample_rate):
+                # 采样率变化：等旧数据播完再重建流
+                engine.drain(timeout=30.0)
+                engine.close()
+                engine = None
+            if engine is None:
+                engine = PlaybackEngine(sample_rate, backend=self._backend)
+                engine.start()
+                self._engine = engine
+                self._engine_generation += 1
+            return engine
+
+    @property
+    def engine_generation(self) -> int:
+        """播放引擎代数（每次创建/按采样率重建加一，位置与播放时钟随之归零）"""
+        return self._engine_generation
+
+    def enqueue(self, audio: np.ndarray, sample_rate: int = None) -> int:
+        """
+        追加一段音频到连续播放流（不阻塞到播放完成）
+
+        Returns:
+            该段起始样本的绝对位置（配合 wait_for_position 使用）
+        """
+        sr = sample_rate or self.sample_rate
+        engine = self._get_engine(sr)
+        self._stop_flag.clear()
+        # 参考信号起点 = 当前时间 + 缓冲区里尚未播放的时长 + 声卡延迟
+        start_time = time.monotonic() + engine.queued / float(sr) + engine.output_latency
+        self._notify_reference(audio, sr, start_time)
+        return engine.enqueue(audio)
+
+    def playback_position(self) -> int:
+        """播放引擎当前位置（已送入声卡的样本数）"""
+        engine = self._engine
+        return engine.position if engine is not None else 0
+
+    def playback_time(self) -> float:
+        """播放时钟（秒）= 播放位置 / 采样率（送入声卡的进度）"""
+        engine = self._engine
+        return engine.position / float(engine.sample_rate) if engine is not None else 0.0
+
+    def audible_time(self) -> float:
+        """
+        可听时钟（秒）= 播放时钟 - 声卡输出延迟
+
+        送入声卡的样本还要经过输出延迟才真正发出声音；口型等需要与听到的声音对齐时用它。
+        """
+        engine = self._engine
+        if engine is None:
+            return 0.0
+        return engine.position / float(engine.sample_rate) - engine.output_latency
+
+    def wait_for_position(self, position: int, timeout: Optional[float] = None) -> bool:
+        """等待播放到绝对位置；被打断返回 False"""
+        engine = self._engine
+        return engine.wait_for_position(position, timeout) if engine is not None else False
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """等待已入队音频全部播放完"""
+        engine = self._engine
+        return engine.drain(timeout) if engine is not None else True
+
+    def flush(self):
+        """立即丢弃未播放的音频（打断）"""
+        engine = self._engine
+        if engine is not None:
+            engine.flush()
+
+    def close(self):
+        """关闭常驻播放流"""
+        with self._engine_lock:
+            if self._engine is not None:
+                self._engine.close()
+                self._engine = None
     
     def stop(self):
         """停止播放"""
         self._stop_flag.set()
-        sd.stop()
+        self.flush()
+        if HAS_SOUNDDEVICE:
+            sd.stop()
         self._is_playing = False
     
     def is_playing(self) -> bool:
@@ -15,6 +15,8 @@ import time
 import threading
 import queue
 import re
+import concurrent.futures
+from collections import deque
 from pathlib import Path
 from typing import Optional, Callable
 from dataclasses import dataclass
@@ -28,13 +30,17 @@ src_path = project_root / "src"
 sys.path.insert(0, str(src_path))
 
 from core.audio_io import AudioInput, AudioOutput, AudioConfig
-from core.vad import VADConfig
+from core.vad import VADConfig, EchoAwareVAD, create_vad
 from core.log import log
 from core.exit_signal import consume_exit_request
 from core.emotion_classifier import EmotionClassifier
 from core.ser_engine import SEREngine, SERResult
 from core.punc_engine import PUNCEngine
 from core.sv_engine import SVEngine, SVResult
+from core.text_segmenter import StreamingSentenceSegmenter, SegmenterConfig
+from core.endpointing import AdaptiveEndpointer, EndpointConfig
+from core.lip_sync import LipSyncScheduler, VISEME_SHAPE_MAP
+from core.tracing import tracer
 
 
 class ConversationState(Enum):
@@ -68,9 +74,20 @@ class ConversationConfig:
     tts_model_dir: str = None      # TTS 模型目录（本地模式）
     tts_remote_url: str = None     # TTS 服务地址（远程模式，如 "http://server:5001"）
     tts_spk_id: str = None         # 说话人 ID
-    
+    stream_tts: bool = True        # LLM 边生成边分句送 TTS（流水线，降低首包延迟）
+    stream_tts_first_min_chars: int = 6   # 首句最短字符数（遇逗号即可切出）
+    stream_tts_min_chars: int = 12        # 后续句子最短字符数
+    stream_tts_max_chars: int = 80        # 无标点时强制切分长度
+    gapless_playback: bool = True         # 常驻输出流 + 环形缓冲连续播放（段间无间隙）
+    playback_lead_sec: float = 0.15       # 当前段剩余多少时提前返回，以便下一段无缝入队
+
     # Agent 配置
     user_id: str = "default_user"
+    enable_response_cache: bool = False   # 语义回复缓存：重复的短问句（打招呼等）直接用之前的回复
+    response_cache_audio: bool = True     # 缓存命中时连同合成好的音频一起复用（仅流水线模式）
+    speculative_turn: bool = False        # ASR 中间结果稳定后提前发起 RAG + LLM 请求，最终结果一致则沿用
+    speculation_stable_ms: int = 300      # 中间结果保持不变多久才开始投机（毫秒）
+    speculation_max_per_utterance: int = 3  # 每句话最多发起几次投机（中间结果反复变化时限制浪费）
     
     # 音频 / VAD 配置
     sample_rate: int = 16000
@@ -78,10 +95,17 @@ class ConversationConfig:
     silence_duration: float = 0.6   # 静音多久认为说完
     vad_backend: str = "rms"        # "rms" | "silero"
     vad_preset: str = "balanced"    # "aggressive" | "balanced" | "conservative"
+    adaptive_endpointing: bool = False    # 按中间结果是否像说完了动态调整静音时长（需流式 ASR）
+    endpoint_min_silence: float = 0.25    # 明确说完（句末标点/语气词/完整短句）时的静音时长
+    endpoint_max_silence: float = 1.2     # 明显没说完（连词/逗号/填充词结尾）时的静音时长
+    endpoint_use_punc: bool = True        # 判断不出时用 PUNC 模型预测句末标点（需 enable_punc）
     
     # 交互配置
-    interrupt_on_speak: bool = True
+    interrupt_on_speak: bool = True       # 播放时保持麦克风开启，用户插话即打断（barge-in）
+    barge_in_min_speech_sec: float = 0.3  # 插话需持续的语音时长（秒）
+    barge_in_echo_margin: float = 2.0     # 麦克风能量需超过回声估计的倍数
     auto_listen: bool = True
+    enable_reminder: bool = True          # 启动提醒管理器（离线回放/基准测试时关闭）
 
     # SER 配置（语音情绪识别）
     enable_ser: bool = True
@@ -111,6 +135,13 @@ class ConversationConfig:
     allow_concurrent_speakers: bool = False             # 是否允许并发对话
     voiceprint_cleanup_days: int = 180                  # 声纹数据清理周期（天）
 
+    # ASR 后分析阶段（SV / 说话人识别 / SER / PUNC 并行）
+    analysis_workers: int = 3                           # 常驻线程数
+    analysis_deadline_ms: int = 800                     # 每轮分析总预算（毫秒），超时的结果丢弃；<=0 不限（SV 门控不受限）
+
+    # 延迟追踪
+    trace_export_dir: str = None                        # 停止时导出追踪数据（JSON + CSV）的目录；None 不导出
+
 
 class ConversationManager:
     """
@@ -123,8 +154,14 @@ class ConversationManager:
     4. 循环等待下一轮对话
     """
     
-    def __init__(self, config: ConversationConfig = None):
+    def __init__(self, config: ConversationConfig = None, audio_backend=None):
+        """
+        Args:
+            config: 对话配置
+            audio_backend: 音频后端（默认 sounddevice；离线回放时注入假设备）
+        """
         self.config = config or ConversationConfig()
+        self._audio_backend = audio_backend
         self.state = ConversationState.IDLE
         
         # 组件（延迟初始化）
@@ -139,6 +176,14 @@ class ConversationManager:
         self._running = False
         self._conversation_thread = None
         self._message_queue = queue.Queue()
+
+        # 插话（barge-in）检测
+        self._barge_in_event = threading.Event()
+        self._barge_in_stop = threading.Event()
+        self._barge_in_thread: Optional[threading.Thread] = None
+        self._echo_vad: Optional[EchoAwareVAD] = None
+        # 当前流式回复的取消标志（打断时置位，Agent 立即中止 LLM 流 / 工具等待）
+        self._response_cancel: Optional[threading.Event] = None
         
         # 回调
         self._on_state_change: Optional[Callable] = None
@@ -157,6 +202,18 @@ class ConversationManager:
         self._punc: PUNCEngine | None = None
         self._sv: SVEngine | None = None
         
+        # 自适应端点（延迟创建，跨轮复用）
+        self._endpointer: Optional[AdaptiveEndpointer] = None
+
+        # 投机回合：(SpeculativeTurn, 情绪前缀, 用户 ID)，识别结束后等待回复阶段接管
+        self._pending_speculation: Optional[tuple] = None
+
+        # 口型调度器（延迟创建，按播放时钟驱动）
+        self._lip_sync: Optional[LipSyncScheduler] = None
+
+        # ASR 后分析线程池（延迟创建，跨轮复用）
+        self._analysis_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        
         # 多说话人识别（延迟初始化）
         self._diarization = None
         self._current_user_id: str = self.config.user_id
@@ -396,7 +453,10 @@ class ConversationManager:
         try:
             from backend.llm.agent import Agent
             
-            self._agent = Agent(user_id=self.config.user_id)
+            self._agent = Agent(
+                user_id=self.config.user_id,
+                enable_response_cache=self.config.enable_response_cache,
+            )
             self._agent.start_chat()
             log.debug("[对话] Agent 初始化完成")
         except Exception as e:
@@ -467,8 +527,8 @@ class ConversationManager:
             vad_config=vad_config,
             vad_backend=self.config.vad_backend,
         )
-        self._audio_input = AudioInput(audio_config)
-        self._audio_output = AudioOutput()
+        self._audio_input = AudioInput(audio_config, backend=self._audio_backend)
+        self._audio_output = AudioOutput(backend=self._audio_backend)
         log.debug("[对话] 音频设备初始化完成")
 
     def _init_ser(self):
@@ -576,12 +636,13 @@ class ConversationManager:
             log.warn(f"多说话人识别初始化失败（回退到单用户模式）: {e}")
             self._diarization = None
 
-    def _identify_speaker(self, audio: np.ndarray) -> str:
+    def _identify_speaker(self, audio: np.ndarray, embedding: Optional[np.ndarray] = None) -> str:
         """
         识别说话人
         
         Args:
             audio: 音频数据
+            embedding: 已提取的声纹向量（与 SV 共用，可选）
             
         Returns:
             user_id: 识别到的 user_id（或默认 user_id）
@@ -590,7 +651,7 @@ class ConversationManager:
             return self.config.user_id
         
         try:
-            result = self._diarization.identify(audio, self.config.sample_rate)
+            result = self._diarization.identify(audio, self.config.sample_rate, embedding=embedding)
             
             if result.speaker_id == "unknown":
                 log.debug(f"[说话人] 未识别: score={result.score:.3f}, reason={result.reason}")
@@ -675,8 +736,8 @@ class ConversationManager:
             log.warn(f"PUNC 处理失败，保留原文本: {e}")
             return text
 
-    def _sv_accept(self, full_audio: np.ndarray, duration_sec: float) -> bool:
-        """SV 门控：判断当前语音是否由目标说话人发出。"""
+    def _sv_accept(self, full_audio: np.ndarray, duration_sec: float, embedding: Optional[np.ndarray] = None) -> bool:
+        """SV 门控：判断当前语音是否由目标说话人发出（可传入已提取的声纹向量）。"""
         if not self.config.enable_sv:
             return True
         if full_audio is None or len(full_audio) == 0:
@@ -689,7 +750,10 @@ class ConversationManager:
             return True
 
         try:
-            r: SVResult = self._sv.verify(full_audio, sample_rate=self.config.sample_rate)
+            if embedding is not None:
+                r: SVResult = self._sv.verify_embedding(embedding)
+            else:
+                r = self._sv.verify(full_audio, sample_rate=self.config.sample_rate)
             log.debug(f"[ASR] SV: accept={r.accepted}, score={r.score:.3f}, threshold={r.threshold:.3f}, reason={r.reason}")
             if r.accepted:
                 return True
@@ -721,7 +785,8 @@ class ConversationManager:
         self._init_audio()
         self._init_tts()
         self._init_agent()
-        self._init_reminder()
+        if self.config.enable_reminder:
+            self._init_reminder()
         self._init_ser()
         self._init_punc()
         self._init_sv()
@@ -803,11 +868,31 @@ class ConversationManager:
             self._audio_input.stop_listening()
         if self._audio_output:
             self._audio_output.stop()
+            self._audio_output.close()
         
         if self._reminder_manager:
             self._reminder_manager.stop()
+
+        if self._lip_sync is not None:
+            self._lip_sync.stop()
+
+        if tracer.turns():
+            log.conv(f"[追踪] 延迟统计（毫秒）:\n{tracer.format_summary()}")
+            try:
+                self.export_traces()
+            except Exception as e:
+                log.warn(f"追踪数据导出失败: {e}")
+
+        if self._analysis_pool is not None:
+            self._analysis_pool.shutdown(wait=False)
+            self._analysis_pool = None
         
         if self._agent:
+            self._drop_speculation()
+            if self.config.speculative_turn:
+                stats = self._agent.get_speculation_stats()
+                log.conv(f"[投机] 发起 {stats['started']} 次，命中 {stats['committed']} 次，"
+                         f"命中率 {stats['hit_rate']:.0%}，浪费约 {stats['wasted_tokens']} tokens")
             self._agent.end_chat()
         
         log.debug("对话已停止")
@@ -819,7 +904,10 @@ class ConversationManager:
         while self._running:
             try:
                 # 1. 等待并获取用户输入
+                self._drop_speculation()
+                self._finish_trace()
                 self._set_state(ConversationState.LISTENING)
+                tracer.begin_turn()
                 t0_input = time.perf_counter()
                 user_text = self._listen_and_recognize()
                 elapsed_input = time.perf_counter() - t0_input
@@ -831,6 +919,7 @@ class ConversationManager:
                 if user_text.lower() in ['quit', 'exit', '退出', '结束']:
                     log.debug("收到退出指令")
                     break
+                tracer.set_meta("user_chars", len(user_text))
                 
                 print(f"\n👤 用户: {user_text}")
                 if self._on_user_text:
@@ -839,33 +928,46 @@ class ConversationManager:
                 # 2. Agent 生成回复
                 self._set_state(ConversationState.PROCESSING)
                 t0_agent = time.perf_counter()
-                ai_response = self._generate_response(user_text)
-                elapsed_agent = time.perf_counter() - t0_agent
-                log.debug(f"[耗时] Agent: {elapsed_agent:.2f}s")
-                
-                if not ai_response:
+
+                self._barge_in_event.clear()
+                if self.config.stream_tts and self._tts:
+                    # 流水线：LLM 边生成边分句，首句合成完即开始播放
+                    self._begin_speaking_audio()
+                    ai_response = self._respond_streaming(user_text)
+                    self._end_speaking_audio()
+                    log.debug(f"[耗时] Agent+TTS+播放 总: {time.perf_counter() - t0_agent:.2f}s")
+
+                    if not ai_response:
+                        continue
+
+                    print(f"🤖 AI: {ai_response}")
+                    if self._on_ai_text:
+                        self._on_ai_text(ai_response)
+                else:
+                    ai_response = self._generate_response(user_text)
+                    elapsed_agent = time.perf_counter() - t0_agent
+                    log.debug(f"[耗时] Agent: {elapsed_agent:.2f}s")
+
+                    if not ai_response:
+                        continue
+
+                    print(f"🤖 AI: {ai_response}")
+                    if self._on_ai_text:
+                        self._on_ai_text(ai_response)
+
+                    # 3. TTS 播放
+                    self._set_state(ConversationState.SPEAKING)
+                    t0_tts = time.perf_counter()
+                    self._begin_speaking_audio()
+                    self._speak(ai_response)
+                    self._end_speaking_audio()
+                    log.debug(f"[耗时] TTS+播放 总: {time.perf_counter() - t0_tts:.2f}s")
+
+                if self._barge_in_event.is_set():
+                    # 用户插话：跳过收尾，直接进入下一轮监听（插话音频已交给 ASR）
+                    log.info("[对话] 用户插话，停止播放")
+                    tracer.set_meta("barge_in", True)
                     continue
-                
-                print(f"🤖 AI: {ai_response}")
-                if self._on_ai_text:
-                    self._on_ai_text(ai_response)
-                
-                # 3. TTS 播放
-                self._set_state(ConversationState.SPEAKING)
-                t0_tts = time.perf_counter()
-                # 说话时暂停麦克风，避免回声/串音污染下一轮 ASR 队列
-                try:
-                    if self._audio_input:
-                        self._audio_input.stop_listening()
-                except Exception:
-                    pass
-                self._speak(ai_response)
-                try:
-                    if self._audio_input and self.config.auto_listen:
-                        self._audio_input.start_listening()
-                except Exception:
-                    pass
-                log.debug(f"[耗时] TTS+播放 总: {time.perf_counter() - t0_tts:.2f}s")
 
                 # Agent 工具请求退出：等本轮 TTS 播完后再退出
                 exit_reason = consume_exit_request()
@@ -890,8 +992,144 @@ class ConversationManager:
                 traceback.print_exc()
                 time.sleep(1)
         
+        self._finish_trace()
         self.stop()
     
+    # ============================================================
+    #  延迟追踪
+    # ============================================================
+
+    def _finish_trace(self):
+        """结束当前追踪轮；没有有效输入的轮次直接丢弃"""
+        turn = tracer.current
+        if turn is None:
+            return
+        done = tracer.end_turn(discard="user_chars" not in turn.meta)
+        if done is not None:
+            metrics = done.metrics()
+            log.conv_debug(
+                f"[追踪] turn {done.turn_id}: "
+                + ", ".join(f"{k}={v:.0f}ms" for k, v in sorted(metrics.items()))
+            )
+
+    def export_traces(self, directory: str = None) -> Optional[Path]:
+        """导出延迟追踪（JSON 含分位数统计，CSV 为逐轮明细），返回 JSON 路径"""
+        directory = directory or self.config.trace_export_dir
+        if not directory or not tracer.turns():
+            return None
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        d = Path(directory)
+        json_path = tracer.export_json(d / f"latency_{stamp}.json")
+        tracer.export_csv(d / f"latency_{stamp}.csv")
+        log.debug(f"[追踪] 已导出: {json_path}")
+        return json_path
+
+    # ============================================================
+    #  插话（barge-in）
+    # ============================================================
+
+    def _barge_in_enabled(self) -> bool:
+        return bool(
+            self.config.interrupt_on_speak
+            and self._audio_input is not None
+            and self._asr is not None
+        )
+
+    def _begin_speaking_audio(self):
+        """进入播放阶段：支持插话时保持麦克风并启动检测，否则暂停麦克风"""
+        if self._barge_in_enabled():
+            try:
+                self._start_barge_in_monitor()
+                return
+            except Exception as e:
+                log.warn(f"插话检测启动失败，回退为播放时关麦: {e}")
+        # 说话时暂停麦克风，避免回声/串音污染下一轮 ASR 队列
+        try:
+            if self._audio_input:
+                self._audio_input.stop_listening()
+        except Exception:
+            pass
+
+    def _end_speaking_audio(self):
+        """退出播放阶段：停止插话检测，恢复麦克风"""
+        self._stop_barge_in_monitor()
+        try:
+            if self._audio_input and self.config.auto_listen:
+                self._audio_input.start_listening()
+            elif self._audio_input and not self._barge_in_event.is_set():
+                self._audio_input.stop_listening()
+        except Exception:
+            pass
+
+    def _start_barge_in_monitor(self):
+        """播放期间监听麦克风，确认用户说话后打断播放"""
+        if self._echo_vad is None:
+            # 独立的 VAD 实例，避免与录音阶段共享噪声底噪状态
+            self._echo_vad = EchoAwareVAD(
+                create_vad(self._audio_input._vad_config),
+                echo_margin=self.config.barge_in_echo_margin,
+            )
+        vad = self._echo_vad
+        vad.clear_reference()
+        self._audio_output.set_reference_callback(vad.push_reference)
+
+        self._audio_input.start_listening()
+        self._audio_input.flush_buffer()
+        self._barge_in_stop.clear()
+
+        sr = self._audio_input.config.sample_rate
+        chunk_sec = max(1e-3, self._audio_input.config.chunk_size / float(sr))
+        need = max(1, int(np.ceil(self.config.barge_in_min_speech_sec / chunk_sec)))
+        keep = need + max(0, self._audio_input._vad_config.pre_buffer_chunks)
+
+        def monitor():
+            recent = deque(maxlen=keep)
+            consecutive = 0
+            while not self._barge_in_stop.is_set():
+                chunk = self._audio_input.get_audio_chunk(timeout=0.1)
+                if chunk is None:
+                    continue
+                recent.append(chunk)
+                if vad.detect_speech(chunk, sr):
+                    consecutive += 1
+                else:
+                    consecutive = 0
+                if consecutive >= need:
+                    log.debug(f"[插话] 检测到用户语音（{consecutive} 块）")
+                    # 已读出的语音开头交还给下一轮录音
+                    self._audio_input.set_preroll(list(recent))
+                    self._barge_in_event.set()
+                    self._cancel_response()
+                    try:
+                        self._audio_output.stop()
+                    except Exception:
+                        pass
+                    return
+
+        self._barge_in_thread = threading.Thread(target=monitor, daemon=True, name="BargeIn-Monitor")
+        self._barge_in_thread.start()
+
+    def _stop_barge_in_monitor(self):
+        self._barge_in_stop.set()
+        t = self._barge_in_thread
+        if t is not None and t is not threading.current_thread():
+            t.join(timeout=1.0)
+        self._barge_in_thread = None
+        if self._audio_output:
+            self._audio_output.set_reference_callback(None)
+        if self._echo_vad is not None:
+            self._echo_vad.clear_reference()
+
+    def _cancel_response(self):
+        """取消进行中的流式回复（LLM 流、工具调用、TTS 合成）"""
+        cancel = self._response_cancel
+        if cancel is not None:
+            cancel.set()
+
+    def _speech_cancelled(self) -> bool:
+        """播放是否应中止（停止对话或用户插话）"""
+        return (not self._running) or self._barge_in_event.is_set()
+
     def _listen_and_recognize(self) -> Optional[str]:
         """监听并识别语音"""
         # 有 ASR 引擎即走麦克风（模型在首次 start_stream 时延迟加载，不要求 is_model_loaded）
@@ -991,8 +1229,15 @@ class ConversationManager:
         last_partial_ref = [""]
         full_audio_ref = [None]
         supports_streaming = getattr(self._asr, "supports_streaming", False)
+        # 投机回合：中间结果稳定 speculation_stable_ms 后提前发起请求
+        speculate = self.config.speculative_turn and supports_streaming and self._agent is not None
+        stable_since_ref = [0.0]
+        spec_ref = [None]     # (SpeculativeTurn, 情绪前缀, 用户 ID)
+        spec_count_ref = [0]
+        endpointer = self._get_endpointer() if supports_streaming else None
 
         def on_speech_start():
+            tracer.mark("speech_start")
             log.debug("检测到语音...")
 
         def on_chunk(chunk):
@@ -1000,13 +1245,37 @@ class ConversationManager:
                 result = self._asr.feed_audio(chunk)
                 if result and supports_streaming:
                     part = result.strip()
+                    if part:
+                        tracer.mark("asr_first_partial")
                     if part and part != last_partial_ref[0]:
                         last_partial_ref[0] = part
                         streaming_parts.append(part)
                         merged_stream_ref[0] = self._merge_streaming_pair(merged_stream_ref[0], part)
+                        stable_since_ref[0] = time.perf_counter()
+                        if endpointer is not None:
+                            endpointer.update(merged_stream_ref[0])
                         log.debug(f"[ASR] 中间: '{merged_stream_ref[0]}'")
+                if speculate:
+                    maybe_speculate()
+
+        def maybe_speculate():
+            merged = merged_stream_ref[0]
+            if not merged or spec_count_ref[0] >= self.config.speculation_max_per_utterance:
+                return
+            if (time.perf_counter() - stable_since_ref[0]) * 1000.0 < self.config.speculation_stable_ms:
+                return
+            user_input = self._user_input_for(merged)
+            if spec_ref[0] is not None:
+                if spec_ref[0][0].message == user_input:
+                    return
+                self._agent.cancel_speculation(spec_ref[0][0])
+            spec_count_ref[0] += 1
+            tracer.mark("speculation_start")
+            log.debug(f"[投机] 中间结果已稳定，提前发起请求: '{merged}'")
+            spec_ref[0] = (self._agent.speculate(user_input), self._emotion_prefix(), self._current_user_id)
 
         def on_speech_end(full_audio):
+            tracer.mark("speech_end")
             full_audio_ref[0] = full_audio
 
         self._asr.start_stream()
@@ -1015,7 +1284,12 @@ class ConversationManager:
             on_speech_start=on_speech_start,
             on_chunk=on_chunk,
             on_speech_end=on_speech_end,
+            get_silence_duration=endpointer.silence_duration if endpointer is not None else None,
         )
+        if endpointer is not None:
+            score, reason, silence = endpointer.last_decision
+            tracer.set_meta("endpoint_silence_ms", round(silence * 1000.0))
+            log.debug(f"[端点] 静音阈值 {silence:.2f}s（{reason}, score={score:.1f}）")
         
         full_audio = full_audio_ref[0]
         final = (self._asr.end_stream() or "").strip()
@@ -1027,14 +1301,18 @@ class ConversationManager:
             # 某些场景 end_stream 仅返回尾字，优先采用更完整的流式合并结果
             final = merged_stream
         
+        analysis = None
         if full_audio is not None and len(full_audio) > 0:
             duration_sec = len(full_audio) / self.config.sample_rate
+            # 声纹 / SER 只依赖音频：先提交到线程池，与离线兜底、PUNC 并行
+            analysis = self._start_audio_analysis(full_audio, duration_sec)
             # 仅在结果为空时做离线兜底，避免覆盖有效的短回复（如"好""嗯"）
             # 注意：len(final) <= 1 会错误地覆盖单字符有效回复
             if not final:
                 if self._should_run_offline_fallback(full_audio, duration_sec):
                     try:
-                        offline = self._asr.recognize_audio(full_audio, self.config.sample_rate)
+                        with tracer.span("asr_offline"):
+                            offline = self._asr.recognize_audio(full_audio, self.config.sample_rate)
                         if offline and len(offline) >= len(final):
                             final = offline.strip()
                     except Exception as e:
@@ -1042,48 +1320,161 @@ class ConversationManager:
                 else:
                     log.debug("[ASR] 跳过离线兜底（音频过短或能量过低）")
 
-            # SV：说话人门控（可选）
-            if not self._sv_accept(full_audio, duration_sec):
-                log.info("[ASR] SV 拒绝本轮语音，已丢弃")
-                return None
-
-            # 多说话人识别（在 ASR 之后、SER 之前）
-            if self.config.enable_diarization and duration_sec >= self.config.diarization_min_audio_sec:
-                try:
-                    self._init_diarization()
-                    if self._diarization is not None:
-                        user_id = self._identify_speaker(full_audio)
-                        # 更新当前用户 ID
-                        self._current_user_id = user_id
-                        # 如果 Agent 支持动态用户切换，更新其 user_id
-                        if self._agent and hasattr(self._agent, 'user_id'):
-                            self._agent.user_id = user_id
-                except Exception as e:
-                    log.warn(f"说话人识别失败: {e}")
-
-            # SER：对用户语音做情绪识别（不阻塞主流程太久；失败则忽略）
-            if self.config.enable_ser and duration_sec >= (self.config.ser_min_audio_sec or 0.8):
-                try:
-                    self._init_ser()
-                    if self._ser is not None:
-                        t0_ser = time.perf_counter()
-                        r: SERResult = self._ser.predict(full_audio, sample_rate=self.config.sample_rate)
-                        self._current_user_emotion = r.emotion9
-                        log.debug(f"[耗时] SER: {time.perf_counter() - t0_ser:.2f}s, emo={r.emotion9}, score={r.score:.2f}")
-                except Exception as e:
-                    log.debug(f"SER 推断失败（忽略）: {e}")
-        
         final = self._collapse_repeated_asr_text(final)
-        final = self._apply_punc(final)
+        punc_future = None
+        if final and self.config.enable_punc:
+            punc_future = self._get_analysis_pool().submit(self._traced, "punc", self._apply_punc, final)
+
+        # 投机回合交给回复阶段，在那里与最终文本比对；本轮被丢弃时由下一轮开头取消
+        self._pending_speculation = spec_ref[0]
+
+        if analysis is not None and not self._finish_audio_analysis(analysis, full_audio):
+            log.info("[ASR] SV 拒绝本轮语音，已丢弃")
+            return None
 
+        if punc_future is not None:
+            try:
+                final = punc_future.result(timeout=self._analysis_remaining(analysis)) or final
+            except concurrent.futures.TimeoutError:
+                log.debug("[ASR] PUNC 超出分析预算，使用原文本")
+            except Exception as e:
+                log.warn(f"PUNC 处理失败，保留原文本: {e}")
+
+        tracer.mark("asr_final")
         if final:
             log.debug(f"[ASR] 最终: '{final}'")
         return final or None
     
+    # ============================================================
+    #  ASR 后分析阶段（并行）
+    # ============================================================
+
+    def _get_analysis_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        """常驻分析线程池（避免每轮创建线程）"""
+        if self._analysis_pool is None:
+            self._analysis_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(1, int(self.config.analysis_workers or 1)),
+                thread_name_prefix="PostASR",
+            )
+        return self._analysis_pool
+
+    def _analysis_remaining(self, analysis: Optional[dict]) -> Optional[float]:
+        """本轮分析剩余预算（秒）；None 表示不限"""
+        if self.config.analysis_deadline_ms <= 0:
+            return None
+        if analysis is None:
+            return self.config.analysis_deadline_ms / 1000.0
+        return max(0.0, analysis["deadline"] - time.perf_counter())
+
+    def _start_audio_analysis(self, full_audio: np.ndarray, duration_sec: float) -> dict:
+        """
+        提交只依赖音频的分析任务
+
+        - 声纹向量只算一次，SV 门控与说话人识别共用
+        - SER 并行推理
+        - 说话人识别 / SER 尽力而为，超出 analysis_deadline_ms 即放弃；
+          SV 门控决定是否丢弃本轮，需要时始终等声纹算完，不受预算限制
+        """
+        t0 = time.perf_counter()
+        sr = self.config.sample_rate
+        pool = self._get_analysis_pool()
+        analysis = {
+            "t0": t0,
+            "deadline": t0 + max(0, self.config.analysis_deadline_ms) / 1000.0,
+            "duration_sec": duration_sec,
+            "need_sv": False,
+            "need_diarization": False,
+            "embedding": None,
+            "ser": None,
+        }
+
+        if self.config.enable_sv and duration_sec >= (self.config.sv_min_audio_sec or 0.8):
+            self._init_sv()
+            # 未注册参考说话人时 verify 直接放行，无需提取声纹
+            analysis["need_sv"] = self._sv is not None and self._sv.is_enrolled()
+
+        if self.config.enable_diarization and duration_sec >= self.config.diarization_min_audio_sec:
+            try:
+                self._init_diarization()
+            except Exception as e:
+                log.warn(f"说话人识别失败: {e}")
+            analysis["need_diarization"] = (
+                self._diarization is not None and not self._diarization.is_temporarily_disabled()
+            )
+
+        if analysis["need_sv"] or analysis["need_diarization"]:
+            embedder = self._sv if analysis["need_sv"] else self._diarization.sv_engine
+            analysis["embedding"] = pool.submit(self._traced, "speaker_embed", embedder.embed, full_audio, sr)
+
+        if self.config.enable_ser and duration_sec >= (self.config.ser_min_audio_sec or 0.8):
+            self._init_ser()
+            if self._ser is not None:
+                analysis["ser"] = pool.submit(self._traced, "ser", self._ser.predict, full_audio, sample_rate=sr)
+
+        return analysis
+
+    def _finish_audio_analysis(self, analysis: dict, full_audio: np.ndarray) -> bool:
+        """
+        收集分析结果并应用（在对话线程执行，避免并发修改状态）
+
+        Returns:
+            False 表示 SV 拒绝本轮语音
+        """
+        embedding = None
+        if analysis["embedding"] is not None:
+            # SV 门控不能因超时跳过（否则 drop 策略形同虚设），此时不设超时
+            timeout = None if analysis["need_sv"] else self._analysis_remaining(analysis)
+            try:
+                embedding = analysis["embedding"].result(timeout=timeout)
+            except concurrent.futures.TimeoutError:
+                log.debug("[ASR] 声纹提取超出分析预算，说话人识别本轮跳过")
+            except Exception as e:
+                log.warn(f"声纹提取失败: {e}")
+
+        # SV：说话人门控（可选）；声纹提取失败时由 _sv_accept 直接校验音频
+        if analysis["need_sv"]:
+            with tracer.span("sv_verify"):
+                accepted = self._sv_accept(full_audio, analysis["duration_sec"], embedding=embedding)
+            if not accepted:
+                return False
+
+        # 多说话人识别（在 SV 之后）
+        if analysis["need_diarization"] and embedding is not None:
+            with tracer.span("diarization"):
+                user_id = self._identify_speaker(full_audio, embedding=embedding)
+            # 更新当前用户 ID
+            self._current_user_id = user_id
+            # 如果 Agent 支持动态用户切换，更新其 user_id
+            if self._agent and hasattr(self._agent, 'user_id'):
+                self._agent.user_id = user_id
+
+        # SER：对用户语音做情绪识别（超时/失败则忽略）
+        if analysis["ser"] is not None:
+            try:
+                r: SERResult = analysis["ser"].result(timeout=self._analysis_remaining(analysis))
+                self._current_user_emotion = r.emotion9
+                log.debug(f"[ASR] SER: emo={r.emotion9}, score={r.score:.2f}")
+            except concurrent.futures.TimeoutError:
+                log.debug("[ASR] SER 超出分析预算，忽略")
+            except Exception as e:
+                log.debug(f"SER 推断失败（忽略）: {e}")
+
+        elapsed = time.perf_counter() - analysis['t0']
+        tracer.add_span("post_asr_analysis", elapsed * 1000.0)
+        log.debug(f"[耗时] ASR 后分析: {elapsed:.2f}s")
+        return True
+
+    @staticmethod
+    def _traced(name: str, fn, *args, **kwargs):
+        """在线程池中执行并记录耗时段"""
+        with tracer.span(name):
+            return fn(*args, **kwargs)
+
     def _listen_with_text(self) -> Optional[str]:
         """使用文本输入（调试模式）"""
         try:
             text = input("\n👤 请输入 (或说 'quit' 退出): ").strip()
+            tracer.mark("speech_end")
             return text if text else None
         except EOFError:
             return None
@@ -1119,24 +1510,82 @@ class ConversationManager:
 
         return (clean_text or text.strip(), emotion)
 
+    def _get_endpointer(self) -> Optional[AdaptiveEndpointer]:
+        """自适应端点（未启用时返回 None）；每轮录音前重置"""
+        if not self.config.adaptive_endpointing:
+            return None
+        if self._endpointer is None:
+            punctuate = self._punctuate_partial if self.config.endpoint_use_punc and self.config.enable_punc else None
+            self._endpointer = AdaptiveEndpointer(
+                EndpointConfig(
+                    base_silence=self.config.silence_duration,
+                    min_silence=self.config.endpoint_min_silence,
+                    max_silence=self.config.endpoint_max_silence,
+                ),
+                punctuate=punctuate,
+            )
+        self._endpointer.reset()
+        return self._endpointer
+
+    def _punctuate_partial(self, text: str) -> Optional[str]:
+        """端点判断用的标点预测：只信模型结果，启发式兜底（长句一律补句号）没有参考价值"""
+        # 模型由最终文本的标点恢复加载；录音循环里不等模型加载
+        if self._punc is None or not self._punc.model_ready:
+            return None
+        r = self._punc.restore(text)
+        return r.text if r.used_model else None
+
+    def _emotion_prefix(self) -> str:
+        """用户语音情绪提示前缀（尽量不污染语义检索：只加一行简短信息）"""
+        ue = (self._current_user_emotion or "neutral").strip().lower()
+        if ue and ue != "neutral":
+            return f"（用户当前情绪：{self._emotion9_to_cn(ue)}）"
+        return ""
+
+    def _user_input_for(self, user_text: str) -> str:
+        """发给 Agent 的用户输入：情绪前缀 + 识别文本"""
+        return self._emotion_prefix() + user_text
+
+    def _take_speculation(self):
+        """
+        取出本轮的投机回合
+
+        情绪前缀或说话人在识别结束后发生变化时，投机构建的上下文已不适用，直接取消；
+        文本是否匹配由 Agent.chat 判断。
+        """
+        pending, self._pending_speculation = self._pending_speculation, None
+        if pending is None:
+            return None
+        speculation, prefix, user_id = pending
+        if prefix != self._emotion_prefix() or user_id != self._current_user_id:
+            self._agent.cancel_speculation(speculation)
+            return None
+        return speculation
+
+    def _drop_speculation(self):
+        """取消未被接管的投机回合（本轮识别被丢弃、退出等）"""
+        pending, self._pending_speculation = self._pending_speculation, None
+        if pending is not None and self._agent is not None:
+            self._agent.cancel_speculation(pending[0])
+
     def _generate_response(self, user_text: str) -> Optional[str]:
         """生成 AI 回复（带情绪解析）"""
         if not self._agent:
             return "抱歉，AI 服务未初始化"
         
         try:
-            # 将用户语音情绪作为上下文提示（尽量不污染语义检索：只加一行简短信息）
-            user_input = user_text
-            ue = (self._current_user_emotion or "neutral").strip().lower()
-            if ue and ue != "neutral":
-                user_input = f"（用户当前情绪：{self._emotion9_to_cn(ue)}）{user_text}"
+            # 将用户语音情绪作为上下文提示
+            user_input = self._user_input_for(user_text)
+            speculation = self._take_speculation()
 
             # 流式获取回复；字幕节流
             response_parts = []
             last_sent_len = 0
             SUBTITLE_CHUNK = 6  # WebSocket 更快，可以更频繁更新
 
-            for chunk in self._agent.chat(user_input, stream=True):
+            tracer.mark("llm_request")
+            for chunk in self._agent.chat(user_input, stream=True, speculation=speculation):
+                tracer.mark("llm_first_token")
                 response_parts.append(chunk)
                 current = "".join(response_parts)
                 if len(current) - last_sent_len >= SUBTITLE_CHUNK:
@@ -1146,6 +1595,7 @@ class ConversationManager:
                     last_sent_len = len(current)
 
             full_response = "".join(response_parts)
+            tracer.mark("llm_done")
             
             # 解析情绪标签
             clean_text, emotion = self._parse_emotion(full_response)
@@ -1163,7 +1613,8 @@ class ConversationManager:
             log.error(f"Agent 错误: {e}")
             return f"抱歉，处理时出错了: {e}"
     
-    def _text_for_tts(self, text: str) -> str:
+    @staticmethod
+    def _text_for_tts(text: str) -> str:
         """清洗 AI 回复，便于 TTS 朗读：去 Markdown、颜文字、多余换行"""
         if not text:
             return ""
@@ -1200,6 +1651,7 @@ class ConversationManager:
                 # 段播放计数（用于检测丢失）
                 expected_seg = 1
                 played_segments = 0
+                tracer.mark("tts_request")
 
                 for chunk_data in self._tts.generate_audio_streaming(
                     text, use_clone=True, max_workers=2
@@ -1227,44 +1679,24 @@ class ConversationManager:
                     played_segments += 1
 
                     if first_chunk:
+                        tracer.mark("tts_first_packet")
+                        tracer.mark("playback_start")
                         t_first_chunk = time.perf_counter() - t_tts_start
                         log.debug(f"开始播放... [耗时] TTS 首包: {t_first_chunk:.2f}s")
                         first_chunk = False
                         # 👉 音频开始播放时触发气泡显示（而非在 TTS 生成完时）
                         self._send_subtitle(text, is_final=True, emotion=self._current_emotion)
 
-                    # 启动嘴型同步线程（与播放同步）
-                    if visemes and self._on_viseme:
-                        # 优先使用 Rhubarb viseme 数据驱动口型
-                        lip_thread = threading.Thread(
-                            target=self._send_visemes_for_chunk,
-                            args=(visemes, audio, self._tts.sample_rate),
-                            daemon=True,
-                            name="Viseme-Sender",
-                        )
-                        lip_thread.start()
-                    elif self._on_audio_rms:
-                        # Fallback: 用 RMS 驱动嘴型
-                        rms_thread = threading.Thread(
-                            target=self._send_rms_for_chunk,
-                            args=(audio, self._tts.sample_rate),
-                            daemon=True,
-                            name="RMS-Sender",
-                        )
-                        rms_thread.start()
-
-                    # 直接播放当前段（阻塞直到播放完）
-                    self._audio_output.play_array(
-                        audio,
-                        self._tts.sample_rate,
-                        blocking=True
-                    )
+                    if self._speech_cancelled():
+                        break
+                    self._play_tts_chunk(audio, visemes)
+                    if self._speech_cancelled():
+                        break
 
+                self._finish_playback()
+                tracer.mark("playback_end")
                 # 播放结束，重置嘴型
-                if self._on_viseme:
-                    self._on_viseme(0.0, 0.0)
-                if self._on_audio_rms:
-                    self._on_audio_rms(0.0)
+                self._reset_mouth()
 
                 t_total = time.perf_counter() - t_tts_start
                 log.tts(f"[_speak] 播放完成，共 {played_segments} 段，总耗时 {t_total:.2f}s")
@@ -1284,76 +1716,310 @@ class ConversationManager:
         self._send_subtitle(text, is_final=True, emotion=self._current_emotion)
         time.sleep(len(text) * 0.05)  # 模拟说话时间
 
-    def _send_rms_for_chunk(self, audio, sample_rate: int):
-        """在音频播放期间按 ~20fps 发送 RMS 值，驱动嘴型同步"""
-        try:
-            window_ms = 50  # 50ms 窗口
-            window_samples = max(1, int(sample_rate * window_ms / 1000))
-            
-            audio_float = audio.astype(np.float32)
-            # 归一化到 [-1, 1]
-            max_val = np.max(np.abs(audio_float))
-            if max_val > 1.0:
-                audio_float = audio_float / 32768.0
-            
-            for i in range(0, len(audio_float), window_samples):
-                window = audio_float[i:i + window_samples]
-                rms = float(np.sqrt(np.mean(window ** 2)))
-                if self._on_audio_rms:
-                    self._on_audio_rms(rms)
-                time.sleep(window_ms / 1000.0)
-        except Exception:
-            pass
+    def _tts_voice_key(self) -> str:
+        """当前音色标识：TTS 后端/模型/说话人变化后不复用缓存的音频"""
+        return "|".join(str(x) for x in (
+            type(self._tts).__name__,
+            self.config.tts_remote_url or self.config.tts_model_dir,
+            self.config.tts_spk_id,
+            self._tts.sample_rate,
+        ))
+
+    def _play_tts_chunk(self, audio, visemes=None):
+        """播放一段 TTS 音频（阻塞），口型时间线交给调度器按播放时钟发送"""
+        sr = self._tts.sample_rate
+        if self.config.gapless_playback:
+            start = self._audio_output.enqueue(audio, sr)
+            # 口型按可听时钟对齐（扣除声卡输出延迟）；引擎重建后位置归零，按代数重新对齐
+            self._start_lip_sync(
+                audio, visemes, start / float(sr), self._audio_output.audible_time,
+                epoch=("engine", self._audio_output.engine_generation),
+            )
+            # 提前返回，下一段在本段结束前入队，实现无缝衔接
+            lead = int(sr * max(0.0, self.config.playback_lead_sec))
+            self._audio_output.wait_for_position(start + max(0, len(audio) - lead))
+            return
 
-    # Rhubarb 口型映射: shape → (openY, form)
-    # A=静息/小口  B=轻合唇音  C=较开口  D=大开口  E=圆嘴音  F=窄口音  G=轻开  H=微开
-    VISEME_SHAPE_MAP = {
-        'X': (0.00, 0.00),   # 闭嘴（静音）
-        'A': (0.05, 0.00),   # 口型很小，中性
-        'B': (0.25, 0.60),   # 双唇轻合（b/m/p）— 偏笑口形
-        'C': (0.50, 0.20),   # 中等开口（e/辅音）
-        'D': (0.85, 0.40),   # 大张口（a）
-        'E': (0.55, -0.40),  # 圆嘴（o）— form 负值
-        'F': (0.35, -0.70),  # 窄嘴（u/w）— form 更负
-        'G': (0.20, 0.30),   # 轻开口（辅音）
-        'H': (0.40, 0.10),   # 中等开口（l）
-    }
-
-    def _send_visemes_for_chunk(self, visemes: list, audio, sample_rate: int):
-        """按 Rhubarb 时间线发送 viseme 口型数据，精确同步播放"""
-        try:
-            if not visemes:
-                return
-            audio_duration = len(audio) / max(1, sample_rate)
-            t0 = time.perf_counter()
-            interval = 1.0 / 30  # 30fps 推送率
-
-            # 将 visemes 按时间展平为帧序列
-            cue_idx = 0
-            current_shape = 'X'
-            elapsed = 0.0
-            while elapsed < audio_duration:
-                # 推进到当前时刻对应的 cue
-                while cue_idx < len(visemes) - 1:
-                    next_start = visemes[cue_idx + 1].get('start', 999)
-                    if elapsed >= next_start:
-                        cue_idx += 1
-                    else:
-                        break
-                current_shape = visemes[cue_idx].get('value', 'X')
-                openY, form = self.VISEME_SHAPE_MAP.get(current_shape, (0.0, 0.0))
+        self._start_lip_sync(audio, visemes, time.monotonic(), time.monotonic, epoch="monotonic")
 
-                if self._on_viseme:
-                    self._on_viseme(openY, form)
+        # 直接播放当前段（阻塞直到播放完）
+        self._audio_output.play_array(
+            audio,
+            sr,
+            blocking=True
+        )
 
-                time.sleep(interval)
-                elapsed = time.perf_counter() - t0
+    def _finish_playback(self):
+        """等待连续播放流中剩余音频播完（被打断时不等待）"""
+        if self.config.gapless_playback and self._audio_output and not self._speech_cancelled():
+            self._audio_output.drain()
 
-            # 结束时发送闭嘴
-            if self._on_viseme:
-                self._on_viseme(0.0, 0.0)
-        except Exception:
-            pass
+    def _get_lip_sync(self) -> LipSyncScheduler:
+        if self._lip_sync is None:
+            self._lip_sync = LipSyncScheduler(
+                on_viseme=lambda openY, form: self._on_viseme and self._on_viseme(openY, form),
+                on_rms=lambda rms: self._on_audio_rms and self._on_audio_rms(rms),
+            )
+        return self._lip_sync
+
+    def _start_lip_sync(self, audio, visemes, start: float, clock: Callable[[], float], epoch=None):
+        """登记本段口型时间线（start 与 clock 同一时间基准，epoch 标识该基准）"""
+        if not (visemes and self._on_viseme) and not self._on_audio_rms:
+            return
+        lip = self._get_lip_sync()
+        lip.set_clock(clock, epoch)
+        sr = self._tts.sample_rate
+        if visemes and self._on_viseme:
+            # 优先使用 Rhubarb viseme 数据驱动口型
+            lip.add_visemes(visemes, len(audio) / float(max(1, sr)), start)
+        else:
+            # Fallback: 用 RMS 包络驱动嘴型
+            lip.add_rms(audio, sr, start)
+
+    def _reset_mouth(self):
+        """嘴型归零"""
+        if self._lip_sync is not None:
+            self._lip_sync.clear(close_mouth=False)
+        if self._on_viseme:
+            self._on_viseme(0.0, 0.0)
+        if self._on_audio_rms:
+            self._on_audio_rms(0.0)
+
+    def _respond_streaming(self, user_text: str) -> Optional[str]:
+        """
+        LLM → TTS → 播放 三级流水线
+
+        - 生产线程：消费 Agent 流式输出，增量分句后放入句子队列
+        - 合成线程：逐句调用 TTS，音频块放入播放队列
+        - 当前线程：按顺序播放音频块（首句合成完即开口，不等整段回复）
+
+        Returns:
+            清洗后的完整回复文本（供打印/回调），失败时返回 None
+        """
+        if not self._agent:
+            self._send_subtitle("抱歉，AI 服务未初始化", is_final=True)
+            return "抱歉，AI 服务未初始化"
+
+        user_input = self._user_input_for(user_text)
+        speculation = self._take_speculation()
+
+        segmenter = StreamingSentenceSegmenter(SegmenterConfig(
+            first_min_chars=self.config.stream_tts_first_min_chars,
+            min_chars=self.config.stream_tts_min_chars,
+            max_chars=self.config.stream_tts_max_chars,
+        ))
+        sentence_queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        # 播放队列限长：合成领先播放太多没有意义，还会占内存
+        audio_queue: "queue.Queue" = queue.Queue(maxsize=8)
+        stop_event = threading.Event()
+        # 打断路径（插话监听 / interrupt）直接置位 stop_event，不等 LLM 下一个 token 到达
+        self._response_cancel = stop_event
+        # emotion_locked: 已从显式标签确定情绪，后续不再被规则推断覆盖
+        result = {"text": "", "error": None, "emotion_locked": False}
+        t_start = time.perf_counter()
+        # 回复缓存的音频：命中时按句复用，未缓存音频时收集本轮合成结果，播放完整后写回
+        # 替身 Agent（回放脚本等）可能没有回复缓存相关属性
+        cache = getattr(self._agent, "response_cache", None) if self.config.response_cache_audio else None
+        cached_audio = {"loaded": False, "sentences": None}
+        synthesized: dict = {}
+
+        def cached_sentence_audio(sentence: str):
+            entry = getattr(self._agent, "last_cache_entry", None)
+            if cache is None or entry is None:
+                return None
+            if not cached_audio["loaded"]:
+                cached_audio["loaded"] = True
+                found = cache.get_audio(entry.entry_id, self._tts_voice_key())
+                if found is not None and found[1] == self._tts.sample_rate:
+                    cached_audio["sentences"] = found[0]
+            return (cached_audio["sentences"] or {}).get(sentence)
+
+        def put_sentence(sentence: str):
+            clean = self._EMOTION_PATTERN.sub("", sentence).strip()
+            clean = self._text_for_tts(clean) if clean else ""
+            # 纯标点片段不送 TTS
+            if clean and re.search(r"\w", clean):
+                sentence_queue.put(clean)
+
+        def produce():
+            parts = []
+            last_sent_len = 0
+            SUBTITLE_CHUNK = 6
+            tracer.mark("llm_request")
+            stream = self._agent.chat(user_input, stream=True, speculation=speculation, cancel=stop_event)
+            try:
+                for chunk in stream:
+                    if stop_event.is_set():
+                        break
+                    tracer.mark("llm_first_token")
+                    parts.append(chunk)
+                    current = "".join(parts)
+                    if len(current) - last_sent_len >= SUBTITLE_CHUNK:
+                        clean, _ = self._parse_emotion(current)
+                        self._send_subtitle(clean, is_final=False)
+                        last_sent_len = len(current)
+                    if not result["emotion_locked"]:
+                        # 情绪标签一般在回复开头，尽早确定以便首句字幕带上情绪
+                        found = self._EMOTION_PATTERN.search(current)
+                        if found:
+                            self._current_emotion = found.group(1).lower()
+                            result["emotion_locked"] = True
+                    for sentence in segmenter.feed(chunk):
+                        put_sentence(sentence)
+                tail = segmenter.flush()
+                if tail:
+                    put_sentence(tail)
+                tracer.mark("llm_done")
+                full = "".join(parts)
+                clean_text, emotion = self._parse_emotion(full)
+                if not result["emotion_locked"]:
+                    self._current_emotion = emotion
+                result["text"] = clean_text if full.strip() else ""
+            except Exception as e:
+                log.error(f"Agent 错误: {e}")
+                result["error"] = e
+            finally:
+                if stop_event.is_set():
+                    # 打断：关闭生成器，取消 LLM 流
+                    try:
+                        stream.close()
+                    except Exception:
+                        pass
+                sentence_queue.put(None)
+
+        def put_audio(item) -> bool:
+            # 队列满时轮询，打断后不再阻塞
+            while not stop_event.is_set():
+                try:
+                    audio_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def synthesize():
+            try:
+                while not stop_event.is_set():
+                    sentence = sentence_queue.get()
+                    if sentence is None:
+                        break
+                    audio = cached_sentence_audio(sentence)
+                    if audio is not None:
+                        tracer.mark("tts_first_packet")
+                        put_audio((sentence, audio, None))
+                        continue
+                    t0 = time.perf_counter()
+                    tracer.mark("tts_request")
+                    chunks = self._tts.generate_audio_streaming(
+                        sentence, use_clone=True, max_workers=1
+                    )
+                    try:
+                        for chunk_data in chunks:
+                            if stop_event.is_set():
+                                break
+                            tracer.mark("tts_first_packet")
+                            if len(chunk_data) == 4:
+                                audio, _, _, visemes = chunk_data
+                            else:
+                                audio, _, _ = chunk_data
+                                visemes = None
+                            if cache is not None:
+                                synthesized.setdefault(sentence, []).append(np.asarray(audio, dtype=np.float32))
+                            put_audio((sentence, audio, visemes))
+                    finally:
+                        if stop_event.is_set() and hasattr(chunks, "close"):
+                            # 打断：取消剩余段的合成
+                            chunks.close()
+                    log.tts_debug(f"[流水线] 句子合成 {time.perf_counter() - t0:.2f}s: {sentence[:20]}")
+            except Exception as e:
+                log.error(f"TTS 错误: {e}")
+            finally:
+                put_audio(None)
+
+        self._current_emotion = "neutral"
+        producer = threading.Thread(target=produce, daemon=True, name="LLM-Producer")
+        synthesizer = threading.Thread(target=synthesize, daemon=True, name="TTS-Synth")
+        producer.start()
+        synthesizer.start()
+
+        spoken_parts = []
+        last_sentence = None
+        first_chunk = True
+        try:
+            while True:
+                try:
+                    item = audio_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self._speech_cancelled():
+                        stop_event.set()
+                        break
+                    continue
+                if item is None:
+                    break
+                if self._speech_cancelled():
+                    stop_event.set()
+                    break
+                sentence, audio, visemes = item
+                if sentence is not last_sentence:
+                    spoken_parts.append(sentence)
+                    last_sentence = sentence
+                    if first_chunk:
+                        tracer.mark("playback_start")
+                        log.debug(f"开始播放... [耗时] 首句首包: {time.perf_counter() - t_start:.2f}s")
+                        first_chunk = False
+                        self._set_state(ConversationState.SPEAKING)
+                        # 👉 音频开始播放时触发气泡显示
+                        self._send_subtitle("".join(spoken_parts), is_final=True, emotion=self._current_emotion)
+                    else:
+                        self._send_subtitle("".join(spoken_parts), is_final=False, emotion=self._current_emotion)
+                self._play_tts_chunk(audio, visemes)
+                if self._speech_cancelled():
+                    stop_event.set()
+                    break
+            self._finish_playback()
+            tracer.mark("playback_end")
+        except Exception as e:
+            log.error(f"播放错误: {e}")
+            stop_event.set()
+        finally:
+            self._reset_mouth()
+            self._response_cancel = None
+
+        # Agent 收到取消后很快返回；等它把已生成部分写入历史，下一轮再开始
+        producer.join(timeout=1.0)
+        if stop_event.is_set():
+            # 被打断：只返回已经说出口的部分
+            log.tts(f"[流水线] 播放中止，已播放 {len(spoken_parts)} 句")
+            return "".join(spoken_parts) or None
+
+        log.tts(f"[流水线] 播放完成，共 {len(spoken_parts)} 句，总耗时 {time.perf_counter() - t_start:.2f}s")
+
+        entry = getattr(self._agent, "last_cache_entry", None)
+        if cache is not None and entry is not None and synthesized and cached_audio["sentences"] is None \
+                and result["error"] is None and len(synthesized) == len(spoken_parts):
+            # 完整播放的缓存回复：保存整段音频，下次命中时免去 TTS
+            cache.attach_audio(
+                entry.entry_id,
+                self._tts_voice_key(),
+                {s: np.concatenate([a.reshape(-1) for a in chunks]) for s, chunks in synthesized.items()},
+                self._tts.sample_rate,
+            )
+
+        if result["error"] is not None and not spoken_parts:
+            msg = f"抱歉，处理时出错了: {result['error']}"
+            self._send_subtitle(msg, is_final=True)
+            return msg
+
+        text = result["text"]
+        if text and first_chunk:
+            # 有文本但没有合成出音频（TTS 失败），至少显示字幕
+            self._send_subtitle(text, is_final=True, emotion=self._current_emotion)
+        elif text:
+            self._send_subtitle(text, is_final=False, emotion=self._current_emotion)
+        return text or None
+
+    # Rhubarb 口型映射: shape → (openY, form)，定义见 core.lip_sync
+    VISEME_SHAPE_MAP = VISEME_SHAPE_MAP
     
     # === 手动触发方法（供外部调用）===
     
@@ -1370,8 +2036,10 @@ class ConversationManager:
         self._message_queue.put(("listen", None))
     
     def interrupt(self):
-        """打断当前操作"""
-        if self.state == ConversationState.SPEAKING:
+        """打断当前操作（停止播放，取消未完成的 TTS 与 LLM 流）"""
+        self._barge_in_event.set()
+        self._cancel_response()
+        if self._audio_output:
             self._audio_output.stop()
         self._set_state(ConversationState.IDLE)
 
@@ -103,7 +103,8 @@ class DiarizationEngine:
     def identify(
         self,
         audio: np.ndarray,
-        sample_rate: int = 16000
+        sample_rate: int = 16000,
+        embedding: Optional[np.ndarray] = None
     ) -> DiarizationResult:
         """
         识别音频中的说话人（带超时控制和错误处理）
@@ -111,6 +112,7 @@ class DiarizationEngine:
         Args:
             audio: 音频数据（float32, mono）
             sample_rate: 采样率
+            embedding: 已提取的声纹向量（可选；提供时跳过提取，只做数据库匹配）
             
         Returns:
             DiarizationResult: 包含 speaker_id, score, reason
@@ -144,8 +146,27 @@ class DiarizationEngine:
                 is_confident=False
             )
         
-        # 需求 8.4: 使用超时控制（默认 500ms）
         start_time = time.time()
+        if embedding is not None:
+            # 声纹已由调用方提取（与 SV 共用），匹配本身很快，无需超时线程
+            try:
+                result = self._do_identify(audio, sample_rate, duration_sec, embedding)
+                self._consecutive_failures = 0
+                log.debug(f"[说话人识别] 成功: speaker_id={result.speaker_id}, score={result.score:.3f}, 耗时={(time.time() - start_time) * 1000:.0f}ms")
+                return result
+            except Exception as e:
+                self._consecutive_failures += 1
+                log.error(f"[说话人识别] 失败: {type(e).__name__}: {e} (失败次数: {self._consecutive_failures}/{self._max_failures})")
+                self._check_and_disable_if_needed()
+                return DiarizationResult(
+                    speaker_id=self._last_speaker_id or "unknown",
+                    score=0.0,
+                    reason=f"error:{type(e).__name__}",
+                    duration_sec=duration_sec,
+                    is_confident=False
+                )
+        
+        # 需求 8.4: 使用超时控制（默认 500ms）
         executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
         future = executor.submit(self._do_identify, audio, sample_rate, duration_sec)
         
@@ -224,7 +245,8 @@ class DiarizationEngine:
         self,
         audio: np.ndarray,
         sample_rate: int,
-        duration_sec: float
+        duration_sec: float,
+        embedding: Optional[np.ndarray] = None
     ) -> DiarizationResult:
         """
         执行实际的识别逻辑（内部方法，用于超时控制）
@@ -233,12 +255,16 @@ class DiarizationEngine:
             audio: 音频数据
             sample_rate: 采样率
             duration_sec: 音频时长
+            embedding: 已提取的声纹向量（可选）
             
         Returns:
             DiarizationResult
         """
         # 提取声纹特征（带缓存）
-        query_emb = self._extract_embedding_cached(audio, sample_rate)
+        if embedding is not None:
+            query_emb = embedding
+        else:
+            query_emb = self._extract_embedding_cached(audio, sample_rate)
         
         # 需求 8.3: 与数据库匹配（可能抛出数据库访问异常）
         speaker_id, score = self.voiceprint_db.find_best_match(
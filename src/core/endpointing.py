@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+自适应端点检测（何时认为用户说完）
+
+固定静音阈值两头不讨好：短了会在句中停顿处截断，长了每轮都要白等一整段静音。
+这里根据流式 ASR 中间结果判断「这句话看起来是否已经说完」，动态调整静音等待时长：
+- 句末标点（ASR 自带或 PUNC 预测）、句末语气词、常见的完整短句 → 缩短
+- 以连词/介词/填充词、逗号顿号结尾 → 延长
+- 没有中间结果或判断不出 → 使用基准时长
+
+VAD 仍然决定「有没有声音」；AudioInput.record_until_silence 在静音期间
+调用 silence_duration() 取当前应等待的时长。
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+
+@dataclass
+class EndpointConfig:
+    """自适应端点参数（秒）"""
+    base_silence: float = 0.6    # 判断不出时的静音时长（即原固定阈值）
+    min_silence: float = 0.25    # 明确说完时的静音时长
+    max_silence: float = 1.2     # 明显没说完时的静音时长
+
+
+# 句末 / 句中标点
+_FINAL_PUNCT = "。！？!?…~～"
+_STRONG_FINAL_PUNCT = "！？!?"
+_CONTINUATION_PUNCT = "，,、；;：:—-"
+_TRAILING_SPACE = re.compile(r"\s+$")
+
+# 句末语气词 / 疑问词（疑问语气更确定）
+_QUESTION_ENDINGS = (
+    "吗", "呢", "么", "没", "怎么样", "什么", "哪里", "哪儿", "几点", "多少", "为什么", "怎么办",
+    "好不好", "行不行", "对不对", "是不是",
+)
+_FINAL_PARTICLES = ("吧", "啊", "呀", "嘛", "啦", "哦", "喔", "哈", "咯", "呗", "了")
+
+# 整句即完整回复的短语
+_COMPLETE_PHRASES = {
+    "好", "好的", "好啊", "行", "可以", "对", "对的", "是", "是的", "嗯好", "没有", "不是", "不用",
+    "不用了", "知道了", "明白了", "谢谢", "谢谢你", "再见", "拜拜", "晚安", "早安", "你好",
+    "ok", "okay", "yes", "no", "thanks", "bye",
+}
+
+# 说明话还没说完的结尾：连词、介词、半截的主谓
+_INCOMPLETE_ENDINGS = (
+    "然后", "但是", "可是", "不过", "因为", "所以", "而且", "并且", "还有", "就是", "以及", "或者",
+    "还是", "如果", "要是", "比如", "那个", "这个", "那么", "的话", "觉得", "我想", "我要", "帮我",
+    "和", "跟", "与", "及", "在", "把", "被", "给", "向", "从", "比", "让", "往", "就", "请",
+)
+# 单独出现也说明没说完的填充词
+_FILLERS = ("嗯", "呃", "额", "啊", "那", "这", "就是", "那个", "然后")
+
+
+class AdaptiveEndpointer:
+    """
+    按中间结果动态给出静音等待时长
+
+    用法（每句话一轮）:
+        ep = AdaptiveEndpointer(EndpointConfig(base_silence=0.6), punctuate=punc_fn)
+        ep.reset()
+        ep.update(partial_text)          # 每次中间结果变化时
+        ep.silence_duration()            # 静音期间由录音循环调用
+    """
+
+    def __init__(
+        self,
+        config: Optional[EndpointConfig] = None,
+        punctuate: Optional[Callable[[str], Optional[str]]] = None,
+    ):
+        """
+        Args:
+            config: 端点参数
+            punctuate: 标点预测（如 PUNCEngine）；返回带标点文本，无法预测时返回 None。
+                       只在静音期间、中间结果本身判断不出时调用，结果按文本缓存
+        """
+        self.config = config or EndpointConfig()
+        self._punctuate = punctuate
+        self._punc_cache: Dict[str, Optional[str]] = {}
+        self._text = ""
+        # 最近一次决策：(完整度分数, 依据, 静音时长)
+        self.last_decision: Tuple[float, str, float] = (0.0, "no_text", self.config.base_silence)
+
+    def reset(self):
+        self._text = ""
+        self._punc_cache.clear()
+        self.last_decision = (0.0, "no_text", self.config.base_silence)
+
+    def update(self, text: str):
+        """记录最新的中间结果"""
+        self._text = (text or "").strip()
+
+    def silence_duration(self) -> float:
+        """当前应等待的静音时长（秒）"""
+        score, reason = self.completeness(self._text)
+        cfg = self.config
+        if score >= 0:
+            duration = cfg.base_silence - score * (cfg.base_silence - cfg.min_silence)
+        else:
+            duration = cfg.base_silence - score * (cfg.max_silence - cfg.base_silence)
+        self.last_decision = (score, reason, duration)
+        return duration
+
+    def completeness(self, text: str) -> Tuple[float, str]:
+        """
+        判断文本看起来是否已说完
+
+        Returns:
+            (分数, 依据)。分数在 [-1, 1]：1 明确说完，-1 明显没说完，0 判断不出
+        """
+        s = _TRAILING_SPACE.sub("", text or "")
+        if not s:
+            return 0.0, "no_text"
+
+        last = s[-1]
+        if last in _CONTINUATION_PUNCT:
+            return -0.8, "continuation_punct"
+        if last in _STRONG_FINAL_PUNCT:
+            return 1.0, "final_punct"
+        if last in _FINAL_PUNCT:
+            return 0.8, "final_punct"
+
+        core = s.rstrip(_FINAL_PUNCT + _CONTINUATION_PUNCT).strip().lower()
+        if core in _FILLERS:
+            return -1.0, "filler"
+        if core in _COMPLETE_PHRASES:
+            return 1.0, "complete_phrase"
+        for word in _INCOMPLETE_ENDINGS:
+            if core.endswith(word) and len(core) > len(word):
+                return -1.0, f"incomplete_ending:{word}"
+        if core.endswith(_QUESTION_ENDINGS):
+            return 1.0, "question"
+        if core.endswith(_FINAL_PARTICLES):
+            return 0.7, "final_particle"
+
+        predicted = self._predict_punct(s)
+        if predicted:
+            tail = predicted.rstrip()[-1:]
+            if tail in _STRONG_FINAL_PUNCT:
+                return 0.8, "punc_final"
+            if tail in _FINAL_PUNCT:
+                return 0.5, "punc_final"
+            if tail in _CONTINUATION_PUNCT:
+                return -0.6, "punc_continuation"
+        return 0.0, "unknown"
+
+    def _predict_punct(self, text: str) -> Optional[str]:
+        if self._punctuate is None:
+            return None
+        if text not in self._punc_cache:
+            try:
+                self._punc_cache[text] = self._punctuate(text)
+            except Exception:
+                self._punc_cache[text] = None
+        return self._punc_cache[text]
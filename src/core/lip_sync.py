@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+口型同步调度器
+用播放时钟（而不是 time.sleep 计时）驱动 Live2D 嘴型
+
+- 每段 TTS 音频在入队时预先算好口型时间线（Rhubarb viseme 或 RMS 包络，向量化一次算完）
+- 一个常驻线程按播放位置查表发送当前帧，值不变时不重复发送
+- 打断时 clear() 立即闭嘴
+
+用法:
+    from core.lip_sync import LipSyncScheduler
+
+    lip = LipSyncScheduler(on_viseme=send_viseme, on_rms=send_rms, clock=output.audible_time)
+    lip.add_rms(audio, sample_rate, start=start_sample / sample_rate)
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from core.log import log
+except ImportError:
+    class _Fallback:
+        @staticmethod
+        def debug(msg): pass
+        @staticmethod
+        def warn(msg): print(msg)
+    log = _Fallback()
+
+
+# Rhubarb 口型映射: shape → (openY, form)
+# A=静息/小口  B=轻合唇音  C=较开口  D=大开口  E=圆嘴音  F=窄口音  G=轻开  H=微开
+VISEME_SHAPE_MAP: Dict[str, Tuple[float, float]] = {
+    'X': (0.00, 0.00),   # 闭嘴（静音）
+    'A': (0.05, 0.00),   # 口型很小，中性
+    'B': (0.25, 0.60),   # 双唇轻合（b/m/p）— 偏笑口形
+    'C': (0.50, 0.20),   # 中等开口（e/辅音）
+    'D': (0.85, 0.40),   # 大张口（a）
+    'E': (0.55, -0.40),  # 圆嘴（o）— form 负值
+    'F': (0.35, -0.70),  # 窄嘴（u/w）— form 更负
+    'G': (0.20, 0.30),   # 轻开口（辅音）
+    'H': (0.40, 0.10),   # 中等开口（l）
+}
+
+
+def rms_envelope(audio: np.ndarray, sample_rate: int, window_ms: int = 50) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    向量化计算 RMS 包络
+
+    Returns:
+        (times, values)：每个窗口的起始时间（秒）与 RMS 值
+    """
+    a = np.asarray(audio, dtype=np.float32).reshape(-1)
+    if a.size == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    # int16 量级的数据归一化到 [-1, 1]
+    if np.max(np.abs(a)) > 1.0:
+        a = a / 32768.0
+    win = max(1, int(sample_rate * window_ms / 1000))
+    n_full = len(a) // win
+    values = []
+    if n_full:
+        values.append(np.sqrt(np.mean(a[: n_full * win].reshape(n_full, win) ** 2, axis=1)))
+    if len(a) > n_full * win:
+        tail = a[n_full * win:]
+        values.append(np.array([np.sqrt(np.mean(tail ** 2))], dtype=np.float32))
+    v = np.concatenate(values).astype(np.float32)
+    times = np.arange(len(v), dtype=np.float32) * (win / float(sample_rate))
+    return times, v
+
+
+def viseme_timeline(
+    visemes: List[Dict],
+    shape_map: Dict[str, Tuple[float, float]] = VISEME_SHAPE_MAP,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rhubarb cue 列表 → 时间线
+
+    Returns:
+        (times, values)：cue 起始时间（秒）与 (openY, form) 数组，shape (n, 2)
+    """
+    times, values = [], []
+    for cue in visemes or []:
+        try:
+            t = float(cue.get('start', 0.0))
+        except (TypeError, ValueError):
+            continue
+        times.append(t)
+        values.append(shape_map.get(cue.get('value', 'X'), (0.0, 0.0)))
+    if not times:
+        return np.zeros(0, dtype=np.float32), np.zeros((0, 2), dtype=np.float32)
+    order = np.argsort(times, kind="stable")
+    return (
+        np.asarray(times, dtype=np.float32)[order],
+        np.asarray(values, dtype=np.float32).reshape(-1, 2)[order],
+    )
+
+
+@dataclass
+class LipSyncTrack:
+    """一段音频的口型时间线"""
+    kind: str            # "viseme" | "rms"
+    start: float         # 段起点（播放时钟，秒）
+    duration: float      # 段时长（秒）
+    times: np.ndarray    # 帧相对段起点的时间（秒），升序
+    values: np.ndarray   # rms: (n,)；viseme: (n, 2)
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+    def value_at(self, t: float):
+        i = int(np.searchsorted(self.times, t - self.start, side="right")) - 1
+        if i < 0:
+            return None
+        return self.values[i]
+
+
+class LipSyncScheduler:
+    """
+    单线程口型调度器
+
+    clock 返回当前播放时钟（秒），与 add_* 的 start 同一基准：
+    - 连续播放引擎：已播放样本数 / 采样率 - 输出延迟（AudioOutput.audible_time）
+    - 逐段 sd.play：time.monotonic()
+    时钟基准变化（换时钟、播放引擎重建后位置归零）时用 set_clock 的 epoch 重新对齐。
+    """
+
+    def __init__(
+        self,
+        on_viseme: Optional[Callable[[float, float], None]] = None,
+        on_rms: Optional[Callable[[float], None]] = None,
+        clock: Optional[Callable[[], float]] = None,
+        fps: float = 30.0,
+        rms_epsilon: float = 0.01,
+    ):
+        self.on_viseme = on_viseme
+        self.on_rms = on_rms
+        self._clock = clock or time.monotonic
+        self._interval = 1.0 / max(1.0, fps)
+        self._rms_epsilon = rms_epsilon
+        self._tracks: List[LipSyncTrack] = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._last_sent = None
+        self._mouth_open = False
+        self._epoch = None
+
+    def set_clock(self, clock: Callable[[], float], epoch=None):
+        """
+        设置播放时钟
+
+        epoch 标识时钟基准；与上次不同时丢弃按旧基准登记的时间线（它们的 start 在新时钟上没有意义）。
+        """
+        with self._cond:
+            self._clock = clock
+            if epoch != self._epoch:
+                self._epoch = epoch
+                self._tracks.clear()
+                self._cond.notify_all()
+
+    def now(self) -> float:
+        return self._clock()
+
+    # ---- 添加时间线 ----
+
+    def add_rms(self, audio: np.ndarray, sample_rate: int, start: float, window_ms: int = 50):
+        times, values = rms_envelope(audio, sample_rate, window_ms)
+        self._add(LipSyncTrack("rms", start, len(audio) / float(sample_rate), times, values))
+
+    def add_visemes(self, visemes: List[Dict], duration: float, start: float):
+        times, values = viseme_timeline(visemes)
+        self._add(LipSyncTrack("viseme", start, duration, times, values))
+
+    def _add(self, track: LipSyncTrack):
+        if track.duration <= 0 or len(track.times) == 0:
+            return
+        with self._cond:
+            self._tracks.append(track)
+            self._tracks.sort(key=lambda tr: tr.start)
+            self._cond.notify_all()
+        self._ensure_thread()
+
+    def clear(self, close_mouth: bool = True):
+        """丢弃所有时间线（打断/播放结束）"""
+        with self._cond:
+            self._tracks.clear()
+            self._cond.notify_all()
+        if close_mouth:
+            self._close_mouth()
+
+    # ---- 线程 ----
+
+    def _ensure_thread(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True, name="LipSync")
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._tracks.clear()
+            self._cond.notify_all()
+        t = self._thread
+        if t is not None and t is not threading.current_thread():
+            t.join(timeout=1.0)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                if not self._tracks:
+                    self._cond.wait(timeout=0.5)
+                    continue
+                clock = self._clock
+            try:
+                now = clock()
+            except Exception:
+                now = None
+            if now is not None:
+                self._tick(now)
+            time.sleep(self._interval)
+
+    def _tick(self, now: float):
+        with self._cond:
+            # 丢弃已播完的段
+            while self._tracks and self._tracks[0].end <= now:
+                self._tracks.pop(0)
+            active = None
+            for tr in self._tracks:
+                if tr.start <= now < tr.end:
+                    active = tr
+                    break
+                if tr.start > now:
+                    break
+        if active is None:
+            # 段间空隙或全部播完：闭嘴
+            self._close_mouth()
+            return
+        value = active.value_at(now)
+        if value is None:
+            self._close_mouth()
+            return
+        self._emit(active.kind, value)
+
+    def _emit(self, kind: str, value):
+        try:
+            if kind == "viseme":
+                key = ("viseme", float(value[0]), float(value[1]))
+                if key == self._last_sent:
+                    return
+                if self.on_viseme:
+                    self.on_viseme(key[1], key[2])
+            else:
+                rms = float(value)
+                last = self._last_sent
+                if last is not None and last[0] == "rms" and abs(last[1] - rms) < self._rms_epsilon:
+                    return
+                key = ("rms", rms)
+                if self.on_rms:
+                    self.on_rms(rms)
+            self._last_sent = key
+            self._mouth_open = True
+        except Exception as e:
+            log.debug(f"[LipSync] 发送失败: {e}")
+
+    def _close_mouth(self):
+        if not self._mouth_open:
+            return
+        self._mouth_open = False
+        self._last_sent = None
+        try:
+            if self.on_viseme:
+                self.on_viseme(0.0, 0.0)
+            if self.on_rms:
+                self.on_rms(0.0)
+        except Exception as e:
+            log.debug(f"[LipSync] 发送失败: {e}")
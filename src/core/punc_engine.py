@@ -68,6 +68,10 @@ class PUNCEngine:
         except Exception:
             return "cpu"
 
+    @property
+    def model_ready(self) -> bool:
+        return self._model_ready
+
     def _ensure_model(self):
         if self._model_ready:
             return
@@ -0,0 +1,647 @@
+# -*- coding: utf-8 -*-
+"""
+无界面多会话服务器
+一个进程通过 WebSocket 承载多个相互隔离的对话会话，共享同一套已加载的模型
+
+结构:
+  - SharedEngines: ASR / PUNC / TTS 只加载一次，每个引擎前面挂一个 EngineQueue
+  - EngineQueue:   按会话分队列、轮转取任务（公平调度），超出积压上限直接拒绝
+  - Session:       每个连接一个会话：独立的 Agent（历史/记忆/用户）、音频缓冲、当前回合
+  - SessionServer: 准入控制（会话数上限、并发回合上限）、空闲超时
+
+协议（客户端 → 服务端）:
+  文本帧 JSON:
+    {"type": "hello", "user_id": "u1", "tts": true}   可选，必须是第一条消息
+    {"type": "text", "text": "..."}                    文字输入，开始新回合（打断进行中的回合）
+    {"type": "audio_end"}                              结束一段语音输入，识别后开始新回合
+    {"type": "cancel"}                                 打断当前回合
+    {"type": "stats"}                                  查询服务端队列状态
+    {"type": "bye"}                                    结束会话
+  二进制帧: PCM16LE 单声道音频（采样率见 session 消息），累积到 audio_end
+
+协议（服务端 → 客户端）:
+    {"type": "session", "session_id": "...", "sample_rate": 16000}
+    {"type": "state", "state": "processing" | "speaking" | "idle"}
+    {"type": "asr", "text": "..."}
+    {"type": "delta", "text": "..."}                   LLM 增量正文（已去除情绪标签）
+    {"type": "reply", "text": "...", "emotion": "joy"}
+    {"type": "audio", "sentence": 1, "sample_rate": 24000} 紧随其后的二进制帧为该句的 PCM16LE 音频
+    {"type": "error", "message": "..."}
+
+用法:
+    python -m core.session_server --port 8766 --max-sessions 32
+"""
+
+import asyncio
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+# 添加路径
+project_root = Path(__file__).parent.parent.parent
+src_path = project_root / "src"
+sys.path.insert(0, str(src_path))
+
+from core.log import log
+from core.conversation_manager import ConversationManager, ConversationConfig
+from core.text_segmenter import StreamingSentenceSegmenter, SegmenterConfig
+from core.emotion_classifier import EmotionClassifier
+
+try:
+    from websockets.asyncio.server import serve as ws_serve  # websockets >= 13
+    HAS_WEBSOCKETS = True
+except ImportError:
+    try:
+        from websockets.server import serve as ws_serve  # type: ignore
+        HAS_WEBSOCKETS = True
+    except ImportError:
+        HAS_WEBSOCKETS = False
+
+
+@dataclass
+class ServerConfig:
+    """服务端配置"""
+    host: str = "0.0.0.0"
+    port: int = 8766
+
+    # 准入控制
+    max_sessions: int = 32                 # 同时在线会话上限，超出时拒绝连接（1013）
+    max_concurrent_turns: int = 16         # 同时进行 LLM 回合的会话上限，其余排队（FIFO）
+    idle_timeout_sec: float = 600.0        # 会话空闲超时
+    max_utterance_sec: float = 30.0        # 单段语音输入上限
+
+    # 共享引擎
+    enable_asr: bool = True
+    enable_tts: bool = True
+    asr_workers: int = 1                   # 每个引擎的工作线程数（GPU 模型一般为 1）
+    tts_workers: int = 1
+    max_pending_jobs: int = 64             # 每个引擎的积压上限，超出时请求直接失败
+
+    # 会话
+    sample_rate: int = 16000               # 客户端上行音频采样率
+    enable_tools: bool = False             # 服务端模式默认不开工具（摄像头/截图/终端等只对本机有意义）
+    enable_response_cache: bool = False    # 语义回复缓存（各会话共享，按用户/角色分区）
+    stream_tts_first_min_chars: int = 6
+    stream_tts_min_chars: int = 12
+    stream_tts_max_chars: int = 80
+
+    # 模型路径/设备等沿用对话配置
+    conversation: Optional[ConversationConfig] = None
+
+
+class EngineBusy(RuntimeError):
+    """引擎积压超过上限"""
+
+
+class EngineQueue:
+    """
+    共享引擎的请求队列
+
+    每个会话一条队列，工作线程按会话轮转取任务：一个会话的长回复被拆成多个任务，
+    不会饿死其它会话。任务在线程中执行，结果通过 asyncio.Future 交回事件循环。
+    """
+
+    def __init__(self, name: str, workers: int = 1, max_pending: int = 64):
+        self.name = name
+        self.max_pending = max(1, int(max_pending))
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._running = True
+        self._busy = 0
+        self.completed = 0
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"Engine-{name}-{i}", daemon=True)
+            for i in range(max(1, int(workers)))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, session_id: str, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        """提交任务（在事件循环中调用），返回可 await 的 Future"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if self._pending >= self.max_pending:
+                raise EngineBusy(f"{self.name} 繁忙（积压 {self._pending}）")
+            self._queues.setdefault(session_id, deque()).append((loop, future, fn, args, kwargs))
+            self._pending += 1
+            self._cond.notify()
+        return future
+
+    def cancel_session(self, session_id: str):
+        """丢弃某会话尚未开始的任务"""
+        with self._cond:
+            jobs = self._queues.pop(session_id, None) or ()
+            self._pending -= len(jobs)
+        for loop, future, *_ in jobs:
+            loop.call_soon_threadsafe(self._cancel_future, future)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "pending": self._pending,
+                "sessions": len(self._queues),
+                "busy": self._busy,
+                "completed": self.completed,
+            }
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _next_job(self):
+        with self._cond:
+            while self._running and not self._queues:
+                self._cond.wait()
+            if not self._running:
+                return None
+            # 轮转：取队首会话的一个任务，该会话还有任务则移到队尾
+            session_id, jobs = next(iter(self._queues.items()))
+            job = jobs.popleft()
+            if jobs:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._pending -= 1
+            self._busy += 1
+            return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            loop, future, fn, args, kwargs = job
+            try:
+                if future.cancelled():
+                    continue
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    loop.call_soon_threadsafe(self._set_exception, future, e)
+                else:
+                    loop.call_soon_threadsafe(self._set_result, future, result)
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self.completed += 1
+
+    @staticmethod
+    def _set_result(future: asyncio.Future, result):
+        if not future.done():
+            future.set_result(result)
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, exc: BaseException):
+        if not future.done():
+            future.set_exception(exc)
+
+    @staticmethod
+    def _cancel_future(future: asyncio.Future):
+        if not future.done():
+            future.cancel()
+
+
+class SharedEngines:
+    """
+    进程内共享的模型引擎
+
+    加载逻辑复用 ConversationManager 的 _init_asr / _init_tts / _init_punc（路径解析、设备选择、远程 TTS），
+    每个引擎只加载一次，由 EngineQueue 串行/限流使用。
+    """
+
+    def __init__(self, config: ServerConfig):
+        self.config = config
+        loader = ConversationManager(config.conversation or ConversationConfig())
+        self.asr = None
+        self.punc = None
+        self.tts = None
+        if config.enable_asr:
+            loader._init_asr()
+            loader._init_punc()
+            self.asr = loader._asr
+            self.punc = loader._punc
+        if config.enable_tts:
+            loader._init_tts()
+            self.tts = loader._tts
+        self.text_for_tts = ConversationManager._text_for_tts
+
+        self.asr_queue = EngineQueue("asr", config.asr_workers, config.max_pending_jobs) if self.asr else None
+        self.tts_queue = EngineQueue("tts", config.tts_workers, config.max_pending_jobs) if self.tts else None
+
+        # 所有会话共用一个 LLM 客户端（同一个 keep-alive 连接池）
+        from backend.llm.api_infer.router import create_llm_client
+        from backend.llm.api_infer.config import DEEPSEEK_API_KEY, BASE_URL, MODEL
+        self.llm = create_llm_client(url=BASE_URL, api_key=DEEPSEEK_API_KEY, model_name=MODEL)
+
+        log.info(
+            f"[Server] 共享引擎就绪: ASR={'on' if self.asr else 'off'} "
+            f"PUNC={'on' if self.punc else 'off'} TTS={'on' if self.tts else 'off'}"
+        )
+
+    def recognize(self, audio: np.ndarray, sample_rate: int) -> str:
+        """批量识别一段语音并恢复标点（在 ASR 工作线程中执行）"""
+        text = (self.asr.recognize_audio(audio, sample_rate) or "").strip()
+        if text and self.punc is not None:
+            try:
+                restored = self.punc.restore(text)
+                if restored.text:
+                    text = restored.text
+            except Exception as e:
+                log.warn(f"[Server] PUNC 失败，保留原文本: {e}")
+        return text
+
+    def synthesize(self, text: str, cancel: threading.Event) -> Optional[np.ndarray]:
+        """合成一句话（在 TTS 工作线程中执行）；回合被打断时尽早停止"""
+        parts = []
+        for chunk_data in self.tts.generate_audio_streaming(text, use_clone=True, max_workers=1):
+            if cancel.is_set():
+                return None
+            parts.append(np.asarray(chunk_data[0], dtype=np.float32).reshape(-1))
+        return np.concatenate(parts) if parts else None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        out = {}
+        if self.asr_queue:
+            out["asr"] = self.asr_queue.stats()
+        if self.tts_queue:
+            out["tts"] = self.tts_queue.stats()
+        return out
+
+
+class Session:
+    """单个连接的会话状态"""
+
+    _EMOTION_PATTERN = ConversationManager._EMOTION_PATTERN
+    _emotion_classifier = EmotionClassifier()
+
+    def __init__(self, server: "SessionServer", websocket, user_id: str, with_tts: bool):
+        self.server = server
+        self.ws = websocket
+        self.session_id = uuid.uuid4().hex[:12]
+        self.user_id = user_id
+        self.with_tts = with_tts and server.engines.tts_queue is not None
+        self.agent = None
+        self._audio: list = []
+        self._audio_samples = 0
+        self._turn: Optional[asyncio.Task] = None
+        self._cancel = threading.Event()
+        self._send_lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+
+    # ---------- 发送 ----------
+
+    async def send_json(self, data: Dict[str, Any]):
+        await self.send(json.dumps(data, ensure_ascii=False))
+
+    async def send(self, message):
+        try:
+            async with self._send_lock:
+                await self.ws.send(message)
+        except Exception:
+            pass
+
+    async def send_audio(self, sentence: int, audio: np.ndarray, sample_rate: int):
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+        # 头与数据在同一把锁内发送，保证客户端收到的顺序
+        try:
+            async with self._send_lock:
+                await self.ws.send(json.dumps(
+                    {"type": "audio", "sentence": sentence, "sample_rate": sample_rate},
+                    ensure_ascii=False,
+                ))
+                await self.ws.send(pcm)
+        except Exception:
+            pass
+
+    # ---------- 生命周期 ----------
+
+    async def open(self):
+        from backend.llm.agent import Agent
+
+        self.agent = await asyncio.to_thread(
+            Agent,
+            user_id=self.user_id,
+            enable_tools=self.server.config.enable_tools,
+            llm=self.server.engines.llm,
+            enable_response_cache=self.server.config.enable_response_cache,
+        )
+        await asyncio.to_thread(self.agent.start_chat)
+
+    async def close(self):
+        await self.cancel_turn()
+        if self.agent is not None:
+            # 记忆提取已在后台队列中进行，这里不会阻塞
+            await asyncio.to_thread(self.agent.end_chat)
+
+    # ---------- 输入 ----------
+
+    def feed_audio(self, data: bytes) -> bool:
+        """累积上行音频；超过单段上限返回 False"""
+        chunk = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+        limit = int(self.server.config.max_utterance_sec * self.server.config.sample_rate)
+        if self._audio_samples + len(chunk) > limit:
+            return False
+        self._audio.append(chunk)
+        self._audio_samples += len(chunk)
+        return True
+
+    async def end_audio(self):
+        if not self._audio:
+            return
+        audio = np.concatenate(self._audio)
+        self._audio, self._audio_samples = [], 0
+        if self.server.engines.asr_queue is None:
+            await self.send_json({"type": "error", "message": "服务端未启用语音识别"})
+            return
+        await self.cancel_turn()
+        try:
+            text = await self.server.engines.asr_queue.submit(
+                self.session_id, self.server.engines.recognize, audio, self.server.config.sample_rate
+            )
+        except EngineBusy as e:
+            await self.send_json({"type": "error", "message": str(e)})
+            return
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            await self.send_json({"type": "error", "message": f"语音识别失败: {e}"})
+            return
+        await self.send_json({"type": "asr", "text": text})
+        if text:
+            await self.start_turn(text)
+
+    # ---------- 回合 ----------
+
+    async def start_turn(self, text: str):
+        await self.cancel_turn()
+        self._cancel = threading.Event()
+        self._turn = asyncio.create_task(self._run_turn(text, self._cancel))
+
+    async def cancel_turn(self):
+        """打断当前回合：取消 LLM 请求、丢弃未开始的 TTS/ASR 任务"""
+        self._cancel.set()
+        for queue in (self.server.engines.tts_queue, self.server.engines.asr_queue):
+            if queue is not None:
+                queue.cancel_session(self.session_id)
+        turn, self._turn = self._turn, None
+        if turn is not None and not turn.done():
+            turn.cancel()
+            try:
+                await turn
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _run_turn(self, text: str, cancel: threading.Event):
+        await self.send_json({"type": "state", "state": "processing"})
+        async with self.server.turn_slots:
+            segmenter = StreamingSentenceSegmenter(SegmenterConfig(
+                first_min_chars=self.server.config.stream_tts_first_min_chars,
+                min_chars=self.server.config.stream_tts_min_chars,
+                max_chars=self.server.config.stream_tts_max_chars,
+            ))
+            sentences: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+            speaker = asyncio.create_task(self._speak(sentences, cancel)) if self.with_tts else None
+            parts = []
+            try:
+                async for chunk in self.agent.achat(text):
+                    parts.append(chunk)
+                    delta = self._EMOTION_PATTERN.sub("", chunk)
+                    if delta:
+                        await self.send_json({"type": "delta", "text": delta})
+                    if speaker is not None:
+                        for sentence in segmenter.feed(chunk):
+                            self._queue_sentence(sentences, sentence)
+                if speaker is not None:
+                    tail = segmenter.flush()
+                    if tail:
+                        self._queue_sentence(sentences, tail)
+                full = "".join(parts)
+                found = self._EMOTION_PATTERN.search(full)
+                clean = re.sub(r"  +", " ", self._EMOTION_PATTERN.sub("", full)).strip()
+                emotion = found.group(1).lower() if found else self._emotion_classifier.classify(clean).emotion
+                await self.send_json({"type": "reply", "text": clean, "emotion": emotion})
+            except asyncio.CancelledError:
+                if speaker is not None:
+                    speaker.cancel()
+                raise
+            except Exception as e:
+                log.error(f"[Server] 会话 {self.session_id} 回合失败: {e}")
+                await self.send_json({"type": "error", "message": str(e)})
+            finally:
+                if speaker is not None and not speaker.done():
+                    sentences.put_nowait(None)
+        if speaker is not None:
+            await speaker
+        await self.send_json({"type": "state", "state": "idle"})
+
+    def _queue_sentence(self, sentences: asyncio.Queue, sentence: str):
+        clean = self._EMOTION_PATTERN.sub("", sentence).strip()
+        clean = self.server.engines.text_for_tts(clean) if clean else ""
+        # 纯标点片段不送 TTS
+        if clean and re.search(r"\w", clean):
+            sentences.put_nowait(clean)
+
+    async def _speak(self, sentences: asyncio.Queue, cancel: threading.Event):
+        """按顺序逐句合成：每句一个 TTS 任务，多个会话之间轮转"""
+        engines = self.server.engines
+        index = 0
+        while True:
+            sentence = await sentences.get()
+            if sentence is None or cancel.is_set():
+                return
+            try:
+                audio = await engines.tts_queue.submit(self.session_id, engines.synthesize, sentence, cancel)
+            except EngineBusy as e:
+                await self.send_json({"type": "error", "message": str(e)})
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warn(f"[Server] TTS 失败: {e}")
+                continue
+            if audio is None or cancel.is_set():
+                continue
+            index += 1
+            if index == 1:
+                await self.send_json({"type": "state", "state": "speaking"})
+            await self.send_audio(index, audio, engines.tts.sample_rate)
+
+
+class SessionServer:
+    """多会话 WebSocket 服务器"""
+
+    def __init__(self, config: Optional[ServerConfig] = None, engines: Optional[SharedEngines] = None):
+        self.config = config or ServerConfig()
+        self.engines = engines or SharedEngines(self.config)
+        self.sessions: Dict[str, Session] = {}
+        self._connections = 0               # 已准入的连接数（含尚未完成握手的）
+        self.turn_slots: Optional[asyncio.Semaphore] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.config.max_sessions,
+            "engines": self.engines.stats(),
+            "llm": self.engines.llm.get_usage_stats(),
+        }
+
+    async def _handler(self, websocket):
+        if self._connections >= self.config.max_sessions:
+            await websocket.close(code=1013, reason="server busy")
+            return
+        self._connections += 1
+        try:
+            await self._run_session(websocket)
+        finally:
+            self._connections -= 1
+
+    async def _run_session(self, websocket):
+        user_id, with_tts = "default_user", True
+        first = None
+        try:
+            first = await asyncio.wait_for(websocket.recv(), timeout=self.config.idle_timeout_sec)
+        except Exception:
+            return
+        if isinstance(first, str):
+            try:
+                msg = json.loads(first)
+            except ValueError:
+                msg = {}
+            if msg.get("type") == "hello":
+                user_id = str(msg.get("user_id") or user_id)
+                with_tts = bool(msg.get("tts", True))
+                first = None
+
+        session = Session(self, websocket, user_id, with_tts)
+        self.sessions[session.session_id] = session
+        try:
+            try:
+                await session.open()
+            except Exception as e:
+                log.error(f"[Server] 会话初始化失败: {e}")
+                await session.send_json({"type": "error", "message": f"会话初始化失败: {e}"})
+                return
+            log.info(f"[Server] 会话开始 {session.session_id} user={user_id} (在线 {len(self.sessions)})")
+            await session.send_json({
+                "type": "session",
+                "session_id": session.session_id,
+                "sample_rate": self.config.sample_rate,
+            })
+            if first is not None:
+                await self._dispatch(session, first)
+            while True:
+                try:
+                    message = await asyncio.wait_for(websocket.recv(), timeout=self.config.idle_timeout_sec)
+                except asyncio.TimeoutError:
+                    await session.send_json({"type": "error", "message": "空闲超时"})
+                    break
+                session.last_active = time.monotonic()
+                if not await self._dispatch(session, message):
+                    break
+        except Exception:
+            pass
+        finally:
+            self.sessions.pop(session.session_id, None)
+            await session.close()
+            log.info(f"[Server] 会话结束 {session.session_id} (在线 {len(self.sessions)})")
+
+    async def _dispatch(self, session: Session, message) -> bool:
+        """处理一条客户端消息；返回 False 表示结束会话"""
+        if isinstance(message, (bytes, bytearray)):
+            if not session.feed_audio(bytes(message)):
+                await session.send_json({"type": "error", "message": "语音过长，已忽略超出部分"})
+            return True
+        try:
+            msg = json.loads(message)
+        except ValueError:
+            await session.send_json({"type": "error", "message": "无效的 JSON"})
+            return True
+
+        mtype = msg.get("type")
+        if mtype == "text":
+            text = (msg.get("text") or "").strip()
+            if text:
+                await session.start_turn(text)
+        elif mtype == "audio_end":
+            # 识别在后台进行，不阻塞后续消息（如 cancel）
+            asyncio.create_task(session.end_audio())
+        elif mtype == "cancel":
+            await session.cancel_turn()
+            await session.send_json({"type": "state", "state": "idle"})
+        elif mtype == "stats":
+            await session.send_json({"type": "stats", **self.stats()})
+        elif mtype == "bye":
+            return False
+        else:
+            await session.send_json({"type": "error", "message": f"未知消息类型: {mtype}"})
+        return True
+
+    async def serve(self):
+        """运行服务直到 stop()"""
+        if not HAS_WEBSOCKETS:
+            raise RuntimeError("websockets 未安装，请运行: pip install websockets")
+        self.turn_slots = asyncio.Semaphore(max(1, self.config.max_concurrent_turns))
+        self._stop = asyncio.Event()
+        async with ws_serve(self._handler, self.config.host, self.config.port, max_size=2 ** 22):
+            log.info(f"[Server] 多会话服务已启动: ws://{self.config.host}:{self.config.port}")
+            await self._stop.wait()
+        await self.engines.llm.aclose()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+
+def main():
+    import argparse
+
+    p = argparse.ArgumentParser(description="无界面多会话服务器（WebSocket，文本/音频）")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=8766)
+    p.add_argument("--max-sessions", type=int, default=32, help="同时在线会话上限")
+    p.add_argument("--max-turns", type=int, default=16, help="同时进行的 LLM 回合上限")
+    p.add_argument("--no-asr", action="store_true", help="不加载语音识别（仅文本输入）")
+    p.add_argument("--no-tts", action="store_true", help="不加载语音合成（仅文本输出）")
+    p.add_argument("--tts-remote-url", default=None, help="远程 TTS 服务地址")
+    p.add_argument("--asr-device", default="auto")
+    p.add_argument("--enable-tools", action="store_true", help="允许 Agent 调用工具")
+    p.add_argument("--response-cache", action="store_true", help="启用语义回复缓存")
+    args = p.parse_args()
+
+    config = ServerConfig(
+        host=args.host,
+        port=args.port,
+        max_sessions=args.max_sessions,
+        max_concurrent_turns=args.max_turns,
+        enable_asr=not args.no_asr,
+        enable_tts=not args.no_tts,
+        enable_tools=args.enable_tools,
+        enable_response_cache=args.response_cache,
+        conversation=ConversationConfig(
+            asr_device=args.asr_device,
+            tts_remote_url=args.tts_remote_url,
+            enable_reminder=False,
+        ),
+    )
+    server = SessionServer(config)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -91,7 +91,8 @@ class SpeakerManager:
         speaker_name: str,
         audio: np.ndarray,
         sample_rate: int = 16000,
-        metadata: Optional[Dict] = None
+        metadata: Optional[Dict] = None,
+        embedding: Optional[np.ndarray] = None
     ) -> RegisterResult:
         """
         注册新说话人
@@ -101,6 +102,7 @@ class SpeakerManager:
             audio: 音频样本（建议 >3 秒）
             sample_rate: 采样率
             metadata: 额外元数据（昵称、偏好等）
+            embedding: 已提取的声纹向量（可选；对话分析阶段已算过时复用，避免重复推理）
             
         Returns:
             RegisterResult: 包含 speaker_id, success, message
@@ -128,7 +130,8 @@ class SpeakerManager:
                     )
             
             # 3. 提取声纹特征
-            embedding = self.sv_engine.embed(audio, sample_rate=sample_rate)
+            if embedding is None:
+                embedding = self.sv_engine.embed(audio, sample_rate=sample_rate)
             
             # 4. 评估声纹质量
             quality_score = self._evaluate_voiceprint_quality(embedding, audio, sample_rate)
@@ -204,7 +207,8 @@ class SpeakerManager:
         speaker_id: str,
         audio: np.ndarray,
         sample_rate: int = 16000,
-        merge_strategy: str = "average"
+        merge_strategy: str = "average",
+        embedding: Optional[np.ndarray] = None
     ) -> bool:
         """
         更新说话人声纹（添加新样本）
@@ -214,6 +218,7 @@ class SpeakerManager:
             audio: 新音频样本
             sample_rate: 采样率
             merge_strategy: 融合策略 ("average" | "weighted" | "replace")
+            embedding: 已提取的声纹向量（可选，复用分析阶段结果）
             
         Returns:
             是否成功
@@ -232,7 +237,10 @@ class SpeakerManager:
                 return False
             
             # 3. 提取新的声纹特征
-            new_embedding = self.sv_engine.embed(audio, sample_rate=sample_rate)
+            if embedding is not None:
+                new_embedding = embedding
+            else:
+                new_embedding = self.sv_engine.embed(audio, sample_rate=sample_rate)
             
             # 4. 评估新声纹质量
             quality_score = self._evaluate_voiceprint_quality(new_embedding, audio, sample_rate)
@@ -183,6 +183,17 @@ class SVEngine:
 
         try:
             q = self.embed(audio, sample_rate=sample_rate)
+            return self.verify_embedding(q, threshold=th)
+        except Exception as e:
+            return SVResult(accepted=True, score=0.0, threshold=th, reason=f"fail_open:{type(e).__name__}")
+
+    def verify_embedding(self, embedding: np.ndarray, threshold: float | None = None) -> SVResult:
+        """用已提取的声纹向量做验证（与说话人识别共用一次 embed 结果）。"""
+        th = float(self.threshold if threshold is None else threshold)
+        if not self.is_enrolled():
+            return SVResult(accepted=True, score=1.0, threshold=th, reason="not_enrolled")
+        try:
+            q = self._l2norm(np.asarray(embedding, dtype=np.float32).reshape(-1))
             score = float(np.dot(self._enroll_emb, q))
             return SVResult(accepted=score >= th, score=score, threshold=th, reason="cosine")
         except Exception as e:
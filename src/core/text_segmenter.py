@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+增量分句器
+把 LLM 流式输出的 token 增量切成可以直接送 TTS 的句子/子句
+
+设计目标：
+- 每次 feed 一段增量文本，立即返回已完整的句子，剩余部分留在缓冲区
+- 句末标点（。！？；…）直接断句；逗号等子句标点只在缓冲区足够长时断句，
+  避免切出「嗯，」这种过短片段导致 TTS 韵律破碎
+- 首句允许更短，尽快拿到首包音频
+- 超长无标点文本按最大长度强制切分，避免单段合成时间过长
+
+用法:
+    from core.text_segmenter import StreamingSentenceSegmenter
+
+    seg = StreamingSentenceSegmenter()
+    for delta in llm_stream:
+        for sentence in seg.feed(delta):
+            tts_queue.put(sentence)
+    tail = seg.flush()
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class SegmenterConfig:
+    """分句参数"""
+    # 首句最短长度（字符），满足后遇到子句标点即可切出
+    first_min_chars: int = 6
+    # 后续句子的最短长度（遇到子句标点时）
+    min_chars: int = 12
+    # 无标点时的最大长度，超过则强制切分
+    max_chars: int = 80
+
+
+class StreamingSentenceSegmenter:
+    """
+    增量分句器
+
+    - feed(delta) 返回本次新完成的句子列表
+    - flush() 返回缓冲区剩余文本（流结束时调用）
+    """
+
+    # 句末标点：遇到即断句
+    SENTENCE_END = set("。！？!?；;…\n")
+    # 子句标点：缓冲区足够长时断句
+    CLAUSE_END = set("，,、：:")
+    # 紧跟在句末标点后的闭合符号，应归入前一句
+    CLOSERS = set("”’\"'）)】]」』》")
+
+    def __init__(self, config: Optional[SegmenterConfig] = None):
+        self.config = config or SegmenterConfig()
+        self._buffer: str = ""
+        self._emitted: int = 0
+
+    def reset(self):
+        """清空状态（新一轮对话前调用）"""
+        self._buffer = ""
+        self._emitted = 0
+
+    @property
+    def pending(self) -> str:
+        """尚未切出的缓冲文本"""
+        return self._buffer
+
+    def _min_chars(self) -> int:
+        return self.config.first_min_chars if self._emitted == 0 else self.config.min_chars
+
+    def _find_cut(self) -> int:
+        """
+        在缓冲区中查找切分位置
+
+        Returns:
+            切分点（不含）；-1 表示暂不切分
+        """
+        buf = self._buffer
+        n = len(buf)
+        i = 0
+        while i < n:
+            ch = buf[i]
+            if ch in self.SENTENCE_END or (ch == "." and i + 1 < n and buf[i + 1].isspace()):
+                j = i + 1
+                # 连续标点（如「！？」「……」）及闭合引号一并归入本句
+                while j < n and (buf[j] in self.SENTENCE_END or buf[j] in self.CLOSERS):
+                    j += 1
+                if j == n and buf[i] != "\n":
+                    # 句末标点在缓冲区末尾：后面可能还有闭合符号，等下一个 delta 再定
+                    return -1
+                return j
+            if ch in self.CLAUSE_END and i + 1 >= self._min_chars():
+                return i + 1
+            i += 1
+
+        if n >= self.config.max_chars:
+            # 超长无标点：优先在空白处切，否则硬切
+            cut = buf.rfind(" ", 0, self.config.max_chars)
+            return cut + 1 if cut > 0 else self.config.max_chars
+        return -1
+
+    def feed(self, delta: str) -> List[str]:
+        """
+        输入一段增量文本
+
+        Returns:
+            本次新完成的句子（已去除首尾空白，过滤纯空白）
+        """
+        if not delta:
+            return []
+        self._buffer += delta
+        out: List[str] = []
+        while True:
+            cut = self._find_cut()
+            if cut <= 0:
+                break
+            piece = self._buffer[:cut].strip()
+            self._buffer = self._buffer[cut:]
+            if piece:
+                out.append(piece)
+                self._emitted += 1
+        return out
+
+    def flush(self) -> Optional[str]:
+        """流结束：返回剩余文本（若有）"""
+        piece = self._buffer.strip()
+        self._buffer = ""
+        if piece:
+            self._emitted += 1
+            return piece
+        return None
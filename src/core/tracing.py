@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+轮次延迟追踪
+记录每轮对话各阶段的时间点与耗时，用数据而不是猜测定位热路径回归
+
+- mark(name)：时间点（相对本轮开始的毫秒数，同名只记第一次，如首包/首 token）
+- span(name)：耗时段（同名累加，如多次工具调用）
+- 最近 N 轮保存在环形缓冲区，summary() 给出 p50/p95/p99
+- export_json / export_csv 导出明细
+
+对话只有一条主线，因此同一时刻只有一个「当前轮」；
+ASR/Agent/TTS 各线程直接往全局 tracer 打点即可，无需传递上下文。
+
+用法:
+    from core.tracing import tracer
+
+    tracer.begin_turn()
+    tracer.mark("speech_end")
+    with tracer.span("rag"):
+        ...
+    tracer.end_turn()
+    print(tracer.format_summary())
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+# 派生指标：名称 → (起点 mark, 终点 mark)
+DERIVED_METRICS = {
+    "response_latency": ("speech_end", "playback_start"),   # 用户说完 → AI 开口
+    "asr_finalize": ("speech_end", "asr_final"),
+    "llm_ttft": ("llm_request", "llm_first_token"),
+    "tts_first_packet": ("tts_request", "tts_first_packet"),
+    "playback": ("playback_start", "playback_end"),
+}
+
+
+@dataclass
+class TurnTrace:
+    """一轮对话的追踪记录"""
+    turn_id: int
+    started_at: str
+    t0: float = field(default_factory=time.perf_counter)
+    marks: Dict[str, float] = field(default_factory=dict)   # 毫秒（相对 t0）
+    spans: Dict[str, float] = field(default_factory=dict)   # 毫秒（累加）
+    meta: Dict[str, object] = field(default_factory=dict)
+
+    def mark(self, name: str, at: Optional[float] = None):
+        if name not in self.marks:
+            t = time.perf_counter() if at is None else at
+            self.marks[name] = (t - self.t0) * 1000.0
+
+    def add_span(self, name: str, ms: float):
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def metrics(self) -> Dict[str, float]:
+        """展平为 指标名 → 毫秒"""
+        out: Dict[str, float] = {}
+        for k, v in self.marks.items():
+            out[f"mark.{k}"] = v
+        for k, v in self.spans.items():
+            out[f"span.{k}"] = v
+        for name, (a, b) in DERIVED_METRICS.items():
+            if a in self.marks and b in self.marks:
+                out[name] = self.marks[b] - self.marks[a]
+        return out
+
+    def to_dict(self) -> Dict:
+        return {
+            "turn_id": self.turn_id,
+            "started_at": self.started_at,
+            "marks": {k: round(v, 2) for k, v in self.marks.items()},
+            "spans": {k: round(v, 2) for k, v in self.spans.items()},
+            "metrics": {k: round(v, 2) for k, v in self.metrics().items()},
+            "meta": self.meta,
+        }
+
+
+class Tracer:
+    """全局追踪器（线程安全）"""
+
+    def __init__(self, capacity: int = 200):
+        self._lock = threading.Lock()
+        self._turns: deque = deque(maxlen=capacity)
+        self._current: Optional[TurnTrace] = None
+        self._next_id = 1
+        self.enabled = True
+
+    # ---- 轮次 ----
+
+    def begin_turn(self, **meta) -> Optional[TurnTrace]:
+        """开始新一轮（未结束的上一轮直接丢弃）"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            turn = TurnTrace(
+                turn_id=self._next_id,
+                started_at=datetime.now().isoformat(timespec="milliseconds"),
+            )
+            turn.meta.update(meta)
+            self._next_id += 1
+            self._current = turn
+            return turn
+
+    def end_turn(self, discard: bool = False) -> Optional[TurnTrace]:
+        """结束当前轮并存入环形缓冲区；discard=True 时丢弃（如本轮无有效输入）"""
+        with self._lock:
+            turn, self._current = self._current, None
+            if turn is not None and not discard:
+                self._turns.append(turn)
+            return None if discard else turn
+
+    @property
+    def current(self) -> Optional[TurnTrace]:
+        return self._current
+
+    # ---- 打点 ----
+
+    def mark(self, name: str):
+        turn = self._current
+        if turn is not None:
+            with self._lock:
+                turn.mark(name)
+
+    def add_span(self, name: str, ms: float):
+        turn = self._current
+        if turn is not None:
+            with self._lock:
+                turn.add_span(name, ms)
+
+    def set_meta(self, key: str, value):
+        turn = self._current
+        if turn is not None:
+            with self._lock:
+                turn.meta[key] = value
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """耗时段上下文管理器；未开始轮次时几乎零开销"""
+        turn = self._current
+        if turn is None:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - t0) * 1000.0
+            # 轮次已切换则不再计入
+            if self._current is turn:
+                with self._lock:
+                    turn.add_span(name, ms)
+
+    # ---- 统计与导出 ----
+
+    def turns(self) -> List[TurnTrace]:
+        with self._lock:
+            return list(self._turns)
+
+    def summary(self, last_n: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """
+        各指标的分位数统计
+
+        Returns:
+            {指标名: {"count", "mean", "p50", "p95", "p99", "max"}}（毫秒）
+        """
+        turns = self.turns()
+        if last_n:
+            turns = turns[-last_n:]
+        values: Dict[str, List[float]] = {}
+        for t in turns:
+            for k, v in t.metrics().items():
+                values.setdefault(k, []).append(v)
+        out: Dict[str, Dict[str, float]] = {}
+        for k, vs in sorted(values.items()):
+            arr = np.asarray(vs, dtype=np.float64)
+            p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+            out[k] = {
+                "count": int(arr.size),
+                "mean": round(float(arr.mean()), 2),
+                "p50": round(float(p50), 2),
+                "p95": round(float(p95), 2),
+                "p99": round(float(p99), 2),
+                "max": round(float(arr.max()), 2),
+            }
+        return out
+
+    def format_summary(self, last_n: Optional[int] = None) -> str:
+        """人类可读的统计表"""
+        s = self.summary(last_n)
+        if not s:
+            return "（暂无追踪数据）"
+        width = max(len(k) for k in s)
+        lines = [f"{'metric':<{width}}  {'n':>4}  {'p50':>9}  {'p95':>9}  {'p99':>9}"]
+        for k, v in s.items():
+            lines.append(f"{k:<{width}}  {v['count']:>4}  {v['p50']:>9.1f}  {v['p95']:>9.1f}  {v['p99']:>9.1f}")
+        return "\n".join(lines)
+
+    def export_json(self, path) -> Path:
+        """导出明细 + 统计到 JSON"""
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+            "summary": self.summary(),
+            "turns": [t.to_dict() for t in self.turns()],
+        }
+        p.write_text(json.dumps(data, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        return p
+
+    def export_csv(self, path) -> Path:
+        """导出明细到 CSV（每轮一行，列为各指标毫秒数）"""
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        turns = self.turns()
+        rows = [t.metrics() for t in turns]
+        columns = sorted({k for r in rows for k in r})
+        with p.open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["turn_id", "started_at"] + columns)
+            for t, r in zip(turns, rows):
+                w.writerow([t.turn_id, t.started_at] + [
+                    f"{r[c]:.2f}" if c in r else "" for c in columns
+                ])
+        return p
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self._current = None
+
+
+# 全局实例
+tracer = Tracer()
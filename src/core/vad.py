@@ -8,6 +8,9 @@ VAD 负责判断「当前音频块是否有语音」，Endpoint 逻辑（何时
 
 from __future__ import annotations
 
+import threading
+import time
+from collections import deque
 from dataclasses import dataclass, field
 from typing import Literal, Optional
 
@@ -204,6 +207,116 @@ class SileroVADBackend(VADBackend):
         return p > self.config.silero_threshold
 
 
+class EchoAwareVAD(VADBackend):
+    """
+    回声感知 VAD（播放期间检测用户插话）
+
+    扬声器外放时麦克风会录到 TTS 自己的声音，普通 VAD 会把它当成用户说话。
+    这里记录播放参考信号的能量包络，只有当麦克风能量明显高于
+    「参考能量 × 回声耦合系数」时才认为是用户语音；
+    被判为回声的块会用来在线更新耦合系数（适配不同音量/设备）。
+
+    用法:
+        vad = EchoAwareVAD(create_vad(config))
+        audio_output.set_reference_callback(vad.push_reference)
+        if vad.detect_speech(mic_chunk, 16000): ...
+    """
+
+    # 包络帧长（秒）
+    FRAME_SEC = 0.02
+    # 参考信号保留时长（秒）
+    HISTORY_SEC = 10.0
+
+    def __init__(
+        self,
+        inner: VADBackend,
+        echo_margin: float = 2.0,
+        echo_tail_sec: float = 0.3,
+        initial_coupling: float = 0.5,
+    ):
+        """
+        Args:
+            inner: 实际做语音判断的 VAD 后端
+            echo_margin: 麦克风能量需超过回声估计的倍数
+            echo_tail_sec: 回声延迟/混响容忍（秒），参考窗口向前扩展
+            initial_coupling: 初始回声耦合系数（麦克风 RMS / 参考 RMS）
+        """
+        self._inner = inner
+        self.echo_margin = echo_margin
+        self.echo_tail_sec = echo_tail_sec
+        self._initial_coupling = initial_coupling
+        self._coupling = initial_coupling
+        self._lock = threading.Lock()
+        # (开始时间, 结束时间, 帧 RMS 包络)
+        self._ref: deque = deque()
+
+    def push_reference(self, audio: np.ndarray, sample_rate: int, start_time: Optional[float] = None):
+        """登记一段即将播放的参考音频（由 AudioOutput 在播放前调用）"""
+        if audio is None or len(audio) == 0 or not sample_rate:
+            return
+        a = np.asarray(audio, dtype=np.float32).reshape(-1)
+        frame = max(1, int(sample_rate * self.FRAME_SEC))
+        n_frames = max(1, len(a) // frame)
+        head = a[: n_frames * frame]
+        if head.size < frame:
+            env = np.array([np.sqrt(np.mean(a ** 2))], dtype=np.float32)
+        else:
+            env = np.sqrt(np.mean(head.reshape(n_frames, frame) ** 2, axis=1))
+        t0 = time.monotonic() if start_time is None else start_time
+        t1 = t0 + len(a) / float(sample_rate)
+        with self._lock:
+            self._ref.append((t0, t1, env))
+            while self._ref and self._ref[0][1] < t1 - self.HISTORY_SEC:
+                self._ref.popleft()
+
+    def clear_reference(self):
+        """播放被打断/结束时清空参考信号"""
+        with self._lock:
+            self._ref.clear()
+
+    def _reference_rms(self, t0: float, t1: float) -> float:
+        """[t0, t1] 时间窗内参考信号的最大帧能量"""
+        peak = 0.0
+        with self._lock:
+            for r0, r1, env in self._ref:
+                if r1 < t0 or r0 > t1:
+                    continue
+                i0 = max(0, int((t0 - r0) / self.FRAME_SEC))
+                i1 = min(len(env), int((t1 - r0) / self.FRAME_SEC) + 1)
+                if i1 > i0:
+                    peak = max(peak, float(env[i0:i1].max()))
+        return peak
+
+    def detect_speech(self, audio_chunk: np.ndarray, sample_rate: int = 16000) -> bool:
+        now = time.monotonic()
+        dur = len(audio_chunk) / float(sample_rate)
+        is_speech = self._inner.detect_speech(audio_chunk, sample_rate)
+
+        ref = self._reference_rms(now - dur - self.echo_tail_sec, now)
+        if ref <= 1e-4:
+            # 没有播放，退化为普通 VAD
+            return is_speech
+
+        if audio_chunk.dtype == np.int16:
+            a = audio_chunk.astype(np.float32) / 32768.0
+        else:
+            a = audio_chunk.astype(np.float32)
+        mic = float(np.sqrt(np.mean(a ** 2))) if a.size else 0.0
+
+        if is_speech and mic > self._coupling * ref * self.echo_margin:
+            return True
+
+        # 判为回声：平滑更新耦合系数
+        ratio = mic / ref
+        self._coupling = float(np.clip(self._coupling * 0.9 + ratio * 0.1, 0.01, 4.0))
+        return False
+
+    def reset(self):
+        self._inner.reset()
+        self._coupling = self._initial_coupling
+        self.clear_reference()
+
+
 def create_vad(config: VADConfig) -> VADBackend:
     """根据配置创建 VAD 后端"""
     if config.backend == "rms":
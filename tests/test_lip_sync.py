@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+LipSyncScheduler 测试：按注入的时钟查表发送口型，不启动调度线程
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.lip_sync import LipSyncScheduler  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+class ManualClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def _scheduler(sent):
+    lip = LipSyncScheduler(on_rms=sent.append)
+    # 不启动后台线程，由测试调用 _tick 驱动
+    lip._ensure_thread = lambda: None
+    return lip
+
+
+def test_frames_follow_clock():
+    sent = []
+    clock = ManualClock()
+    lip = _scheduler(sent)
+    lip.set_clock(clock, epoch=1)
+    audio = np.concatenate([np.zeros(SAMPLE_RATE // 2), np.ones(SAMPLE_RATE // 2)]).astype(np.float32)
+    lip.add_rms(audio, SAMPLE_RATE, start=1.0)
+
+    lip._tick(clock())
+    assert sent == []            # 段尚未开始
+    clock.t = 1.75
+    lip._tick(clock())
+    assert sent and sent[-1] > 0.5
+    clock.t = 2.5
+    lip._tick(clock())
+    assert sent[-1] == 0.0       # 段已结束，闭嘴
+
+
+def test_new_epoch_drops_tracks_from_old_clock():
+    sent = []
+    clock = ManualClock()
+    lip = _scheduler(sent)
+    lip.set_clock(clock, epoch=1)
+    lip.add_rms(np.ones(SAMPLE_RATE, dtype=np.float32), SAMPLE_RATE, start=5.0)
+
+    # 播放引擎重建：位置归零，旧时间线（start=5s）不应在新时钟走到 5s 时被播放
+    lip.set_clock(clock, epoch=2)
+    lip.add_rms(np.ones(SAMPLE_RATE, dtype=np.float32) * 0.5, SAMPLE_RATE, start=0.0)
+    clock.t = 0.5
+    lip._tick(clock())
+    assert sent[-1] < 1.0
+    clock.t = 5.5
+    lip._tick(clock())
+    assert sent[-1] == 0.0
+
+    # 同一 epoch 再次设置时钟不丢弃时间线
+    lip.add_rms(np.ones(SAMPLE_RATE, dtype=np.float32), SAMPLE_RATE, start=6.0)
+    lip.set_clock(clock, epoch=2)
+    clock.t = 6.5
+    lip._tick(clock())
+    assert sent[-1] > 0.5
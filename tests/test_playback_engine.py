@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+PlaybackEngine 回环测试
+
+注入假 OutputStream 后端，由测试手动驱动音频回调，不需要声卡。
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.audio_io import AudioOutput, PlaybackEngine  # noqa: E402
+
+SAMPLE_RATE = 16000
+BLOCK = 256
+
+
+class FakeOutputStream:
+    """兼容 sounddevice.OutputStream 接口的假输出流，pull() 模拟声卡取一块数据"""
+
+    def __init__(self, samplerate, channels, dtype, blocksize, latency, callback):
+        self.samplerate = samplerate
+        self.callback = callback
+        self.latency = 0.02
+        self.started = False
+        self.closed = False
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.closed = True
+
+    def pull(self, frames: int) -> np.ndarray:
+        outdata = np.full((frames, 1), np.nan, dtype=np.float32)
+        self.callback(outdata, frames, None, None)
+        return outdata[:, 0].copy()
+
+
+class FakeBackend:
+    """假 sounddevice 模块，记录创建过的输出流"""
+
+    def __init__(self):
+        self.streams = []
+
+    def OutputStream(self, **kwargs):
+        stream = FakeOutputStream(**kwargs)
+        self.streams.append(stream)
+        return stream
+
+
+def _ramp(start: int, length: int) -> np.ndarray:
+    """可逐样本校验连续性的递增信号"""
+    return (np.arange(start, start + length, dtype=np.float32) / 65536.0)
+
+
+@pytest.fixture
+def backend():
+    return FakeBackend()
+
+
+@pytest.fixture
+def engine(backend):
+    eng = PlaybackEngine(SAMPLE_RATE, buffer_seconds=1.0, backend=backend)
+    eng.start()
+    yield eng
+    eng.close()
+
+
+def test_back_to_back_chunks_play_without_gap(engine, backend):
+    stream = backend.streams[0]
+    lengths = [100, 333, 1, 700, 250]
+    starts = []
+    offset = 0
+    for n in lengths:
+        starts.append(engine.enqueue(_ramp(offset, n)))
+        offset += n
+
+    # 每段起点紧接上一段终点
+    assert starts == list(np.cumsum([0] + lengths[:-1]))
+
+    played = np.concatenate([stream.pull(BLOCK) for _ in range(offset // BLOCK)])
+    tail = stream.pull(offset - len(played))
+    played = np.concatenate([played, tail])
+
+    # 块与块之间没有插入静音，也没有欠载
+    np.testing.assert_array_equal(played, _ramp(0, offset))
+    assert engine.position == offset
+    assert engine.queued == 0
+
+
+def test_underrun_pads_silence_without_advancing_position(engine, backend):
+    stream = backend.streams[0]
+    engine.enqueue(_ramp(1, 100))
+
+    out = stream.pull(BLOCK)
+    np.testing.assert_array_equal(out[:100], _ramp(1, 100))
+    np.testing.assert_array_equal(out[100:], 0.0)
+    assert engine.position == 100
+
+    # 欠载后续写的数据从断点继续
+    engine.enqueue(_ramp(101, 50))
+    out = stream.pull(50)
+    np.testing.assert_array_equal(out, _ramp(101, 50))
+    assert engine.position == 150
+
+
+def test_position_advances_with_callbacks(engine, backend):
+    stream = backend.streams[0]
+    engine.enqueue(np.ones(SAMPLE_RATE, dtype=np.float32))
+    assert engine.position == 0
+    assert engine.queued == SAMPLE_RATE
+
+    for i in range(1, 5):
+        stream.pull(BLOCK)
+        assert engine.position == i * BLOCK
+        assert engine.queued == SAMPLE_RATE - i * BLOCK
+
+
+def test_audio_output_playback_time(backend):
+    output = AudioOutput(sample_rate=SAMPLE_RATE, backend=backend)
+    try:
+        assert output.playback_time() == 0.0
+        first = output.enqueue(np.ones(SAMPLE_RATE // 2, dtype=np.float32))
+        second = output.enqueue(np.ones(SAMPLE_RATE // 2, dtype=np.float32))
+        assert (first, second) == (0, SAMPLE_RATE // 2)
+
+        stream = backend.streams[0]
+        stream.pull(SAMPLE_RATE // 4)
+        assert output.playback_position() == SAMPLE_RATE // 4
+        assert output.playback_time() == pytest.approx(0.25)
+        stream.pull(SAMPLE_RATE // 2)
+        assert output.playback_time() == pytest.approx(0.75)
+    finally:
+        output.close()
+
+
+def test_flush_drops_queued_audio_immediately(engine, backend):
+    stream = backend.streams[0]
+    engine.enqueue(np.ones(SAMPLE_RATE // 2, dtype=np.float32))
+    stream.pull(BLOCK)
+
+    engine.flush()
+    assert engine.queued == 0
+    assert engine.position == BLOCK
+
+    # flush 之后的下一次回调即为静音
+    np.testing.assert_array_equal(stream.pull(BLOCK), 0.0)
+    assert engine.position == BLOCK
+
+    # flush 后重新入队的数据从当前位置开始播放
+    start = engine.enqueue(_ramp(0, 64))
+    assert start == BLOCK
+    np.testing.assert_array_equal(stream.pull(64), _ramp(0, 64))
+
+
+def test_flush_interrupts_waiters(engine, backend):
+    start = engine.enqueue(np.ones(SAMPLE_RATE // 2, dtype=np.float32))
+    result = {}
+
+    def waiter():
+        result["reached"] = engine.wait_for_position(start + SAMPLE_RATE // 2, timeout=5.0)
+
+    t = threading.Thread(target=waiter)
+    t.start()
+    engine.flush()
+    t.join(timeout=2.0)
+    assert not t.is_alive()
+    assert result["reached"] is False
+
+
+def test_enqueue_blocks_when_full_and_resumes_as_audio_plays(backend):
+    eng = PlaybackEngine(SAMPLE_RATE, buffer_seconds=BLOCK / SAMPLE_RATE, backend=backend)
+    eng.start()
+    try:
+        stream = backend.streams[0]
+        data = _ramp(0, BLOCK * 3)
+        t = threading.Thread(target=eng.enqueue, args=(data,))
+        t.start()
+
+        played = []
+        for _ in range(3):
+            while eng.queued < BLOCK:
+                assert t.is_alive()
+                time.sleep(0.001)
+            played.append(stream.pull(BLOCK))
+        t.join(timeout=2.0)
+        assert not t.is_alive()
+
+        np.testing.assert_array_equal(np.concatenate(played), data)
+        assert eng.position == len(data)
+    finally:
+        eng.close()
+
+
+def test_audible_time_subtracts_output_latency(backend):
+    output = AudioOutput(sample_rate=SAMPLE_RATE, backend=backend)
+    try:
+        output.enqueue(np.ones(SAMPLE_RATE, dtype=np.float32))
+        stream = backend.streams[0]
+        stream.pull(SAMPLE_RATE // 2)
+        assert output.playback_time() == pytest.approx(0.5)
+        assert output.audible_time() == pytest.approx(0.5 - stream.latency)
+    finally:
+        output.close()
+
+
+def test_engine_rebuilt_on_sample_rate_change_resets_position(backend):
+    output = AudioOutput(sample_rate=SAMPLE_RATE, backend=backend)
+    try:
+        output.enqueue(np.ones(BLOCK, dtype=np.float32))
+        backend.streams[0].pull(BLOCK)
+        assert output.engine_generation == 1
+        assert output.playback_position() == BLOCK
+
+        start = output.enqueue(np.ones(BLOCK, dtype=np.float32), SAMPLE_RATE * 2)
+        assert output.engine_generation == 2
+        assert len(backend.streams) == 2 and backend.streams[0].closed
+        # 新引擎位置从 0 开始，调用方须按 engine_generation 重新对齐时钟
+        assert start == 0
+        assert output.playback_position() == 0
+    finally:
+        output.close()